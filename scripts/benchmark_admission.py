@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Lecturas a DynamoDB del webhook durante un atraso de ProcessingQueue, sin y con
+control de admisión (webhook/admission.py).
+
+Simula 20 minutos de tráfico (reloj simulado, sin esperas) mientras la cola
+sube de 0 a 12 000 mensajes y se vacía. Corre el lambda_handler real con
+tablas y SQS en memoria y reporta, por minuto, la profundidad, el modo y las
+lecturas a DynamoDB. Después pasa los mensajes diferidos por
+processor/deferred_enrichment.py y los compara con los del modo normal.
+
+Uso:
+    python scripts/benchmark_admission.py [requests_por_segundo=5]
+"""
+import io
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('USERS_TABLE', 'guatepass-users-bench')
+os.environ.setdefault('TAGS_TABLE', 'guatepass-tags-bench')
+os.environ.setdefault('PROCESSING_QUEUE_URL', 'https://sqs.us-east-1.amazonaws.com/000000000000/guatepass-bench')
+os.environ.pop('SNAPSHOT_BUCKET', None)
+os.environ.pop('ADMISSION_MAX_MESSAGES', None)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'processor'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'webhook'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+import app as webhook_app
+from admission import QueueDepthMonitor
+from benchmark_webhook_lookups import CASOS, TAGS, USUARIOS, Latencia, RecursoSimulado, TablaSimulada
+from deferred_enrichment import CruceInvalido, completar_cruce
+
+MINUTOS = 20
+# Umbrales del template
+MAX_MENSAJES, MAX_EDAD, REFRESH = 5000, 120, 15
+# Mensajes por segundo que drena el processor, para estimar la edad del más antiguo
+DRENADO = 50
+
+def profundidad(t):
+    """0 hasta el minuto 3, sube a 12 000 en el 8, se mantiene hasta el 12 y se vacía en el 18"""
+    minuto = t / 60
+    if minuto < 3:
+        return 0
+    if minuto < 8:
+        return int(12000 * (minuto - 3) / 5)
+    if minuto < 12:
+        return 12000
+    return max(0, int(12000 * (18 - minuto) / 6))
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+class SqsSimulado:
+    def __init__(self, reloj):
+        self.reloj = reloj
+        self.mensajes = []
+
+    def get_queue_attributes(self, **kwargs):
+        return {'Attributes': {'ApproximateNumberOfMessages': str(profundidad(self.reloj()))}}
+
+    def send_message(self, MessageBody, **kwargs):
+        self.mensajes.append(json.loads(MessageBody))
+        return {'MessageId': f"msg-{len(self.mensajes)}"}
+
+class CloudWatchSimulado:
+    def __init__(self, reloj):
+        self.reloj = reloj
+
+    def get_metric_data(self, **kwargs):
+        return {'MetricDataResults': [{'Values': [profundidad(self.reloj()) / DRENADO]}]}
+
+def preparar(reloj, con_admision):
+    lecturas = Latencia(0)
+    validator = webhook_app.validator
+    validator.users_table = TablaSimulada(os.environ['USERS_TABLE'], 'placa', USUARIOS, lecturas)
+    validator.tags_table = TablaSimulada(os.environ['TAGS_TABLE'], 'tag_id', TAGS, lecturas)
+    validator.dynamodb = RecursoSimulado([validator.users_table, validator.tags_table], lecturas)
+    validator.snapshot_loader = validator.plate_filter_loader = None
+    sqs = webhook_app.sqs = SqsSimulado(reloj)
+    webhook_app.admission = None
+    if con_admision:
+        webhook_app.admission = QueueDepthMonitor(webhook_app.processing_queue_url, MAX_MENSAJES, MAX_EDAD, REFRESH,
+                                                  metricas=webhook_app.metricas, sqs=sqs,
+                                                  cloudwatch=CloudWatchSimulado(reloj), reloj=reloj)
+    return lecturas, sqs
+
+def correr(por_segundo, con_admision):
+    reloj = Reloj()
+    lecturas, sqs = preparar(reloj, con_admision)
+    salida = io.StringIO()
+    por_minuto, estados = [], {}
+    for minuto in range(MINUTOS):
+        antes, degradados = lecturas.llamadas, 0
+        for segundo in range(60):
+            reloj.ahora = minuto * 60 + segundo
+            for i in range(por_segundo):
+                _, campos = CASOS[(segundo * por_segundo + i) % len(CASOS)]
+                body = {**campos, 'peaje_id': 'PEAJE_ZONA10',
+                        'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}
+                with redirect_stdout(salida):
+                    respuesta = webhook_app.lambda_handler({'body': json.dumps(body)}, None)
+                estados[respuesta['statusCode']] = estados.get(respuesta['statusCode'], 0) + 1
+                degradados += json.loads(respuesta['body']).get('degraded', False)
+        por_minuto.append((profundidad(reloj()), degradados, lecturas.llamadas - antes))
+    return por_minuto, estados, sqs.mensajes, salida.getvalue()
+
+def metricas_emf(salida):
+    totales = {}
+    for linea in salida.splitlines():
+        if linea.startswith('{"_aws"'):
+            for nombre in ('EntradasModoDegradado', 'SalidasModoDegradado', 'CrucesDiferidos'):
+                totales[nombre] = totales.get(nombre, 0) + json.loads(linea).get(nombre, 0)
+    return totales
+
+def comparar_enriquecimiento():
+    """Cada caso en modo degradado, completado por el processor, contra el mensaje del modo normal"""
+    lecturas = Latencia(0)
+    users = TablaSimulada('users', 'placa', USUARIOS, lecturas)
+    tags = TablaSimulada('tags', 'tag_id', TAGS, lecturas)
+    campos_comparados = ('placa', 'user_type', 'user_email', 'user_phone', 'has_tag', 'tag_id', 'tag_info', 'metodo_pago')
+    print(f"\n{'Caso':<21} {'modo normal':<20} {'degradado + processor':<30}")
+    for nombre, campos in CASOS:
+        body = {**campos, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}
+        reloj = Reloj()
+        _, sqs = preparar(reloj, False)
+        with redirect_stdout(io.StringIO()):
+            normal = webhook_app.lambda_handler({'body': json.dumps(body)}, None)
+        esperado = sqs.mensajes[0] if sqs.mensajes else None
+
+        diferido = webhook_app.build_deferred_message(webhook_app.validator.validate_offline(dict(body))[2])
+        try:
+            completo = completar_cruce(diferido, users, tags)
+            iguales = esperado is not None and all(completo.get(c) == esperado.get(c) for c in campos_comparados)
+            resultado = f"{completo['user_type']}, {'mismo mensaje' if iguales else 'DISTINTO'}"
+        except CruceInvalido as e:
+            iguales = esperado is None
+            resultado = f"rechazado: {e}"
+        estado = 'encolado' if esperado else f"HTTP {normal['statusCode']}"
+        print(f"{nombre:<21} {estado:<20} {resultado:<30} {'✅' if iguales else '❌'}")
+
+def main(por_segundo=5):
+    por_segundo = int(por_segundo)
+    sin, estados_sin, _, _ = correr(por_segundo, False)
+    con, estados_con, mensajes, salida = correr(por_segundo, True)
+
+    print(f"=== {MINUTOS} min a {por_segundo} requests/s; degradado con ≥{MAX_MENSAJES} mensajes o "
+          f"≥{MAX_EDAD}s de edad, normal bajo la mitad ===\n")
+    print(f"{'min':>3} {'cola':>7} {'lecturas sin':>13} {'lecturas con':>13} {'degradados':>11}")
+    for minuto, ((cola, _, lecturas_sin), (_, degradados, lecturas_con)) in enumerate(zip(sin, con)):
+        print(f"{minuto:>3} {cola:>7} {lecturas_sin:>13} {lecturas_con:>13} {degradados:>11}")
+    total_sin, total_con = sum(m[2] for m in sin), sum(m[2] for m in con)
+    print(f"\nLecturas a DynamoDB: {total_sin} sin control de admisión, {total_con} con "
+          f"({1 - total_con / total_sin:.0%} menos)")
+    print(f"HTTP sin: {estados_sin}  con: {estados_con}")
+    print(f"Mensajes con enriquecer = true: {sum(1 for m in mensajes if m.get('enriquecer'))}")
+    print(f"EMF: {metricas_emf(salida)}")
+    comparar_enriquecimiento()
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Mide la tasa de falsos positivos del filtro de Bloom de placas y el tamaño
+del filtro para distintos presupuestos de bits por placa.
+
+Uso:
+    python scripts/benchmark_bloom.py [placas_registradas] [placas_no_registradas]
+"""
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'webhook'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from bloom_filter import BloomFilter
+
+LETRAS = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+
+def generar_placas(cantidad, prefijo, rng):
+    """Placas sintéticas únicas con formato P-123ABC"""
+    placas = set()
+    while len(placas) < cantidad:
+        placas.add(f"{prefijo}-{rng.randint(0, 999):03d}{''.join(rng.choice(LETRAS) for _ in range(3))}")
+    return list(placas)
+
+def main(registradas=200000, consultas=200000):
+    rng = random.Random(42)
+    # Prefijos distintos garantizan que las consultas no estén registradas
+    placas = generar_placas(registradas, 'P', rng)
+    ajenas = generar_placas(consultas, 'C', rng)
+
+    print(f"Placas registradas: {registradas}, consultas de placas no registradas: {consultas}\n")
+    print(f"{'bits/placa':>10} {'k':>3} {'fp esperado':>12} {'fp medido':>10} {'MB @5M placas':>14} {'µs/consulta':>12}")
+
+    for bits_por_placa in (6, 8, 10, 12, 16, 20):
+        bloom = BloomFilter(bits_por_placa * registradas, max(1, round(bits_por_placa * math.log(2))))
+        bloom.update(placas)
+
+        inicio = time.perf_counter()
+        falsos_positivos = sum(1 for placa in ajenas if bloom.might_contain(placa))
+        duracion = time.perf_counter() - inicio
+
+        assert all(bloom.might_contain(p) for p in placas[:10000]), "Falso negativo detectado"
+
+        mb_5m = bits_por_placa * 5_000_000 / 8 / 1024 / 1024
+        print(f"{bits_por_placa:>10} {bloom.num_hashes:>3} {bloom.expected_false_positive_rate():>12.4%} "
+              f"{falsos_positivos / consultas:>10.4%} {mb_5m:>14.2f} {duracion / consultas * 1e6:>12.2f}")
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Conexiones abiertas y tiempo por ronda de GetItem concurrentes según el tamaño
+del pool de boto3 (layers/shared/python/aws_clients.py).
+
+Cada ronda es una ráfaga de hilos x GetItem en paralelo, como un lote del
+processor o un POST /tags/bulk. Un servidor HTTP local responde como DynamoDB
+con latencia_ms por request, y la primera request de cada conexión tarda además
+handshake_ms (TCP + TLS contra el endpoint real). Al terminar la ráfaga, urllib3
+guarda como mucho `pool` conexiones ociosas y cierra el resto. En la siguiente
+ronda los hilos de más vuelven a pagar el handshake.
+
+Uso:
+    python scripts/benchmark_connection_pool.py [hilos=16] [rondas=20] [latencia_ms=8] [handshake_ms=30] [pools=10,50]
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+from botocore.config import Config
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from aws_clients import config_from_env
+
+# urllib3 avisa cada vez que descarta una conexión con el pool lleno
+logging.getLogger('urllib3.connectionpool').setLevel(logging.ERROR)
+
+class DynamoSimulado(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y body en un solo write: sin la espera de ACK retrasado de TCP
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+    latencia = 0.008
+    handshake = 0.03
+    conexiones = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with DynamoSimulado.lock:
+            DynamoSimulado.conexiones += 1
+        time.sleep(self.handshake)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.latencia)
+        body = json.dumps({'Item': {'placa': {'S': 'P-123ABC'}}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-amz-json-1.0')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def medir(endpoint, pool, hilos, rondas):
+    config = config_from_env().merge(Config(max_pool_connections=pool))
+    client = boto3.session.Session().client('dynamodb', endpoint_url=endpoint, config=config)
+    DynamoSimulado.conexiones = 0
+
+    def leer(_):
+        client.get_item(TableName='guatepass-users-bench', Key={'placa': {'S': 'P-123ABC'}})
+
+    tiempos = []
+    for _ in range(rondas):
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            list(executor.map(leer, range(hilos)))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    # La primera ronda abre todas las conexiones con cualquier pool
+    return statistics.median(tiempos[1:] or tiempos), DynamoSimulado.conexiones
+
+def main(hilos=16, rondas=20, latencia_ms=8, handshake_ms=30, pools='10,50'):
+    hilos, rondas = int(hilos), int(rondas)
+    DynamoSimulado.latencia, DynamoSimulado.handshake = float(latencia_ms) / 1000, float(handshake_ms) / 1000
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), DynamoSimulado)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{servidor.server_port}"
+
+    print(f"=== {rondas} rondas de {hilos} GetItem en paralelo, latencia {latencia_ms} ms, "
+          f"handshake {handshake_ms} ms ===\n")
+    print(f"{'Pool':>6} {'p50 ronda ms':>13} {'conexiones abiertas':>20}")
+    for pool in (int(n) for n in pools.split(',')):
+        p50, conexiones = medir(endpoint, pool, hilos, rondas)
+        print(f"{pool:>6} {p50:>13.1f} {conexiones:>20}")
+    servidor.shutdown()
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
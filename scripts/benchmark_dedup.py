@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Cobros encolados por el webhook cuando cámara y antena reportan el mismo cruce
+varias veces, sin supresión, con la memoria del contenedor sola y con memoria
+más la escritura condicional en DynamoDB (webhook/dedup.py).
+
+Genera 30 minutos de cruces en las 4 plazas. Cada cruce llega 1, 2 o 3 veces
+con hasta 8 s de diferencia, y algunos vehículos vuelven a pasar por la misma
+plaza 10 minutos después (cruce real que no se debe suprimir). Los requests se
+reparten al azar entre N contenedores con el lambda_handler real y tablas y SQS
+en memoria.
+
+Uso:
+    python scripts/benchmark_dedup.py [vehiculos=2000] [contenedores=4]
+"""
+import io
+import json
+import os
+import random
+import sys
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('USERS_TABLE', 'guatepass-users-bench')
+os.environ.setdefault('TAGS_TABLE', 'guatepass-tags-bench')
+os.environ.setdefault('PROCESSING_QUEUE_URL', 'https://sqs.us-east-1.amazonaws.com/000000000000/guatepass-bench')
+os.environ.pop('SNAPSHOT_BUCKET', None)
+os.environ.pop('ADMISSION_MAX_MESSAGES', None)
+os.environ.pop('DEDUP_WINDOW_SECONDS', None)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'webhook'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+import app as webhook_app
+from benchmark_webhook_lookups import Latencia, RecursoSimulado, TablaSimulada
+from botocore.exceptions import ClientError
+from dedup import CrossingSuppressor
+
+PEAJES = ['PEAJE_ZONA10', 'PEAJE_ZONA11', 'PEAJE_ZONA12', 'PEAJE_ZONA13']
+VENTANA = 60
+
+class ContadoresSimulados:
+    """update_item/delete_item con la condición que usa CrossingSuppressor"""
+    def __init__(self):
+        self.items = {}
+        self.escrituras = 0
+
+    def update_item(self, Key, ExpressionAttributeValues, **kwargs):
+        self.escrituras += 1
+        valores = ExpressionAttributeValues
+        actual = self.items.get(Key['contador'])
+        if actual is not None and valores[':desde'] < actual < valores[':hasta']:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'duplicada'},
+                               'Item': {'aceptado': {'N': str(actual)}}}, 'UpdateItem')
+        self.items[Key['contador']] = valores[':leido']
+
+    def delete_item(self, Key, ExpressionAttributeValues, **kwargs):
+        self.escrituras += 1
+        if self.items.get(Key['contador']) == ExpressionAttributeValues[':leido']:
+            del self.items[Key['contador']]
+
+class SqsSimulado:
+    def __init__(self):
+        self.mensajes = []
+
+    def send_message(self, MessageBody, **kwargs):
+        self.mensajes.append(json.loads(MessageBody))
+        return {'MessageId': f"msg-{len(self.mensajes)}"}
+
+def generar(vehiculos, rng):
+    """(lecturas en orden de llegada, cruces reales)"""
+    inicio = datetime.now(timezone.utc) - timedelta(minutes=45)
+    lecturas, cruces = [], 0
+    for i in range(vehiculos):
+        placa = f"P-{i:05d}A"
+        peaje = rng.choice(PEAJES)
+        momentos = [rng.uniform(0, 1800)]
+        if rng.random() < 0.05:
+            # Vuelve a pasar por la misma plaza 10 minutos después
+            momentos.append(momentos[0] + 600)
+        for momento in momentos:
+            cruces += 1
+            for _ in range(rng.choices((1, 2, 3), weights=(0.5, 0.3, 0.2))[0]):
+                leido = momento + rng.uniform(0, 8)
+                # Llegada con hasta 2 s de retraso de red: puede llegar antes una lectura posterior
+                lecturas.append((leido + rng.uniform(0, 2), {
+                    'placa': placa, 'peaje_id': peaje,
+                    'timestamp': (inicio + timedelta(seconds=leido)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+                }))
+    lecturas.sort(key=lambda lectura: lectura[0])
+    return [body for _, body in lecturas], cruces
+
+def preparar(vehiculos):
+    usuarios = {f"P-{i:05d}A": {'placa': f"P-{i:05d}A", 'tipo_usuario': 'registrado', 'email': 'bench@guatepass.com',
+                                'metodo_pago': 'tarjeta_credito'} for i in range(vehiculos)}
+    lecturas = Latencia(0)
+    validator = webhook_app.validator
+    validator.users_table = TablaSimulada(os.environ['USERS_TABLE'], 'placa', usuarios, lecturas)
+    validator.tags_table = TablaSimulada(os.environ['TAGS_TABLE'], 'tag_id', {}, lecturas)
+    validator.dynamodb = RecursoSimulado([validator.users_table, validator.tags_table], lecturas)
+    validator.snapshot_loader = validator.plate_filter_loader = None
+    webhook_app.admission = None
+
+def correr(lecturas, contenedores, modo, rng):
+    sqs = webhook_app.sqs = SqsSimulado()
+    tabla = ContadoresSimulados() if modo == 'memoria + tabla' else None
+    supresores = [None] * contenedores if modo == 'sin supresión' else \
+        [CrossingSuppressor(VENTANA, table=tabla, metricas=webhook_app.metricas) for _ in range(contenedores)]
+    salida = io.StringIO()
+    for body in lecturas:
+        webhook_app.suppressor = rng.choice(supresores)
+        with redirect_stdout(salida):
+            webhook_app.lambda_handler({'body': json.dumps(body)}, None)
+    return sqs.mensajes, tabla, salida.getvalue()
+
+def suprimidas_por_plaza(salida):
+    totales = {}
+    for linea in salida.splitlines():
+        if linea.startswith('{"_aws"') and 'LecturasSuprimidas' in linea:
+            registro = json.loads(linea)
+            totales[registro['Plaza']] = totales.get(registro['Plaza'], 0) + registro['LecturasSuprimidas']
+    return totales
+
+def bytes_por_llave(llaves=100000):
+    supresor = CrossingSuppressor(VENTANA, max_entries=llaves)
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    for i in range(llaves):
+        supresor._remember(supresor._key(f"P-{i:06d}", 'PEAJE_ZONA10'), 1700000000000 + i)
+    despues = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (despues - antes) / llaves
+
+def main(vehiculos=2000, contenedores=4):
+    vehiculos, contenedores = int(vehiculos), int(contenedores)
+    rng = random.Random(11)
+    lecturas, cruces = generar(vehiculos, rng)
+    preparar(vehiculos)
+    print(f"=== {len(lecturas)} lecturas de {cruces} cruces reales ({vehiculos} vehículos), ventana {VENTANA} s ===\n")
+    print(f"{'Modo':<17} {'contenedores':>12} {'encolados':>10} {'cobros de más':>14} {'escrituras':>11}")
+    por_plaza = {}
+    for modo, n in (('sin supresión', 1), ('memoria', 1), ('memoria', contenedores),
+                    ('memoria + tabla', contenedores)):
+        mensajes, tabla, salida = correr(lecturas, n, modo, random.Random(3))
+        print(f"{modo:<17} {n:>12} {len(mensajes):>10} {len(mensajes) - cruces:>14} "
+              f"{tabla.escrituras if tabla else 0:>11}")
+        por_plaza = suprimidas_por_plaza(salida)
+    print(f"\nLecturasSuprimidas por plaza (memoria + tabla): {dict(sorted(por_plaza.items()))}")
+    por_llave = bytes_por_llave()
+    print(f"Memoria: {por_llave:.0f} bytes por llave en el OrderedDict "
+          f"(DEDUP_MAX_ENTRIES=100000 ≈ {por_llave * 100000 / 1024 / 1024:.0f} MB)")
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
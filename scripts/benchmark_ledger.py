@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Compara el diseño actual de saldo (reescribir saldo_disponible en el item del
+usuario) contra el ledger append-only para una sola cuenta con muchos débitos.
+
+DynamoDB limita cada partición a 1000 WCU/s y 3000 RCU/s, así que para una sola
+cuenta el throughput sostenible lo define la llave más cargada. El script
+ejecuta el código real de PaymentCalculator/BalanceLedger contra tablas en
+memoria, cuenta la capacidad consumida por llave de partición y deriva los
+débitos por segundo sostenibles en una cuenta.
+
+Los débitos llegan a una tasa ofrecida (reloj simulado) y se reparten entre
+varios contenedores del processor. Cada débito es una transacción condicionada
+al saldo (del usuario o del shard) junto con su marca de cobro en CountersTable
+(charge_marks.py), a 2 WCU por KB y por item.
+
+Uso:
+    python scripts/benchmark_ledger.py [debitos] [debitos_por_segundo] [contenedores] [shards]
+"""
+import contextlib
+import io
+import json
+import math
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'processor'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from balance_ledger import BalanceLedger
+from payment_calculator import PaymentCalculator
+
+WCU_POR_PARTICION = 1000
+RCU_POR_PARTICION = 3000
+PLACA = 'P-FLOTA1'
+MONTO = Decimal('22.50')
+SALDO_INICIAL = Decimal('100000000')
+
+class Reloj:
+    """Reloj simulado: avanza 1/tasa segundos por débito"""
+
+    def __init__(self):
+        self.ahora = time.time()
+
+    def __call__(self):
+        return self.ahora
+
+def tamano_item(item):
+    return len(json.dumps(item, default=str).encode('utf-8'))
+
+class ClienteEnMemoria:
+    """transact_write_items sobre las tablas en memoria: todas las condiciones o ninguna escritura"""
+
+    def __init__(self):
+        self.tablas = {}
+
+    def transact_write_items(self, TransactItems):
+        pendientes = []
+        for accion in TransactItems:
+            (tipo, datos), = accion.items()
+            tabla = self.tablas[datos['TableName']]
+            llave = datos.get('Key') or {k: datos['Item'][k] for k in tabla.llaves}
+            actual = tabla.items.get(tabla._llave(llave))
+            valores = datos.get('ExpressionAttributeValues', {})
+            if 'ConditionExpression' in datos and not cumple(datos['ConditionExpression'], actual or {}, valores):
+                razones = [{'Code': 'ConditionalCheckFailed' if a is accion else 'None'} for a in TransactItems]
+                raise ClientError({'Error': {'Code': 'TransactionCanceledException'}, 'CancellationReasons': razones},
+                                  'TransactWriteItems')
+            pendientes.append((tabla, tipo, datos, llave))
+        for tabla, tipo, datos, llave in pendientes:
+            if tipo == 'Put':
+                tabla._guardar(dict(datos['Item']))
+            elif tipo == 'Delete':
+                tabla._borrar(llave)
+            else:
+                tabla._actualizar(llave, datos['UpdateExpression'], datos.get('ExpressionAttributeValues', {}))
+            # Escritura transaccional: 2 WCU por KB
+            tabla.wcu[llave[tabla.hash_key]] += 2 * math.ceil(tamano_item(tabla.items.get(tabla._llave(llave), {})) / 1024)
+
+def cumple(condicion, item, valores):
+    """Condiciones simples: attribute_not_exists(x), x = :v, x >= :v unidas con OR"""
+    for parte in condicion.split(' OR '):
+        parte = parte.strip()
+        match = re.match(r'attribute_not_exists\((\w+)\)', parte)
+        if match:
+            if match.group(1) not in item:
+                return True
+            continue
+        atributo, operador, valor = parte.split()
+        if atributo in item and (item[atributo] == valores[valor] if operador == '=' else item[atributo] >= valores[valor]):
+            return True
+    return False
+
+class TablaEnMemoria:
+    """Tabla mínima que registra WCU/RCU consumidas por llave de partición"""
+
+    def __init__(self, name, cliente, hash_key, range_key=None):
+        self.name = name
+        self.meta = SimpleNamespace(client=cliente)
+        cliente.tablas[name] = self
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.llaves = [k for k in (hash_key, range_key) if k]
+        self.items = {}
+        self.por_hash = defaultdict(dict)
+        self.wcu = defaultdict(float)
+        self.rcu = defaultdict(float)
+
+    def _llave(self, key):
+        return (key[self.hash_key], key.get(self.range_key) if self.range_key else None)
+
+    def _guardar(self, item):
+        llave = self._llave(item)
+        self.items[llave] = item
+        self.por_hash[llave[0]][llave[1]] = item
+        return item
+
+    def _borrar(self, key):
+        llave = self._llave(key)
+        self.items.pop(llave, None)
+        self.por_hash[llave[0]].pop(llave[1], None)
+
+    def _actualizar(self, key, expresion, valores):
+        item = self.items.get(self._llave(key)) or self._guardar(dict(key))
+        for clausula, cuerpo in re.findall(r'(SET|ADD|REMOVE) (.*?)(?= (?:SET|ADD|REMOVE) |$)', expresion):
+            if clausula == 'REMOVE':
+                for atributo in cuerpo.split(', '):
+                    item.pop(atributo.strip(), None)
+            elif clausula == 'ADD':
+                atributo, valor = cuerpo.split()
+                item[atributo] = item.get(atributo, 0) + valores[valor]
+            else:
+                for asignacion in re.split(r', (?=\w+ =)', cuerpo):
+                    atributo, valor = [p.strip() for p in asignacion.split('=', 1)]
+                    match = re.match(r'if_not_exists\((\w+), (:\w+)\)(?: \+ (:\w+))?', valor)
+                    resta = re.match(r'(\w+) - (:\w+)$', valor)
+                    if match:
+                        actual = item.get(match.group(1), valores[match.group(2)])
+                        item[atributo] = actual + valores[match.group(3)] if match.group(3) else actual
+                    elif resta:
+                        item[atributo] = item[resta.group(1)] - valores[resta.group(2)]
+                    else:
+                        item[atributo] = valores[valor]
+        return item
+
+    def get_item(self, Key, ConsistentRead=False, **kwargs):
+        item = self.items.get(self._llave(Key))
+        costo = math.ceil(max(tamano_item(item or {}), 1) / 4096)
+        self.rcu[Key[self.hash_key]] += costo if ConsistentRead else costo / 2
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item):
+        self._guardar(dict(Item))
+        self.wcu[Item[self.hash_key]] += math.ceil(tamano_item(Item) / 1024)
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression=None, **kwargs):
+        if ConditionExpression and not cumple(ConditionExpression, self.items.get(self._llave(Key)) or {},
+                                              ExpressionAttributeValues):
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+        item = self._actualizar(Key, UpdateExpression, ExpressionAttributeValues)
+        self.wcu[Key[self.hash_key]] += math.ceil(tamano_item(item) / 1024)
+        return {'Attributes': dict(item)}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, ConsistentRead=False, IndexName=None, **kwargs):
+        valores = ExpressionAttributeValues
+        if IndexName:
+            # pendientes-index: items de saldo con 'pendiente'
+            items = [dict(i) for i in self.items.values() if i.get('pendiente') == valores[':si']]
+            self.rcu['pendientes-index'] += max(math.ceil(sum(tamano_item(i) for i in items) / 4096), 1) / 2
+            return {'Items': items}
+        hash_value = valores[':c']
+        items = sorted(
+            (dict(item) for r, item in self.por_hash[hash_value].items() if valores[':desde'] <= r <= valores[':hasta']),
+            key=lambda item: item[self.range_key]
+        )
+        costo = max(math.ceil(sum(tamano_item(i) for i in items) / 4096), 1)
+        self.rcu[hash_value] += costo if ConsistentRead else costo / 2
+        return {'Items': items}
+
+def crear_usuarios(cliente, extra=None):
+    users = TablaEnMemoria('users', cliente, 'placa')
+    users.put_item({'placa': PLACA, 'tipo_usuario': 'registrado', 'saldo_disponible': SALDO_INICIAL, **(extra or {})})
+    users.wcu.clear()
+    return users
+
+def ejecutar(nombre, debitos, tasa, calculadoras, users, tablas, reloj, compactar=None):
+    """Mismo patrón del processor por cruce: saldo antes, pago, saldo después"""
+    inicio = time.perf_counter()
+    siguiente_compactacion = reloj() + 60
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(debitos):
+            calculadora = calculadoras[i % len(calculadoras)]
+            calculadora.verificar_saldo_actual(PLACA, users)
+            assert calculadora.procesar_pago(PLACA, MONTO, 'registrado', users, f"{PLACA}#PEAJE_ZONA10#{i}")
+            calculadora.verificar_saldo_actual(PLACA, users)
+            reloj.ahora += 1 / tasa
+            if compactar and reloj() >= siguiente_compactacion:
+                compactar()
+                siguiente_compactacion += 60
+    duracion = time.perf_counter() - inicio
+
+    wcu = defaultdict(float)
+    rcu = defaultdict(float)
+    for tabla in tablas:
+        for llave, valor in tabla.wcu.items():
+            wcu[llave] += valor
+        for llave, valor in tabla.rcu.items():
+            rcu[llave] += valor
+
+    wcu_max = max(wcu.values()) / debitos
+    rcu_max = max(rcu.values()) / debitos
+    sostenible = min(WCU_POR_PARTICION / wcu_max, RCU_POR_PARTICION / rcu_max)
+    limitante = 'escrituras' if WCU_POR_PARTICION / wcu_max <= RCU_POR_PARTICION / rcu_max else 'lecturas'
+
+    print(f"{nombre:<26} {len(wcu):>7} {wcu_max:>12.3f} {rcu_max:>12.3f} {sostenible:>14.0f} {limitante:>11} "
+          f"{duracion / debitos * 1e6:>10.1f}")
+
+def main(debitos=250000, tasa=2000, contenedores=4, shards=4):
+    print(f"{debitos} débitos de Q{MONTO} sobre una sola cuenta, {tasa} débitos/s ofrecidos, "
+          f"{contenedores} contenedores\n")
+    print(f"{'diseño':<26} {'llaves':>7} {'WCU/déb hot':>12} {'RCU/déb hot':>12} {'débitos/s máx':>14} "
+          f"{'limitante':>11} {'µs/déb loc':>10}")
+
+    # Diseño actual: cada débito reescribe saldo_disponible del usuario (con su marca de cobro)
+    reloj = Reloj()
+    cliente = ClienteEnMemoria()
+    users = crear_usuarios(cliente)
+    counters = TablaEnMemoria('counters', cliente, 'contador')
+    calculadoras = [PaymentCalculator(counters_table=counters) for _ in range(contenedores)]
+    ejecutar('actual (item de usuario)', debitos, tasa, calculadoras, users, [users, counters], reloj)
+    with contextlib.redirect_stdout(io.StringIO()):
+        saldo_final = PaymentCalculator().verificar_saldo_actual(PLACA, users)
+    print(f"{'':<26} saldo final {saldo_final} (esperado {SALDO_INICIAL - MONTO * debitos})")
+
+    # Ledger append-only con compactación cada minuto
+    reloj = Reloj()
+    cliente = ClienteEnMemoria()
+    users = crear_usuarios(cliente, {'modo_saldo': 'ledger'})
+    ledger_table = TablaEnMemoria('ledger', cliente, 'cuenta', 'entrada')
+    counters = TablaEnMemoria('counters', cliente, 'contador')
+    ledgers = [BalanceLedger(ledger_table, shards=shards, reloj=reloj) for _ in range(contenedores)]
+    compactador = BalanceLedger(ledger_table, shards=shards, reloj=reloj)
+
+    def compactar():
+        corte = datetime.fromtimestamp(reloj() - 5, timezone.utc).isoformat()
+        compactador.compactar(users, PLACA, corte)
+
+    ejecutar(f'ledger ({shards} shards)', debitos, tasa, [PaymentCalculator(l, counters) for l in ledgers],
+             users, [users, ledger_table, counters], reloj, compactar)
+
+    reloj.ahora += 10
+    verificador = PaymentCalculator(BalanceLedger(ledger_table, shards=shards, reloj=reloj))
+    with contextlib.redirect_stdout(io.StringIO()):
+        saldo_final = verificador.verificar_saldo_actual(PLACA, users)
+    assert saldo_final == SALDO_INICIAL - MONTO * debitos, f"Saldo incorrecto en el ledger: {saldo_final}"
+    print(f"{'':<26} saldo final {saldo_final} (exacto)")
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:5]])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Lotes de SQS en processor/app.py con la pasarela simulada sana, lenta o caída,
+con y sin circuit breaker.
+
+Corre el lambda_handler real con tablas y SNS en memoria (sin latencia) y la
+PasarelaSimulada de payment_gateway.py con la configuración del template
+(timeout 2 s, 3 intentos, plazo 5 s). Por escenario reporta el tiempo de cada
+lote, los cobros diferidos (batchItemFailures), las llamadas a la pasarela y el
+p50/p99 de LatenciaAutorizacion leído de las líneas EMF que imprime el handler.
+
+Uso:
+    python scripts/benchmark_payment_gateway.py [lotes=5] [registros=10]
+"""
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from decimal import Decimal
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+for variable in ('USERS_TABLE', 'TRANSACTIONS_TABLE', 'TAGS_TABLE'):
+    os.environ.setdefault(variable, f"guatepass-{variable.lower()}-bench")
+os.environ.setdefault('NOTIFICATIONS_TOPIC_ARN', 'arn:aws:sns:us-east-1:000000000000:guatepass-bench')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'processor'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+import app as processor_app
+from account_summary import AccountSummary
+from payment_gateway import CircuitBreaker, ClientePasarela, PasarelaSimulada
+from plaza_traffic import PlazaTraffic
+
+ESCENARIOS = (
+    # nombre, latencia_ms, tasa_error, umbral del circuito
+    ('sana', 120, 0.01, 5),
+    ('lenta (3 s)', 3000, 0.0, 5),
+    ('caída (503)', 120, 1.0, 5),
+    ('lenta sin circuito', 3000, 0.0, 10 ** 9),
+    ('caída sin circuito', 120, 1.0, 10 ** 9),
+)
+
+class TablaSimulada:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def get_item(self, Key, **kwargs):
+        placa = Key.get('placa')
+        if not placa:
+            return {}
+        return {'Item': {'placa': placa, 'saldo_disponible': Decimal('100000'), 'email': 'bench@guatepass.com'}}
+
+    def put_item(self, **kwargs):
+        return {}
+
+    def update_item(self, **kwargs):
+        return {'Attributes': {}}
+
+    def query(self, **kwargs):
+        return {'Items': []}
+
+class SnsSimulado:
+    def publish(self, **kwargs):
+        return {'MessageId': 'bench'}
+
+class PasarelaContada(PasarelaSimulada):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.llamadas = 0
+
+    def autorizar(self, solicitud, timeout):
+        with self._lock:
+            self.llamadas += 1
+        return super().autorizar(solicitud, timeout)
+
+def lote(numero, registros):
+    records = []
+    for i in range(registros):
+        placa = f"P-{i:03d}ABC"
+        data = {'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': f"2025-01-20T10:{numero:02d}:{i:02d}Z",
+                'user_type': 'registrado', 'has_tag': False, 'metodo_pago': 'tarjeta_credito',
+                'user_email': 'bench@guatepass.com', 'user_phone': None}
+        records.append({'messageId': f"msg-{numero}-{i}", 'body': json.dumps(data), 'attributes': {}})
+    return records
+
+def preparar(latencia_ms, tasa_error, umbral):
+    tabla = TablaSimulada()
+    processor_app.users_table = processor_app.transactions_table = processor_app.tags_table = tabla
+    processor_app.counters_table = tabla
+    processor_app.account_summary = AccountSummary(tabla)
+    processor_app.plaza_traffic = PlazaTraffic(tabla)
+    processor_app.payment_calculator.ledger = None
+    processor_app.sns = SnsSimulado()
+    pasarela = PasarelaContada(latencia_ms=latencia_ms, sigma=0.3, tasa_rechazo=0.02, tasa_error=tasa_error)
+    processor_app.pasarela_pago = ClientePasarela(pasarela, CircuitBreaker(umbral=umbral, enfriamiento=30),
+                                                  timeout=2.0, max_intentos=3, plazo=5.0,
+                                                  metricas=processor_app.metricas)
+    return pasarela
+
+def latencias_emf(salida):
+    valores = []
+    for linea in salida.splitlines():
+        if linea.startswith('{"_aws"'):
+            valor = json.loads(linea).get('LatenciaAutorizacion', [])
+            valores.extend(valor if isinstance(valor, list) else [valor])
+    return sorted(valores)
+
+def main(lotes=5, registros=10):
+    lotes, registros = int(lotes), int(registros)
+    print(f"=== {lotes} lotes de {registros} cruces (placas distintas), timeout 2 s, 3 intentos, plazo 5 s ===\n")
+    print(f"{'Pasarela':<20} {'lote 1 ms':>10} {'lotes 2+ ms':>12} {'diferidos':>10} {'llamadas':>9} "
+          f"{'aut p50':>8} {'aut p99':>8}")
+    for nombre, latencia_ms, tasa_error, umbral in ESCENARIOS:
+        pasarela = preparar(latencia_ms, tasa_error, umbral)
+        tiempos, diferidos, salida = [], 0, io.StringIO()
+        for numero in range(lotes):
+            inicio = time.perf_counter()
+            with redirect_stdout(salida):
+                respuesta = processor_app.lambda_handler({'Records': lote(numero, registros)}, None)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            diferidos += len(respuesta['batchItemFailures'])
+        latencias = latencias_emf(salida.getvalue())
+        p50 = statistics.median(latencias) if latencias else 0
+        p99 = latencias[int(len(latencias) * 0.99) - 1] if latencias else 0
+        resto = statistics.median(tiempos[1:]) if len(tiempos) > 1 else 0
+        print(f"{nombre:<20} {tiempos[0]:>10.0f} {resto:>12.0f} {diferidos:>7}/{lotes * registros:<3} "
+              f"{pasarela.llamadas:>8} {p50:>8.0f} {p99:>8.0f}")
+    print("\naut p50/p99: LatenciaAutorizacion (ms por intento) de las líneas EMF del handler.")
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tiempo de pared de un lote de SQS en processor/app.py según PROCESSOR_CONCURRENCY.
+
+Corre el lambda_handler real con tablas y SNS en memoria que simulan la latencia
+de cada llamada (usuarios, transacciones, versión, resumen, tráfico, pasarela
+de pago y publish).
+Los registros se reparten entre varias placas; al final verifica que los cruces
+de cada placa se guardaron en el orden del lote.
+
+Uso:
+    python scripts/benchmark_processor_concurrency.py [registros=10] [placas=10] [latencia_ms=8] [niveles=1,2,4,8,16]
+"""
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from decimal import Decimal
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+for variable in ('USERS_TABLE', 'TRANSACTIONS_TABLE', 'TAGS_TABLE'):
+    os.environ.setdefault(variable, f"guatepass-{variable.lower()}-bench")
+os.environ.setdefault('NOTIFICATIONS_TOPIC_ARN', 'arn:aws:sns:us-east-1:000000000000:guatepass-bench')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'processor'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+import app as processor_app
+from account_summary import AccountSummary
+from payment_gateway import CircuitBreaker, ClientePasarela, PasarelaSimulada
+from plaza_traffic import PlazaTraffic
+
+REPETICIONES = 5
+
+class TablaSimulada:
+    """Cada llamada duerme la latencia; get_item devuelve el usuario con saldo de sobra"""
+    def __init__(self, latencia):
+        self.latencia = latencia
+        self.llamadas = 0
+        self.guardadas = []
+        self._lock = threading.Lock()
+
+    def _llamada(self):
+        with self._lock:
+            self.llamadas += 1
+        time.sleep(self.latencia)
+
+    def get_item(self, Key, **kwargs):
+        self._llamada()
+        placa = Key.get('placa')
+        if not placa:
+            return {}
+        return {'Item': {'placa': placa, 'saldo_disponible': Decimal('100000'), 'email': 'bench@guatepass.com',
+                         'telefono': '50200000000'}}
+
+    def put_item(self, Item, **kwargs):
+        self._llamada()
+        with self._lock:
+            self.guardadas.append((Item['placa'], Item['timestamp']))
+        return {}
+
+    def update_item(self, **kwargs):
+        self._llamada()
+        return {'Attributes': {}}
+
+    def query(self, **kwargs):
+        self._llamada()
+        return {'Items': []}
+
+class SnsSimulado:
+    def __init__(self, latencia):
+        self.latencia = latencia
+
+    def publish(self, **kwargs):
+        time.sleep(self.latencia)
+        return {'MessageId': 'bench'}
+
+def lote(registros, placas):
+    records = []
+    for i in range(registros):
+        placa = f"P-{i % placas:03d}ABC"
+        data = {'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': f"2025-01-20T10:{i // 60:02d}:{i % 60:02d}Z",
+                'user_type': 'registrado', 'has_tag': False, 'metodo_pago': 'tarjeta_credito',
+                'user_email': 'bench@guatepass.com', 'user_phone': '50200000000'}
+        records.append({'messageId': f"msg-{i}", 'body': json.dumps(data), 'attributes': {'MessageGroupId': placa}})
+    return records
+
+def preparar(latencia):
+    tabla = TablaSimulada(latencia)
+    processor_app.users_table = processor_app.transactions_table = processor_app.tags_table = tabla
+    processor_app.counters_table = tabla
+    processor_app.account_summary = AccountSummary(tabla)
+    processor_app.plaza_traffic = PlazaTraffic(tabla)
+    processor_app.payment_calculator.ledger = None
+    processor_app.sns = SnsSimulado(latencia)
+    # Pasarela con la misma latencia fija y sin rechazos ni errores
+    pasarela = PasarelaSimulada(latencia_ms=latencia * 1000, sigma=0, tasa_rechazo=0, tasa_error=0)
+    processor_app.pasarela_pago = ClientePasarela(pasarela, CircuitBreaker())
+    return tabla
+
+def en_orden(guardadas, records):
+    """Los cruces de cada placa se guardaron en el orden en que llegaron en el lote"""
+    esperado, real = {}, {}
+    for record in records:
+        data = json.loads(record['body'])
+        esperado.setdefault(data['placa'], []).append(data['timestamp'])
+    for placa, timestamp in guardadas:
+        real.setdefault(placa, []).append(timestamp)
+    return esperado == real
+
+def medir(records, latencia, concurrencia):
+    processor_app.PROCESSOR_CONCURRENCY = concurrencia
+    tiempos, ordenado = [], True
+    for _ in range(REPETICIONES):
+        tabla = preparar(latencia)
+        inicio = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            respuesta = processor_app.lambda_handler({'Records': records}, None)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert not respuesta['batchItemFailures'], respuesta
+        ordenado = ordenado and en_orden(tabla.guardadas, records)
+    return statistics.median(tiempos), tabla.llamadas, ordenado
+
+def main(registros=10, placas=10, latencia_ms=8, niveles='1,2,4,8,16'):
+    registros, placas, latencia = int(registros), int(placas), float(latencia_ms) / 1000
+    records = lote(registros, placas)
+    print(f"=== Lote de {registros} registros, {placas} placas, latencia {latencia_ms} ms por llamada ===\n")
+    print(f"{'Concurrencia':>12} {'p50 lote ms':>12} {'ms/registro':>12} {'speedup':>8} {'orden por placa':>16}")
+    base = None
+    for concurrencia in (int(n) for n in niveles.split(',')):
+        p50, llamadas, ordenado = medir(records, latencia, concurrencia)
+        base = base or p50
+        print(f"{concurrencia:>12} {p50:>12.1f} {p50 / registros:>12.2f} {base / p50:>7.1f}x "
+              f"{'ok' if ordenado else 'ROTO':>16}")
+    print(f"\nLlamadas a DynamoDB por lote: {llamadas} (+{registros} autorizaciones y {registros} publish a SNS)")
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Compara llamadas a DynamoDB y latencia por ruta de /users/{placa}/tag entre
+tags/app.py y una versión anterior del handler (por ejemplo la de antes de
+TransactWriteItems, sacada con git show). Corre los handlers en proceso con
+tablas en memoria que simulan la latencia de cada llamada.
+
+También lanza dos POST simultáneos con el mismo tag_id para placas distintas:
+sin condiciones ambos pasan la lectura previa y el tag queda asociado a dos
+usuarios. Al final mide POST /tags/bulk con una flotilla (asociar y después
+desactivar sin tag_id); una transacción de 100 items se simula con el doble de
+latencia que una llamada simple.
+
+Uso:
+    git show <commit>:src/functions/tags/app.py > /tmp/tags_app_anterior.py
+    python scripts/benchmark_tags.py [app_anterior.py] [latencia_ms=8] [repeticiones=50] [flotilla=1000]
+"""
+import importlib.util
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('USERS_TABLE', 'guatepass-users-bench')
+os.environ.setdefault('TAGS_TABLE', 'guatepass-tags-bench')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'tags'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+APP_ACTUAL = os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'tags', 'app.py')
+PLACA = 'P-123ABC'
+TAG = 'TAG-001'
+
+class TablaSimulada:
+    """get_item, put_item, update_item (SET/REMOVE y condiciones simples) y query de un índice por igualdad"""
+    def __init__(self, name, llave, contador):
+        self.name = name
+        self.llave = llave
+        self.contador = contador
+        self.items = {}
+
+    def _condicion_cumple(self, item, expresion, valores):
+        if not expresion:
+            return True
+        match = re.fullmatch(r'attribute_(not_)?exists\((\w+)\)', expresion)
+        if match:
+            existe = item is not None and match.group(2) in item
+            return not existe if match.group(1) else existe
+        campo, valor = [parte.strip() for parte in expresion.split('=')]
+        return item is not None and item.get(campo) == valores[valor]
+
+    def _aplicar_update(self, key, expresion, valores):
+        item = dict(self.items.get(key[self.llave], key))
+        for accion, cuerpo in re.findall(r'(SET|REMOVE)\s+(.*?)(?=\s+(?:SET|REMOVE)\s|$)', expresion):
+            for parte in cuerpo.split(','):
+                if accion == 'SET':
+                    campo, valor = [p.strip() for p in parte.split('=')]
+                    item[campo] = valores[valor]
+                else:
+                    item.pop(parte.strip(), None)
+        return item
+
+    def verificar(self, operacion):
+        """Código de cancelación de la operación dentro de una transacción"""
+        key = operacion.get('Key') or {self.llave: operacion['Item'][self.llave]}
+        item = self.items.get(key[self.llave])
+        cumple = self._condicion_cumple(item, operacion.get('ConditionExpression'),
+                                        operacion.get('ExpressionAttributeValues', {}))
+        return 'None' if cumple else 'ConditionalCheckFailed'
+
+    def aplicar(self, tipo, operacion):
+        if tipo == 'Put':
+            self.items[operacion['Item'][self.llave]] = dict(operacion['Item'])
+        else:
+            key = operacion['Key']
+            self.items[key[self.llave]] = self._aplicar_update(
+                key, operacion['UpdateExpression'], operacion.get('ExpressionAttributeValues', {}))
+
+    def get_item(self, Key, **kwargs):
+        self.contador.llamada()
+        item = self.items.get(Key[self.llave])
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item, **kwargs):
+        self.contador.llamada()
+        with self.contador.lock:
+            self.aplicar('Put', {'Item': Item})
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ConditionExpression=None,
+                    ReturnValues=None, **kwargs):
+        self.contador.llamada()
+        with self.contador.lock:
+            if not self._condicion_cumple(self.items.get(Key[self.llave]), ConditionExpression,
+                                          ExpressionAttributeValues or {}):
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+            self.aplicar('Update', {'Key': Key, 'UpdateExpression': UpdateExpression,
+                                    'ExpressionAttributeValues': ExpressionAttributeValues})
+        item = self.items[Key[self.llave]]
+        return {'Attributes': dict(item)} if ReturnValues == 'ALL_NEW' else {}
+
+    def query(self, KeyConditionExpression, **kwargs):
+        self.contador.llamada()
+        condicion, valor = KeyConditionExpression.get_expression()['values']
+        campo = condicion.name
+        return {'Items': [dict(item) for item in self.items.values() if item.get(campo) == valor]}
+
+class ContadorLlamadas:
+    def __init__(self, latencia):
+        self.latencia = latencia
+        self.llamadas = 0
+        self.lock = threading.Lock()
+
+    def llamada(self, factor=1.0):
+        with self.lock:
+            self.llamadas += 1
+        time.sleep(self.latencia * factor)
+
+class ClienteSimulado:
+    """transact_write_items sobre las tablas simuladas: todas las condiciones o ninguna escritura"""
+    def __init__(self, tablas, contador):
+        self.tablas = {tabla.name: tabla for tabla in tablas}
+        self.contador = contador
+
+    def transact_write_items(self, TransactItems):
+        self.contador.llamada(1 + len(TransactItems) / 100)
+        with self.contador.lock:
+            operaciones = [(tipo, operacion) for item in TransactItems for tipo, operacion in item.items()]
+            razones = [self.tablas[op['TableName']].verificar(op) for _, op in operaciones]
+            if any(razon != 'None' for razon in razones):
+                raise ClientError({'Error': {'Code': 'TransactionCanceledException'},
+                                   'CancellationReasons': [{'Code': razon} for razon in razones]},
+                                  'TransactWriteItems')
+            for tipo, operacion in operaciones:
+                self.tablas[operacion['TableName']].aplicar(tipo, operacion)
+        return {}
+
+class RecursoSimulado:
+    def __init__(self, cliente):
+        self.meta = type('Meta', (), {'client': cliente})()
+
+    def batch_get_item(self, RequestItems):
+        self.meta.client.contador.llamada()
+        respuestas = {}
+        for nombre, pedido in RequestItems.items():
+            tabla = self.meta.client.tablas[nombre]
+            respuestas[nombre] = [dict(tabla.items[key[tabla.llave]]) for key in pedido['Keys']
+                                  if key[tabla.llave] in tabla.items]
+        return {'Responses': respuestas}
+
+def cargar_app(ruta, nombre):
+    spec = importlib.util.spec_from_file_location(nombre, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def preparar(app, latencia, con_tag=True, placas=(PLACA,)):
+    contador = ContadorLlamadas(latencia)
+    app.users_table = TablaSimulada(os.environ['USERS_TABLE'], 'placa', contador)
+    app.tags_table = TablaSimulada(os.environ['TAGS_TABLE'], 'tag_id', contador)
+    app.dynamodb = RecursoSimulado(ClienteSimulado([app.users_table, app.tags_table], contador))
+    for placa in placas:
+        app.users_table.items[placa] = {'placa': placa, 'nombre': 'Juan Pérez', 'tiene_tag': con_tag,
+                                        **({'tag_id': TAG} if con_tag else {})}
+    if con_tag:
+        app.tags_table.items[TAG] = {'tag_id': TAG, 'placa': PLACA, 'estado': 'activo',
+                                     'metodo_pago': 'tarjeta_credito', 'configuracion': {'notificaciones': True}}
+    return contador
+
+def evento(metodo, placa=PLACA, body=None):
+    return {'httpMethod': metodo, 'path': f"/users/{placa}/tag", 'pathParameters': {'placa': placa},
+            'body': json.dumps(body or {})}
+
+RUTAS = (
+    ('POST', False, {'tag_id': TAG, 'metodo_pago': 'tarjeta_credito'}),
+    ('GET', True, None),
+    ('PUT', True, {'configuracion': {'notificaciones': False}}),
+    ('PUT tag_id', True, {'tag_id': TAG, 'configuracion': {'notificaciones': False}}),
+    ('DELETE', True, {'razon': 'Cambio de vehiculo'}),
+)
+
+def medir_rutas(app, latencia, repeticiones):
+    resultados = {}
+    for ruta, con_tag, body in RUTAS:
+        metodo = ruta.split()[0]
+        tiempos, llamadas = [], 0
+        for _ in range(repeticiones):
+            contador = preparar(app, latencia, con_tag)
+            inicio = time.perf_counter()
+            respuesta = app.lambda_handler(evento(metodo, body=body), None)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            assert respuesta['statusCode'] == 200, respuesta
+            llamadas += contador.llamadas
+        resultados[ruta] = (llamadas / repeticiones, statistics.median(tiempos))
+    return resultados
+
+def asociaciones_simultaneas(app, latencia, intentos=20):
+    """Dos placas piden el mismo tag a la vez; cuenta las veces que ambas quedaron con el tag"""
+    duplicados = 0
+    for _ in range(intentos):
+        preparar(app, latencia, con_tag=False, placas=(PLACA, 'P-456DEF'))
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            respuestas = list(executor.map(
+                lambda placa: app.lambda_handler(evento('POST', placa, {'tag_id': TAG}), None), (PLACA, 'P-456DEF')))
+        if all(respuesta['statusCode'] == 200 for respuesta in respuestas):
+            duplicados += 1
+    return duplicados
+
+def lote_flotilla(app, latencia, flotilla):
+    """POST /tags/bulk: asociar un tag a cada placa (1% de tags ya en uso) y luego desactivarlos"""
+    placas = [f"P-{i:06d}" for i in range(flotilla)]
+    contador = preparar(app, latencia, con_tag=False, placas=placas)
+    for i in range(0, flotilla, 100):
+        app.tags_table.items[f"TAG-F{i:06d}"] = {'tag_id': f"TAG-F{i:06d}", 'estado': 'inactivo'}
+    medidas = {}
+    for operacion, extra in (('asociar', lambda i: {'tag_id': f"TAG-F{i:06d}"}), ('desactivar', lambda i: {})):
+        body = {'operaciones': [{'operacion': operacion, 'placa': placa, **extra(i)} for i, placa in enumerate(placas)]}
+        contador.llamadas = 0
+        inicio = time.perf_counter()
+        respuesta = app.lambda_handler({'resource': '/tags/bulk', 'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+        datos = json.loads(respuesta['body'])
+        medidas[operacion] = ((time.perf_counter() - inicio) * 1000, contador.llamadas, datos['aplicadas'],
+                              datos['rechazadas'])
+    return medidas
+
+def main(app_anterior=None, latencia_ms=8, repeticiones=50, flotilla=1000):
+    latencia = float(latencia_ms) / 1000
+    repeticiones = int(repeticiones)
+    flotilla = int(flotilla)
+    versiones = [('actual', cargar_app(APP_ACTUAL, 'tags_app_actual'))]
+    if app_anterior:
+        versiones.insert(0, ('anterior', cargar_app(app_anterior, 'tags_app_anterior')))
+
+    # Los prints del handler no cuentan en la medición
+    salida, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        resultados = {nombre: medir_rutas(app, latencia, repeticiones) for nombre, app in versiones}
+        carreras = {nombre: asociaciones_simultaneas(app, latencia) for nombre, app in versiones}
+        lote = lote_flotilla(versiones[-1][1], latencia, flotilla)
+    finally:
+        sys.stdout.close()
+        sys.stdout = salida
+
+    print(f"=== /users/{{placa}}/tag: latencia DynamoDB {latencia_ms} ms, {repeticiones} repeticiones ===\n")
+    print(f"{'Ruta':<12} " + ' '.join(f"{nombre + ' llamadas':>18} {nombre + ' p50 ms':>16}" for nombre, _ in versiones))
+    for ruta, _, _ in RUTAS:
+        print(f"{ruta:<12} " + ' '.join(f"{resultados[nombre][ruta][0]:>18.1f} {resultados[nombre][ruta][1]:>16.2f}"
+                                        for nombre, _ in versiones))
+    print("\nPOST simultáneos del mismo tag para dos placas (20 intentos):")
+    for nombre, _ in versiones:
+        print(f"  {nombre}: {carreras[nombre]} veces quedó el tag asociado a ambas placas")
+
+    print(f"\nPOST /tags/bulk con {flotilla} placas (BULK_WORKERS={versiones[-1][1].BULK_WORKERS}):")
+    for operacion, (ms, llamadas, aplicadas, rechazadas) in lote.items():
+        individual = resultados[versiones[0][0]]['POST' if operacion == 'asociar' else 'DELETE']
+        print(f"  {operacion:<10} {ms:>8.1f} ms, {llamadas} llamadas, {aplicadas} aplicadas, {rechazadas} rechazadas "
+              f"(una por una con {versiones[0][0]}: {individual[1] * flotilla:.0f} ms, "
+              f"{individual[0] * flotilla:.0f} llamadas)")
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
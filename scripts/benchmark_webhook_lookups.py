@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+p50/p99 de POST /webhook/toll con latencia inyectada en DynamoDB y SQS, entre
+webhook/app.py y una versión anterior del handler (lecturas de tag y usuario
+una detrás de otra). Cada llamada simulada tarda latencia_ms con variación
+log-normal, así el p99 refleja las colas de varias lecturas en serie.
+
+Uso:
+    git show <commit>:src/functions/webhook/app.py > /tmp/webhook_app_anterior.py
+    python scripts/benchmark_webhook_lookups.py [app_anterior.py] [latencia_ms=8] [requests=300]
+"""
+import importlib.util
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('USERS_TABLE', 'guatepass-users-bench')
+os.environ.setdefault('TAGS_TABLE', 'guatepass-tags-bench')
+os.environ.setdefault('PROCESSING_QUEUE_URL', 'https://sqs.us-east-1.amazonaws.com/000000000000/guatepass-bench')
+# Sin snapshot ni filtro de Bloom: todas las lecturas van a DynamoDB
+os.environ.pop('SNAPSHOT_BUCKET', None)
+
+WEBHOOK_DIR = os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'webhook')
+sys.path.insert(0, WEBHOOK_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+
+USUARIOS = {
+    'P-123ABC': {'placa': 'P-123ABC', 'tipo_usuario': 'registrado', 'email': 'juan@email.com',
+                 'telefono': '50212345678', 'tiene_tag': False, 'metodo_pago': 'tarjeta_credito'},
+    'P-456DEF': {'placa': 'P-456DEF', 'tipo_usuario': 'registrado', 'email': 'maria@email.com',
+                 'telefono': '50298765432', 'tiene_tag': True, 'tag_id': 'TAG-001', 'metodo_pago': 'tarjeta_debito'}
+}
+TAGS = {'TAG-001': {'tag_id': 'TAG-001', 'placa': 'P-456DEF', 'estado': 'activo', 'metodo_pago': 'tarjeta_debito'}}
+
+CASOS = (
+    ('solo placa', {'placa': 'P-123ABC'}),
+    ('placa + tag', {'placa': 'P-456DEF', 'tag_id': 'TAG-001'}),
+    ('solo tag', {'tag_id': 'TAG-001'}),
+    ('placa no registrada', {'placa': 'P-000XXX'}),
+)
+
+class Latencia:
+    def __init__(self, latencia, seed=5):
+        self.latencia = latencia
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.llamadas = 0
+
+    def esperar(self):
+        with self.lock:
+            self.llamadas += 1
+            demora = self.latencia * self.rng.lognormvariate(0, 0.5)
+        time.sleep(demora)
+
+class TablaSimulada:
+    def __init__(self, name, llave, items, latencia):
+        self.name = name
+        self.llave = llave
+        self.items = items
+        self.latencia = latencia
+
+    def get_item(self, Key, **kwargs):
+        self.latencia.esperar()
+        item = self.items.get(Key[self.llave])
+        return {'Item': dict(item)} if item else {}
+
+class RecursoSimulado:
+    def __init__(self, tablas, latencia):
+        self.tablas = {tabla.name: tabla for tabla in tablas}
+        self.latencia = latencia
+
+    def batch_get_item(self, RequestItems):
+        self.latencia.esperar()
+        respuestas = {}
+        for nombre, pedido in RequestItems.items():
+            tabla = self.tablas[nombre]
+            respuestas[nombre] = [dict(tabla.items[key[tabla.llave]]) for key in pedido['Keys']
+                                  if key[tabla.llave] in tabla.items]
+        return {'Responses': respuestas}
+
+class SqsSimulado:
+    def __init__(self, latencia):
+        self.latencia = latencia
+
+    def send_message(self, **kwargs):
+        self.latencia.esperar()
+        return {'MessageId': 'bench'}
+
+def cargar_app(ruta, nombre):
+    spec = importlib.util.spec_from_file_location(nombre, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def preparar(app, latencia_dynamo, latencia_sqs):
+    validator = app.validator
+    validator.users_table = TablaSimulada(os.environ['USERS_TABLE'], 'placa', USUARIOS, latencia_dynamo)
+    validator.tags_table = TablaSimulada(os.environ['TAGS_TABLE'], 'tag_id', TAGS, latencia_dynamo)
+    validator.dynamodb = RecursoSimulado([validator.users_table, validator.tags_table], latencia_dynamo)
+    validator.snapshot_loader = validator.plate_filter_loader = None
+    app.sqs = SqsSimulado(latencia_sqs)
+
+def medir(app, latencia, requests):
+    resultados = {}
+    for nombre, campos in CASOS:
+        latencia_dynamo, latencia_sqs = Latencia(latencia), Latencia(latencia, seed=7)
+        preparar(app, latencia_dynamo, latencia_sqs)
+        tiempos, estados = [], set()
+        for _ in range(requests):
+            body = {**campos, 'peaje_id': 'PEAJE_ZONA10',
+                    'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}
+            inicio = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                respuesta = app.lambda_handler({'body': json.dumps(body)}, None)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            estados.add(respuesta['statusCode'])
+        tiempos.sort()
+        resultados[nombre] = (latencia_dynamo.llamadas / requests, statistics.median(tiempos),
+                              tiempos[int(len(tiempos) * 0.99) - 1], estados)
+    return resultados
+
+def main(app_anterior=None, latencia_ms=8, requests=300):
+    latencia, requests = float(latencia_ms) / 1000, int(requests)
+    versiones = [('actual', cargar_app(os.path.join(WEBHOOK_DIR, 'app.py'), 'webhook_app_actual'))]
+    if app_anterior:
+        versiones.insert(0, ('anterior', cargar_app(app_anterior, 'webhook_app_anterior')))
+    resultados = {nombre: medir(app, latencia, requests) for nombre, app in versiones}
+
+    print(f"=== POST /webhook/toll: {requests} requests por caso, latencia {latencia_ms} ms "
+          f"(log-normal) en DynamoDB y SQS ===\n")
+    print(f"{'Caso':<21} {'versión':<9} {'lecturas':>9} {'p50 ms':>8} {'p99 ms':>8} {'HTTP':>6}")
+    for caso, _ in CASOS:
+        for nombre, _ in versiones:
+            lecturas, p50, p99, estados = resultados[nombre][caso]
+            print(f"{caso:<21} {nombre:<9} {lecturas:>9.1f} {p50:>8.2f} {p99:>8.2f} "
+                  f"{','.join(str(e) for e in sorted(estados)):>6}")
+    print("\nLas lecturas son llamadas a DynamoDB por request; cada request hace además un send_message a SQS.")
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 import boto3
 import json
+import os
+import sys
 from decimal import Decimal
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from transaction_schema import leer_transaccion
+
 def check_transactions():
     dynamodb = boto3.resource('dynamodb')
     
@@ -27,7 +32,7 @@ def check_transactions():
     
     try:
         response = transactions_table.scan()
-        transactions = response.get('Items', [])
+        transactions = [leer_transaccion(tx) for tx in response.get('Items', [])]
         
         print(f"\n TRANSACCIONES REGISTRADAS: {len(transactions)}")
         
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Corre localmente la consolidación de estados de cuenta mensuales sobre un mes
+sintético de tráfico no registrado, con el mismo código de la Lambda
+(particionar -> consolidar_shard), en varios procesos.
+
+Uso:
+    python scripts/consolidate_statements.py [cruces] [placas] [segmentos] [shards] [workers]
+"""
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'invoices'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from statements import MULTA_TARDIA, consolidar_shard, particionar, rutas_por_shard
+
+PERIODO = '2025-10'
+# Tarifa con recargo, sin multa: con CONSOLIDATED_STATEMENTS el processor no la cobra por cruce
+PEAJES = {'PEAJE_ZONA10': '37.50', 'PEAJE_ZONA11': '45.00', 'PEAJE_ZONA12': '30.00', 'PEAJE_ZONA13': '52.50'}
+
+def generar_segmento(segmento, cruces, placas, directorio, shards):
+    """Equivale a un segmento del scan paralelo: filas sintéticas -> archivos por shard"""
+    rng = random.Random(segmento)
+    peajes = list(PEAJES.items())
+
+    def filas():
+        for i in range(cruces):
+            peaje_id, monto = peajes[rng.randrange(len(peajes))]
+            dia = rng.randint(1, 31)
+            segundo = rng.randrange(86400)
+            yield {
+                'placa': f"P-{rng.randrange(placas):06d}",
+                'transaction_id': f"TXN-{segmento:03d}{i:09d}",
+                'factura_id': '',
+                'peaje_id': peaje_id,
+                'timestamp': f"{PERIODO}-{dia:02d}T{segundo // 3600:02d}:{segundo // 60 % 60:02d}:{segundo % 60:02d}Z",
+                'monto': monto,
+                'pago_real': 1
+            }
+
+    return particionar(filas(), directorio, f"seg{segmento:03d}", shards)
+
+def consolidar(rutas):
+    items = consolidar_shard(rutas, PERIODO)
+    estados = [item for item in items if 'estado_id' in item]
+    return (len(estados), sum(item['total_cruces'] for item in estados),
+            sum(item['total_cobrado'] for item in estados),
+            sum(item['total'] for item in estados))
+
+def main(cruces=3000000, placas=400000, segmentos=8, shards=16, workers=None):
+    workers = workers or os.cpu_count()
+    directorio = tempfile.mkdtemp(prefix='estados-')
+    print(f"{cruces} cruces no registrados de {PERIODO}, ~{placas} placas, "
+          f"{segmentos} segmentos, {shards} shards, {workers} workers\n")
+
+    try:
+        inicio = time.perf_counter()
+        por_segmento = [cruces // segmentos + (1 if s < cruces % segmentos else 0) for s in range(segmentos)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            escritos = sum(executor.map(generar_segmento, range(segmentos), por_segmento,
+                                        [placas] * segmentos, [directorio] * segmentos, [shards] * segmentos))
+        fase1 = time.perf_counter() - inicio
+        megabytes = sum(os.path.getsize(os.path.join(directorio, n)) for n in os.listdir(directorio)) / 1024 / 1024
+
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            resultados = list(executor.map(consolidar, rutas_por_shard(directorio, shards)))
+        fase2 = time.perf_counter() - inicio
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    estados = sum(r[0] for r in resultados)
+    lineas = sum(r[1] for r in resultados)
+    cobrado = sum((r[2] for r in resultados), Decimal('0'))
+    total = sum((r[3] for r in resultados), Decimal('0'))
+    assert lineas == escritos == cruces, "Se perdieron cruces en la consolidación"
+    assert total == cobrado + MULTA_TARDIA * estados, "El total de los estados no cuadra con lo cobrado"
+
+    # ru_maxrss está en KB en Linux: es el pico del worker más grande
+    pico_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    print(f"Fase 1 (scan -> archivos por shard): {fase1:8.1f} s  ({megabytes:.0f} MB en disco)")
+    print(f"Fase 2 (agrupar por placa):          {fase2:8.1f} s")
+    print(f"Total:                               {fase1 + fase2:8.1f} s  ({cruces / (fase1 + fase2):,.0f} cruces/s)")
+    print(f"Pico de memoria por worker:          {pico_mb:8.0f} MB")
+    print(f"\nEstados generados: {estados} (antes: {cruces} facturas y notificaciones)")
+    print(f"Cobrado por cruce: Q{cobrado:,.2f}  ->  total de los estados: Q{total:,.2f} "
+          f"(multa tardía una vez por estado; antes Q{cobrado + MULTA_TARDIA * cruces:,.2f} con multa por cruce)")
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:6]])
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Exportador incremental de transacciones a particiones columnares NumPy (.npz).
+
+Cada corrida lee solo las transacciones procesadas después de la marca de agua
+guardada (fecha_procesado), usando el índice dia-procesado-index. Las escribe
+aplanadas por columnas, particionadas por día del cruce y plaza:
+
+    <destino>/dia=2025-11-14/peaje=PEAJE_ZONA10/part-<corrida>.npz
+
+Columnas: transaction_id, placa, timestamp (datetime64[ms] UTC), monto_centavos
+(int64), user_type y tipo_escenario (códigos uint8, ver CATEGORIAS) y
+pago_exitoso (int8: 1, 0, -1 = sin pago).
+
+Uso:
+    python scripts/export_transactions.py exportar <destino> [dev|prod]
+    python scripts/export_transactions.py completo <destino> [dev|prod]   # primera carga con scan paralelo
+    python scripts/export_transactions.py simular <destino> [cruces]      # mes sintético + tiempo de carga
+"""
+import glob
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import boto3
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from transaction_schema import leer_transaccion
+
+INDICE = 'dia-procesado-index'
+# Debe coincidir con EXPORT_DAY_SHARDS del processor
+SHARDS_POR_DIA = 8
+# El índice es eventualmente consistente: no se exportan filas más recientes que esto
+RETRASO_SEGUNDOS = 120
+SEGMENTOS_SCAN = 8
+ARCHIVO_ESTADO = '_estado.json'
+
+CATEGORIAS = {
+    'user_type': ['desconocido', 'registrado', 'no_registrado'],
+    'tipo_escenario': ['desconocido', 'tag_express', 'registrado_digital', 'no_registrado_tradicional']
+}
+CODIGOS = {columna: {valor: i for i, valor in enumerate(valores)} for columna, valores in CATEGORIAS.items()}
+PROYECCION = ('transaction_id, placa, peaje_id, #ts, monto, user_type, tipo_escenario, resultado.pago.exitoso, '
+              'fecha_procesado, v, monto_c, pago')
+
+def aplanar(tx: dict) -> tuple:
+    """Solo los campos que usa analítica; resultado.pago.exitoso -> 1/0/-1"""
+    tx = leer_transaccion(tx)
+    pago = tx.get('resultado', {}).get('pago', {})
+    exitoso = -1 if 'exitoso' not in pago else int(bool(pago['exitoso']))
+    return (
+        tx['transaction_id'],
+        tx['placa'],
+        tx['peaje_id'],
+        tx['timestamp'],
+        int((Decimal(str(tx['monto'])) * 100).to_integral_value()),
+        CODIGOS['user_type'].get(tx.get('user_type'), 0),
+        CODIGOS['tipo_escenario'].get(tx.get('tipo_escenario'), 0),
+        exitoso
+    )
+
+def a_datetime64(timestamps):
+    """ISO con Z u offset -> datetime64[ms] en UTC"""
+    if all(ts.endswith('Z') for ts in timestamps):
+        # Caso normal: NumPy parsea ISO 8601 directamente, mucho más rápido que fromisoformat
+        return np.array([ts[:-1] for ts in timestamps], dtype='datetime64[ms]')
+    valores = []
+    for ts in timestamps:
+        momento = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+        if momento.tzinfo is not None:
+            momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+        valores.append(momento)
+    return np.array(valores, dtype='datetime64[ms]')
+
+def escribir_particiones(filas, destino: str, corrida: str) -> dict:
+    """Agrupa por (día del cruce, plaza) y escribe un part-<corrida>.npz por partición"""
+    particiones = defaultdict(list)
+    for fila in filas:
+        particiones[(fila[3][:10], fila[2])].append(fila)
+
+    for (dia, peaje_id), grupo in particiones.items():
+        directorio = os.path.join(destino, f"dia={dia}", f"peaje={peaje_id}")
+        os.makedirs(directorio, exist_ok=True)
+        transaction_ids, placas, _, timestamps, montos, user_types, escenarios, exitosos = zip(*grupo)
+        np.savez_compressed(
+            os.path.join(directorio, f"part-{corrida}.npz"),
+            transaction_id=np.array(transaction_ids, dtype='S'),
+            placa=np.array(placas, dtype='S'),
+            timestamp=a_datetime64(timestamps),
+            monto_centavos=np.array(montos, dtype=np.int64),
+            user_type=np.array(user_types, dtype=np.uint8),
+            tipo_escenario=np.array(escenarios, dtype=np.uint8),
+            pago_exitoso=np.array(exitosos, dtype=np.int8)
+        )
+    return {f"{dia}/{peaje_id}": len(grupo) for (dia, peaje_id), grupo in particiones.items()}
+
+def leer_estado(destino: str) -> dict:
+    ruta = os.path.join(destino, ARCHIVO_ESTADO)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta) as archivo:
+        return json.load(archivo)
+
+def guardar_estado(destino: str, estado: dict):
+    # Se escribe al final y de forma atómica: si la corrida falla, la siguiente repite desde la marca anterior
+    ruta = os.path.join(destino, ARCHIVO_ESTADO)
+    with open(ruta + '.tmp', 'w') as archivo:
+        json.dump(estado, archivo, indent=2)
+    os.replace(ruta + '.tmp', ruta)
+
+def consultar_dia(table, dia: str, desde: str, hasta: str):
+    """Filas de un día del índice con desde < fecha_procesado <= hasta, en todos sus shards"""
+    def consultar_shard(shard):
+        kwargs = {
+            'IndexName': INDICE,
+            'KeyConditionExpression': 'dia_procesado = :dia AND fecha_procesado BETWEEN :desde AND :hasta',
+            'ProjectionExpression': PROYECCION,
+            'ExpressionAttributeNames': {'#ts': 'timestamp'},
+            'ExpressionAttributeValues': {':dia': f"{dia}#{shard}", ':desde': desde, ':hasta': hasta}
+        }
+        filas = []
+        while True:
+            response = table.query(**kwargs)
+            filas.extend(aplanar(tx) for tx in response.get('Items', []) if tx['fecha_procesado'] != desde)
+            if 'LastEvaluatedKey' not in response:
+                return filas
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with ThreadPoolExecutor(max_workers=SHARDS_POR_DIA) as executor:
+        return [fila for filas in executor.map(consultar_shard, range(SHARDS_POR_DIA)) for fila in filas]
+
+def exportar(destino: str, environment: str = 'dev'):
+    table = boto3.resource('dynamodb').Table(f'guatepass-transactions-{environment}')
+    estado = leer_estado(destino)
+    if 'marca_de_agua' not in estado:
+        print("ERROR: sin marca de agua. Corre primero: export_transactions.py completo <destino>")
+        sys.exit(1)
+
+    desde = estado['marca_de_agua']
+    hasta = (datetime.utcnow() - timedelta(seconds=RETRASO_SEGUNDOS)).isoformat() + 'Z'
+    corrida = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+
+    dia = datetime.fromisoformat(desde[:10])
+    filas = []
+    while dia.strftime('%Y-%m-%d') <= hasta[:10]:
+        filas.extend(consultar_dia(table, dia.strftime('%Y-%m-%d'), desde, hasta))
+        dia += timedelta(days=1)
+
+    particiones = escribir_particiones(filas, destino, corrida) if filas else {}
+    guardar_estado(destino, {'marca_de_agua': hasta, 'ultima_corrida': corrida})
+    print(f"Exportadas {len(filas)} transacciones nuevas en {len(particiones)} particiones "
+          f"(fecha_procesado {desde} -> {hasta})")
+
+def exportar_completo(destino: str, environment: str = 'dev'):
+    """Primera carga: scan paralelo de toda la tabla (incluye filas anteriores al índice)"""
+    table = boto3.resource('dynamodb').Table(f'guatepass-transactions-{environment}')
+    hasta = (datetime.utcnow() - timedelta(seconds=RETRASO_SEGUNDOS)).isoformat() + 'Z'
+    corrida = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+
+    def escanear(segmento):
+        kwargs = {
+            'Segment': segmento,
+            'TotalSegments': SEGMENTOS_SCAN,
+            'ProjectionExpression': PROYECCION,
+            'ExpressionAttributeNames': {'#ts': 'timestamp'}
+        }
+        filas = []
+        while True:
+            response = table.scan(**kwargs)
+            filas.extend(aplanar(tx) for tx in response.get('Items', []) if tx.get('fecha_procesado', '') <= hasta)
+            if 'LastEvaluatedKey' not in response:
+                return filas
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    os.makedirs(destino, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=SEGMENTOS_SCAN) as executor:
+        filas = [fila for parte in executor.map(escanear, range(SEGMENTOS_SCAN)) for fila in parte]
+
+    particiones = escribir_particiones(filas, destino, corrida)
+    guardar_estado(destino, {'marca_de_agua': hasta, 'ultima_corrida': corrida})
+    print(f"Carga completa: {len(filas)} transacciones en {len(particiones)} particiones (hasta {hasta})")
+
+def cargar(destino: str, desde: str = None, hasta: str = None, peaje_id: str = None) -> dict:
+    """Concatena las particiones del rango de días (YYYY-MM-DD, inclusive) en un dict de columnas"""
+    columnas = defaultdict(list)
+    for ruta in sorted(glob.glob(os.path.join(destino, 'dia=*', f"peaje={peaje_id or '*'}", 'part-*.npz'))):
+        dia = ruta.split('dia=')[1][:10]
+        if (desde and dia < desde) or (hasta and dia > hasta):
+            continue
+        plaza = ruta.split('peaje=')[1].split(os.sep)[0]
+        with np.load(ruta) as parte:
+            for nombre in parte.files:
+                columnas[nombre].append(parte[nombre])
+            columnas['peaje_id'].append(np.full(len(parte['monto_centavos']), plaza, dtype='S12'))
+    return {nombre: np.concatenate(partes) for nombre, partes in columnas.items()}
+
+def simular(destino: str, cruces: int = 3000000):
+    """Escribe un mes sintético y mide cuánto tarda en cargarse y agregarse"""
+    rng = random.Random(7)
+    peajes = ['PEAJE_ZONA10', 'PEAJE_ZONA11', 'PEAJE_ZONA12', 'PEAJE_ZONA13']
+    escenarios = [('registrado', 'tag_express', 1), ('registrado', 'registrado_digital', 1),
+                  ('no_registrado', 'no_registrado_tradicional', -1)]
+
+    inicio = time.perf_counter()
+    for dia in range(1, 31):
+        filas = []
+        for i in range(cruces // 30):
+            user_type, escenario, exitoso = escenarios[rng.randrange(3)]
+            segundo = rng.randrange(86400)
+            filas.append((
+                f"TXN-{dia:02d}{i:06X}", f"P-{rng.randrange(400000):06d}", peajes[rng.randrange(4)],
+                f"2025-10-{dia:02d}T{segundo // 3600:02d}:{segundo // 60 % 60:02d}:{segundo % 60:02d}Z",
+                rng.choice((2250, 2500, 3000, 5250)), CODIGOS['user_type'][user_type],
+                CODIGOS['tipo_escenario'][escenario], exitoso
+            ))
+        escribir_particiones(filas, destino, 'simulada')
+    escritura = time.perf_counter() - inicio
+
+    megabytes = sum(os.path.getsize(r) for r in glob.glob(os.path.join(destino, '**', '*.npz'), recursive=True)) / 1024 / 1024
+
+    inicio = time.perf_counter()
+    datos = cargar(destino, '2025-10-01', '2025-10-31')
+    carga = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    por_plaza = {}
+    for plaza in np.unique(datos['peaje_id']):
+        mascara = datos['peaje_id'] == plaza
+        por_plaza[plaza.decode()] = (int(mascara.sum()), datos['monto_centavos'][mascara].sum() / 100)
+    agregacion = time.perf_counter() - inicio
+
+    print(f"{len(datos['monto_centavos'])} transacciones de un mes, 30 días x 4 plazas = 120 particiones")
+    print(f"Escritura: {escritura:.1f} s, {megabytes:.1f} MB en disco ({megabytes * 1024 * 1024 / len(datos['monto_centavos']):.1f} bytes/fila)")
+    print(f"Carga del mes: {carga:.2f} s")
+    print(f"Ingresos por plaza: {agregacion:.2f} s")
+    for plaza, (cantidad, total) in sorted(por_plaza.items()):
+        print(f"  {plaza}: {cantidad} cruces, Q{total:,.2f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ('exportar', 'completo', 'simular'):
+        print("Uso: python scripts/export_transactions.py <exportar|completo|simular> <destino> [dev|prod|cruces]")
+        sys.exit(1)
+    comando, destino = sys.argv[1], sys.argv[2]
+    if comando == 'exportar':
+        exportar(destino, sys.argv[3] if len(sys.argv) > 3 else 'dev')
+    elif comando == 'completo':
+        exportar_completo(destino, sys.argv[3] if len(sys.argv) > 3 else 'dev')
+    else:
+        simular(destino, int(sys.argv[3]) if len(sys.argv) > 3 else 3000000)
@@ -5,6 +5,9 @@ import os
 import sys
 from decimal import Decimal
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from registry_changes import registrar_reinicio
+
 def load_initial_data():
     # Especificar región explícitamente
     dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
@@ -73,6 +76,8 @@ def load_initial_data():
                     print(f"ERROR en fila {row_num}: {str(e)}")
                     continue
         
+        # Placas nuevas: el filtro de Bloom y el snapshot anteriores dejan de usarse
+        registrar_reinicio(dynamodb.Table('guatepass-counters-dev'))
         print("\n¡Proceso completado!")
         
         # Verificar carga
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Mide lo que cuesta un poll repetido de /history/payments/{placa} sin cambios:
+respuesta completa, la misma comprimida con gzip (como la entrega API Gateway con
+MinimumCompressionSize), respuesta desde la caché del contenedor y 304 por
+If-None-Match. Después simula polls de muchas placas intercalados con cruces
+nuevos (que incrementan la versión) y reporta la tasa de hits de la caché.
+
+Corre el handler real de history/app.py en proceso, con tablas en memoria que
+simulan la latencia de cada llamada a DynamoDB.
+
+Uso:
+    python scripts/measure_history_polling.py [transacciones=500] [limite=50] [latencia_ms=8] [polls=200]
+"""
+import gzip
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('TRANSACTIONS_TABLE', 'guatepass-transactions-bench')
+os.environ.setdefault('SUMMARY_TABLE', 'guatepass-account-summary-bench')
+os.environ.setdefault('COUNTERS_TABLE', 'guatepass-counters-bench')
+os.environ.pop('ARCHIVE_BUCKET', None)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'history'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+import app as history_app
+from response_cache import ResponseCache
+
+PLACA = 'P-123ABC'
+
+class TablaSimulada:
+    """Solo lo que usa el historial: query del índice por placa y get_item de la versión"""
+    def __init__(self, por_placa, latencia):
+        self.por_placa = por_placa
+        self.latencia = latencia
+        self.llamadas = 0
+
+    def query(self, KeyConditionExpression, Limit, ExclusiveStartKey=None, **kwargs):
+        self.llamadas += 1
+        time.sleep(self.latencia)
+        items = self.por_placa[KeyConditionExpression.get_expression()['values'][1]]
+        inicio = ExclusiveStartKey['i'] if ExclusiveStartKey else 0
+        response = {'Items': [dict(item) for item in items[inicio:inicio + Limit]]}
+        if inicio + Limit < len(items):
+            response['LastEvaluatedKey'] = {'i': inicio + Limit}
+        return response
+
+    def get_item(self, Key, **kwargs):
+        self.llamadas += 1
+        time.sleep(self.latencia)
+        item = self.por_placa.get(Key['contador'])
+        return {'Item': dict(item)} if item else {}
+
+def transacciones(n, placa=PLACA):
+    rng = random.Random(3)
+    items = []
+    for i in range(n):
+        escenario = rng.choice(['tag_express', 'registrado_digital'])
+        items.append({
+            'transaction_id': f"TXN-{i:08X}", 'placa': placa, 'peaje_id': rng.choice(['PEAJE_ZONA10', 'PEAJE_ZONA11']),
+            'timestamp': f"2025-{1 + i // 2000:02d}-{1 + i // 80 % 25:02d}T{i % 24:02d}:{i % 60:02d}:00Z",
+            'user_type': 'registrado', 'tipo_escenario': escenario, 'v': 2, 'monto_c': 2250 if escenario == 'tag_express' else 2500,
+            'pago': 1, 'auth': f"AUTH-{i:08X}", 'metodo': 1, 'fecha_procesado': '2025-01-20T10:30:05.123456Z'
+        })
+    items.sort(key=lambda tx: (tx['timestamp'], tx['transaction_id']), reverse=True)
+    return items
+
+def medir(poll, n):
+    tiempos = []
+    for _ in range(n):
+        inicio = time.perf_counter()
+        respuesta = poll()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return respuesta, statistics.median(tiempos), sorted(tiempos)[int(len(tiempos) * 0.99) - 1]
+
+def llamadas():
+    return history_app.transactions_table.llamadas + history_app.counters_table.llamadas
+
+def reiniciar_llamadas():
+    history_app.transactions_table.llamadas = history_app.counters_table.llamadas = 0
+
+def evento_de(placa, limite, headers=None):
+    return {'resource': '/history/payments/{placa}', 'pathParameters': {'placa': placa},
+            'queryStringParameters': {'limite': str(limite)}, 'headers': {'Accept-Encoding': 'gzip', **(headers or {})}}
+
+def poll_sin_cambios(total, limite, polls):
+    history_app.transactions_table = TablaSimulada({PLACA: transacciones(total)}, history_app.transactions_table.latencia)
+    history_app.counters_table.por_placa = {f"version#{PLACA}": {'version': Decimal(total)}}
+    evento = evento_de(PLACA, limite)
+    etag = history_app.lambda_handler(evento, None)['headers']['ETag']
+    condicional = evento_de(PLACA, limite, {'If-None-Match': etag})
+
+    resultados = {}
+    # Sin caché (cada poll construye la página), desde la caché y 304
+    for nombre, cache, ev in (('completa', ResponseCache(max_entradas=0), evento),
+                              ('cache', ResponseCache(), evento),
+                              ('304', ResponseCache(), condicional)):
+        history_app.response_cache = cache
+        history_app.lambda_handler(ev, None)
+        reiniciar_llamadas()
+        respuesta, p50, p99 = medir(lambda: history_app.lambda_handler(ev, None), polls)
+        resultados[nombre] = (respuesta, p50, p99, llamadas() / polls)
+    assert resultados['cache'][0]['headers'].get('X-Cache') == 'HIT'
+    assert resultados['304'][0]['statusCode'] == 304
+    return resultados
+
+def polls_con_cruces(placas=200, polls=5000, prob_cruce=0.1, limite=50, seed=11):
+    """Polls de placas al azar (unas más activas que otras); cada poll tiene prob_cruce de que la placa haya cruzado antes"""
+    rng = random.Random(seed)
+    nombres = [f"P-{i:03d}ABC" for i in range(placas)]
+    history_app.transactions_table = TablaSimulada({placa: transacciones(60, placa) for placa in nombres},
+                                                   history_app.transactions_table.latencia)
+    history_app.counters_table.por_placa = {f"version#{placa}": {'version': Decimal(1)} for placa in nombres}
+    history_app.response_cache = ResponseCache(max_entradas=128)
+    pesos = [1 / (i + 1) for i in range(placas)]
+    reiniciar_llamadas()
+    for placa in rng.choices(nombres, weights=pesos, k=polls):
+        if rng.random() < prob_cruce:
+            history_app.counters_table.por_placa[f"version#{placa}"]['version'] += 1
+        history_app.lambda_handler(evento_de(placa, limite), None)
+    return history_app.response_cache.estadisticas(), history_app.transactions_table.llamadas
+
+def main(total=500, limite=50, latencia_ms=8, polls=200):
+    latencia = latencia_ms / 1000
+    history_app.transactions_table = TablaSimulada({}, latencia)
+    history_app.counters_table = TablaSimulada({}, latencia)
+    history_app.archive = None
+
+    # Los prints del handler no cuentan en la medición
+    salida, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        resultados = poll_sin_cambios(total, limite, polls)
+        estadisticas, queries = polls_con_cruces(limite=limite)
+    finally:
+        sys.stdout.close()
+        sys.stdout = salida
+
+    cuerpo = resultados['completa'][0]['body'].encode('utf-8')
+    comprimido = gzip.compress(cuerpo, compresslevel=6)
+
+    print(f"=== POLL SIN CAMBIOS: {PLACA}, {total} transacciones, limite={limite}, "
+          f"latencia DynamoDB {latencia_ms} ms, {polls} polls ===\n")
+    print(f"{'Respuesta':<28} {'bytes body':>11} {'llamadas DB':>12} {'p50 ms':>8} {'p99 ms':>8}")
+    filas = (('200 completa', 'completa', len(cuerpo)), ('200 gzip (API Gateway)', 'completa', len(comprimido)),
+             ('200 desde caché', 'cache', len(cuerpo)), ('304 If-None-Match', '304', 0))
+    for etiqueta, nombre, tamano in filas:
+        _, p50, p99, por_poll = resultados[nombre]
+        print(f"{etiqueta:<28} {tamano:>11} {por_poll:>12.1f} {p50:>8.2f} {p99:>8.2f}")
+
+    consultas = estadisticas['hits'] + estadisticas['misses']
+    print(f"\n=== {consultas} polls de 200 placas (Zipf), 10% con cruce nuevo, caché de 128 entradas ===")
+    print(f"Estadísticas: {estadisticas}")
+    print(f"Queries de página: {queries} ({queries / consultas:.0%} de los polls)")
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*args)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Compara el tamaño de los items de TransactionsTable en formato v1 (resultado
+completo) y v2 (transaction_schema) para cada escenario, las WCU que cuesta
+guardar un cruce (la tabla más cada índice, según lo que proyecta), las RCU de
+una página de historial y el almacenamiento por millón de cruces.
+
+Tamaños según las reglas de DynamoDB: nombres de atributo + valores, números
+~ dígitos significativos / 2 + 1, mapas y listas 3 bytes + 1 por elemento.
+
+Uso:
+    python scripts/measure_item_size.py
+"""
+import math
+import os
+import sys
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'processor'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from invoice_generator import InvoiceGenerator
+from transaction_schema import compactar_transaccion, leer_transaccion
+
+LLAVES_TABLA = ('transaction_id', 'timestamp')
+TAMANO_PAGINA = 50
+# Atributos de cada índice de TransactionsTable (template.yaml)
+INDICES = {
+    'dia-procesado-index': ('dia_procesado', 'fecha_procesado', 'placa', 'peaje_id', 'monto', 'user_type',
+                            'tipo_escenario', 'resultado', 'v', 'monto_c', 'pago'),
+    'placa-timestamp-index': None  # ALL
+}
+
+def tamano_valor(valor) -> int:
+    if isinstance(valor, bool) or valor is None:
+        return 1
+    if isinstance(valor, str):
+        return len(valor.encode('utf-8'))
+    if isinstance(valor, (int, Decimal)):
+        digitos = len(Decimal(valor).normalize().as_tuple().digits)
+        return math.ceil(digitos / 2) + 1
+    if isinstance(valor, dict):
+        return 3 + sum(len(k.encode('utf-8')) + tamano_valor(v) + 1 for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return 3 + sum(tamano_valor(v) + 1 for v in valor)
+    raise TypeError(type(valor))
+
+def tamano_item(item: dict) -> int:
+    return sum(len(k.encode('utf-8')) + tamano_valor(v) for k, v in item.items() if v is not None)
+
+def wcu(item: dict) -> int:
+    return math.ceil(tamano_item(item) / 1024)
+
+def wcu_por_cruce(item: dict) -> dict:
+    costo = {'tabla': wcu(item)}
+    for indice, atributos in INDICES.items():
+        if atributos is None:
+            costo[indice] = wcu(item)
+        else:
+            costo[indice] = wcu({k: v for k, v in item.items() if k in LLAVES_TABLA + atributos})
+    return costo
+
+def item_v1(escenario: str) -> dict:
+    """Items como los guardaba processor/app.py antes de v2"""
+    base = {
+        'transaction_id': 'TXN-A1B2C3D4',
+        'placa': 'P-123ABC',
+        'peaje_id': 'PEAJE_ZONA10',
+        'timestamp': '2025-01-20T10:30:00Z',
+        'has_tag': escenario == 'tag_express',
+        'tag_id': 'TAG-001' if escenario == 'tag_express' else None,
+        'tipo_escenario': escenario,
+        'fecha_procesado': '2025-01-20T10:30:05.123456Z',
+        'dia_procesado': '2025-01-20#3'
+    }
+    pago = {
+        'exitoso': True,
+        'codigo_autorizacion': 'AUTH-9F8E7D6C',
+        'mensaje': 'Pago procesado exitosamente',
+        'metodo_pago': 'tarjeta_credito',
+        'pago_real': True
+    }
+    if escenario == 'tag_express':
+        monto = Decimal('22.50')
+        resultado = {'tipo_escenario': escenario, 'monto': monto, 'tag_id': 'TAG-001',
+                     'procesamiento_rapido': True, 'pago': pago, 'descuento_aplicado': '10%'}
+        user_type = 'registrado'
+    elif escenario == 'registrado_digital':
+        monto = Decimal('25.00')
+        resultado = {'tipo_escenario': escenario, 'monto': monto, 'pago': pago, 'metodo_pago': 'tarjeta_credito'}
+        user_type = 'registrado'
+    else:
+        monto = Decimal('52.50')
+        factura = InvoiceGenerator().generar_factura(base['placa'], base['peaje_id'], monto, 'no_registrado')
+        factura['factura_id'] = 'FACT-0000000123'
+        factura['pago_real_exitoso'] = False
+        resultado = {'tipo_escenario': escenario, 'monto': monto, 'factura': factura,
+                     'enviar_invitacion': True, 'pago_real': False}
+        user_type = 'no_registrado'
+    return {**base, 'monto': monto, 'user_type': user_type, 'resultado': resultado}
+
+def rcu_pagina(item: dict) -> float:
+    # Query eventualmente consistente: 0.5 RCU por cada 4 KB leídos en total
+    return math.ceil(tamano_item(item) * TAMANO_PAGINA / 4096) * 0.5
+
+def medir():
+    print(f"{'Escenario':<27} {'v1 bytes':>9} {'v2 bytes':>9} {'WCU v1':>7} {'WCU v2':>7} "
+          f"{'RCU pág v1':>11} {'RCU pág v2':>11}")
+    totales = {'v1': 0, 'v2': 0}
+    bytes_totales = {'v1': 0, 'v2': 0}
+    for escenario in ('tag_express', 'registrado_digital', 'no_registrado_tradicional'):
+        v1 = item_v1(escenario)
+        v2 = compactar_transaccion(v1)
+        # La vista v1 reconstruida conserva lo que leen historial, facturas y exportador
+        vista = leer_transaccion(v2)
+        assert vista['monto'] == v1['monto'] and vista['tipo_escenario'] == v1['tipo_escenario']
+
+        costo_v1 = sum(wcu_por_cruce(v1).values())
+        costo_v2 = sum(wcu_por_cruce(v2).values())
+        totales['v1'] += costo_v1
+        totales['v2'] += costo_v2
+        # Tabla + índice ALL + índice INCLUDE: lo que se almacena por cruce
+        for version, item in (('v1', v1), ('v2', v2)):
+            bytes_totales[version] += sum(tamano_item(item) for _ in range(2)) + tamano_item(
+                {k: v for k, v in item.items() if k in LLAVES_TABLA + INDICES['dia-procesado-index']})
+        print(f"{escenario:<27} {tamano_item(v1):>9} {tamano_item(v2):>9} {costo_v1:>7} {costo_v2:>7} "
+              f"{rcu_pagina(v1):>11} {rcu_pagina(v2):>11}")
+    print("\nWCU = put en la tabla + escritura en cada índice (dia-procesado-index, placa-timestamp-index)")
+    print(f"RCU pág = query de {TAMANO_PAGINA} transacciones del mismo escenario en placa-timestamp-index")
+    print(f"Promedio por cruce (3 escenarios): v1 {totales['v1'] / 3:.2f} WCU, v2 {totales['v2'] / 3:.2f} WCU")
+    for version in ('v1', 'v2'):
+        print(f"Almacenamiento {version} (tabla + índices) por millón de cruces: "
+              f"{bytes_totales[version] / 3 * 1e6 / 1024 ** 3:.2f} GB")
+
+if __name__ == "__main__":
+    medir()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Muestra cruces e ingresos por minuto de una plaza desde los contadores
+de PlazaTrafficTable (sin scans: un query por shard).
+
+Uso:
+    python scripts/plaza_traffic.py PEAJE_ZONA10 [minutos] [dev|prod]
+"""
+import os
+import sys
+from decimal import Decimal
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'processor'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from plaza_traffic import PlazaTraffic
+
+VALID_PEAJES = ['PEAJE_ZONA10', 'PEAJE_ZONA11', 'PEAJE_ZONA12', 'PEAJE_ZONA13']
+ANCHO_BARRA = 40
+
+def mostrar_trafico(peaje_id, minutos=30, environment='dev', shards=8):
+    if peaje_id not in VALID_PEAJES:
+        print(f"ERROR: peaje_id invalido. Debe ser uno de: {VALID_PEAJES}")
+        sys.exit(1)
+
+    table = boto3.resource('dynamodb').Table(f'guatepass-plaza-traffic-{environment}')
+    serie = PlazaTraffic(table, shards=shards).ultimos_minutos(peaje_id, minutos)
+
+    print(f"=== TRÁFICO {peaje_id} - últimos {minutos} minutos (UTC) ===\n")
+    maximo = max((m['cruces_total'] for m in serie), default=0) or 1
+    for minuto in serie:
+        barra = '█' * round(minuto['cruces_total'] / maximo * ANCHO_BARRA)
+        print(f"{minuto['minuto'][11:]}  {minuto['cruces_total']:>5} cruces  Q{minuto['monto_total']:>10.2f}  {barra}")
+
+    por_tipo = {}
+    for minuto in serie:
+        for tipo, valores in minuto['por_tipo'].items():
+            acumulado = por_tipo.setdefault(tipo, {'cruces': 0, 'monto': Decimal('0')})
+            acumulado['cruces'] += valores['cruces']
+            acumulado['monto'] += valores['monto']
+
+    print(f"\nTotal: {sum(m['cruces_total'] for m in serie)} cruces, "
+          f"Q{sum((m['monto_total'] for m in serie), Decimal('0')):.2f}")
+    for tipo, valores in sorted(por_tipo.items()):
+        print(f"  {tipo:<15} {valores['cruces']:>6} cruces  Q{valores['monto']:>10.2f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python scripts/plaza_traffic.py <PEAJE_ID> [minutos] [dev|prod]")
+        sys.exit(1)
+    mostrar_trafico(
+        sys.argv[1].upper(),
+        int(sys.argv[2]) if len(sys.argv) > 2 else 30,
+        sys.argv[3] if len(sys.argv) > 3 else 'dev'
+    )
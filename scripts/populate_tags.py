@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 import boto3
 import json
+import os
+import sys
 from decimal import Decimal
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from registry_changes import registrar_reinicio
+
 def populate_tags():
     dynamodb = boto3.resource('dynamodb')
     tags_table = dynamodb.Table('guatepass-tags-dev')
@@ -53,6 +58,8 @@ def populate_tags():
         except Exception as e:
             print(f"Error creando tag {tag['tag_id']}: {str(e)}")
     
+    # El snapshot del webhook anterior a esta carga deja de usarse hasta reconstruirlo
+    registrar_reinicio(dynamodb.Table('guatepass-counters-dev'))
     print("Población de tags completada!")
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Reconcilia AccountSummaryTable contra las transacciones crudas.
+
+Recalcula los acumulados (total y por mes, por tipo_escenario) con un scan
+paralelo de TransactionsTable más las transacciones ya archivadas en S3, usando
+la misma regla que el processor (account_summary.contribucion), y los compara
+con los items de resumen.
+
+Uso:
+    python scripts/reconcile_summaries.py [dev|prod] [--corregir]
+
+Con --corregir aplica la diferencia con ADD, así no pisa los cruces que el
+processor sume mientras corre la reconciliación.
+"""
+import sys
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'processor'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from account_summary import PERIODO_TOTAL, contribucion, periodo_de
+from transaction_archive import TransactionArchive
+from transaction_schema import leer_transaccion
+
+SEGMENTOS = 8
+
+def escanear(table, segmento, **kwargs):
+    kwargs.update({'Segment': segmento, 'TotalSegments': SEGMENTOS})
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def acumular(transacciones):
+    esperado = defaultdict(lambda: defaultdict(Decimal))
+    for tx in transacciones:
+        for periodo in (PERIODO_TOTAL, periodo_de(tx['timestamp'])):
+            for atributo, valor in contribucion(tx).items():
+                esperado[(tx['placa'], periodo)][atributo] += valor
+    return esperado
+
+def acumular_segmento(transactions_table, segmento):
+    # Las filas archivadas se cuentan desde S3 (siguen en la tabla solo durante la gracia del TTL)
+    return acumular(map(leer_transaccion, escanear(transactions_table, segmento,
+                                                   FilterExpression='attribute_not_exists(archivado)',
+                                                   ProjectionExpression='placa, peaje_id, #ts, monto, tipo_escenario, v, monto_c, '
+                                                                        'pago, pago_real, resultado.pago, resultado.pago_real',
+                                                   ExpressionAttributeNames={'#ts': 'timestamp'})))
+
+def transacciones_archivadas(archive):
+    paginator = archive.s3.get_paginator('list_objects_v2')
+    keys = [
+        objeto['Key']
+        for pagina in paginator.paginate(Bucket=archive.bucket, Prefix=f"{archive.prefijo}/placa=")
+        for objeto in pagina.get('Contents', [])
+    ]
+    for inicio in range(0, len(keys), 100):
+        yield from map(leer_transaccion, archive.leer_partes(keys[inicio:inicio + 100]))
+
+def es_acumulado(atributo):
+    return atributo.startswith('gasto_') or atributo.startswith('cruces_')
+
+def reconciliar(environment='dev', corregir=False):
+    dynamodb = boto3.resource('dynamodb')
+    transactions_table = dynamodb.Table(f'guatepass-transactions-{environment}')
+    summary_table = dynamodb.Table(f'guatepass-account-summary-{environment}')
+
+    print(f"=== RECONCILIACIÓN DE RESUMENES ({environment}) ===")
+
+    cuenta = boto3.client('sts').get_caller_identity()['Account']
+    archive = TransactionArchive(f'guatepass-archive-{cuenta}-{environment}')
+
+    esperado = defaultdict(lambda: defaultdict(Decimal))
+    with ThreadPoolExecutor(max_workers=SEGMENTOS) as executor:
+        parciales = list(executor.map(lambda s: acumular_segmento(transactions_table, s), range(SEGMENTOS)))
+        for parcial in parciales + [acumular(transacciones_archivadas(archive))]:
+            for llave, acumulados in parcial.items():
+                for atributo, valor in acumulados.items():
+                    esperado[llave][atributo] += valor
+
+    actual = {}
+    with ThreadPoolExecutor(max_workers=SEGMENTOS) as executor:
+        for items in executor.map(lambda s: list(escanear(summary_table, s)), range(SEGMENTOS)):
+            for item in items:
+                actual[(item['placa'], item['periodo'])] = {k: v for k, v in item.items() if es_acumulado(k)}
+
+    diferencias = {}
+    for llave in set(esperado) | set(actual):
+        atributos = set(esperado.get(llave, {})) | set(actual.get(llave, {}))
+        delta = {
+            atributo: esperado.get(llave, {}).get(atributo, Decimal('0')) - actual.get(llave, {}).get(atributo, Decimal('0'))
+            for atributo in atributos
+        }
+        delta = {atributo: valor for atributo, valor in delta.items() if valor != 0}
+        if delta:
+            diferencias[llave] = delta
+
+    print(f"Items de resumen esperados: {len(esperado)}, encontrados: {len(actual)}")
+    if not diferencias:
+        print("✅ Todos los resúmenes cuadran con las transacciones")
+        return 0
+
+    print(f"❌ {len(diferencias)} items con diferencias:")
+    for (placa, periodo), delta in sorted(diferencias.items()):
+        detalle = ', '.join(f"{atributo} {valor:+}" for atributo, valor in sorted(delta.items()))
+        print(f"  {placa} {periodo}: {detalle}")
+
+    if corregir:
+        for (placa, periodo), delta in diferencias.items():
+            nombres = {f"#a{i}": atributo for i, atributo in enumerate(delta)}
+            summary_table.update_item(
+                Key={'placa': placa, 'periodo': periodo},
+                UpdateExpression='ADD ' + ', '.join(f"#a{i} :v{i}" for i in range(len(delta))),
+                ExpressionAttributeNames=nombres,
+                ExpressionAttributeValues={f":v{i}": valor for i, valor in enumerate(delta.values())}
+            )
+        print(f"🔧 {len(diferencias)} items corregidos")
+
+    return len(diferencias)
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    diferencias = reconciliar(args[0] if args else 'dev', corregir='--corregir' in sys.argv)
+    sys.exit(1 if diferencias and '--corregir' not in sys.argv else 0)
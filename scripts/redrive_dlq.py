@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Inspección y reenvío de la DLQ de la cola de procesamiento.
+
+Un cruce que falla 5 veces (maxReceiveCount) pasa a guatepass-processing-dlq-<env>.
+El processor guarda el motivo de cada falla en CountersTable (fallo#<messageId>,
+ver processor/dead_letters.py); con eso se agrupan los mensajes por tipo de error
+y se reenvían a la cola de procesamiento solo los tipos elegidos:
+
+- a --tasa mensajes por segundo, para no competir con el tráfico en vivo
+- sin reenviar un cruce que ya tiene transacción (placa-timestamp-index) ni un
+  mensaje que otra corrida ya reenvió (redrive#<messageId>, escritura condicional)
+- con progreso cada 25 mensajes y parada si la proporción de errores pasa de
+  --max-error (después de 20 mensajes)
+
+Un cruce que se cobró y falló después (al facturar o guardar) se reenvía igual:
+el débito lleva la marca cobro#<referencia> (processor/charge_marks.py) y la
+nueva entrega completa la transacción sin descontar el saldo otra vez.
+
+'todos' no incluye json_invalido ni mensaje_incompleto: fallarían igual; se
+reenvían nombrándolos después de corregir el productor o el processor.
+
+Uso:
+    python scripts/redrive_dlq.py inspeccionar [dev|prod]
+    python scripts/redrive_dlq.py reenviar <tipo|todos> [dev|prod] [--tasa=5] [--max-error=0.2] [--limite=N]
+    python scripts/redrive_dlq.py simular      # DLQ y tablas en memoria, de punta a punta
+"""
+import itertools
+import json
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'processor'))
+from dead_letters import NO_REENVIABLES, clave_fallo
+
+INDICE_PLACA = 'placa-timestamp-index'
+# Tiempo que los mensajes leídos quedan ocultos en la DLQ mientras corre el script
+VISIBILIDAD = 300
+PROGRESO_CADA = 25
+MUESTRA_MINIMA = 20
+# Las marcas redrive# vencen como los mensajes de la DLQ (14 días)
+DIAS_MARCA = 14
+
+class Redrive:
+    def __init__(self, sqs, dlq_url, cola_url, counters_table, transactions_table,
+                 reloj=time.monotonic, dormir=time.sleep):
+        self.sqs = sqs
+        self.dlq_url = dlq_url
+        self.cola_url = cola_url
+        self.counters_table = counters_table
+        self.transactions_table = transactions_table
+        self.reloj = reloj
+        self.dormir = dormir
+
+    def recibir(self):
+        """Todos los mensajes visibles de la DLQ; quedan ocultos hasta borrarlos o liberarlos"""
+        mensajes = OrderedDict()
+        while True:
+            respuesta = self.sqs.receive_message(QueueUrl=self.dlq_url, MaxNumberOfMessages=10,
+                                                 AttributeNames=['All'], MessageAttributeNames=['All'],
+                                                 VisibilityTimeout=VISIBILIDAD, WaitTimeSeconds=1)
+            nuevos = [m for m in respuesta.get('Messages', []) if m['MessageId'] not in mensajes]
+            if not nuevos:
+                return list(mensajes.values())
+            for mensaje in nuevos:
+                mensajes[mensaje['MessageId']] = mensaje
+
+    def liberar(self, mensajes):
+        for mensaje in mensajes:
+            try:
+                self.sqs.change_message_visibility(QueueUrl=self.dlq_url, ReceiptHandle=mensaje['ReceiptHandle'],
+                                                   VisibilityTimeout=0)
+            except ClientError as e:
+                print(f"⚠️ No se pudo liberar {mensaje['MessageId']}: {e}")
+
+    def registro_fallo(self, mensaje):
+        respuesta = self.counters_table.get_item(Key=clave_fallo(mensaje['MessageId']))
+        return respuesta.get('Item') or {'tipo_error': 'sin_registro'}
+
+    def clasificar(self, mensajes):
+        """[(mensaje, registro de fallo)] en el orden de la DLQ"""
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return list(zip(mensajes, executor.map(self.registro_fallo, mensajes)))
+
+    def inspeccionar(self):
+        mensajes = self.recibir()
+        try:
+            por_tipo = OrderedDict()
+            for mensaje, registro in self.clasificar(mensajes):
+                por_tipo.setdefault(registro['tipo_error'], []).append((mensaje, registro))
+        finally:
+            self.liberar(mensajes)
+
+        print(f"📬 DLQ {self.dlq_url.rsplit('/', 1)[-1]}: {len(mensajes)} mensajes")
+        for tipo, grupo in sorted(por_tipo.items(), key=lambda item: -len(item[1])):
+            placas = sorted({registro['placa'] for _, registro in grupo if registro.get('placa')})
+            detalle = next((registro['detalle'] for _, registro in grupo if registro.get('detalle')), '')
+            nota = '  (no se reenvía con todos)' if tipo in NO_REENVIABLES else ''
+            print(f"  {tipo:<40} {len(grupo):>5}{nota}")
+            if placas:
+                print(f"      placas: {', '.join(placas[:5])}{' ...' if len(placas) > 5 else ''}")
+            if detalle:
+                print(f"      detalle: {detalle[:120]}")
+        return {tipo: len(grupo) for tipo, grupo in por_tipo.items()}
+
+    def ya_procesado(self, data) -> bool:
+        """El cruce ya tiene transacción: se procesó en una entrega que la DLQ no vio"""
+        if not data or not data.get('placa') or not data.get('timestamp'):
+            return False
+        respuesta = self.transactions_table.query(
+            IndexName=INDICE_PLACA,
+            KeyConditionExpression=Key('placa').eq(data['placa']) & Key('timestamp').eq(data['timestamp'])
+        )
+        return any(tx.get('peaje_id') == data.get('peaje_id') for tx in respuesta.get('Items', []))
+
+    def marcar(self, message_id: str) -> bool:
+        """False si otra corrida ya reenvió este mensaje"""
+        ahora = int(time.time())
+        try:
+            self.counters_table.put_item(
+                Item={'contador': f"redrive#{message_id}",
+                      'fecha': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ahora)),
+                      'expira_en': ahora + DIAS_MARCA * 86400},
+                ConditionExpression='attribute_not_exists(contador)'
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def enviar(self, mensaje):
+        parametros = {'QueueUrl': self.cola_url, 'MessageBody': mensaje['Body']}
+        if mensaje.get('MessageAttributes'):
+            parametros['MessageAttributes'] = mensaje['MessageAttributes']
+        grupo = mensaje.get('Attributes', {}).get('MessageGroupId')
+        if grupo:
+            # FIFO: misma placa como grupo; el messageId original evita duplicar un reenvío repetido
+            parametros['MessageGroupId'] = grupo
+            parametros['MessageDeduplicationId'] = mensaje['MessageId']
+        self.sqs.send_message(**parametros)
+
+    def borrar(self, mensaje):
+        self.sqs.delete_message(QueueUrl=self.dlq_url, ReceiptHandle=mensaje['ReceiptHandle'])
+
+    def reenviar_mensaje(self, mensaje) -> str:
+        try:
+            data = json.loads(mensaje['Body'])
+        except ValueError:
+            data = None
+        if self.ya_procesado(data):
+            self.borrar(mensaje)
+            return 'ya_procesados'
+        if not self.marcar(mensaje['MessageId']):
+            self.borrar(mensaje)
+            return 'ya_reenviados'
+        try:
+            self.enviar(mensaje)
+        except Exception:
+            # Sin marca, una corrida posterior puede volver a intentarlo
+            self.counters_table.delete_item(Key={'contador': f"redrive#{mensaje['MessageId']}"})
+            raise
+        self.borrar(mensaje)
+        return 'reenviados'
+
+    def reenviar(self, tipos, tasa: float = 5, max_error: float = 0.2, limite: int = None):
+        mensajes = self.recibir()
+        clasificados = self.clasificar(mensajes)
+        if 'todos' in tipos:
+            elegidos = [m for m, registro in clasificados
+                        if registro['tipo_error'] not in NO_REENVIABLES or registro['tipo_error'] in tipos]
+        else:
+            elegidos = [m for m, registro in clasificados if registro['tipo_error'] in tipos]
+        if limite is not None:
+            elegidos = elegidos[:limite]
+        print(f"🔁 {len(elegidos)} de {len(mensajes)} mensajes de la DLQ a {tasa:g}/s "
+              f"(tipos: {', '.join(tipos)}, máximo de errores {max_error:.0%})")
+
+        conteo = {'reenviados': 0, 'ya_procesados': 0, 'ya_reenviados': 0, 'errores': 0}
+        atendidos = set()
+        inicio = self.reloj()
+        try:
+            for numero, mensaje in enumerate(elegidos, 1):
+                # Ritmo constante: el mensaje n sale en inicio + n / tasa
+                self.dormir(max(0.0, inicio + (numero - 1) / tasa - self.reloj()))
+                try:
+                    conteo[self.reenviar_mensaje(mensaje)] += 1
+                    atendidos.add(mensaje['MessageId'])
+                except Exception as e:
+                    conteo['errores'] += 1
+                    print(f"❌ Error reenviando {mensaje['MessageId']}: {e}")
+
+                proporcion = conteo['errores'] / numero
+                if numero % PROGRESO_CADA == 0 or numero == len(elegidos):
+                    print(f"  {numero}/{len(elegidos)}  reenviados {conteo['reenviados']}  "
+                          f"ya procesados {conteo['ya_procesados']}  ya reenviados {conteo['ya_reenviados']}  "
+                          f"errores {conteo['errores']}  ({self.reloj() - inicio:.1f}s)")
+                if numero >= MUESTRA_MINIMA and proporcion > max_error:
+                    print(f"🛑 Detenido: {proporcion:.0%} de errores en {numero} mensajes (máximo {max_error:.0%})")
+                    break
+        finally:
+            # Lo no elegido, lo que falló y lo que no alcanzó a salir vuelve a ser visible en la DLQ
+            self.liberar([m for m in mensajes if m['MessageId'] not in atendidos])
+        return conteo
+
+# ==================== SIMULACIÓN EN MEMORIA ====================
+
+class RelojSimulado:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+    def dormir(self, segundos):
+        self.ahora += segundos
+
+class ColaSimulada:
+    """receive/delete/change_visibility/send con la semántica de SQS que usa Redrive"""
+    def __init__(self, url, reloj, tasa_fallo_envio=0.0):
+        self.url = url
+        self.reloj = reloj
+        self.tasa_fallo_envio = tasa_fallo_envio
+        self.mensajes = OrderedDict()
+        self._envios = itertools.count(1)
+
+    def agregar(self, body, attributes=None, message_id=None):
+        message_id = message_id or str(uuid.uuid4())
+        self.mensajes[message_id] = {'MessageId': message_id, 'Body': body, 'Attributes': dict(attributes or {}),
+                                     'MessageAttributes': {}, 'visible_desde': 0.0, 'handle': None}
+        return message_id
+
+    def receive_message(self, MaxNumberOfMessages=10, VisibilityTimeout=30, **kwargs):
+        visibles = [m for m in self.mensajes.values() if m['visible_desde'] <= self.reloj()][:MaxNumberOfMessages]
+        for mensaje in visibles:
+            mensaje['visible_desde'] = self.reloj() + VisibilityTimeout
+            mensaje['handle'] = uuid.uuid4().hex
+        return {'Messages': [{'MessageId': m['MessageId'], 'ReceiptHandle': m['handle'], 'Body': m['Body'],
+                              'Attributes': m['Attributes'], 'MessageAttributes': m['MessageAttributes']}
+                             for m in visibles]}
+
+    def _por_handle(self, handle):
+        for message_id, mensaje in self.mensajes.items():
+            if mensaje['handle'] == handle:
+                return message_id
+        raise ClientError({'Error': {'Code': 'ReceiptHandleIsInvalid', 'Message': handle}}, 'DeleteMessage')
+
+    def delete_message(self, ReceiptHandle, **kwargs):
+        del self.mensajes[self._por_handle(ReceiptHandle)]
+
+    def change_message_visibility(self, ReceiptHandle, VisibilityTimeout, **kwargs):
+        self.mensajes[self._por_handle(ReceiptHandle)]['visible_desde'] = self.reloj() + VisibilityTimeout
+
+class SqsSimulado:
+    """Enruta por QueueUrl a cada ColaSimulada; send_message puede fallar a una tasa fija"""
+    def __init__(self, *colas):
+        self.colas = {cola.url: cola for cola in colas}
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        cola = self.colas[QueueUrl]
+        numero = next(cola._envios)
+        if cola.tasa_fallo_envio and numero % round(1 / cola.tasa_fallo_envio) == 0:
+            raise ClientError({'Error': {'Code': 'ServiceUnavailable', 'Message': 'SQS no disponible'}},
+                              'SendMessage')
+        return {'MessageId': cola.agregar(MessageBody)}
+
+    def __getattr__(self, nombre):
+        def llamada(QueueUrl, **kwargs):
+            return getattr(self.colas[QueueUrl], nombre)(**kwargs)
+        return llamada
+
+class TablaSimulada:
+    def __init__(self, llave):
+        self.llave = llave
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get(Key[self.llave])
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item, ConditionExpression=None):
+        if ConditionExpression and Item[self.llave] in self.items:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'existe'}},
+                              'PutItem')
+        self.items[Item[self.llave]] = dict(Item)
+
+    def delete_item(self, Key):
+        self.items.pop(Key[self.llave], None)
+
+    def _igualdades(self, condicion):
+        expresion = condicion.get_expression()
+        if expresion['operator'] == 'AND':
+            return {k: v for parte in expresion['values'] for k, v in self._igualdades(parte).items()}
+        atributo, valor = expresion['values']
+        return {atributo.name: valor}
+
+    def query(self, KeyConditionExpression, **kwargs):
+        filtro = self._igualdades(KeyConditionExpression)
+        return {'Items': [dict(item) for item in self.items.values()
+                          if all(item.get(k) == v for k, v in filtro.items())]}
+
+def sembrar(dlq, counters, transactions):
+    """DLQ con la mezcla de fallas de una caída de la pasarela más algunos mensajes malos"""
+    cruce = lambda i: {'placa': f"P-{i:03d}ABC", 'peaje_id': 'PEAJE_ZONA10', 'timestamp': f"2025-01-20T10:{i // 60:02d}:{i % 60:02d}Z",
+                       'user_type': 'registrado', 'has_tag': False, 'metodo_pago': 'tarjeta_credito'}
+    casos = ([('pasarela_no_disponible', 'Sin respuesta de la pasarela: HTTP 503')] * 40 +
+             [('aws:ProvisionedThroughputExceededException', 'Rate of requests exceeds the allowed throughput')] * 6 +
+             [('mensaje_incompleto', "'user_type'")] * 2 + [('json_invalido', 'El body del mensaje no es JSON')] * 3 +
+             [(None, None)] * 2)
+    for i, (tipo, detalle) in enumerate(casos):
+        data = cruce(i)
+        if tipo == 'mensaje_incompleto':
+            del data['user_type']
+        body = '{"placa": "P-' if tipo == 'json_invalido' else json.dumps(data)
+        message_id = dlq.agregar(body, {'ApproximateReceiveCount': '5'})
+        if tipo:
+            registro = {**clave_fallo(message_id), 'tipo_error': tipo, 'detalle': detalle, 'recepciones': 5}
+            if tipo != 'json_invalido':
+                registro['placa'] = data['placa']
+            counters.put_item(Item=registro)
+        if tipo == 'pasarela_no_disponible' and i % 8 == 0:
+            # Procesado en una entrega posterior cuyo borrado de la DLQ no llegó
+            transactions.put_item(Item={'transaction_id': f"TXN-{i:04d}", **data})
+    return len(casos)
+
+def simular():
+    reloj = RelojSimulado()
+    dlq = ColaSimulada('https://sqs.local/guatepass-processing-dlq-sim', reloj)
+    cola = ColaSimulada('https://sqs.local/guatepass-processing-sim', reloj)
+    counters, transactions = TablaSimulada('contador'), TablaSimulada('transaction_id')
+    redrive = Redrive(SqsSimulado(dlq, cola), dlq.url, cola.url, counters, transactions,
+                      reloj=reloj, dormir=reloj.dormir)
+    total = sembrar(dlq, counters, transactions)
+    errores = []
+
+    print("=== 1. Inspección ===")
+    redrive.inspeccionar()
+    if len(dlq.mensajes) != total:
+        errores.append('la inspección sacó mensajes de la DLQ')
+
+    print("\n=== 2. Reenvío de pasarela_no_disponible a 10/s ===")
+    conteo = redrive.reenviar(['pasarela_no_disponible'], tasa=10)
+    print(f"  cola de procesamiento: {len(cola.mensajes)}  DLQ: {len(dlq.mensajes)}")
+    if (conteo['reenviados'], conteo['ya_procesados'], len(cola.mensajes)) != (35, 5, 35):
+        errores.append(f"reenvío por tipo: {conteo}")
+
+    print("\n=== 3. 'todos' después de una corrida interrumpida (2 mensajes ya marcados redrive#) ===")
+    for mensaje in list(dlq.mensajes.values())[:2]:
+        counters.put_item(Item={'contador': f"redrive#{mensaje['MessageId']}"})
+    conteo = redrive.reenviar(['todos'], tasa=10)
+    print(f"  cola de procesamiento: {len(cola.mensajes)}  DLQ: {len(dlq.mensajes)}")
+    if conteo != {'reenviados': 6, 'ya_procesados': 0, 'ya_reenviados': 2, 'errores': 0} or len(dlq.mensajes) != 5:
+        errores.append(f"todos: {conteo}")
+
+    print("\n=== 4. Reenvío con SQS fallando 1 de cada 3 envíos (máximo 20% de errores) ===")
+    dlq_caida = ColaSimulada('https://sqs.local/guatepass-processing-dlq-sim2', reloj)
+    cola_caida = ColaSimulada('https://sqs.local/guatepass-processing-sim2', reloj, tasa_fallo_envio=1 / 3)
+    counters_caida = TablaSimulada('contador')
+    sembrar(dlq_caida, counters_caida, TablaSimulada('transaction_id'))
+    conteo = Redrive(SqsSimulado(dlq_caida, cola_caida), dlq_caida.url, cola_caida.url, counters_caida,
+                     TablaSimulada('transaction_id'), reloj=reloj, dormir=reloj.dormir).reenviar(['todos'], tasa=10)
+    marcas = sum(1 for llave in counters_caida.items if llave.startswith('redrive#'))
+    print(f"  cola de procesamiento: {len(cola_caida.mensajes)}  DLQ: {len(dlq_caida.mensajes)}  marcas: {marcas}")
+    if conteo['reenviados'] + conteo['errores'] != MUESTRA_MINIMA or marcas != conteo['reenviados']:
+        errores.append(f"umbral de errores: {conteo}, {marcas} marcas")
+    if len(dlq_caida.mensajes) + len(cola_caida.mensajes) != total:
+        errores.append('se perdieron mensajes al detenerse')
+
+    print()
+    for error in errores:
+        print(f"❌ {error}")
+    if not errores:
+        print("✅ Ningún mensaje perdido ni duplicado; la corrida se detuvo en el umbral de errores")
+    return not errores
+
+def cola_url(sqs, nombre):
+    try:
+        return sqs.get_queue_url(QueueName=nombre)['QueueUrl']
+    except ClientError:
+        return sqs.get_queue_url(QueueName=f"{nombre}.fifo")['QueueUrl']
+
+def desde_aws(environment):
+    sqs = boto3.client('sqs')
+    dynamodb = boto3.resource('dynamodb')
+    return Redrive(sqs, cola_url(sqs, f"guatepass-processing-dlq-{environment}"),
+                   cola_url(sqs, f"guatepass-processing-{environment}"),
+                   dynamodb.Table(f"guatepass-counters-{environment}"),
+                   dynamodb.Table(f"guatepass-transactions-{environment}"))
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith('--')]
+    opciones = dict(a[2:].split('=', 1) for a in sys.argv[1:] if a.startswith('--') and '=' in a)
+    comando = argumentos[0] if argumentos else None
+    if comando == 'simular':
+        sys.exit(0 if simular() else 1)
+    elif comando == 'inspeccionar':
+        desde_aws(argumentos[1] if len(argumentos) > 1 else 'dev').inspeccionar()
+    elif comando == 'reenviar' and len(argumentos) > 1:
+        conteo = desde_aws(argumentos[2] if len(argumentos) > 2 else 'dev').reenviar(
+            argumentos[1].split(','),
+            tasa=float(opciones.get('tasa', 5)),
+            max_error=float(opciones.get('max-error', 0.2)),
+            limite=int(opciones['limite']) if 'limite' in opciones else None
+        )
+        sys.exit(1 if conteo['errores'] else 0)
+    else:
+        print("Uso: python scripts/redrive_dlq.py <inspeccionar|reenviar <tipo|todos>|simular> [dev|prod] "
+              "[--tasa=5] [--max-error=0.2] [--limite=N]")
+        sys.exit(1)
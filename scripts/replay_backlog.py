@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Sube un backlog NDJSON de una plaza para que WebhookReplayFunction lo reingeste.
+
+Uso:
+    python scripts/replay_backlog.py PEAJE_ZONA10 backlog_zona10.ndjson
+
+Cada línea del archivo es un cruce con el mismo formato de POST /webhook/toll.
+"""
+import boto3
+import os
+import sys
+from datetime import datetime, timezone
+
+VALID_PEAJES = ['PEAJE_ZONA10', 'PEAJE_ZONA11', 'PEAJE_ZONA12', 'PEAJE_ZONA13']
+
+def get_replay_bucket(stack_name='guatepass-stack'):
+    cloudformation = boto3.client('cloudformation')
+    stacks = cloudformation.describe_stacks(StackName=stack_name)
+    for output in stacks['Stacks'][0]['Outputs']:
+        if output['OutputKey'] == 'ReplayBucketName':
+            return output['OutputValue']
+    return None
+
+def replay_backlog(peaje_id, file_path):
+    if peaje_id not in VALID_PEAJES:
+        print(f"ERROR: peaje_id invalido. Debe ser uno de: {VALID_PEAJES}")
+        sys.exit(1)
+
+    if not os.path.exists(file_path):
+        print(f"ERROR: Archivo {file_path} no encontrado")
+        sys.exit(1)
+
+    bucket = get_replay_bucket()
+    if not bucket:
+        print("ERROR: No se encontro el output ReplayBucketName del stack")
+        sys.exit(1)
+
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    key = f"backlog/{peaje_id}/{stamp}-{os.path.basename(file_path)}"
+
+    # upload_file hace multipart y no carga el archivo completo en memoria
+    s3 = boto3.client('s3')
+    s3.upload_file(file_path, bucket, key, ExtraArgs={'ContentType': 'application/x-ndjson'})
+
+    print(f"Backlog subido: s3://{bucket}/{key}")
+    print(f"El reporte quedara en: s3://{bucket}/reportes/{peaje_id}/{stamp}-{os.path.basename(file_path)}.<epoch>.json")
+    print("Revisa /aws/lambda/webhook-replay-dev en CloudWatch para ver el progreso")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python scripts/replay_backlog.py <PEAJE_ID> <archivo.ndjson>")
+        sys.exit(1)
+    replay_backlog(sys.argv[1], sys.argv[2])
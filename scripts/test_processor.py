@@ -39,9 +39,18 @@ def test_processor():
     sqs = boto3.client('sqs')
     queue_url = sqs.list_queues(QueueNamePrefix='guatepass-processing-dev')['QueueUrls'][0]
     
+    # En modo FIFO (ProcessingQueueFifo=true) cada placa es un grupo de mensajes
+    fifo_params = {}
+    if queue_url.endswith('.fifo'):
+        fifo_params = {
+            'MessageGroupId': test_message['placa'],
+            'MessageDeduplicationId': f"{test_message['placa']}-{test_message['timestamp']}"
+        }
+    
     response = sqs.send_message(
         QueueUrl=queue_url,
-        MessageBody=json.dumps(test_message)
+        MessageBody=json.dumps(test_message),
+        **fifo_params
     )
     
     print(f" Mensaje enviado a SQS: {response['MessageId']}")
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Descarga el snapshot publicado de tags/placas y lo compara contra las tablas.
+
+Uso:
+    python scripts/verify_snapshot.py <bucket> [snapshots/index.bin]
+"""
+import boto3
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'functions', 'webhook'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'layers', 'shared', 'python'))
+from snapshot_index import SnapshotIndex, parallel_scan, verify_snapshot
+
+def main(bucket, key='snapshots/index.bin'):
+    dynamodb = boto3.resource('dynamodb')
+    s3 = boto3.client('s3')
+
+    path = '/tmp/snapshot-verify.bin'
+    s3.download_file(bucket, key, path)
+    index = SnapshotIndex(path)
+
+    version = datetime.fromtimestamp(index.version_ms / 1000, tz=timezone.utc)
+    print(f"Snapshot version: {version.isoformat()} ({index.age_seconds:.0f}s de antiguedad)")
+    print(f"Registros: {index.n_tags} tags, {index.n_placas} placas, {os.path.getsize(path)} bytes")
+
+    tags = parallel_scan(dynamodb.Table('guatepass-tags-dev'), 4)
+    users = parallel_scan(dynamodb.Table('guatepass-users-dev'), 4)
+    report = verify_snapshot(index, tags, users)
+
+    print(f"Tags correctos: {report['tags_ok']}")
+    print(f"Placas correctas: {report['placas_ok']}")
+    print(f"No representables (se resuelven en DynamoDB): {report['no_representables']}")
+    print(f"Faltantes en snapshot: {len(report['faltantes'])} {report['faltantes'][:20]}")
+    print(f"Diferentes a la tabla: {len(report['diferentes'])} {report['diferentes'][:20]}")
+
+    index.close()
+    if report['diferentes']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python scripts/verify_snapshot.py <bucket> [key]")
+        sys.exit(1)
+    main(*sys.argv[1:3])
@@ -0,0 +1,211 @@
+"""
+Archiva en S3 las transacciones con más de ARCHIVE_AFTER_DAYS días.
+
+Corre una vez al día. Recorre los días de proceso (dia-procesado-index) que ya
+pasaron la edad de archivo y no se han archivado: lee las filas completas,
+escribe una parte NDJSON gzip por placa y mes (transaction_archive) y marca cada
+fila con archivado = true y expira_en. El TTL de DynamoDB borra la copia después
+de ARCHIVE_GRACE_HOURS; mientras tanto las lecturas la ignoran y usan el archivo.
+
+El progreso (último día archivado) vive en archivo/_progreso.json y se guarda
+por día, así una corrida cortada por timeout sigue donde quedó. Solo la primera
+corrida busca el día más antiguo en el índice; si no hay nada que archivar,
+guarda como progreso el día anterior al corte. Reprocesar un
+día reescribe sus partes completas, no duplica.
+
+Las filas anteriores a dia_procesado se archivan una sola vez con {"completo": true}.
+"""
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+from transaction_archive import TransactionArchive
+
+dynamodb = aws_clients.resource('dynamodb')
+s3 = aws_clients.client('s3')
+transactions_table = dynamodb.Table(os.environ['TRANSACTIONS_TABLE'])
+archive = TransactionArchive(os.environ['ARCHIVE_BUCKET'], s3=s3)
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_GRACE_HOURS = int(os.environ.get('ARCHIVE_GRACE_HOURS', '168'))
+EXPORT_DAY_SHARDS = int(os.environ.get('EXPORT_DAY_SHARDS', '8'))
+INDICE_DIA = 'dia-procesado-index'
+CLAVE_PROGRESO = f"{archive.prefijo}/_progreso.json"
+# Margen para guardar el progreso antes de que Lambda corte la ejecución
+MARGEN_MS = 120000
+SEGMENTOS_SCAN = 8
+# Rondas de BatchGetItem con UnprocessedKeys antes de dejar el día para la próxima corrida
+BATCH_GET_MAX_ATTEMPTS = 5
+BATCH_GET_BACKOFF_BASE = 0.05
+BATCH_GET_BACKOFF_MAX = 2.0
+
+def lambda_handler(event, context):
+    print(f"Event: {json.dumps(event)}")
+    corte = datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+    if (event or {}).get('completo'):
+        archivadas = archivar_anteriores(corte.isoformat() + 'Z')
+        return {'statusCode': 200, 'body': json.dumps({'archivadas': archivadas})}
+
+    progreso = leer_progreso()
+    dia = datetime.fromisoformat(progreso['ultimo_dia']) + timedelta(days=1) if progreso else primer_dia()
+    if not progreso and (not dia or dia.date() > corte.date()):
+        # Nada que archivar todavía: se guarda el progreso para no recorrer el índice cada día
+        guardar_progreso((corte - timedelta(days=1)).strftime('%Y-%m-%d'))
+        dia = None
+    archivadas = 0
+    dias = 0
+
+    while dia and dia.date() <= corte.date():
+        if context and context.get_remaining_time_in_millis() < MARGEN_MS:
+            print(f"⏸️ Tiempo agotado; la próxima corrida sigue desde {dia.date()}")
+            break
+        archivadas += archivar_dia(dia.strftime('%Y-%m-%d'))
+        guardar_progreso(dia.strftime('%Y-%m-%d'))
+        dia += timedelta(days=1)
+        dias += 1
+
+    print(f"✅ {archivadas} transacciones archivadas en {dias} días de proceso")
+    return {'statusCode': 200, 'body': json.dumps({'dias': dias, 'archivadas': archivadas})}
+
+def archivar_dia(dia: str) -> int:
+    """Archiva todas las transacciones procesadas en el día (todos los shards del índice)"""
+    def consultar_shard(shard):
+        kwargs = {
+            'IndexName': INDICE_DIA,
+            'KeyConditionExpression': 'dia_procesado = :dia',
+            'ProjectionExpression': 'transaction_id, #ts',
+            'ExpressionAttributeNames': {'#ts': 'timestamp'},
+            'ExpressionAttributeValues': {':dia': f"{dia}#{shard}"}
+        }
+        llaves = []
+        while True:
+            response = transactions_table.query(**kwargs)
+            llaves.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return llaves
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with ThreadPoolExecutor(max_workers=EXPORT_DAY_SHARDS) as executor:
+        llaves = [llave for parte in executor.map(consultar_shard, range(EXPORT_DAY_SHARDS)) for llave in parte]
+
+    # El índice no proyecta la fila completa: se lee de la tabla en lotes de 100
+    return archivar(leer_filas(llaves), dia)
+
+def leer_filas(llaves) -> list:
+    """
+    Lee las filas en lotes de 100. Si quedan UnprocessedKeys después de
+    BATCH_GET_MAX_ATTEMPTS rondas se lanza el error antes de escribir nada: el
+    progreso no avanza y la próxima corrida reprocesa el día completo.
+    """
+    filas = []
+    for inicio in range(0, len(llaves), 100):
+        pendientes = {transactions_table.name: {'Keys': llaves[inicio:inicio + 100]}}
+        for intento in range(BATCH_GET_MAX_ATTEMPTS):
+            if intento:
+                # Backoff exponencial con jitter completo
+                time.sleep(random.uniform(0, min(BATCH_GET_BACKOFF_MAX, BATCH_GET_BACKOFF_BASE * (2 ** intento))))
+            response = dynamodb.batch_get_item(RequestItems=pendientes)
+            filas.extend(response['Responses'].get(transactions_table.name, []))
+            pendientes = response.get('UnprocessedKeys') or {}
+            if not pendientes:
+                break
+        if pendientes:
+            restantes = len(pendientes[transactions_table.name]['Keys'])
+            raise RuntimeError(f"{restantes} filas sin leer por throttling tras {BATCH_GET_MAX_ATTEMPTS} intentos")
+    return filas
+
+def archivar(filas, parte: str) -> int:
+    """Escribe las partes por placa y mes y después marca las filas para expirar"""
+    grupos = defaultdict(list)
+    for tx in filas:
+        grupos[(tx['placa'], tx['timestamp'][:7])].append(tx)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda grupo: archive.escribir_parte(grupo[0][0], grupo[0][1], parte, grupo[1]),
+                          grupos.items()))
+
+    # Solo después de que todas las partes están en S3
+    expira_en = int(time.time()) + ARCHIVE_GRACE_HOURS * 3600
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda tx: marcar_archivada(tx, expira_en), filas))
+
+    if filas:
+        print(f"📦 {parte}: {len(filas)} transacciones en {len(grupos)} partes")
+    return len(filas)
+
+def marcar_archivada(tx, expira_en: int):
+    try:
+        transactions_table.update_item(
+            Key={'transaction_id': tx['transaction_id'], 'timestamp': tx['timestamp']},
+            UpdateExpression='SET archivado = :si, expira_en = :expira',
+            # Si la fila ya expiró no se vuelve a crear
+            ConditionExpression='attribute_exists(transaction_id)',
+            ExpressionAttributeValues={':si': True, ':expira': expira_en}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def archivar_anteriores(hasta: str) -> int:
+    """Backfill: filas sin dia_procesado (anteriores al índice) con timestamp antes del corte"""
+    def escanear(segmento):
+        kwargs = {
+            'Segment': segmento,
+            'TotalSegments': SEGMENTOS_SCAN,
+            'FilterExpression': 'attribute_not_exists(dia_procesado) AND attribute_not_exists(archivado) AND #ts < :hasta',
+            'ExpressionAttributeNames': {'#ts': 'timestamp'},
+            'ExpressionAttributeValues': {':hasta': hasta}
+        }
+        filas = []
+        while True:
+            response = transactions_table.scan(**kwargs)
+            filas.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return filas
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with ThreadPoolExecutor(max_workers=SEGMENTOS_SCAN) as executor:
+        filas = [tx for parte in executor.map(escanear, range(SEGMENTOS_SCAN)) for tx in parte]
+
+    # Nombre de parte por corrida: una segunda corrida no pisa lo que ya expiró de DynamoDB
+    return archivar(filas, f"completo-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}")
+
+def primer_dia():
+    """Solo en la primera corrida (sin progreso guardado): el día de proceso más antiguo de la tabla"""
+    response = transactions_table.scan(
+        IndexName=INDICE_DIA,
+        ProjectionExpression='dia_procesado'
+    )
+    dias = [item['dia_procesado'][:10] for item in response.get('Items', [])]
+    while 'LastEvaluatedKey' in response:
+        response = transactions_table.scan(
+            IndexName=INDICE_DIA,
+            ProjectionExpression='dia_procesado',
+            ExclusiveStartKey=response['LastEvaluatedKey']
+        )
+        dias.extend(item['dia_procesado'][:10] for item in response.get('Items', []))
+    return datetime.fromisoformat(min(dias)) if dias else None
+
+def leer_progreso() -> dict:
+    try:
+        return json.loads(s3.get_object(Bucket=archive.bucket, Key=CLAVE_PROGRESO)['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return {}
+        raise
+
+def guardar_progreso(dia: str):
+    s3.put_object(
+        Bucket=archive.bucket,
+        Key=CLAVE_PROGRESO,
+        Body=json.dumps({'ultimo_dia': dia, 'actualizado': datetime.utcnow().isoformat() + 'Z'}).encode('utf-8'),
+        ContentType='application/json'
+    )
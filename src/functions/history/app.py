@@ -1,10 +1,24 @@
 import json
-import boto3
 import os
+from datetime import datetime
 from decimal import Decimal
+from boto3.dynamodb.conditions import Key
 
-dynamodb = boto3.resource('dynamodb')
+import aws_clients
+from http_cache import calcular_etag, cabeceras, no_modificado, respuesta_304, version_de_placa
+from response_cache import cache_from_env
+from transaction_archive import archive_from_env, leer_pagina
+
+dynamodb = aws_clients.resource('dynamodb')
 transactions_table = dynamodb.Table(os.environ['TRANSACTIONS_TABLE'])
+summary_table = dynamodb.Table(os.environ['SUMMARY_TABLE']) if os.environ.get('SUMMARY_TABLE') else None
+counters_table = dynamodb.Table(os.environ['COUNTERS_TABLE']) if os.environ.get('COUNTERS_TABLE') else None
+archive = archive_from_env(os.environ)
+# Vive mientras el contenedor esté caliente; se invalida con la versión de la placa
+response_cache = cache_from_env(os.environ)
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 200
 
 def lambda_handler(event, context):
     print(f"Event: {json.dumps(event)}")
@@ -19,16 +33,37 @@ def lambda_handler(event, context):
     if not is_valid_placa(placa):
         return error_response(400, "INVALID_PLACA", "Invalid placa format")
     
+    if event.get('resource') == '/users/{placa}/summary':
+        return summary_handler(placa)
+    
+    params = event.get('queryStringParameters') or {}
+    limite = params.get('limite', str(LIMITE_POR_DEFECTO))
+    if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_MAXIMO:
+        return error_response(400, "INVALID_LIMITE", f"limite must be between 1 and {LIMITE_MAXIMO}")
+    
+    # La versión de la placa decide el ETag (GET condicional) y si la caché sigue vigente
+    version = etag = None
     try:
-        # Consultar transacciones de la placa
-        response = transactions_table.scan(
-            FilterExpression='placa = :placa',
-            ExpressionAttributeValues={':placa': placa}
+        version = version_de_placa(counters_table, transactions_table, placa)
+        etag = calcular_etag(version, event.get('resource'), placa, limite, params.get('cursor'))
+        if no_modificado(event, etag):
+            return respuesta_304(etag)
+    except Exception as e:
+        print(f"Error computing ETag: {str(e)}")
+    
+    llave = (event.get('resource'), placa, limite, params.get('cursor'))
+    body = response_cache.obtener(llave, version) if version else None
+    if body is not None:
+        return cached_response(body, etag)
+    
+    try:
+        # Página de la placa: recientes desde DynamoDB, antiguas desde el archivo en S3
+        # Solo pagos exitosos (excluir facturas de no registrados)
+        transactions, siguiente_cursor = leer_pagina(
+            transactions_table, archive, placa, int(limite), params.get('cursor'),
+            incluir=lambda tx: tx.get('user_type') != 'no_registrado' and tx.get('resultado', {}).get('pago', {}).get('exitoso', True)
         )
         
-        transactions = response.get('Items', [])
-        
-        # Filtrar solo pagos exitosos (excluir facturas de no registrados)
         payments = [
             {
                 'transaction_id': tx['transaction_id'],
@@ -40,38 +75,97 @@ def lambda_handler(event, context):
                 'fecha_procesado': tx.get('fecha_procesado')
             }
             for tx in transactions
-            if tx.get('user_type') != 'no_registrado' and tx.get('resultado', {}).get('pago', {}).get('exitoso', True)
         ]
         
-        # Ordenar por timestamp descendente
-        payments.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        return success_response({
+        response = success_response({
             'placa': placa,
+            # Ambos cuentan las filas de esta página; el total de la placa está en /users/{placa}/summary
             'total_payments': len(payments),
-            'payments': payments
-        })
+            'total_en_pagina': len(payments),
+            'payments': payments,
+            'siguiente_cursor': siguiente_cursor
+        }, etag)
+        if version:
+            response_cache.guardar(llave, version, response['body'])
+        return response
         
+    except ValueError:
+        return error_response(400, "INVALID_CURSOR", "Invalid pagination cursor")
     except Exception as e:
         print(f"Error querying payments: {str(e)}")
         return error_response(500, "INTERNAL_ERROR", "Error retrieving payment history")
 
+def summary_handler(placa):
+    """Resumen de la placa en una sola lectura: items TOTAL y mes actual"""
+    mes_actual = datetime.utcnow().strftime('%Y-%m')
+    try:
+        # 'TOTAL' ordena después de cualquier 'YYYY-MM', así un solo query trae ambos
+        response = summary_table.query(
+            KeyConditionExpression=Key('placa').eq(placa) & Key('periodo').gte(mes_actual)
+        )
+        items = {item['periodo']: item for item in response.get('Items', [])}
+        
+        if 'TOTAL' not in items:
+            return error_response(404, "NO_SUMMARY_FOUND", "No transactions found for this placa")
+        
+        total = format_summary(items['TOTAL'])
+        total['ultima_plaza'] = items['TOTAL'].get('ultima_plaza')
+        total['ultimo_timestamp'] = items['TOTAL'].get('ultimo_timestamp')
+        
+        return success_response({
+            'placa': placa,
+            'total': total,
+            'mes_actual': {'periodo': mes_actual, **format_summary(items.get(mes_actual, {}))}
+        })
+        
+    except Exception as e:
+        print(f"Error querying summary: {str(e)}")
+        return error_response(500, "INTERNAL_ERROR", "Error retrieving account summary")
+
+def format_summary(item):
+    """Convierte gasto_<escenario>/cruces_<escenario> en un desglose por escenario"""
+    por_escenario = {}
+    for atributo, valor in item.items():
+        for prefijo, campo in (('gasto_', 'gasto'), ('cruces_', 'cruces')):
+            if atributo.startswith(prefijo) and atributo != f"{prefijo}total":
+                por_escenario.setdefault(atributo[len(prefijo):], {'gasto': 0, 'cruces': 0})[campo] = (
+                    int(valor) if campo == 'cruces' else valor
+                )
+    return {
+        'gasto': item.get('gasto_total', 0),
+        'cruces': int(item.get('cruces_total', 0)),
+        'por_escenario': por_escenario
+    }
+
 def is_valid_placa(placa):
     """Valida formato de placa guatemalteca"""
     import re
     pattern = r'^[A-Z0-9]{1,3}-[A-Z0-9]{3,6}$'
     return re.match(pattern, placa) is not None
 
-def success_response(data):
+def success_response(data, etag=None):
     return {
         'statusCode': 200,
         'headers': {
             'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
+            'Access-Control-Allow-Origin': '*',
+            **(cabeceras(etag) if etag else {})
         },
         'body': json.dumps(data, default=decimal_default)
     }
 
+def cached_response(body, etag):
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'X-Cache': 'HIT',
+            **cabeceras(etag)
+        },
+        'body': body
+    }
+
 def error_response(status_code, error_code, message):
     return {
         'statusCode': status_code,
@@ -1,16 +1,31 @@
 import json
-import boto3
 import os
+import re
 from decimal import Decimal
 
-dynamodb = boto3.resource('dynamodb')
+from boto3.dynamodb.conditions import Key
+
+import aws_clients
+from http_cache import calcular_etag, cabeceras, no_modificado, respuesta_304, version_de_placa
+from response_cache import cache_from_env
+from transaction_archive import archive_from_env, leer_pagina
+
+dynamodb = aws_clients.resource('dynamodb')
 transactions_table = dynamodb.Table(os.environ['TRANSACTIONS_TABLE'])
+statements_table = dynamodb.Table(os.environ['STATEMENTS_TABLE']) if os.environ.get('STATEMENTS_TABLE') else None
+counters_table = dynamodb.Table(os.environ['COUNTERS_TABLE']) if os.environ.get('COUNTERS_TABLE') else None
+archive = archive_from_env(os.environ)
+# Vive mientras el contenedor esté caliente; se invalida con la versión de la placa
+response_cache = cache_from_env(os.environ)
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 200
 
 def lambda_handler(event, context):
     print(f"Event: {json.dumps(event)}")
     
     # Extraer placa del path
-    placa = event.get('pathParameters', {}).get('placa', '').upper()
+    placa = (event.get('pathParameters') or {}).get('placa', '').upper()
     
     if not placa:
         return error_response(400, "MISSING_PLACA", "Placa parameter is required")
@@ -19,16 +34,38 @@ def lambda_handler(event, context):
     if not is_valid_placa(placa):
         return error_response(400, "INVALID_PLACA", "Invalid placa format")
     
+    if event.get('resource') == '/history/statements/{placa}':
+        periodo = (event.get('queryStringParameters') or {}).get('periodo')
+        return statements_handler(placa, periodo)
+    
+    params = event.get('queryStringParameters') or {}
+    limite = params.get('limite', str(LIMITE_POR_DEFECTO))
+    if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_MAXIMO:
+        return error_response(400, "INVALID_LIMITE", f"limite must be between 1 and {LIMITE_MAXIMO}")
+    
+    # La versión de la placa decide el ETag (GET condicional) y si la caché sigue vigente
+    version = etag = None
+    try:
+        version = version_de_placa(counters_table, transactions_table, placa)
+        etag = calcular_etag(version, event.get('resource'), placa, limite, params.get('cursor'))
+        if no_modificado(event, etag):
+            return respuesta_304(etag)
+    except Exception as e:
+        print(f"Error computing ETag: {str(e)}")
+    
+    llave = (event.get('resource'), placa, limite, params.get('cursor'))
+    body = response_cache.obtener(llave, version) if version else None
+    if body is not None:
+        return cached_response(body, etag)
+    
     try:
-        # Consultar transacciones de la placa
-        response = transactions_table.scan(
-            FilterExpression='placa = :placa',
-            ExpressionAttributeValues={':placa': placa}
+        # Página de la placa: recientes desde DynamoDB, antiguas desde el archivo en S3
+        # Solo facturas de no registrados
+        transactions, siguiente_cursor = leer_pagina(
+            transactions_table, archive, placa, int(limite), params.get('cursor'),
+            incluir=lambda tx: tx.get('user_type') == 'no_registrado' and tx.get('resultado', {}).get('factura')
         )
         
-        transactions = response.get('Items', [])
-        
-        # Filtrar solo facturas de no registrados
         invoices = [
             {
                 'factura_id': tx.get('resultado', {}).get('factura', {}).get('factura_id', 'N/A'),
@@ -42,37 +79,98 @@ def lambda_handler(event, context):
                 'estado': 'pendiente'
             }
             for tx in transactions
-            if tx.get('user_type') == 'no_registrado' and tx.get('resultado', {}).get('factura')
         ]
         
-        # Ordenar por timestamp descendente
-        invoices.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        return success_response({
+        response = success_response({
             'placa': placa,
+            # Ambos cuentan las filas de esta página; el total de la placa está en /users/{placa}/summary
             'total_invoices': len(invoices),
-            'invoices': invoices
-        })
+            'total_en_pagina': len(invoices),
+            'invoices': invoices,
+            'siguiente_cursor': siguiente_cursor
+        }, etag)
+        if version:
+            response_cache.guardar(llave, version, response['body'])
+        return response
         
+    except ValueError:
+        return error_response(400, "INVALID_CURSOR", "Invalid pagination cursor")
     except Exception as e:
         print(f"Error querying invoices: {str(e)}")
         return error_response(500, "INTERNAL_ERROR", "Error retrieving invoice history")
 
+def statements_handler(placa, periodo=None):
+    """Estados de cuenta mensuales de la placa (más reciente primero)"""
+    if periodo and not re.match(r'^\d{4}-\d{2}$', periodo):
+        return error_response(400, "INVALID_PERIODO", "Periodo must be YYYY-MM")
+    
+    try:
+        condicion = Key('placa').eq(placa)
+        if periodo:
+            condicion = condicion & Key('periodo').begins_with(periodo)
+        
+        kwargs = {'KeyConditionExpression': condicion}
+        items = []
+        while True:
+            response = statements_table.query(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        
+        # Las partes "YYYY-MM#NNN" quedan justo después de su encabezado "YYYY-MM". Solo cuentan
+        # las primeras "partes - 1": una corrida anterior del mes con más líneas pudo dejar partes
+        # de más, y una parte sin encabezado no es un estado completo
+        statements = []
+        partes = 0
+        for item in items:
+            periodo_base, _, numero = item['periodo'].partition('#')
+            if numero:
+                if statements and statements[-1]['periodo'] == periodo_base and int(numero) < partes:
+                    statements[-1]['lineas'].extend(item['lineas'])
+                continue
+            partes = int(item.pop('partes', 1))
+            statements.append(item)
+        
+        statements.reverse()
+        
+        return success_response({
+            'placa': placa,
+            'total_statements': len(statements),
+            'statements': statements
+        })
+        
+    except Exception as e:
+        print(f"Error querying statements: {str(e)}")
+        return error_response(500, "INTERNAL_ERROR", "Error retrieving statements")
+
 def is_valid_placa(placa):
-    import re
     pattern = r'^[A-Z0-9]{1,3}-[A-Z0-9]{3,6}$'
     return re.match(pattern, placa) is not None
 
-def success_response(data):
+def success_response(data, etag=None):
     return {
         'statusCode': 200,
         'headers': {
             'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
+            'Access-Control-Allow-Origin': '*',
+            **(cabeceras(etag) if etag else {})
         },
         'body': json.dumps(data, default=decimal_default)
     }
 
+def cached_response(body, etag):
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'X-Cache': 'HIT',
+            **cabeceras(etag)
+        },
+        'body': body
+    }
+
 def error_response(status_code, error_code, message):
     return {
         'statusCode': status_code,
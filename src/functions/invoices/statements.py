@@ -0,0 +1,203 @@
+"""
+Estados de cuenta mensuales consolidados para placas no registradas.
+
+En lugar de una factura (y una multa tardía) por cruce, cada placa recibe un
+estado de cuenta por mes con todas sus líneas. Con CONSOLIDATED_STATEMENTS el
+processor descuenta cada cruce sin la multa y sin factura ni notificación; el
+estado suma lo cobrado y agrega la multa una sola vez:
+
+    subtotal_peajes = líneas sin multa        total_cobrado   = lo descontado por cruce
+    total           = subtotal + multa        saldo_pendiente = total - total_cobrado
+
+Los cruces anteriores con factura propia ya pagaron su multa: su línea la descuenta
+y el saldo pendiente queda en negativo (a favor de la placa). El proceso corre en
+dos fases con memoria acotada:
+
+1. Scan paralelo de TransactionsTable (Segment/TotalSegments). Cada segmento
+   escribe sus filas en archivos temporales particionados por hash de placa.
+2. Cada shard de placas se agrupa por separado (en paralelo) y se escribe un
+   estado por placa en StatementsTable. En memoria solo vive un shard a la vez
+   por worker: ~ cruces del mes / shards.
+
+    placa   (HASH)  = placa
+    periodo (RANGE) = "YYYY-MM"        -> encabezado con totales y primeras líneas
+                      "YYYY-MM#NNN"    -> partes adicionales si la placa tiene muchas líneas
+"""
+import os
+import shutil
+import tempfile
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import aws_clients
+from transaction_schema import leer_transaccion
+
+MULTA_TARDIA = Decimal('15.00')
+# Mantiene cada item muy por debajo del límite de 400 KB de DynamoDB
+LINEAS_POR_ITEM = 1000
+CAMPOS = ('placa', 'transaction_id', 'factura_id', 'peaje_id', 'timestamp', 'monto', 'pago_real')
+
+def shard_de_placa(placa: str, shards: int) -> int:
+    # crc32 es estable entre procesos (hash() de Python no lo es)
+    return zlib.crc32(placa.encode('utf-8')) % shards
+
+def escanear_segmento(transactions_table, periodo: str, segmento: int, total_segmentos: int):
+    """Filas no_registrado del periodo en un segmento del scan paralelo"""
+    kwargs = {
+        'Segment': segmento,
+        'TotalSegments': total_segmentos,
+        'FilterExpression': 'user_type = :nr AND begins_with(#ts, :periodo)',
+        'ProjectionExpression': 'placa, transaction_id, peaje_id, #ts, monto, resultado.factura.factura_id, '
+                                'resultado.pago_real, v, monto_c, factura_id, consolidado, pago_real',
+        'ExpressionAttributeNames': {'#ts': 'timestamp'},
+        'ExpressionAttributeValues': {':nr': 'no_registrado', ':periodo': periodo}
+    }
+    while True:
+        response = transactions_table.scan(**kwargs)
+        for tx in map(leer_transaccion, response.get('Items', [])):
+            yield {
+                'placa': tx['placa'],
+                'transaction_id': tx['transaction_id'],
+                'factura_id': tx.get('resultado', {}).get('factura', {}).get('factura_id', ''),
+                'peaje_id': tx['peaje_id'],
+                'timestamp': tx['timestamp'],
+                'monto': tx['monto'],
+                'pago_real': int(bool(tx.get('resultado', {}).get('pago_real')))
+            }
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def particionar(filas, directorio: str, prefijo: str, shards: int) -> int:
+    """Escribe las filas en un archivo por shard (TSV); devuelve cuántas escribió"""
+    archivos = [
+        open(os.path.join(directorio, f"{prefijo}-{shard:03d}.tsv"), 'w', encoding='utf-8', buffering=1 << 20)
+        for shard in range(shards)
+    ]
+    total = 0
+    try:
+        for fila in filas:
+            archivos[shard_de_placa(fila['placa'], shards)].write(
+                '\t'.join(str(fila[campo]) for campo in CAMPOS) + '\n'
+            )
+            total += 1
+    finally:
+        for archivo in archivos:
+            archivo.close()
+    return total
+
+def rutas_por_shard(directorio: str, shards: int):
+    """Agrupa los archivos de todos los segmentos por shard"""
+    rutas = defaultdict(list)
+    for nombre in sorted(os.listdir(directorio)):
+        if nombre.endswith('.tsv'):
+            rutas[int(nombre[-7:-4])].append(os.path.join(directorio, nombre))
+    return [rutas[shard] for shard in range(shards)]
+
+def consolidar_shard(rutas, periodo: str, generado_en: str = None) -> list:
+    """Agrupa por placa las filas de un shard y construye los items de estado de cuenta"""
+    lineas_por_placa = defaultdict(list)
+    for ruta in rutas:
+        with open(ruta, encoding='utf-8') as archivo:
+            for linea in archivo:
+                placa, transaction_id, factura_id, peaje_id, timestamp, monto, pago_real = linea.rstrip('\n').split('\t')
+                lineas_por_placa[placa].append((timestamp, transaction_id, factura_id, peaje_id, monto, pago_real))
+
+    generado_en = generado_en or datetime.utcnow().isoformat() + 'Z'
+    items = []
+    for placa, lineas in lineas_por_placa.items():
+        items.extend(construir_estado(placa, periodo, lineas, generado_en))
+    return items
+
+def construir_estado(placa: str, periodo: str, lineas, generado_en: str) -> list:
+    """Encabezado con totales + partes de hasta LINEAS_POR_ITEM líneas ordenadas por timestamp"""
+    lineas = sorted(lineas)
+    # Solo las facturas individuales (cruces anteriores a la consolidación) incluían la multa
+    detalle = [
+        {
+            'timestamp': timestamp,
+            'transaction_id': transaction_id,
+            **({'factura_id': factura_id} if factura_id else {}),
+            'peaje_id': peaje_id,
+            'monto': Decimal(monto) - (MULTA_TARDIA if factura_id else 0)
+        }
+        for timestamp, transaction_id, factura_id, peaje_id, monto, _ in lineas
+    ]
+    subtotal = sum((linea['monto'] for linea in detalle), Decimal('0'))
+    cobrado = sum((Decimal(monto) for *_, monto, pago_real in lineas if pago_real == '1'), Decimal('0'))
+    partes = [detalle[i:i + LINEAS_POR_ITEM] for i in range(0, len(detalle), LINEAS_POR_ITEM)]
+
+    items = [{
+        'placa': placa,
+        'periodo': periodo,
+        'estado_id': f"EC-{periodo}-{placa}",
+        'total_cruces': len(lineas),
+        'subtotal_peajes': subtotal,
+        'multa_tardia': MULTA_TARDIA,
+        'total': subtotal + MULTA_TARDIA,
+        'total_cobrado': cobrado,
+        'saldo_pendiente': subtotal + MULTA_TARDIA - cobrado,
+        'partes': len(partes),
+        'lineas': partes[0],
+        'estado': 'pendiente',
+        'generado_en': generado_en
+    }]
+    for numero, parte in enumerate(partes[1:], start=1):
+        items.append({'placa': placa, 'periodo': f"{periodo}#{numero:03d}", 'lineas': parte})
+    return items
+
+def guardar_estados(statements_table, items) -> int:
+    with statements_table.batch_writer(overwrite_by_pkeys=['placa', 'periodo']) as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    return len(items)
+
+def generar_estados(transactions_table, statements_table, periodo: str, segmentos: int = 8,
+                    shards: int = 16, workers: int = 8, directorio: str = None) -> dict:
+    """Fase 1: scan paralelo -> archivos por shard. Fase 2: agrupar y escribir cada shard en paralelo."""
+    directorio_temporal = tempfile.mkdtemp(prefix='estados-', dir=directorio)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            cruces = sum(executor.map(
+                lambda segmento: particionar(
+                    escanear_segmento(transactions_table, periodo, segmento, segmentos),
+                    directorio_temporal, f"seg{segmento:03d}", shards
+                ),
+                range(segmentos)
+            ))
+
+            generado_en = datetime.utcnow().isoformat() + 'Z'
+
+            def procesar(rutas):
+                items = consolidar_shard(rutas, periodo, generado_en)
+                guardar_estados(statements_table, items)
+                return sum(1 for item in items if 'estado_id' in item)
+
+            placas = sum(executor.map(procesar, rutas_por_shard(directorio_temporal, shards)))
+    finally:
+        shutil.rmtree(directorio_temporal, ignore_errors=True)
+
+    return {'periodo': periodo, 'cruces': cruces, 'estados': placas}
+
+def periodo_anterior(hoy: datetime = None) -> str:
+    hoy = hoy or datetime.utcnow()
+    return (hoy.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+
+def consolidation_handler(event, context):
+    """Lambda programada el día 1 de cada mes; el periodo también puede venir en el evento"""
+    dynamodb = aws_clients.resource('dynamodb')
+    periodo = (event or {}).get('periodo') or periodo_anterior()
+
+    resultado = generar_estados(
+        dynamodb.Table(os.environ['TRANSACTIONS_TABLE']),
+        dynamodb.Table(os.environ['STATEMENTS_TABLE']),
+        periodo,
+        segmentos=int(os.environ.get('STATEMENT_SCAN_SEGMENTS', '8')),
+        shards=int(os.environ.get('STATEMENT_SHARDS', '16')),
+        workers=int(os.environ.get('STATEMENT_WORKERS', '8'))
+    )
+    print(f"📑 Estados de cuenta {periodo}: {resultado['estados']} placas, {resultado['cruces']} cruces")
+    return resultado
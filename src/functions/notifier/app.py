@@ -7,6 +7,8 @@ from datetime import datetime
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+CANALES = ('email', 'sms')
+
 def lambda_handler(event, context):
     """
     Lambda function que procesa notificaciones de SNS y simula envio de emails/SMS
@@ -35,13 +37,16 @@ def lambda_handler(event, context):
 
 def process_notification(notification_data):
     """
-    Procesa y simula el envio de notificaciones segun el tipo de usuario y escenario
+    Procesa y simula el envio de notificaciones segun el tipo de usuario y escenario.
+    Solo envía por los canales que resolvió el processor (preferencias del usuario).
     """
     placa = notification_data.get('placa')
     escenario = notification_data.get('escenario')
     user_type = notification_data.get('user_type')
-    email = notification_data.get('email')
-    telefono = notification_data.get('telefono')
+    # Mensajes sin 'canales' (anteriores a las preferencias): todos los canales con contacto
+    canales = notification_data.get('canales', CANALES)
+    email = notification_data.get('email') if 'email' in canales else None
+    telefono = notification_data.get('telefono') if 'sms' in canales else None
     monto = notification_data.get('monto')
     resultado = notification_data.get('resultado', {})
     peaje_id = notification_data.get('peaje_id')
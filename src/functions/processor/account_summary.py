@@ -0,0 +1,84 @@
+"""
+Resumen de cuenta por placa mantenido al escribir cada transacción.
+
+    placa   (HASH)  = placa
+    periodo (RANGE) = "TOTAL"   -> acumulado de toda la vida de la cuenta
+                      "YYYY-MM" -> acumulado del mes
+
+Cada item guarda gasto y cruces totales y por tipo_escenario
+(gasto_<escenario>, cruces_<escenario>), más la última plaza y el último
+timestamp. El gasto solo suma lo que se cobró (transaction_schema.cobro_exitoso);
+un cruce con pago rechazado o sin saldo suma al conteo de cruces.
+
+Los acumulados (ADD en TOTAL y en el mes) van en la misma TransactWriteItems que
+guarda la transacción, condicionada a que transaction_id no exista: una nueva
+entrega del cruce cancela todo y no se cuenta dos veces. La última plaza se
+avanza después con una escritura condicional aparte, que repetida no cambia nada.
+"""
+import os
+from decimal import Decimal
+from typing import Dict, List
+
+import aws_clients
+from transaction_schema import cobro_exitoso
+
+PERIODO_TOTAL = 'TOTAL'
+
+def periodo_de(timestamp: str) -> str:
+    return timestamp[:7]
+
+def contribucion(transaccion: dict) -> dict:
+    """Lo que una transacción suma al resumen; el reconciliador usa la misma regla"""
+    escenario = transaccion.get('tipo_escenario', 'unknown')
+    monto = transaccion['monto']
+    if not isinstance(monto, Decimal):
+        monto = Decimal(str(monto))
+    if not cobro_exitoso(transaccion.get('resultado', {})):
+        monto = Decimal('0')
+    return {
+        'gasto_total': monto,
+        'cruces_total': 1,
+        f"gasto_{escenario}": monto,
+        f"cruces_{escenario}": 1
+    }
+
+class AccountSummary:
+    def __init__(self, summary_table):
+        self.summary_table = summary_table
+
+    def items_transaccion(self, transaccion: dict) -> List[Dict]:
+        """Updates (TransactWriteItems) que suman la transacción al item TOTAL y al del mes"""
+        nombres = {}
+        valores = {}
+        sumas = []
+        for i, (atributo, valor) in enumerate(contribucion(transaccion).items()):
+            nombres[f"#a{i}"] = atributo
+            valores[f":v{i}"] = valor
+            sumas.append(f"#a{i} :v{i}")
+
+        return [{'Update': {
+            'TableName': self.summary_table.name,
+            'Key': {'placa': transaccion['placa'], 'periodo': periodo},
+            'UpdateExpression': f"ADD {', '.join(sumas)}",
+            'ExpressionAttributeNames': nombres,
+            'ExpressionAttributeValues': valores
+        }} for periodo in (PERIODO_TOTAL, periodo_de(transaccion['timestamp']))]
+
+    def avanzar_ultimo(self, transaccion: dict):
+        """Última plaza y timestamp de TOTAL y del mes; un cruce atrasado (replay, reintento) no los retrocede"""
+        for periodo in (PERIODO_TOTAL, periodo_de(transaccion['timestamp'])):
+            try:
+                self.summary_table.update_item(
+                    Key={'placa': transaccion['placa'], 'periodo': periodo},
+                    UpdateExpression='SET ultima_plaza = :peaje, ultimo_timestamp = :ts',
+                    ConditionExpression='attribute_not_exists(ultimo_timestamp) OR ultimo_timestamp <= :ts',
+                    ExpressionAttributeValues={':peaje': transaccion['peaje_id'], ':ts': transaccion['timestamp']}
+                )
+            except self.summary_table.meta.client.exceptions.ConditionalCheckFailedException:
+                pass
+
+def summary_from_env(dynamodb=None):
+    if not os.environ.get('SUMMARY_TABLE'):
+        return None
+    dynamodb = dynamodb or aws_clients.resource('dynamodb')
+    return AccountSummary(dynamodb.Table(os.environ['SUMMARY_TABLE']))
@@ -1,13 +1,32 @@
+import hashlib
 import json
-import boto3
+import aws_clients
 import os
+import random
 import traceback
-import uuid
+from collections import OrderedDict
 from decimal import Decimal
 from datetime import datetime
 
+from botocore.exceptions import ClientError
+
 # Importar la clase PaymentCalculator
 from payment_calculator import PaymentCalculator
+from balance_ledger import ledger_from_env
+from invoice_generator import InvoiceGenerator
+from invoice_numbering import numbering_from_env
+from account_summary import summary_from_env
+from plaza_traffic import traffic_from_env
+from transaction_schema import MENSAJE_EXITOSO, MENSAJE_FALLIDO, compactar_transaccion, cobro_exitoso
+from http_cache import clave_version
+from notification_preferences import atributos_mensaje, contacto_de, resolver_canales, sin_contacto
+from concurrency import procesar_grupos
+from payment_gateway import PasarelaNoDisponible, gateway_from_env
+from dead_letters import registrar_fallo, tipo_error
+from charge_marks import motivos_cancelacion
+from deferred_enrichment import CruceInvalido, completar_cruce, fuera_de_grupo, reencolar_por_placa
+from replay_order import APLICADO, ESPERAR, replay_order_from_env
+from metricas import Metricas
 
 # Configuración de tarifas
 TARIFAS_BASE = {
@@ -21,77 +40,124 @@ RECARGO_NO_REGISTRADO = Decimal('1.5')
 MULTA_TARDIA = Decimal('15.00')
 DESCUENTO_TAG = Decimal('0.9')
 
+# Shards por día del índice dia-procesado-index (exportador incremental)
+EXPORT_DAY_SHARDS = int(os.environ.get('EXPORT_DAY_SHARDS', '8'))
+
+# Formato de los items de TransactionsTable: 2 = compacto (transaction_schema), 1 = resultado completo
+TRANSACTION_SCHEMA_VERSION = int(os.environ.get('TRANSACTION_SCHEMA_VERSION', '2'))
+
+# Cruces no registrados al estado de cuenta mensual (invoices/statements.py): sin multa
+# tardía, factura ni notificación por cruce; la multa se cobra una vez en el estado
+ESTADOS_CONSOLIDADOS = os.environ.get('CONSOLIDATED_STATEMENTS', 'false').lower() == 'true'
+
+# Grupos (placas) del lote de SQS procesados en paralelo; 1 = en serie
+PROCESSOR_CONCURRENCY = int(os.environ.get('PROCESSOR_CONCURRENCY', '10'))
+
 # Clients de AWS
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+dynamodb = aws_clients.resource('dynamodb')
+sns = aws_clients.client('sns')
 
 # Tablas DynamoDB
 users_table = dynamodb.Table(os.environ['USERS_TABLE'])
 transactions_table = dynamodb.Table(os.environ['TRANSACTIONS_TABLE'])
 tags_table = dynamodb.Table(os.environ['TAGS_TABLE'])
+# Versión por placa (version#<placa>) que invalida la caché y los ETag del historial
+counters_table = dynamodb.Table(os.environ['COUNTERS_TABLE']) if os.environ.get('COUNTERS_TABLE') else None
 
 # SNS Topic
 notifications_topic_arn = os.environ['NOTIFICATIONS_TOPIC_ARN']
 
-# Inicializar PaymentCalculator
-payment_calculator = PaymentCalculator()
+# Cola de procesamiento (opcional): cruces diferidos que llegaron en otro grupo FIFO vuelven al de su placa
+processing_queue_url = os.environ.get('PROCESSING_QUEUE_URL')
+sqs = aws_clients.client('sqs') if processing_queue_url else None
+
+# Inicializar PaymentCalculator (con ledger de saldo si LEDGER_TABLE está configurada y
+# marcas de cobro en COUNTERS_TABLE para no descontar dos veces el mismo cruce)
+payment_calculator = PaymentCalculator(ledger_from_env(dynamodb), counters_table)
+
+# Facturas con numeración fiscal por bloques arrendados, asignada al guardar la transacción (COUNTERS_TABLE)
+invoice_generator = InvoiceGenerator(numbering_from_env(dynamodb))
+
+# Resumen por placa (SUMMARY_TABLE) sumado en la misma transacción que guarda el cruce
+account_summary = summary_from_env(dynamodb)
+
+# Contadores por plaza y minuto (TRAFFIC_TABLE)
+plaza_traffic = traffic_from_env(dynamodb)
+
+# Orden por placa de los cruces de replay de backlog (replay#<archivo>#<placa> en COUNTERS_TABLE)
+orden_replay = replay_order_from_env(counters_table)
 
-def calcular_monto(peaje_id, user_type, has_tag):
+# Pasarela de pago (PAYMENT_GATEWAY) con timeouts, reintentos y circuit breaker; métricas EMF por invocación
+metricas = Metricas({'Servicio': 'processor'})
+pasarela_pago = gateway_from_env(metricas)
+
+def calcular_monto(peaje_id, user_type, has_tag, con_multa=True):
     tarifa_base = TARIFAS_BASE.get(peaje_id, Decimal('25.00'))
     
     if user_type == 'no_registrado':
-        return (tarifa_base * RECARGO_NO_REGISTRADO + MULTA_TARDIA).quantize(Decimal('0.01'))
+        multa = MULTA_TARDIA if con_multa else Decimal('0')
+        return (tarifa_base * RECARGO_NO_REGISTRADO + multa).quantize(Decimal('0.01'))
     elif user_type == 'registrado' and has_tag:
         return (tarifa_base * DESCUENTO_TAG).quantize(Decimal('0.01'))
     else:
         return tarifa_base.quantize(Decimal('0.01'))
 
-def procesar_pago_real(placa, monto, user_type):
-    """Procesa el pago REAL descontando del saldo"""
+def procesar_pago_real(placa, monto, user_type, referencia=None):
+    """Procesa el pago REAL descontando del saldo (una sola vez por referencia de cobro)"""
     print(f"💰 PROCESANDO PAGO REAL: {placa} - {monto}Q - {user_type}")
     
-    try:
-        # Usar PaymentCalculator para descontar saldo
-        pago_exitoso = payment_calculator.procesar_pago(placa, monto, user_type, users_table)
-        
-        if pago_exitoso:
-            print(f"✅ PAGO REAL EXITOSO: {placa} - {monto}Q descontados")
-        else:
-            print(f"❌ PAGO REAL FALLIDO: {placa} - Saldo insuficiente")
-            
-        return pago_exitoso
+    # Un error que no sea falta de saldo se propaga: el mensaje vuelve a la cola y el
+    # reintento reutiliza la autorización de la pasarela (misma referencia de cobro)
+    pago_exitoso = payment_calculator.procesar_pago(placa, monto, user_type, users_table, referencia)
+    
+    if pago_exitoso:
+        print(f"✅ PAGO REAL EXITOSO: {placa} - {monto}Q descontados")
+    else:
+        print(f"❌ PAGO REAL FALLIDO: {placa} - Saldo insuficiente")
         
-    except Exception as e:
-        print(f"❌ ERROR EN PAGO REAL: {e}")
-        traceback.print_exc()
-        return False
+    return pago_exitoso
 
-def simular_procesamiento_pago(placa, monto, metodo_pago, user_type):
-    """Simula el procesamiento de pago PERO también procesa pago real"""
-    print(f"🎯 SIMULANDO PAGO + PAGO REAL: {placa} - {monto}Q")
-    
-    # 1. PROCESAR PAGO REAL (descontar saldo)
-    pago_real_exitoso = procesar_pago_real(placa, monto, user_type)
+def referencia_cobro(data):
+    """Llave de idempotencia del cobro: igual en cada reintento y en cada entrega del mensaje"""
+    return f"{data['placa']}#{data['peaje_id']}#{data['timestamp']}"
+
+def procesar_cobro(data, monto, metodo_pago, user_type):
+    """
+    Autoriza el cobro en la pasarela y, si se aprueba, descuenta el saldo.
+    Si la pasarela no responde se lanza PasarelaNoDisponible antes de tocar el
+    saldo: el mensaje vuelve a la cola y el cobro se reintenta completo.
+    """
+    placa = data['placa']
+    print(f"🎯 AUTORIZANDO PAGO: {placa} - {monto}Q - {metodo_pago}")
     
-    # 2. Simular detalles de procesamiento (para la notificación)
-    import random
-    exito_simulado = random.random() > 0.05  # 95% de éxito
+    autorizacion = pasarela_pago.autorizar(placa, monto, metodo_pago, referencia_cobro(data))
+    if not autorizacion.get('aprobado'):
+        print(f"❌ PAGO RECHAZADO POR LA PASARELA: {placa} - {autorizacion.get('motivo')}")
+        return {
+            'exitoso': False,
+            'error': 'Pago rechazado',
+            'mensaje': MENSAJE_FALLIDO,
+            'metodo_pago': metodo_pago,
+            'pago_real': False,
+            'rechazado': True
+        }
     
-    if pago_real_exitoso and exito_simulado:
+    pago_real_exitoso = procesar_pago_real(placa, monto, user_type, referencia_cobro(data))
+    if pago_real_exitoso:
         return {
             'exitoso': True,
-            'codigo_autorizacion': f"AUTH-{uuid.uuid4().hex[:8].upper()}",
-            'mensaje': 'Pago procesado exitosamente',
+            'codigo_autorizacion': autorizacion.get('codigo_autorizacion'),
+            'mensaje': MENSAJE_EXITOSO,
             'metodo_pago': metodo_pago,
             'pago_real': True
         }
     else:
         return {
             'exitoso': False,
-            'error': 'Fondos insuficientes' if not pago_real_exitoso else 'Error en procesamiento',
-            'mensaje': 'El pago no pudo ser procesado',
+            'error': 'Fondos insuficientes',
+            'mensaje': MENSAJE_FALLIDO,
             'metodo_pago': metodo_pago,
-            'pago_real': pago_real_exitoso
+            'pago_real': False
         }
 
 def procesar_usuario_con_tag(data):
@@ -107,9 +173,9 @@ def procesar_usuario_con_tag(data):
     # Calcular monto con descuento por tag
     monto = calcular_monto(peaje_id, user_type, True)
     
-    # Procesar pago REAL + simular
+    # Autorizar en la pasarela y descontar saldo
     metodo_pago = tag_info.get('metodo_pago', 'tarjeta_credito')
-    resultado_pago = simular_procesamiento_pago(placa, monto, metodo_pago, user_type)
+    resultado_pago = procesar_cobro(data, monto, metodo_pago, user_type)
     
     resultado = {
         'tipo_escenario': 'tag_express',
@@ -134,8 +200,8 @@ def procesar_usuario_registrado(data):
     # Calcular monto normal
     monto = calcular_monto(peaje_id, user_type, False)
     
-    # Procesar pago REAL + simular
-    resultado_pago = simular_procesamiento_pago(placa, monto, metodo_pago, user_type)
+    # Autorizar en la pasarela y descontar saldo
+    resultado_pago = procesar_cobro(data, monto, metodo_pago, user_type)
     
     resultado = {
         'tipo_escenario': 'registrado_digital',
@@ -154,26 +220,24 @@ def procesar_usuario_no_registrado(data):
     
     print(f"📄 Procesando usuario no registrado: {placa}")
     
-    # Calcular monto con recargo
-    monto = calcular_monto(peaje_id, user_type, False)
+    # Calcular monto con recargo (la multa va al estado de cuenta si se consolida)
+    monto = calcular_monto(peaje_id, user_type, False, con_multa=not ESTADOS_CONSOLIDADOS)
     
     # PROCESAR PAGO REAL también para no registrados
-    pago_real_exitoso = procesar_pago_real(placa, monto, user_type)
+    pago_real_exitoso = procesar_pago_real(placa, monto, user_type, referencia_cobro(data))
     
-    # Generar factura simulada
-    factura_id = f"FACT-{uuid.uuid4().hex[:8].upper()}"
-    factura = {
-        'factura_id': factura_id,
-        'placa': placa,
-        'peaje_id': peaje_id,
-        'monto': Decimal(monto),
-        'fecha_emision': datetime.utcnow().isoformat() + 'Z',
-        'concepto': f'Cobro de peaje {peaje_id} - Usuario no registrado',
-        'cargo_premium': '50%',
-        'multa_tardia': 'Q15.00',
-        'mensaje_invitacion': 'Registrese en GuatePass para evitar recargos',
-        'pago_real_exitoso': pago_real_exitoso
-    }
+    if ESTADOS_CONSOLIDADOS:
+        # Sin factura por cruce: el cruce es una línea del estado de cuenta del mes
+        return monto, {
+            'tipo_escenario': 'no_registrado_tradicional',
+            'monto': Decimal(monto),
+            'consolidado': True,
+            'pago_real': pago_real_exitoso
+        }
+    
+    # Generar factura (el número fiscal se asigna al guardar la transacción)
+    factura = invoice_generator.generar_factura(placa, peaje_id, Decimal(monto), user_type)
+    factura['pago_real_exitoso'] = pago_real_exitoso
     
     resultado = {
         'tipo_escenario': 'no_registrado_tradicional',
@@ -185,11 +249,24 @@ def procesar_usuario_no_registrado(data):
     
     return monto, resultado
 
+def id_transaccion(data):
+    """Id derivado de la referencia del cobro: una nueva entrega del cruce no crea otra transacción"""
+    return f"TXN-{hashlib.sha256(referencia_cobro(data).encode('utf-8')).hexdigest()[:16].upper()}"
+
 def guardar_transaccion(transaction_data, monto, resultado):
-    """Guarda la transacción en DynamoDB"""
-    try:
-        transaction_id = f"TXN-{uuid.uuid4().hex[:8].upper()}"
-        
+    """
+    Guarda la transacción en DynamoDB (condicionada a que no exista) y, en la misma
+    transacción, la suma al resumen de la placa y le asigna el número fiscal si
+    lleva factura. Devuelve False si una entrega anterior ya la guardó; un error de
+    escritura se propaga y el mensaje se reintenta (el cobro no se repite, ver charge_marks).
+    """
+    transaction_id = id_transaccion(transaction_data)
+    fecha_procesado = datetime.utcnow().isoformat() + 'Z'
+    resumen = account_summary.items_transaccion(datos_resumen(transaction_data, monto, resultado)) if account_summary else []
+    
+    def items_transaccion(numero=None):
+        if numero is not None:
+            invoice_generator.numerar(resultado['factura'], numero)
         item = {
             'transaction_id': transaction_id,
             'placa': transaction_data['placa'],
@@ -201,23 +278,103 @@ def guardar_transaccion(transaction_data, monto, resultado):
             'tag_id': transaction_data.get('tag_id'),
             'tipo_escenario': resultado['tipo_escenario'],
             'resultado': resultado,
-            'fecha_procesado': datetime.utcnow().isoformat() + 'Z'
+            'fecha_procesado': fecha_procesado,
+            # Día de proceso con shard al azar: el índice del exportador no concentra un día en una llave
+            'dia_procesado': f"{fecha_procesado[:10]}#{random.randrange(EXPORT_DAY_SHARDS)}"
         }
-        
-        transactions_table.put_item(Item=item)
-        print(f"💾 Transaccion guardada: {transaction_id} - Escenario: {resultado['tipo_escenario']}")
+        if TRANSACTION_SCHEMA_VERSION >= 2:
+            item = compactar_transaccion(item)
+        return [{'Put': {'TableName': transactions_table.name, 'Item': item,
+                         'ConditionExpression': 'attribute_not_exists(transaction_id)'}}] + resumen
+    
+    try:
+        if resultado.get('factura') and invoice_generator.numeracion:
+            invoice_generator.numeracion.escribir(items_transaccion)
+        elif resumen:
+            transactions_table.meta.client.transact_write_items(TransactItems=items_transaccion())
+        else:
+            put = items_transaccion()[0]['Put']
+            transactions_table.put_item(Item=put['Item'], ConditionExpression=put['ConditionExpression'])
+    except ClientError as e:
+        if not transaccion_repetida(e):
+            raise
+        print(f"⏭️ Transaccion {transaction_id} ya guardada en una entrega anterior")
+        return False
+    
+    print(f"💾 Transaccion guardada: {transaction_id} - Escenario: {resultado['tipo_escenario']}")
+    incrementar_version(transaction_data['placa'])
+    return True
+
+def transaccion_repetida(e):
+    """La condición attribute_not_exists(transaction_id) falló (sola o dentro de una transacción)"""
+    codigo = e.response['Error']['Code']
+    if codigo == 'ConditionalCheckFailedException':
         return True
+    # El resumen no tiene condiciones y el conflicto sobre el arriendo de facturas se reintenta en invoice_numbering
+    return codigo == 'TransactionCanceledException' and 'ConditionalCheckFailed' in motivos_cancelacion(e)
+
+def incrementar_version(placa):
+    """Invalida el historial cacheado de la placa (caché de respuestas y ETag)"""
+    if not counters_table:
+        return
+    try:
+        counters_table.update_item(
+            Key=clave_version(placa),
+            UpdateExpression='ADD #version :uno',
+            ExpressionAttributeNames={'#version': 'version'},
+            ExpressionAttributeValues={':uno': 1}
+        )
     except Exception as e:
-        print(f"❌ Error guardando transaccion: {e}")
-        traceback.print_exc()
-        return False
+        # La transacción ya quedó guardada; las entradas de caché vencen por TTL
+        print(f"❌ Error incrementando version de {placa}: {e}")
+
+def datos_resumen(transaction_data, monto, resultado):
+    """Campos de la transacción que usa account_summary.contribucion"""
+    return {
+        'placa': transaction_data['placa'],
+        'peaje_id': transaction_data['peaje_id'],
+        'timestamp': transaction_data['timestamp'],
+        'monto': monto,
+        'tipo_escenario': resultado['tipo_escenario'],
+        'resultado': resultado
+    }
+
+def actualizar_resumen(transaction_data, monto, resultado):
+    """Avanza la última plaza del resumen; los acumulados ya se sumaron al guardar la transacción"""
+    if not account_summary:
+        return
+    try:
+        account_summary.avanzar_ultimo(datos_resumen(transaction_data, monto, resultado))
+        print(f"📈 Resumen actualizado para {transaction_data['placa']}")
+    except Exception as e:
+        # Solo queda atrasada la última plaza; el siguiente cruce de la placa la avanza
+        print(f"❌ Error actualizando resumen: {e}")
+
+def actualizar_trafico(transaction_data, monto, resultado):
+    """Suma el cruce a los contadores de la plaza en su minuto (ingreso solo si se cobró)"""
+    if not plaza_traffic:
+        return
+    cobrado = Decimal(str(monto)) if cobro_exitoso(resultado) else Decimal('0')
+    try:
+        plaza_traffic.registrar(
+            transaction_data['peaje_id'], transaction_data['user_type'], cobrado, transaction_data['timestamp']
+        )
+    except Exception as e:
+        print(f"❌ Error actualizando trafico de plaza: {e}")
 
 def enviar_notificacion_sns(transaction_data, monto, resultado):
-    """Envía notificación a SNS"""
+    """Envía notificación a SNS por los canales que el usuario tiene habilitados"""
     try:
-        # Obtener información del usuario para notificación
-        user_response = users_table.get_item(Key={'placa': transaction_data['placa']})
-        user_info = user_response.get('Item', {})
+        # El webhook incluye email y teléfono en el mensaje; hits del snapshot y mensajes anteriores consultan al usuario
+        user_info = None
+        if sin_contacto(transaction_data):
+            user_info = users_table.get_item(Key={'placa': transaction_data['placa']}).get('Item', {})
+        contacto = contacto_de(transaction_data, user_info)
+        canales = resolver_canales(transaction_data, contacto)
+        
+        if not canales:
+            print(f"🔕 Sin canales de notificacion para {transaction_data['placa']}, no se publica")
+            return
         
         notification_data = {
             'placa': transaction_data['placa'],
@@ -226,70 +383,159 @@ def enviar_notificacion_sns(transaction_data, monto, resultado):
             'user_type': transaction_data['user_type'],
             'escenario': resultado['tipo_escenario'],
             'resultado': resultado,
-            'email': user_info.get('email'),
-            'telefono': user_info.get('telefono'),
-            'nombre': user_info.get('nombre'),
+            'email': contacto['email'],
+            'telefono': contacto['sms'],
+            'nombre': (user_info or {}).get('nombre'),
+            'canales': canales,
             'timestamp': datetime.utcnow().isoformat() + 'Z'
         }
         
         sns.publish(
             TopicArn=notifications_topic_arn,
             Message=json.dumps(notification_data, default=str),
-            Subject=f"GuatePass - {resultado['tipo_escenario']} - {transaction_data['peaje_id']}"
+            Subject=f"GuatePass - {resultado['tipo_escenario']} - {transaction_data['peaje_id']}",
+            MessageAttributes=atributos_mensaje(resultado['tipo_escenario'], canales)
         )
         
-        print(f"📧 Notificacion enviada a SNS para {transaction_data['placa']}")
+        print(f"📧 Notificacion enviada a SNS para {transaction_data['placa']} ({', '.join(canales)})")
         
     except Exception as e:
         print(f"❌ Error enviando notificacion: {e}")
 
-def lambda_handler(event, context):
-    print(f"🔄 Procesando {len(event['Records'])} mensajes de SQS")
+def procesar_registro(data):
+    """Procesa un mensaje de la cola (un cruce)"""
+    placa = data['placa']
+    user_type = data['user_type']
+    has_tag = data.get('has_tag', False)
+    
+    print(f"🎯 INICIANDO PROCESAMIENTO: {placa} - {user_type} - Tag: {has_tag}")
+    
+    # Verificar saldo ANTES del procesamiento
+    saldo_antes = payment_calculator.verificar_saldo_actual(placa, users_table)
+    print(f"💰 SALDO INICIAL {placa}: {saldo_antes}")
+    
+    # Seleccionar escenario basado en tipo de usuario y tag
+    if has_tag and data.get('tag_id'):
+        monto, resultado = procesar_usuario_con_tag(data)
+    elif user_type == 'registrado':
+        monto, resultado = procesar_usuario_registrado(data)
+    else:
+        monto, resultado = procesar_usuario_no_registrado(data)
+    
+    # Verificar saldo DESPUÉS del procesamiento
+    saldo_despues = payment_calculator.verificar_saldo_actual(placa, users_table)
+    print(f"💰 SALDO FINAL {placa}: {saldo_despues}")
+    print(f"💰 DIFERENCIA: {saldo_antes - saldo_despues}")
     
-    for record in event['Records']:
+    # Guardar transacción en base de datos (un error se propaga y el mensaje se reintenta)
+    if guardar_transaccion(data, monto, resultado):
+        actualizar_resumen(data, monto, resultado)
+        actualizar_trafico(data, monto, resultado)
+        
+        # Enviar notificación (los cruces consolidados se notifican con el estado de cuenta)
+        if not resultado.get('consolidado'):
+            enviar_notificacion_sns(data, monto, resultado)
+        print(f"✅ Procesamiento completado para {placa}")
+    else:
+        print(f"⏭️ {placa}: resumen, trafico y notificacion ya aplicados en la entrega anterior")
+
+def agrupar_registros(records):
+    """
+    Agrupa los registros por grupo de mensajes conservando el orden de llegada.
+    En cola FIFO el grupo es el MessageGroupId (la placa); en cola estándar cada
+    registro se agrupa por la placa del mensaje. Un body que no es JSON queda
+    con data None y se devuelve como fallido.
+    """
+    grupos = OrderedDict()
+    for record in records:
         try:
             data = json.loads(record['body'])
-            placa = data['placa']
-            user_type = data['user_type']
-            has_tag = data.get('has_tag', False)
-            
-            print(f"🎯 INICIANDO PROCESAMIENTO: {placa} - {user_type} - Tag: {has_tag}")
-            
-            # Verificar saldo ANTES del procesamiento
-            saldo_antes = payment_calculator.verificar_saldo_actual(placa, users_table)
-            print(f"💰 SALDO INICIAL {placa}: {saldo_antes}")
-            
-            # Seleccionar escenario basado en tipo de usuario y tag
-            if has_tag and data.get('tag_id'):
-                monto, resultado = procesar_usuario_con_tag(data)
-            elif user_type == 'registrado':
-                monto, resultado = procesar_usuario_registrado(data)
-            else:
-                monto, resultado = procesar_usuario_no_registrado(data)
-            
-            # Verificar saldo DESPUÉS del procesamiento
-            saldo_despues = payment_calculator.verificar_saldo_actual(placa, users_table)
-            print(f"💰 SALDO FINAL {placa}: {saldo_despues}")
-            print(f"💰 DIFERENCIA: {saldo_antes - saldo_despues}")
-            
-            # Guardar transacción en base de datos
-            guardado_exitoso = guardar_transaccion(data, monto, resultado)
-            
-            if guardado_exitoso:
-                # Enviar notificación
-                enviar_notificacion_sns(data, monto, resultado)
-                print(f"✅ Procesamiento completado para {placa}")
-            else:
-                print(f"❌ Procesamiento fallo al guardar para {placa}")
-            
-        except Exception as e:
-            print(f"❌ Error procesando mensaje: {e}")
-            traceback.print_exc()
+        except ValueError as e:
+            print(f"❌ Mensaje con JSON invalido {record.get('messageId')}: {e}")
+            data = None
+        
+        grupo = record.get('attributes', {}).get('MessageGroupId') or (data or {}).get('placa') or record.get('messageId')
+        grupos.setdefault(grupo, []).append((record, data))
+    return grupos
+
+def procesar_grupo(grupo, registros):
+    """
+    Procesa en orden los registros de un grupo; devuelve los messageId a reintentar.
+    Cada fallido queda registrado con su tipo de error (dead_letters) y, tras
+    maxReceiveCount entregas, SQS lo mueve a la DLQ.
+    """
+    fallidos = []
+    for posicion, (record, data) in enumerate(registros):
+        if data is None:
+            tipo, detalle = 'json_invalido', 'El body del mensaje no es JSON'
+        else:
+            try:
+                if orden_replay and orden_replay.aplica(data):
+                    estado = orden_replay.estado(data, int(record.get('attributes', {}).get('ApproximateReceiveCount', 1)))
+                    if estado == APLICADO:
+                        print(f"⏭️ Replay {data['replay_seq']} de {data.get('placa')} ya aplicado, se descarta")
+                        metricas.contar('ReplayRepetidos')
+                        continue
+                    if estado == ESPERAR:
+                        # Falta un cruce anterior de la placa: este y los siguientes del grupo esperan
+                        pendientes = [r['messageId'] for r, _ in registros[posicion:]]
+                        print(f"⏳ Replay {data['replay_seq']} de {data.get('placa')} espera al anterior")
+                        metricas.contar('ReplayEnEspera', len(pendientes))
+                        return fallidos + pendientes
+                if data.get('enriquecer'):
+                    # Aceptado por el webhook en modo degradado: tag y usuario se leen aquí
+                    data = completar_cruce(data, users_table, tags_table)
+                    if sqs and fuera_de_grupo(record, data):
+                        # Solo con tag y en otro grupo: se cobra en orden en el grupo de su placa
+                        message_id = reencolar_por_placa(sqs, processing_queue_url, data)
+                        print(f"↪️ Cruce de {data['placa']} reencolado en su grupo ({message_id})")
+                        metricas.contar('CrucesReagrupados')
+                        continue
+                procesar_registro(data)
+                if orden_replay and orden_replay.aplica(data):
+                    orden_replay.avanzar(data)
+                continue
+            except CruceInvalido as e:
+                # El webhook lo habría rechazado con 400: se registra y no se reintenta
+                print(f"🚫 Cruce rechazado en validación diferida: {e}")
+                metricas.contar('CrucesInvalidos')
+                registrar_fallo(counters_table, record, data, 'cruce_invalido', str(e))
+                continue
+            except PasarelaNoDisponible as e:
+                # Nada se cobró todavía: SQS vuelve a entregar el mensaje después del VisibilityTimeout
+                print(f"⏳ Cobro diferido para {data.get('placa')}: {e}")
+                metricas.contar('CobrosDiferidos')
+                tipo, detalle = tipo_error(e), str(e)
+            except Exception as e:
+                print(f"❌ Error procesando mensaje: {e}")
+                traceback.print_exc()
+                tipo, detalle = tipo_error(e), str(e)
+        
+        registrar_fallo(counters_table, record, data, tipo, detalle)
+        if 'MessageGroupId' in record.get('attributes', {}):
+            # FIFO: no saltarse cobros de la misma placa; el resto del grupo se reintenta en orden
+            pendientes = [r['messageId'] for r, _ in registros[posicion:]]
+            print(f"⏸️ Grupo {grupo}: {len(pendientes)} mensajes devueltos a la cola")
+            return fallidos + pendientes
+        fallidos.append(record['messageId'])
+    return fallidos
+
+def lambda_handler(event, context):
+    print(f"🔄 Procesando {len(event['Records'])} mensajes de SQS")
     
+    # Placas distintas en paralelo (hasta PROCESSOR_CONCURRENCY), cada placa en orden
+    fallidos = procesar_grupos(agrupar_registros(event['Records']), procesar_grupo, PROCESSOR_CONCURRENCY)
+
+    reintentos = aws_clients.resumen()
+    if reintentos:
+        print(f"🔁 Reintentos de AWS en el contenedor: {reintentos}")
+    metricas.publicar()
+
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': f"Procesamiento completado para {len(event['Records'])} mensajes",
-            'procesados': len(event['Records'])
-        })
-    }
\ No newline at end of file
+            'procesados': len(event['Records']) - len(fallidos)
+        }),
+        'batchItemFailures': [{'itemIdentifier': message_id} for message_id in fallidos]
+    }
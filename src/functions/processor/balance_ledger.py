@@ -0,0 +1,373 @@
+"""
+Ledger append-only de saldo para cuentas con muchos cruces por minuto.
+
+En lugar de reescribir saldo_disponible del usuario en cada débito, cada
+movimiento se agrega como un item nuevo en LedgerTable:
+
+    cuenta  (HASH)  = "<placa>#<shard>"      -> reparte las escrituras en varias particiones
+    entrada (RANGE) = "<iso timestamp>#<id>" -> orden temporal dentro del shard
+
+El saldo que se puede gastar está repartido entre los shards: cada uno tiene un
+item de saldo (entrada = '~saldo', ordena después de todas las entradas) con su
+parte en 'disponible'. Un débito es una transacción de dos items del mismo shard:
+
+    Update ~saldo   disponible = disponible - monto   si disponible >= monto
+    Put    entrada  monto negativo
+
+así ningún débito, de ningún contenedor, deja la cuenta en negativo (el processor
+agrega la marca del cobro, charge_marks.py, como tercer item). Si el shard
+elegido no alcanza se prueba con los demás; si ninguno alcanza solo pero la
+suma sí, el saldo se reparte de nuevo entre los shards con una transacción
+condicionada a los valores leídos.
+
+Historial = saldo_disponible del usuario (snapshot compactado hasta ledger_corte)
+          + suma de las entradas con entrada > ledger_corte
+          = suma de 'disponible' de los shards.
+
+La compactación pliega las entradas anteriores a un corte en el snapshot del
+usuario y las borra en la misma transacción. Solo visita las placas con entradas
+pendientes: los items de saldo con 'pendiente' forman el índice disperso
+pendientes-index.
+"""
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_DOWN
+from typing import Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+from charge_marks import CobroRepetido, motivos_cancelacion
+
+# Item de saldo de cada shard y cotas de las entradas (timestamps ISO; DynamoDB no
+# acepta '' en la condición de llave)
+ENTRADA_SALDO = '~saldo'
+INICIO_ENTRADAS = '0'
+FIN_ENTRADAS = '9999'
+
+PENDIENTES_INDEX = 'pendientes-index'
+
+# Límite de items por TransactWriteItems: el usuario + 99 entradas por bloque
+MAX_ITEMS_TRANSACCION = 100
+
+# Rondas de reparto cuando otro contenedor cambia el saldo entre la lectura y la escritura
+MAX_REPARTOS = 3
+
+CENTAVO = Decimal('0.01')
+
+class BalanceLedger:
+    def __init__(self, ledger_table, shards: int = 4, modo_por_defecto: str = 'directo', reloj=time.time):
+        self.ledger_table = ledger_table
+        self.client = ledger_table.meta.client
+        # Solo puede crecer: el saldo de un shard que deja de usarse quedaría fuera de la suma
+        self.shards = shards
+        self.modo_por_defecto = modo_por_defecto
+        self.reloj = reloj
+
+    def usa_ledger(self, usuario: dict) -> bool:
+        """Cuentas marcadas con modo_saldo = 'ledger' (flotas/corporativas) o todas si así se configura"""
+        return usuario.get('modo_saldo', self.modo_por_defecto) == 'ledger'
+
+    def _cuenta(self, placa: str, shard: int) -> str:
+        return f"{placa}#{shard}"
+
+    def _llave_saldo(self, placa: str, shard: int) -> Dict[str, str]:
+        return {'cuenta': self._cuenta(placa, shard), 'entrada': ENTRADA_SALDO}
+
+    def _query_entradas(self, cuenta: str, desde: str, hasta: str = FIN_ENTRADAS):
+        """Entradas de un shard con desde < entrada <= hasta, paginando"""
+        kwargs = {
+            'KeyConditionExpression': 'cuenta = :c AND entrada BETWEEN :desde AND :hasta',
+            'ExpressionAttributeValues': {':c': cuenta, ':desde': desde or INICIO_ENTRADAS, ':hasta': hasta},
+            'ProjectionExpression': 'entrada, monto',
+            'ConsistentRead': True
+        }
+        while True:
+            response = self.ledger_table.query(**kwargs)
+            for item in response.get('Items', []):
+                if item['entrada'] != desde:
+                    yield item
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _saldo_historial(self, usuario: dict) -> Decimal:
+        """Snapshot del usuario + entradas posteriores al corte (lecturas consistentes)"""
+        snapshot = usuario.get('saldo_disponible', Decimal('0'))
+        if not isinstance(snapshot, Decimal):
+            snapshot = Decimal(str(snapshot))
+        corte = usuario.get('ledger_corte', '')
+        return snapshot + sum((item['monto'] for shard in range(self.shards)
+                               for item in self._query_entradas(self._cuenta(usuario['placa'], shard), corte)),
+                              Decimal('0'))
+
+    def _saldos(self, placa: str, consistente: bool = True) -> List[Optional[Decimal]]:
+        """'disponible' de cada shard; None si el item de saldo no existe"""
+        saldos = []
+        for shard in range(self.shards):
+            item = self.ledger_table.get_item(Key=self._llave_saldo(placa, shard),
+                                              ConsistentRead=consistente).get('Item')
+            saldos.append(item.get('disponible', Decimal('0')) if item else None)
+        return saldos
+
+    def _inicializar(self, usuario: dict) -> List[Optional[Decimal]]:
+        """Primera vez de la cuenta en el ledger: todo el saldo actual en el shard 0"""
+        placa = usuario['placa']
+        saldo = self._saldo_historial(usuario)
+        try:
+            self.client.transact_write_items(TransactItems=[
+                {'Put': {
+                    'TableName': self.ledger_table.name,
+                    'Item': {**self._llave_saldo(placa, shard), 'placa': placa,
+                             'disponible': saldo if shard == 0 else Decimal('0')},
+                    'ConditionExpression': 'attribute_not_exists(entrada)'
+                }} for shard in range(self.shards)
+            ])
+            print(f"🧮 Saldo de {placa} inicializado en el ledger: {saldo}")
+        except ClientError as e:
+            # Otro contenedor la inicializó primero
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+        return self._saldos(placa)
+
+    def saldo_disponible(self, usuario: dict) -> Decimal:
+        """
+        Suma de los shards; historial si la cuenta aún no usa el ledger. Es informativo
+        (lecturas eventualmente consistentes): los débitos no dependen de este valor.
+        """
+        saldos = self._saldos(usuario['placa'], consistente=False)
+        if saldos[0] is None:
+            return self._saldo_historial(usuario)
+        return sum((s for s in saldos if s is not None), Decimal('0'))
+
+    def _movimiento(self, placa: str, shard: int, monto: Decimal, tipo: str, referencia: str = None) -> List[Dict]:
+        """Items de la transacción: saldo del shard (condicionado si es débito) + entrada nueva"""
+        ahora = datetime.fromtimestamp(self.reloj(), timezone.utc).isoformat()
+        entrada = {
+            'cuenta': self._cuenta(placa, shard),
+            'entrada': f"{ahora}#{uuid.uuid4().hex[:8]}",
+            'placa': placa,
+            'monto': monto,
+            'tipo': tipo
+        }
+        if referencia:
+            entrada['referencia'] = referencia
+        saldo = {
+            'TableName': self.ledger_table.name,
+            'Key': self._llave_saldo(placa, shard),
+            'UpdateExpression': 'SET disponible = if_not_exists(disponible, :cero) + :monto, placa = :placa, '
+                                'pendiente = if_not_exists(pendiente, :si) ADD movimientos :uno',
+            'ExpressionAttributeValues': {':cero': Decimal('0'), ':monto': monto, ':placa': placa,
+                                          ':si': 'si', ':uno': 1}
+        }
+        if monto < 0:
+            saldo['ConditionExpression'] = 'disponible >= :requerido'
+            saldo['ExpressionAttributeValues'][':requerido'] = -monto
+        return [
+            {'Update': saldo},
+            {'Put': {'TableName': self.ledger_table.name, 'Item': entrada,
+                     'ConditionExpression': 'attribute_not_exists(entrada)'}}
+        ]
+
+    def _intentar(self, items: List[Dict], marca: Optional[Dict] = None) -> bool:
+        """False si la condición del saldo del shard no se cumplió; CobroRepetido si la marca ya existe"""
+        try:
+            self.client.transact_write_items(TransactItems=items + ([marca] if marca else []))
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = motivos_cancelacion(e)
+            if marca and len(reasons) > len(items) and reasons[len(items)] == 'ConditionalCheckFailed':
+                raise CobroRepetido(marca['Put']['Item']['contador'])
+            if reasons and reasons[0] == 'ConditionalCheckFailed':
+                return False
+            raise
+
+    def _repartir(self, placa: str, saldos: List[Optional[Decimal]], monto: Decimal) -> bool:
+        """
+        Reparte el total entre los shards (todo en el shard 0 si la parte de cada uno no
+        alcanza para el débito). False si otro contenedor cambió algún shard mientras tanto.
+        """
+        total = sum((s for s in saldos if s is not None), Decimal('0'))
+        parte = (total / self.shards).quantize(CENTAVO, rounding=ROUND_DOWN)
+        if parte >= monto:
+            nuevos = [parte] * self.shards
+            nuevos[0] += total - parte * self.shards
+        else:
+            nuevos = [total] + [Decimal('0')] * (self.shards - 1)
+
+        items = []
+        for shard, (actual, nuevo) in enumerate(zip(saldos, nuevos)):
+            update = {
+                'TableName': self.ledger_table.name,
+                'Key': self._llave_saldo(placa, shard),
+                'UpdateExpression': 'SET disponible = :nuevo, placa = :placa',
+                'ExpressionAttributeValues': {':nuevo': nuevo, ':placa': placa}
+            }
+            if actual is None:
+                update['ConditionExpression'] = 'attribute_not_exists(disponible)'
+            else:
+                update['ConditionExpression'] = 'disponible = :actual'
+                update['ExpressionAttributeValues'][':actual'] = actual
+            items.append({'Update': update})
+        try:
+            self.client.transact_write_items(TransactItems=items)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            return False
+
+    def debitar(self, placa: str, monto: Decimal, usuario: dict, marca: Optional[Dict] = None) -> bool:
+        """
+        Débito condicionado al saldo del shard; False solo si la suma de los shards no alcanza.
+        marca (charge_marks.marca_cobro) va en la misma transacción que el débito.
+        """
+        inicio = random.randrange(self.shards)
+        orden = [(inicio + i) % self.shards for i in range(self.shards)]
+        for ronda in range(MAX_REPARTOS + 1):
+            for shard in orden:
+                if self._intentar(self._movimiento(placa, shard, -monto, 'debito'), marca):
+                    print(f"✅ DEBITO EN LEDGER: {placa} - {monto}Q (shard {shard})")
+                    return True
+
+            saldos = self._saldos(placa)
+            if saldos[0] is None:
+                saldos = self._inicializar(usuario)
+            total = sum((s for s in saldos if s is not None), Decimal('0'))
+            if total < monto:
+                print(f"❌ SALDO INSUFICIENTE (ledger): {placa} saldo={total} monto={monto}")
+                return False
+            if self._repartir(placa, saldos, monto):
+                orden = [0] + [s for s in orden if s != 0]
+        raise RuntimeError(f"Saldo del ledger de {placa} en contención, reintentar")
+
+    def acreditar(self, placa: str, monto: Decimal, usuario: dict, referencia: str = None) -> str:
+        """Crédito en un shard al azar; la cuenta se inicializa antes para no contarlo dos veces"""
+        if self._saldos(placa)[0] is None:
+            self._inicializar(usuario)
+        items = self._movimiento(placa, random.randrange(self.shards), monto, 'credito', referencia)
+        self.client.transact_write_items(TransactItems=items)
+        return items[1]['Put']['Item']['entrada']
+
+    def compactar(self, users_table, placa: str, nuevo_corte: str) -> dict:
+        """
+        Pliega en el snapshot del usuario las entradas con ledger_corte < entrada <= nuevo_corte.
+        Cada bloque suma sus entradas al usuario y las borra en una sola transacción, así
+        snapshot + entradas nunca cuenta un movimiento dos veces ni lo pierde.
+        """
+        usuario = users_table.get_item(Key={'placa': placa}, ConsistentRead=True).get('Item')
+        if not usuario:
+            return {'placa': placa, 'entradas': 0, 'delta': Decimal('0')}
+
+        corte = usuario.get('ledger_corte', '')
+        entradas = []
+        if nuevo_corte > corte:
+            for shard in range(self.shards):
+                cuenta = self._cuenta(placa, shard)
+                entradas.extend({'cuenta': cuenta, **item} for item in self._query_entradas(cuenta, corte, nuevo_corte))
+        entradas.sort(key=lambda item: item['entrada'])
+
+        delta_total = Decimal('0')
+        por_bloque = MAX_ITEMS_TRANSACCION - 1
+        for start in range(0, len(entradas), por_bloque):
+            bloque = entradas[start:start + por_bloque]
+            # Todas las entradas hasta la última del bloque están en el bloque (orden global)
+            siguiente = nuevo_corte if start + por_bloque >= len(entradas) else bloque[-1]['entrada']
+            delta = sum((item['monto'] for item in bloque), Decimal('0'))
+            condicion = 'ledger_corte = :anterior' if corte else 'attribute_not_exists(ledger_corte)'
+            self.client.transact_write_items(TransactItems=[
+                {'Update': {
+                    'TableName': users_table.name,
+                    'Key': {'placa': placa},
+                    'UpdateExpression': 'SET saldo_disponible = if_not_exists(saldo_disponible, :cero) + :delta, '
+                                        'ledger_corte = :nuevo',
+                    'ConditionExpression': condicion,
+                    'ExpressionAttributeValues': {':cero': Decimal('0'), ':delta': delta, ':nuevo': siguiente,
+                                                  **({':anterior': corte} if corte else {})}
+                }}
+            ] + [
+                {'Delete': {'TableName': self.ledger_table.name,
+                            'Key': {'cuenta': item['cuenta'], 'entrada': item['entrada']}}}
+                for item in bloque
+            ])
+            corte = siguiente
+            delta_total += delta
+
+        # Shards sin entradas después del corte salen del índice de pendientes, salvo
+        # que un movimiento haya llegado entre la lectura y esta escritura
+        for shard in range(self.shards):
+            item = self.ledger_table.get_item(Key=self._llave_saldo(placa, shard), ConsistentRead=True).get('Item')
+            if not item or 'pendiente' not in item:
+                continue
+            if next(self._query_entradas(self._cuenta(placa, shard), corte), None) is not None:
+                continue
+            try:
+                self.ledger_table.update_item(
+                    Key=self._llave_saldo(placa, shard),
+                    UpdateExpression='REMOVE pendiente',
+                    ConditionExpression='movimientos = :vistos',
+                    ExpressionAttributeValues={':vistos': item.get('movimientos', 0)}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+
+        return {'placa': placa, 'entradas': len(entradas), 'delta': delta_total}
+
+    def placas_pendientes(self) -> List[str]:
+        """Placas con algún shard marcado como pendiente (índice disperso, sin scan de la tabla)"""
+        placas = set()
+        kwargs = {
+            'IndexName': PENDIENTES_INDEX,
+            'KeyConditionExpression': 'pendiente = :si',
+            'ExpressionAttributeValues': {':si': 'si'}
+        }
+        while True:
+            response = self.ledger_table.query(**kwargs)
+            placas.update(item['placa'] for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return sorted(placas)
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def ledger_from_env(dynamodb=None):
+    if not os.environ.get('LEDGER_TABLE'):
+        return None
+    dynamodb = dynamodb or aws_clients.resource('dynamodb')
+    return BalanceLedger(
+        dynamodb.Table(os.environ['LEDGER_TABLE']),
+        shards=int(os.environ.get('LEDGER_SHARDS', '4')),
+        modo_por_defecto=os.environ.get('BALANCE_MODE', 'directo')
+    )
+
+def compaction_handler(event, context):
+    """
+    Lambda programada: pliega en bloque las entradas más viejas que LEDGER_COMPACTION_MARGIN_SECONDS.
+    El margen cubre diferencias de reloj entre contenedores que escriben entradas.
+    """
+    dynamodb = aws_clients.resource('dynamodb')
+    ledger = ledger_from_env(dynamodb)
+    users_table = dynamodb.Table(os.environ['USERS_TABLE'])
+
+    margen = int(os.environ.get('LEDGER_COMPACTION_MARGIN_SECONDS', '300'))
+    nuevo_corte = (datetime.now(timezone.utc) - timedelta(seconds=margen)).isoformat()
+
+    placas = ledger.placas_pendientes()
+
+    total = 0
+    for placa in placas:
+        try:
+            resultado = ledger.compactar(users_table, placa, nuevo_corte)
+            total += resultado['entradas']
+            if resultado['entradas']:
+                print(f"🧮 Compactado {placa}: {resultado['entradas']} entradas, delta {resultado['delta']}")
+        except Exception as e:
+            # Otro compactador avanzó el corte; se reintenta en la próxima ejecución
+            print(f"❌ Error compactando {placa}: {e}")
+
+    print(f"🧮 Compactación completada: {len(placas)} cuentas, {total} entradas plegadas, corte {nuevo_corte}")
+    return {'cuentas': len(placas), 'entradas': total, 'corte': nuevo_corte}
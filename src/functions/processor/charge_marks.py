@@ -0,0 +1,45 @@
+"""
+Marcas de cobro: un cruce descuenta saldo una sola vez aunque el mensaje se
+entregue varias veces.
+
+Si algo falla después del débito (factura, guardar la transacción) el mensaje
+vuelve a la cola, y scripts/redrive_dlq.py puede reenviarlo días después. Cada
+débito escribe en la misma transacción una marca en CountersTable:
+
+    contador = "cobro#<referencia_cobro>"   (placa#peaje_id#timestamp)
+
+con attribute_not_exists. Si la marca ya existe la transacción se cancela
+completa: no se descuenta nada y el cobro se da por hecho en la entrega anterior.
+La marca vence por TTL (expira_en) después de la retención de la DLQ.
+"""
+import time
+from decimal import Decimal
+from typing import Dict, List
+
+from botocore.exceptions import ClientError
+
+PREFIJO = 'cobro#'
+
+# Retención de la DLQ (14 días) más un día de margen para el reenvío
+DIAS_MARCA = 15
+
+class CobroRepetido(Exception):
+    """La marca del cobro ya existe: el saldo se descontó en una entrega anterior"""
+
+def clave_cobro(referencia: str) -> Dict[str, str]:
+    return {'contador': f"{PREFIJO}{referencia}"}
+
+def marca_cobro(counters_table, referencia: str, placa: str, monto: Decimal) -> Dict:
+    """Item Put de TransactWriteItems que falla si el cruce ya se cobró"""
+    ahora = int(time.time())
+    return {'Put': {
+        'TableName': counters_table.name,
+        'Item': {**clave_cobro(referencia), 'placa': placa, 'monto': monto,
+                 'fecha': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ahora)),
+                 'expira_en': ahora + DIAS_MARCA * 86400},
+        'ConditionExpression': 'attribute_not_exists(contador)'
+    }}
+
+def motivos_cancelacion(e: ClientError) -> List[str]:
+    """Código por item de una TransactionCanceledException ('None' = el item no falló)"""
+    return [r.get('Code', 'None') for r in e.response.get('CancellationReasons', [])]
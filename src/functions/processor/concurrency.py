@@ -0,0 +1,24 @@
+"""
+Procesamiento de un lote de SQS con concurrencia acotada.
+
+Los registros llegan agrupados por placa (MessageGroupId en FIFO, ver
+agrupar_registros). Cada grupo se procesa en orden dentro de un solo hilo y los
+grupos corren en paralelo, hasta max_concurrencia a la vez: los cobros de una
+misma placa nunca se adelantan entre sí, y la espera de DynamoDB/SNS de placas
+distintas se solapa.
+
+Con max_concurrencia = 1 el lote se procesa en serie, igual que antes.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+def procesar_grupos(grupos, procesar_grupo, max_concurrencia: int = 1) -> list:
+    """
+    grupos: {grupo: registros} en orden de llegada.
+    procesar_grupo(grupo, registros) devuelve los messageId que deben reintentarse.
+    """
+    if max_concurrencia <= 1 or len(grupos) <= 1:
+        return [message_id for grupo, registros in grupos.items() for message_id in procesar_grupo(grupo, registros)]
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrencia, len(grupos))) as executor:
+        resultados = executor.map(lambda item: procesar_grupo(*item), grupos.items())
+        return [message_id for fallidos in resultados for message_id in fallidos]
@@ -0,0 +1,62 @@
+"""
+Registro del motivo de cada mensaje fallido, para inspeccionar la DLQ.
+
+SQS no guarda por qué falló un mensaje. Cuando el processor lo devuelve en
+batchItemFailures, escribe "fallo#<messageId>" en CountersTable con el tipo de
+error. El messageId se conserva al pasar a la DLQ (RedrivePolicy,
+maxReceiveCount), así scripts/redrive_dlq.py agrupa los mensajes por tipo.
+El registro vence por TTL (expira_en).
+
+    json_invalido            el body no es JSON; reenviarlo no sirve
+    mensaje_incompleto       falta un campo (KeyError); corregir el productor
+    pasarela_no_disponible   circuito abierto o pasarela sin respuesta; reenviar cuando se recupere
+    aws:<código>             error de DynamoDB/SNS (throttling, timeout); reenviar
+    <Excepción>              cualquier otro error; revisar el log antes de reenviar
+
+cruce_invalido (deferred_enrichment.py) también se registra aquí, pero el
+mensaje no se reintenta ni llega a la DLQ: el webhook lo habría rechazado.
+"""
+import time
+from typing import Dict, Optional
+
+from botocore.exceptions import ClientError
+
+from payment_gateway import PasarelaNoDisponible
+
+PREFIJO = 'fallo#'
+
+# Tipos que fallarían igual al reenviarse sin corregir el mensaje
+NO_REENVIABLES = {'json_invalido', 'mensaje_incompleto'}
+
+def clave_fallo(message_id: str) -> Dict[str, str]:
+    return {'contador': f"{PREFIJO}{message_id}"}
+
+def tipo_error(e: Exception) -> str:
+    if isinstance(e, PasarelaNoDisponible):
+        return 'pasarela_no_disponible'
+    if isinstance(e, KeyError):
+        return 'mensaje_incompleto'
+    if isinstance(e, ClientError):
+        return f"aws:{e.response.get('Error', {}).get('Code', 'Desconocido')}"
+    return type(e).__name__
+
+def registrar_fallo(counters_table, record: Dict, data: Optional[Dict], tipo: str, detalle: str,
+                    dias: int = 14):
+    """Guarda el último motivo de falla del mensaje; un error al guardar no cambia el resultado del lote"""
+    if not counters_table:
+        return
+    ahora = int(time.time())
+    item = {
+        **clave_fallo(record['messageId']),
+        'tipo_error': tipo,
+        'detalle': detalle[:500],
+        'recepciones': int(record.get('attributes', {}).get('ApproximateReceiveCount', 1)),
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ahora)),
+        'expira_en': ahora + dias * 86400
+    }
+    if data and data.get('placa'):
+        item['placa'] = data['placa']
+    try:
+        counters_table.put_item(Item=item)
+    except Exception as e:
+        print(f"❌ Error registrando fallo de {record['messageId']}: {e}")
@@ -0,0 +1,87 @@
+"""
+Enriquecimiento de los cruces que el webhook aceptó en modo degradado.
+
+Con la cola atrasada el webhook no lee tag ni usuario (webhook/admission.py) y
+encola el cruce con enriquecer = true. Aquí se hacen esas lecturas y las reglas
+de validation.py que dependen de ellas:
+
+    solo tag_id      el tag existe, tiene placa y la placa está registrada
+    solo placa       la placa está registrada
+    placa y tag_id   el tag existe, está activo, es de esa placa y la placa está registrada
+
+Un cruce que no las cumple levanta CruceInvalido: el webhook lo habría
+rechazado con 400, así que no se reintenta.
+
+En cola FIFO el grupo de un cruce solo con tag es la placa que el webhook vio en
+el snapshot, o un grupo único si el tag no estaba. Si la placa leída aquí es otra,
+el cruce ya completo se vuelve a encolar en el grupo de su placa
+(reencolar_por_placa) y se cobra en orden con los demás cruces de la cuenta.
+"""
+import hashlib
+import json
+from typing import Dict, Optional
+
+class CruceInvalido(Exception):
+    """El cruce no pasa las validaciones que el webhook difirió"""
+
+def _leer(table, key: Dict):
+    return table.get_item(Key=key).get('Item')
+
+def completar_cruce(data: Dict, users_table, tags_table) -> Dict:
+    """Devuelve el mensaje con los mismos campos que arma build_processing_message del webhook"""
+    placa = data.get('placa')
+    tag_id = data.get('tag_id')
+    tag = _leer(tags_table, {'tag_id': tag_id}) if tag_id else None
+
+    if tag_id and not tag:
+        raise CruceInvalido(f"Tag ID not found: {tag_id}")
+    if tag_id and not tag.get('placa'):
+        raise CruceInvalido(f"Tag {tag_id} is not associated with any vehicle")
+    if placa and tag_id:
+        if tag.get('estado') != 'activo':
+            raise CruceInvalido(f"Tag is not active: {tag_id}")
+        if tag['placa'] != placa:
+            raise CruceInvalido(f"Tag {tag_id} is associated with placa {tag['placa']}, not {placa}")
+    placa = placa or tag['placa']
+
+    user = _leer(users_table, {'placa': placa})
+    if not user:
+        raise CruceInvalido(f"Placa {placa} not found in system")
+
+    has_active_tag = tag is not None and tag.get('estado') == 'activo'
+    completo = {k: v for k, v in data.items() if k not in ('enriquecer', 'placa_snapshot')}
+    completo.update({
+        'placa': placa,
+        # Con tag activo el usuario cuenta como registrado (determine_user_type del webhook)
+        'user_type': 'registrado' if has_active_tag else user.get('tipo_usuario', 'no_registrado'),
+        'user_email': user.get('email'),
+        'user_phone': user.get('telefono'),
+        'has_tag': has_active_tag,
+        'tag_info': tag,
+        'metodo_pago': user.get('metodo_pago')
+    })
+    return completo
+
+def fuera_de_grupo(record: Dict, completo: Dict) -> bool:
+    """True si el mensaje FIFO llegó en un grupo que no es la placa del cruce completo"""
+    grupo: Optional[str] = record.get('attributes', {}).get('MessageGroupId')
+    return grupo is not None and grupo != completo['placa']
+
+def reencolar_por_placa(sqs, queue_url: str, completo: Dict) -> str:
+    """
+    Encola el cruce completo en el grupo de su placa. El MessageDeduplicationId sale
+    del cruce: si esta entrega se repite, SQS descarta el segundo envío.
+    """
+    crossing = '|'.join(str(completo.get(field) or '') for field in ('placa', 'peaje_id', 'timestamp', 'tag_id'))
+    response = sqs.send_message(
+        QueueUrl=queue_url,
+        MessageBody=json.dumps(completo, default=str),
+        MessageAttributes={
+            'UserType': {'DataType': 'String', 'StringValue': completo['user_type']},
+            'HasActiveTag': {'DataType': 'String', 'StringValue': str(completo['has_tag'])},
+            'PeajeId': {'DataType': 'String', 'StringValue': completo['peaje_id']}
+        },
+        MessageGroupId=completo['placa'],
+        MessageDeduplicationId=hashlib.sha256(crossing.encode('utf-8')).hexdigest()
+    )
+    return response['MessageId']
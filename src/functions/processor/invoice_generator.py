@@ -2,14 +2,27 @@ import uuid
 from datetime import datetime
 from decimal import Decimal
 
+from invoice_numbering import formatear_numero
+
 class InvoiceGenerator:
+    def __init__(self, numeracion=None):
+        # Numeración fiscal al guardar la transacción; sin CountersTable (pruebas locales) se usa un id aleatorio
+        self.numeracion = numeracion
+
+    def numerar(self, factura: dict, numero: int) -> dict:
+        """Asigna el número fiscal que la numeración tomó al guardar la transacción"""
+        factura.update({
+            'factura_id': formatear_numero(self.numeracion.serie, numero),
+            'serie': self.numeracion.serie,
+            'numero': numero
+        })
+        return factura
+
     def generar_factura(self, placa: str, peaje_id: str, monto: Decimal, user_type: str) -> dict:
-        """Genera una factura simulada para usuarios no registrados"""
-        
-        factura_id = f"FACT-{uuid.uuid4().hex[:8].upper()}"
+        """Genera la factura del cobro; con numeración, factura_id queda en None hasta guardarla (numerar)"""
         
         factura = {
-            'factura_id': factura_id,
+            'factura_id': None if self.numeracion else f"FACT-{uuid.uuid4().hex[:8].upper()}",
             'placa': placa,
             'peaje_id': peaje_id,
             'monto': monto,
@@ -26,6 +39,10 @@ class InvoiceGenerator:
         
         # Agregar detalles específicos por tipo de usuario
         if user_type == 'no_registrado':
+            factura['concepto'] = f'Cobro de peaje {peaje_id} - Usuario no registrado'
+            factura['cargo_premium'] = '50%'
+            factura['multa_tardia'] = 'Q15.00'
+            factura['mensaje_invitacion'] = 'Registrese en GuatePass para evitar recargos'
             factura['detalles'] = {
                 'tarifa_base': self._obtener_tarifa_base(peaje_id),
                 'recargo_premium': '50%',
@@ -43,4 +60,4 @@ class InvoiceGenerator:
             'PEAJE_ZONA12': Decimal('20.00'),
             'PEAJE_ZONA13': Decimal('35.00')
         }
-        return tarifas.get(peaje_id, Decimal('25.00'))
\ No newline at end of file
+        return tarifas.get(peaje_id, Decimal('25.00'))
@@ -0,0 +1,339 @@
+"""
+Numeración fiscal secuencial de facturas por bloques arrendados a cada contenedor.
+
+Un contador atómico por factura sería una sola llave caliente para todo el
+sistema. Cada contenedor del processor reserva un bloque de números con una sola
+escritura condicional sobre el contador de la serie y los entrega localmente:
+
+    contador = "<serie>"             siguiente = último número asignado a un bloque
+    contador = "<serie>#bloque#N"    arriendo del bloque que empieza en N: fin, contenedor,
+                                     vence_en y usados (números ya guardados con su factura)
+    contador = "<serie>#pendientes"  bloque_<N> = vence_en de cada bloque con números sin usar
+
+Cada factura se guarda en la misma TransactWriteItems que marca su número en
+"usados", condicionada a que el contenedor siga siendo dueño del arriendo. Un
+número solo queda usado si su transacción se guardó: si el guardado falla, el
+número vuelve al bloque local y lo toma la factura siguiente.
+
+Al retirarse (SIGTERM del runtime, solo con una extensión registrada, o salida
+del proceso) el contenedor suelta su arriendo y reporta los rangos sin usar. Si
+el contenedor se congela y nunca se reanuda, el arriendo vence a los
+INVOICE_LEASE_SECONDS. En ambos casos la siguiente reserva de cualquier
+contenedor toma primero esos bloques desde "<serie>#pendientes" y entrega sus
+números sin usar, así la serie no queda con huecos. Un contenedor que despierta
+con el arriendo ya tomado por otro ve fallar la condición de su transacción,
+descarta el bloque y reserva otro.
+
+Los números son únicos y la serie completa no tiene huecos, pero el orden de
+emisión entre contenedores no es estrictamente cronológico.
+"""
+import atexit
+import heapq
+import os
+import random
+import signal
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+from charge_marks import motivos_cancelacion
+
+# Reservas y transacciones por factura antes de rendirse (contención o arriendo perdido)
+MAX_INTENTOS = 8
+# El arriendo se renueva cuando le falta menos que esto para vencer
+MARGEN_RENOVACION = 60
+
+class InvoiceNumbering:
+    def __init__(self, counters_table, serie: str = 'FACT', tamano_bloque: int = 50,
+                 duracion_arriendo: int = 900, contenedor_id: Optional[str] = None,
+                 reloj=time.time, dormir=time.sleep):
+        self.counters_table = counters_table
+        self.client = counters_table.meta.client
+        self.serie = serie
+        self.tamano_bloque = tamano_bloque
+        self.duracion_arriendo = duracion_arriendo
+        self.contenedor_id = contenedor_id or os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME', uuid.uuid4().hex)
+        self.reloj = reloj
+        self.dormir = dormir
+        self._inicio = None
+        self._libres = []
+        self._vence = 0
+        # Una factura a la vez por contenedor: las transacciones sobre el mismo arriendo no chocan entre sí
+        self._lock = threading.Lock()
+
+    # ---------- llaves ----------
+
+    def _clave_bloque(self, inicio: int) -> Dict[str, str]:
+        return {'contador': f"{self.serie}#bloque#{inicio}"}
+
+    def _clave_pendientes(self) -> Dict[str, str]:
+        return {'contador': f"{self.serie}#pendientes"}
+
+    @staticmethod
+    def _atributo_pendiente(inicio: int) -> str:
+        return f"bloque_{inicio}"
+
+    # ---------- emisión ----------
+
+    def escribir(self, items_con_numero: Callable[[int], List[Dict]]) -> int:
+        """
+        Escribe items_con_numero(numero) junto con la marca del número en el arriendo y
+        devuelve el número. Una cancelación por otro item (p. ej. transacción ya guardada)
+        se propaga y el número vuelve al bloque local.
+        """
+        with self._lock:
+            for intento in range(MAX_INTENTOS):
+                self._preparar_bloque()
+                numero = self._libres[0]
+                try:
+                    self.client.transact_write_items(TransactItems=[self._usar(numero)] + items_con_numero(numero))
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'TransactionCanceledException':
+                        raise
+                    motivos = motivos_cancelacion(e)
+                    if motivos and motivos[0] == 'ConditionalCheckFailed':
+                        # El arriendo venció y otro contenedor tomó el bloque: se reserva otro
+                        print(f"⚠️ Arriendo del bloque {self.serie} {self._inicio} perdido, se reserva otro")
+                        self._soltar_local()
+                        continue
+                    if motivos and 'TransactionConflict' in motivos and \
+                            all(m in ('None', 'TransactionConflict') for m in motivos):
+                        self.dormir(random.uniform(0, 0.01 * 2 ** intento))
+                        continue
+                    raise
+                heapq.heappop(self._libres)
+                print(f"🧾 Factura {formatear_numero(self.serie, numero)} emitida")
+                if not self._libres:
+                    self._cerrar_bloque()
+                return numero
+        raise RuntimeError(f"Numeración de facturas {self.serie} en contención, reintentar")
+
+    def _usar(self, numero: int) -> Dict:
+        return {'Update': {
+            'TableName': self.counters_table.name,
+            'Key': self._clave_bloque(self._inicio),
+            'UpdateExpression': 'ADD usados :numero',
+            'ConditionExpression': 'contenedor = :yo AND NOT contains(usados, :n)',
+            'ExpressionAttributeValues': {':numero': {numero}, ':n': numero, ':yo': self.contenedor_id}
+        }}
+
+    def _preparar_bloque(self):
+        """Deja un bloque local con números libres y arriendo vigente"""
+        if self._libres and self.reloj() < self._vence - MARGEN_RENOVACION:
+            return
+        if self._libres and self._renovar():
+            return
+        self._soltar_local()
+        for intento in range(MAX_INTENTOS):
+            if self._reclamar_bloque() or self._reservar_bloque_nuevo():
+                return
+            self.dormir(random.uniform(0, 0.01 * 2 ** intento))
+        raise RuntimeError(f"Contador de facturas {self.serie} en contención, reintentar")
+
+    def _soltar_local(self):
+        self._inicio, self._libres, self._vence = None, [], 0
+
+    def _tomar(self, inicio: int, fin: int, usados, vence: int):
+        self._inicio = inicio
+        self._libres = [n for n in range(inicio, fin + 1) if n not in usados]
+        heapq.heapify(self._libres)
+        self._vence = vence
+
+    # ---------- arriendos ----------
+
+    def _marcar_pendiente(self, inicio: int, vence: int):
+        """Índice de bloques con números sin usar; es solo una pista, la condición va en el arriendo"""
+        try:
+            self.counters_table.update_item(
+                Key=self._clave_pendientes(),
+                UpdateExpression='SET #bloque = :vence',
+                ExpressionAttributeNames={'#bloque': self._atributo_pendiente(inicio)},
+                ExpressionAttributeValues={':vence': vence}
+            )
+        except Exception as e:
+            print(f"❌ Error actualizando bloques pendientes de {self.serie}: {e}")
+
+    def _quitar_pendiente(self, inicio: int):
+        try:
+            self.counters_table.update_item(
+                Key=self._clave_pendientes(),
+                UpdateExpression='REMOVE #bloque',
+                ExpressionAttributeNames={'#bloque': self._atributo_pendiente(inicio)}
+            )
+        except Exception as e:
+            print(f"❌ Error actualizando bloques pendientes de {self.serie}: {e}")
+
+    def _renovar(self) -> bool:
+        vence = int(self.reloj()) + self.duracion_arriendo
+        try:
+            self.counters_table.update_item(
+                Key=self._clave_bloque(self._inicio),
+                UpdateExpression='SET vence_en = :vence',
+                ConditionExpression='contenedor = :yo',
+                ExpressionAttributeValues={':vence': vence, ':yo': self.contenedor_id}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+        self._vence = vence
+        self._marcar_pendiente(self._inicio, vence)
+        return True
+
+    def _reclamar_bloque(self) -> bool:
+        """Toma un bloque soltado o vencido que todavía tiene números sin usar"""
+        ahora = int(self.reloj())
+        pendientes = self.counters_table.get_item(Key=self._clave_pendientes(), ConsistentRead=True).get('Item', {})
+        prefijo = self._atributo_pendiente('')
+        vencidos = sorted(int(nombre[len(prefijo):]) for nombre, vence in pendientes.items()
+                          if nombre.startswith(prefijo) and vence < ahora)
+        for inicio in vencidos:
+            vence = ahora + self.duracion_arriendo
+            try:
+                bloque = self.counters_table.update_item(
+                    Key=self._clave_bloque(inicio),
+                    UpdateExpression='SET contenedor = :yo, vence_en = :vence',
+                    ConditionExpression='vence_en < :ahora',
+                    ExpressionAttributeValues={':yo': self.contenedor_id, ':vence': vence, ':ahora': ahora},
+                    ReturnValues='ALL_NEW'
+                )['Attributes']
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                # Otro contenedor lo tomó primero o su dueño lo renovó
+                continue
+            self._tomar(inicio, int(bloque['fin']), {int(n) for n in bloque.get('usados', set())}, vence)
+            if not self._libres:
+                self._cerrar_bloque()
+                continue
+            self._marcar_pendiente(inicio, vence)
+            print(f"♻️ Bloque de facturas reutilizado: {self.serie} {inicio}-{bloque['fin']} "
+                  f"({len(self._libres)} números sin usar)")
+            return True
+        return False
+
+    def _reservar_bloque_nuevo(self) -> bool:
+        """Una escritura condicional sobre el contador de la serie, con el arriendo del bloque"""
+        item = self.counters_table.get_item(Key={'contador': self.serie}, ConsistentRead=True).get('Item') or {}
+        actual = int(item.get('siguiente', 0))
+        inicio, fin = actual + 1, actual + self.tamano_bloque
+        ahora = int(self.reloj())
+        vence = ahora + self.duracion_arriendo
+        condicion = 'siguiente = :actual' if actual else 'attribute_not_exists(siguiente)'
+        valores = {':fin': fin}
+        if actual:
+            valores[':actual'] = actual
+        try:
+            self.client.transact_write_items(TransactItems=[
+                {'Update': {
+                    'TableName': self.counters_table.name,
+                    'Key': {'contador': self.serie},
+                    'UpdateExpression': 'SET siguiente = :fin',
+                    'ConditionExpression': condicion,
+                    'ExpressionAttributeValues': valores
+                }},
+                {'Put': {
+                    'TableName': self.counters_table.name,
+                    'Item': {**self._clave_bloque(inicio), 'inicio': inicio, 'fin': fin,
+                             'contenedor': self.contenedor_id, 'vence_en': vence,
+                             'reservado_en': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ahora))},
+                    'ConditionExpression': 'attribute_not_exists(contador)'
+                }},
+                {'Update': {
+                    'TableName': self.counters_table.name,
+                    'Key': self._clave_pendientes(),
+                    'UpdateExpression': 'SET #bloque = :vence',
+                    'ExpressionAttributeNames': {'#bloque': self._atributo_pendiente(inicio)},
+                    'ExpressionAttributeValues': {':vence': vence}
+                }}
+            ])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            # Otro contenedor reservó el mismo bloque: releer el contador
+            return False
+        self._tomar(inicio, fin, set(), vence)
+        print(f"🧾 Bloque de facturas reservado: {self.serie} {inicio}-{fin}")
+        return True
+
+    def _cerrar_bloque(self):
+        """Bloque agotado: sale del índice de pendientes; el arriendo queda como auditoría"""
+        if self._inicio is not None:
+            self._quitar_pendiente(self._inicio)
+        self._soltar_local()
+
+    # ---------- retiro ----------
+
+    def liberar_restante(self) -> List[str]:
+        """Suelta el arriendo y reporta los rangos sin usar; la siguiente reserva los toma"""
+        if not self._lock.acquire(timeout=1):
+            # Una factura en curso: el arriendo vencerá solo
+            return []
+        try:
+            if self._inicio is None or not self._libres:
+                return []
+            rangos = formatear_rangos(sorted(self._libres))
+            self.counters_table.update_item(
+                Key=self._clave_bloque(self._inicio),
+                UpdateExpression='SET vence_en = :cero, sin_usar = :rangos, liberado_en = :fecha',
+                ConditionExpression='contenedor = :yo',
+                ExpressionAttributeValues={':cero': 0, ':rangos': rangos, ':yo': self.contenedor_id,
+                                           ':fecha': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.reloj()))}
+            )
+            self._marcar_pendiente(self._inicio, 0)
+            print(f"🧾 Rangos de facturas sin usar reportados: {self.serie} {', '.join(rangos)} ({self.contenedor_id})")
+            self._soltar_local()
+            return rangos
+        finally:
+            self._lock.release()
+
+    def registrar_retiro(self):
+        """Reporta el rango sin usar al terminar el proceso (SIGTERM del runtime o salida normal)"""
+        atexit.register(self._liberar_sin_error)
+        anterior = signal.getsignal(signal.SIGTERM)
+
+        def al_terminar(signum, frame):
+            self._liberar_sin_error()
+            if callable(anterior):
+                anterior(signum, frame)
+            else:
+                raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, al_terminar)
+
+    def _liberar_sin_error(self):
+        try:
+            self.liberar_restante()
+        except Exception as e:
+            print(f"❌ Error reportando rango de facturas sin usar: {e}")
+
+def formatear_numero(serie: str, numero: int) -> str:
+    return f"{serie}-{numero:010d}"
+
+def formatear_rangos(numeros: List[int]) -> List[str]:
+    """[3, 4, 5, 9] -> ['3-5', '9-9']"""
+    rangos = []
+    for numero in numeros:
+        if rangos and rangos[-1][1] == numero - 1:
+            rangos[-1][1] = numero
+        else:
+            rangos.append([numero, numero])
+    return [f"{inicio}-{fin}" for inicio, fin in rangos]
+
+def numbering_from_env(dynamodb=None):
+    if not os.environ.get('COUNTERS_TABLE'):
+        return None
+    dynamodb = dynamodb or aws_clients.resource('dynamodb')
+    numeracion = InvoiceNumbering(
+        dynamodb.Table(os.environ['COUNTERS_TABLE']),
+        serie=os.environ.get('INVOICE_SERIES', 'FACT'),
+        tamano_bloque=int(os.environ.get('INVOICE_BLOCK_SIZE', '50')),
+        duracion_arriendo=int(os.environ.get('INVOICE_LEASE_SECONDS', '900'))
+    )
+    if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+        numeracion.registrar_retiro()
+    return numeracion
@@ -0,0 +1,47 @@
+"""
+Canales de notificación de un cruce, resueltos antes de publicar en SNS.
+
+    configuracion.notificaciones = False  (tag)  -> sin notificación
+    configuracion.canales = ['email']     (tag)  -> solo esos canales
+    email / telefono vacíos                      -> ese canal no aplica
+
+Si no queda ningún canal el processor no publica. Si queda alguno, el mensaje
+lleva los atributos 'escenario' y 'canales'. La suscripción del notificador
+filtra por ellos (FilterPolicy en template.yaml), y el notificador envía solo
+por los canales del mensaje.
+"""
+import json
+from typing import Dict, List, Optional
+
+CANALES = ('email', 'sms')
+
+# Escenarios que los notificadores saben enviar (FilterPolicy 'escenario')
+ESCENARIOS = ('tag_express', 'registrado_digital', 'no_registrado_tradicional')
+
+def sin_contacto(data: Dict) -> bool:
+    """
+    True si el mensaje no trae email ni teléfono y hay que leerlos del usuario. Se
+    mira el valor, no la llave: con un hit del snapshot el webhook solo tiene flags
+    y manda user_email / user_phone en None.
+    """
+    return data.get('user_email') is None and data.get('user_phone') is None
+
+def contacto_de(data: Dict, user_info: Optional[Dict] = None) -> Dict[str, Optional[str]]:
+    """Email y teléfono del mensaje de la cola (el webhook los incluye); de user_info los que no vienen"""
+    user_info = user_info or {}
+    return {'email': data.get('user_email') or user_info.get('email'),
+            'sms': data.get('user_phone') or user_info.get('telefono')}
+
+def resolver_canales(data: Dict, contacto: Dict[str, Optional[str]]) -> List[str]:
+    configuracion = (data.get('tag_info') or {}).get('configuracion') or {}
+    if configuracion.get('notificaciones') is False:
+        return []
+    permitidos = configuracion.get('canales') or CANALES
+    return [canal for canal in CANALES if canal in permitidos and contacto.get(canal)]
+
+def atributos_mensaje(escenario: str, canales: List[str]) -> Dict:
+    """MessageAttributes de SNS para las FilterPolicy de los notificadores"""
+    return {
+        'escenario': {'DataType': 'String', 'StringValue': escenario},
+        'canales': {'DataType': 'String.Array', 'StringValue': json.dumps(canales)}
+    }
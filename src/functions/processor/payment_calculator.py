@@ -1,8 +1,17 @@
 import os
 from decimal import Decimal
 
+from botocore.exceptions import ClientError
+
+from charge_marks import CobroRepetido, marca_cobro, motivos_cancelacion
+
 class PaymentCalculator:
-    def __init__(self):
+    def __init__(self, ledger=None, counters_table=None):
+        # Ledger append-only opcional para cuentas con modo_saldo = 'ledger'
+        self.ledger = ledger
+        # Marcas cobro#<referencia> (charge_marks): sin CountersTable el débito no es idempotente
+        self.counters_table = counters_table
+        
         # Tarifas base por peaje (en quetzales) - USANDO DECIMAL
         self.tarifas_base = {
             'PEAJE_ZONA10': Decimal('25.00'),
@@ -48,8 +57,13 @@ class PaymentCalculator:
         print(f"   ✅ MONTO FINAL: {monto_final}")
         return monto_final
 
-    def procesar_pago(self, placa: str, monto: Decimal, user_type: str, dynamodb_table) -> bool:
-        """Procesa el pago deduciendo del saldo disponible - USANDO DECIMAL"""
+    def procesar_pago(self, placa: str, monto: Decimal, user_type: str, dynamodb_table, referencia: str = None) -> bool:
+        """
+        Procesa el pago deduciendo del saldo disponible - USANDO DECIMAL.
+        Con referencia el débito se escribe junto con su marca de cobro: si el cruce
+        ya se cobró en una entrega anterior no se descuenta de nuevo y devuelve True.
+        False solo si el usuario no existe o el saldo no alcanza; cualquier otro error se propaga.
+        """
         
         print(f"🔄 INICIANDO PROCESO DE PAGO: {placa}, monto={monto}, user_type={user_type}")
         
@@ -62,6 +76,12 @@ class PaymentCalculator:
                 return False
                 
             usuario = response['Item']
+            marca = marca_cobro(self.counters_table, referencia, placa, monto) if self.counters_table and referencia else None
+            
+            # Cuentas de alto volumen: agregar al ledger en vez de reescribir el item del usuario
+            if self.ledger and self.ledger.usa_ledger(usuario):
+                return self.ledger.debitar(placa, monto, usuario, marca)
+            
             saldo_actual = usuario.get('saldo_disponible', Decimal('0'))
             
             # Asegurarnos que saldo_actual es Decimal
@@ -71,50 +91,61 @@ class PaymentCalculator:
             print(f"💰 VERIFICANDO SALDO: {placa}")
             print(f"   Saldo actual: {saldo_actual}")
             print(f"   Monto a deducir: {monto}")
-            print(f"   Tipo de saldo: {type(saldo_actual)}")
-            print(f"   Tipo de monto: {type(monto)}")
             
-            if saldo_actual >= monto:
-                # Actualizar saldo - USANDO DECIMAL directamente
-                nuevo_saldo = saldo_actual - monto
-                print(f"✅ SALDO SUFICIENTE")
-                print(f"   Actualizando saldo: {saldo_actual} - {monto} = {nuevo_saldo}")
-                
-                # Actualizar en DynamoDB
-                dynamodb_table.update_item(
-                    Key={'placa': placa},
-                    UpdateExpression='SET saldo_disponible = :nuevo_saldo',
-                    ExpressionAttributeValues={
-                        ':nuevo_saldo': nuevo_saldo
-                    },
-                    ReturnValues='UPDATED_NEW'
-                )
-                
-                # Verificar que se actualizó
-                response_verificacion = dynamodb_table.get_item(Key={'placa': placa})
-                saldo_verificado = response_verificacion['Item'].get('saldo_disponible', Decimal('0'))
+            # La escritura condicionada decide: otro cruce pudo gastar el saldo después de la lectura
+            if self._descontar(dynamodb_table, placa, monto, marca):
                 print(f"✅ PAGO EXITOSO: {placa} - {monto}Q")
-                print(f"   Saldo verificado después: {saldo_verificado}")
+                print(f"   Saldo esperado después: {saldo_actual - monto}")
                 return True
             else:
                 # Saldo insuficiente
                 print(f"❌ SALDO INSUFICIENTE")
-                print(f"   Saldo actual: {saldo_actual}")
+                print(f"   Saldo leído: {saldo_actual}")
                 print(f"   Monto requerido: {monto}")
-                print(f"   Diferencia: {monto - saldo_actual}")
                 return False
                 
-        except Exception as e:
-            print(f"❌ ERROR PROCESANDO PAGO: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return False
+        except CobroRepetido:
+            print(f"⏭️ COBRO YA APLICADO: {placa} - {monto}Q descontados en una entrega anterior")
+            return True
+
+    def _descontar(self, dynamodb_table, placa: str, monto: Decimal, marca=None) -> bool:
+        """Resta el monto si el saldo alcanza; False si no alcanza, CobroRepetido si la marca ya existe"""
+        update = {
+            'Key': {'placa': placa},
+            'UpdateExpression': 'SET saldo_disponible = saldo_disponible - :monto',
+            'ConditionExpression': 'saldo_disponible >= :monto',
+            'ExpressionAttributeValues': {':monto': monto}
+        }
+        try:
+            if not marca:
+                dynamodb_table.update_item(**update)
+            else:
+                dynamodb_table.meta.client.transact_write_items(TransactItems=[
+                    {'Update': {'TableName': dynamodb_table.name, **update}}, marca
+                ])
+            return True
+        except ClientError as e:
+            codigo = e.response['Error']['Code']
+            if codigo == 'ConditionalCheckFailedException':
+                return False
+            if codigo != 'TransactionCanceledException':
+                raise
+            motivos = motivos_cancelacion(e)
+            if len(motivos) > 1 and motivos[1] == 'ConditionalCheckFailed':
+                raise CobroRepetido(marca['Put']['Item']['contador'])
+            if motivos and motivos[0] == 'ConditionalCheckFailed':
+                return False
+            raise
 
     def verificar_saldo_actual(self, placa: str, dynamodb_table) -> Decimal:
         """Verifica el saldo actual de un usuario (para debugging)"""
         try:
             response = dynamodb_table.get_item(Key={'placa': placa})
             if 'Item' in response:
+                if self.ledger and self.ledger.usa_ledger(response['Item']):
+                    saldo = self.ledger.saldo_disponible(response['Item'])
+                    print(f"📊 SALDO ACTUAL {placa} (ledger): {saldo}")
+                    return saldo
                 saldo = response['Item'].get('saldo_disponible', Decimal('0'))
                 if not isinstance(saldo, Decimal):
                     saldo = Decimal(str(saldo))
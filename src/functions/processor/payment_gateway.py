@@ -0,0 +1,228 @@
+"""
+Autorización de cobros con tarjeta a través de una pasarela de pago.
+
+    PasarelaSimulada   stub local: latencia log-normal y tasas de rechazo y error configurables
+    PasarelaHttp       POST JSON a PAYMENT_GATEWAY_URL con timeout por llamada
+    ClientePasarela    timeout por intento, reintentos con jitter, plazo total y circuit breaker
+
+Errores:
+
+    rechazo (tarjeta, límite)        respuesta normal: aprobado = False, no se reintenta
+    ErrorPasarela / TimeoutPasarela  transitorio: se reintenta con la misma referencia
+    PasarelaNoDisponible             circuito abierto o intentos agotados: el cobro se difiere
+
+La referencia (placa#peaje#timestamp) es la misma en cada reintento y en cada
+entrega del mensaje de SQS. La pasarela la usa como llave de idempotencia, así
+un timeout después de un cargo no termina en un segundo cargo.
+"""
+import http.client as http_client
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+from urllib import error as urllib_error
+from urllib import request as urllib_request
+
+class ErrorPasarela(Exception):
+    """Falla transitoria de la pasarela (5xx, conexión)"""
+
+class TimeoutPasarela(ErrorPasarela):
+    """La pasarela no respondió dentro del timeout del intento"""
+
+class PasarelaNoDisponible(Exception):
+    """No se pudo obtener respuesta de la pasarela: el cobro se difiere"""
+
+class PasarelaSimulada:
+    nombre = 'simulada'
+
+    def __init__(self, latencia_ms: float = 120, sigma: float = 0.5, tasa_rechazo: float = 0.02,
+                 tasa_error: float = 0.01, rng: Optional[random.Random] = None, dormir=time.sleep):
+        self.latencia_ms = latencia_ms
+        self.sigma = sigma
+        self.tasa_rechazo = tasa_rechazo
+        self.tasa_error = tasa_error
+        self.rng = rng or random.Random()
+        self.dormir = dormir
+        self._lock = threading.Lock()
+
+    def autorizar(self, solicitud: Dict, timeout: float) -> Dict:
+        with self._lock:
+            latencia = self.latencia_ms / 1000 * self.rng.lognormvariate(0, self.sigma)
+            sorteo = self.rng.random()
+        if latencia > timeout:
+            self.dormir(timeout)
+            raise TimeoutPasarela(f"Sin respuesta en {timeout:.2f}s")
+        self.dormir(latencia)
+        if sorteo < self.tasa_error:
+            raise ErrorPasarela('HTTP 503')
+        if sorteo < self.tasa_error + self.tasa_rechazo:
+            return {'aprobado': False, 'motivo': 'Tarjeta rechazada'}
+        return {'aprobado': True, 'codigo_autorizacion': f"AUTH-{uuid.uuid4().hex[:8].upper()}"}
+
+class PasarelaHttp:
+    """
+    Contrato: POST {placa, monto, metodo_pago, referencia} con cabecera Idempotency-Key.
+    200 -> {aprobado, codigo_autorizacion | motivo}; 402 -> rechazo; 5xx o sin respuesta -> transitorio.
+    """
+    nombre = 'http'
+
+    def __init__(self, url: str, api_key: Optional[str] = None):
+        self.url = url
+        self.api_key = api_key
+
+    def autorizar(self, solicitud: Dict, timeout: float) -> Dict:
+        headers = {'Content-Type': 'application/json', 'Idempotency-Key': solicitud['referencia']}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+        peticion = urllib_request.Request(self.url, data=json.dumps(solicitud, default=str).encode('utf-8'),
+                                          headers=headers, method='POST')
+        try:
+            with urllib_request.urlopen(peticion, timeout=timeout) as respuesta:
+                cuerpo = respuesta.read()
+            return json.loads(cuerpo)
+        except urllib_error.HTTPError as e:
+            if e.code == 402:
+                return {'aprobado': False, 'motivo': 'Pago rechazado'}
+            raise ErrorPasarela(f"HTTP {e.code}")
+        except (socket.timeout, TimeoutError):
+            raise TimeoutPasarela(f"Sin respuesta en {timeout:.2f}s")
+        except urllib_error.URLError as e:
+            if isinstance(e.reason, (socket.timeout, TimeoutError)):
+                raise TimeoutPasarela(f"Sin respuesta en {timeout:.2f}s")
+            raise ErrorPasarela(str(e.reason))
+        except (OSError, http_client.HTTPException) as e:
+            raise ErrorPasarela(f"Conexión: {e}")
+        except ValueError:
+            raise ErrorPasarela('Respuesta inválida')
+
+class CircuitBreaker:
+    """
+    cerrado -> abierto tras `umbral` fallas seguidas; abierto rechaza sin llamar
+    durante `enfriamiento` segundos; luego semi_abierto deja pasar una sola prueba.
+    """
+    def __init__(self, umbral: int = 5, enfriamiento: float = 30, reloj=time.monotonic):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self.reloj = reloj
+        self.estado = 'cerrado'
+        self.fallas = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == 'abierto' and self.reloj() - self._abierto_desde >= self.enfriamiento:
+                self.estado = 'semi_abierto'
+                self._prueba_en_curso = False
+            if self.estado == 'cerrado':
+                return True
+            if self.estado == 'semi_abierto' and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            if self.estado != 'cerrado':
+                print("🟢 Pasarela de pago recuperada: circuito cerrado")
+            self.estado = 'cerrado'
+            self.fallas = 0
+            self._prueba_en_curso = False
+
+    def fallo(self):
+        with self._lock:
+            self.fallas += 1
+            if self.estado == 'semi_abierto' or (self.estado == 'cerrado' and self.fallas >= self.umbral):
+                print(f"🔴 Pasarela de pago degradada ({self.fallas} fallas seguidas): circuito abierto "
+                      f"por {self.enfriamiento:.0f}s")
+                self.estado = 'abierto'
+                self._abierto_desde = self.reloj()
+                self._prueba_en_curso = False
+
+class ClientePasarela:
+    def __init__(self, pasarela, circuito: CircuitBreaker, timeout: float = 2.0, max_intentos: int = 3,
+                 plazo: float = 5.0, metricas=None, reloj=time.monotonic, dormir=time.sleep):
+        self.pasarela = pasarela
+        self.circuito = circuito
+        self.timeout = timeout
+        self.max_intentos = max_intentos
+        # Tiempo máximo por cobro sumando intentos y esperas: un cobro lento no frena el lote
+        self.plazo = plazo
+        self.metricas = metricas
+        self.reloj = reloj
+        self.dormir = dormir
+
+    def _contar(self, nombre: str):
+        if self.metricas:
+            self.metricas.contar(nombre)
+
+    def _latencia(self, inicio_intento: float):
+        """Latencia de cada intento, también de los que fallan o vencen por timeout"""
+        if self.metricas:
+            self.metricas.registrar('LatenciaAutorizacion', (self.reloj() - inicio_intento) * 1000, 'Milliseconds')
+
+    def autorizar(self, placa: str, monto, metodo_pago: str, referencia: str) -> Dict:
+        """Respuesta de la pasarela ({'aprobado': ...}); PasarelaNoDisponible si no la hubo"""
+        solicitud = {'placa': placa, 'monto': str(monto), 'metodo_pago': metodo_pago, 'referencia': referencia}
+        inicio = self.reloj()
+        ultimo_error = None
+        for intento in range(1, self.max_intentos + 1):
+            restante = self.plazo - (self.reloj() - inicio)
+            if restante <= 0:
+                break
+            if not self.circuito.permitir():
+                self._contar('CircuitoAbierto')
+                raise PasarelaNoDisponible('Circuito abierto')
+
+            inicio_intento = self.reloj()
+            try:
+                respuesta = self.pasarela.autorizar(solicitud, min(self.timeout, restante))
+            except ErrorPasarela as e:
+                self._latencia(inicio_intento)
+                self.circuito.fallo()
+                self._contar('TimeoutsPasarela' if isinstance(e, TimeoutPasarela) else 'ErroresPasarela')
+                print(f"⚠️ Pasarela intento {intento}/{self.max_intentos} para {referencia}: {e}")
+                ultimo_error = e
+                if intento < self.max_intentos:
+                    # Backoff exponencial con jitter completo, sin pasar del plazo
+                    espera = random.uniform(0, min(0.1 * (2 ** intento), 1.0))
+                    self.dormir(min(espera, max(0.0, self.plazo - (self.reloj() - inicio))))
+                continue
+            except Exception:
+                # Respuesta inesperada: cuenta como falla para no dejar una prueba del circuito abierta
+                self.circuito.fallo()
+                raise
+
+            self._latencia(inicio_intento)
+            self.circuito.exito()
+            if self.metricas:
+                self.metricas.registrar('LatenciaCobro', (self.reloj() - inicio) * 1000, 'Milliseconds')
+                self._contar('AutorizacionesAprobadas' if respuesta.get('aprobado') else 'AutorizacionesRechazadas')
+            return respuesta
+
+        raise PasarelaNoDisponible(f"Sin respuesta de la pasarela: {ultimo_error or 'plazo agotado'}")
+
+def gateway_from_env(metricas=None) -> ClientePasarela:
+    if os.environ.get('PAYMENT_GATEWAY', 'simulada') == 'http':
+        pasarela = PasarelaHttp(os.environ['PAYMENT_GATEWAY_URL'], os.environ.get('PAYMENT_GATEWAY_API_KEY'))
+    else:
+        pasarela = PasarelaSimulada(
+            latencia_ms=float(os.environ.get('PAYMENT_STUB_LATENCY_MS', '120')),
+            sigma=float(os.environ.get('PAYMENT_STUB_LATENCY_SIGMA', '0.5')),
+            tasa_rechazo=float(os.environ.get('PAYMENT_STUB_DECLINE_RATE', '0.02')),
+            tasa_error=float(os.environ.get('PAYMENT_STUB_ERROR_RATE', '0.01'))
+        )
+    circuito = CircuitBreaker(umbral=int(os.environ.get('PAYMENT_BREAKER_FAILURES', '5')),
+                              enfriamiento=float(os.environ.get('PAYMENT_BREAKER_COOLDOWN_SECONDS', '30')))
+    return ClientePasarela(
+        pasarela, circuito,
+        timeout=float(os.environ.get('PAYMENT_TIMEOUT_MS', '2000')) / 1000,
+        max_intentos=int(os.environ.get('PAYMENT_MAX_ATTEMPTS', '3')),
+        plazo=float(os.environ.get('PAYMENT_DEADLINE_MS', '5000')) / 1000,
+        metricas=metricas
+    )
@@ -0,0 +1,134 @@
+"""
+Contadores de tráfico e ingresos por plaza y minuto.
+
+    contador (HASH)  = "<peaje_id>#<shard>"  -> cada cruce suma en un shard al azar
+    minuto   (RANGE) = "YYYY-MM-DDTHH:MM"    -> minuto del cruce (UTC)
+
+Cada item guarda cruces_total/monto_total y el desglose por user_type
+(cruces_<user_type>, monto_<user_type>). El monto es lo cobrado: un cruce con
+pago fallido suma al tráfico con monto 0. En hora pico una plaza recibe cientos de
+cruces por minuto: repartirlos en shards evita que un solo item caliente limite
+las escrituras. Al leer se consultan los shards de la plaza y se suman por minuto.
+Los items expiran con TTL (expira_en).
+"""
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Key
+
+import aws_clients
+
+FORMATO_MINUTO = '%Y-%m-%dT%H:%M'
+MAX_MINUTOS = 1440
+
+def minuto_de(timestamp: str) -> str:
+    """Minuto UTC del cruce; los timestamps sin zona se toman como UTC"""
+    momento = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=timezone.utc)
+    return momento.astimezone(timezone.utc).strftime(FORMATO_MINUTO)
+
+class PlazaTraffic:
+    def __init__(self, traffic_table, shards: int = 8, retencion_dias: int = 7):
+        self.traffic_table = traffic_table
+        self.shards = shards
+        self.retencion_dias = retencion_dias
+
+    def registrar(self, peaje_id: str, user_type: str, monto: Decimal, timestamp: str):
+        """Suma un cruce al minuto del cruce en un shard al azar de la plaza"""
+        minuto = minuto_de(timestamp)
+        inicio_minuto = datetime.strptime(minuto, FORMATO_MINUTO).replace(tzinfo=timezone.utc)
+        expira_en = int((inicio_minuto + timedelta(days=self.retencion_dias)).timestamp())
+
+        self.traffic_table.update_item(
+            Key={'contador': f"{peaje_id}#{random.randrange(self.shards)}", 'minuto': minuto},
+            UpdateExpression='ADD cruces_total :uno, monto_total :monto, #cruces_tipo :uno, #monto_tipo :monto '
+                             'SET expira_en = :expira',
+            ExpressionAttributeNames={'#cruces_tipo': f"cruces_{user_type}", '#monto_tipo': f"monto_{user_type}"},
+            ExpressionAttributeValues={':uno': 1, ':monto': monto, ':expira': expira_en}
+        )
+
+    def ultimos_minutos(self, peaje_id: str, minutos: int, ahora: datetime = None) -> list:
+        """Serie de los últimos N minutos (incluye el actual) con los shards ya sumados"""
+        ahora = ahora or datetime.now(timezone.utc)
+        serie = [(ahora - timedelta(minutes=i)).strftime(FORMATO_MINUTO) for i in range(minutos - 1, -1, -1)]
+        por_minuto = {minuto: {'minuto': minuto, 'cruces_total': 0, 'monto_total': Decimal('0'),
+                               'por_tipo': {}} for minuto in serie}
+
+        def consultar(shard):
+            kwargs = {
+                'KeyConditionExpression': Key('contador').eq(f"{peaje_id}#{shard}") & Key('minuto').between(serie[0], serie[-1])
+            }
+            items = []
+            while True:
+                response = self.traffic_table.query(**kwargs)
+                items.extend(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response:
+                    return items
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        with ThreadPoolExecutor(max_workers=self.shards) as executor:
+            for items in executor.map(consultar, range(self.shards)):
+                for item in items:
+                    acumulado = por_minuto[item['minuto']]
+                    acumulado['cruces_total'] += int(item.get('cruces_total', 0))
+                    acumulado['monto_total'] += item.get('monto_total', Decimal('0'))
+                    for atributo, valor in item.items():
+                        for prefijo, campo in (('cruces_', 'cruces'), ('monto_', 'monto')):
+                            if atributo.startswith(prefijo) and atributo != f"{prefijo}total":
+                                tipo = acumulado['por_tipo'].setdefault(
+                                    atributo[len(prefijo):], {'cruces': 0, 'monto': Decimal('0')}
+                                )
+                                tipo[campo] += int(valor) if campo == 'cruces' else valor
+
+        return [por_minuto[minuto] for minuto in serie]
+
+def traffic_from_env(dynamodb=None):
+    if not os.environ.get('TRAFFIC_TABLE'):
+        return None
+    dynamodb = dynamodb or aws_clients.resource('dynamodb')
+    return PlazaTraffic(
+        dynamodb.Table(os.environ['TRAFFIC_TABLE']),
+        shards=int(os.environ.get('TRAFFIC_SHARDS', '8')),
+        retencion_dias=int(os.environ.get('TRAFFIC_RETENTION_DAYS', '7'))
+    )
+
+# Una instancia por contenedor para el endpoint (tabla y resource reutilizados)
+trafico = traffic_from_env()
+
+def api_handler(event, context):
+    """GET /plazas/{peaje_id}/traffic?minutos=N"""
+    peaje_id = (event.get('pathParameters') or {}).get('peaje_id', '').upper()
+    minutos = (event.get('queryStringParameters') or {}).get('minutos', '60')
+
+    if not minutos.isdigit() or not 1 <= int(minutos) <= MAX_MINUTOS:
+        return _response(400, {'error': {'code': 'INVALID_MINUTOS',
+                                         'message': f"minutos must be between 1 and {MAX_MINUTOS}"}})
+
+    try:
+        serie = trafico.ultimos_minutos(peaje_id, int(minutos))
+    except Exception as e:
+        print(f"Error querying plaza traffic: {str(e)}")
+        return _response(500, {'error': {'code': 'INTERNAL_ERROR', 'message': 'Error retrieving plaza traffic'}})
+
+    return _response(200, {
+        'peaje_id': peaje_id,
+        'minutos': int(minutos),
+        'cruces_total': sum(m['cruces_total'] for m in serie),
+        'monto_total': sum((m['monto_total'] for m in serie), Decimal('0')),
+        'serie': serie
+    })
+
+def _response(status_code, data):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(data, default=lambda o: float(o) if isinstance(o, Decimal) else str(o))
+    }
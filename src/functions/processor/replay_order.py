@@ -0,0 +1,72 @@
+"""
+Orden por placa de los cruces que llegan por replay de backlog (webhook/replay.py).
+
+El replay numera los cruces que encola de cada placa dentro de un archivo
+(replay_seq = 1, 2, 3... en orden de timestamp) y no encola uno más viejo que
+el último de la placa. Aquí cada cruce se aplica solo después del anterior; el
+último aplicado queda en CountersTable (replay#<archivo>#<placa>):
+
+    replay_seq <= último     ya se aplicó (reentrega o archivo reprocesado): se descarta
+    replay_seq == último + 1 se procesa y avanza el cursor
+    replay_seq >  último + 1 falta uno anterior: vuelve a la cola. Tras max_esperas
+                             entregas se procesa igual (el anterior no llegó a encolarse)
+
+En cola FIFO los mensajes de la placa ya llegan en orden y solo aplica el
+primer caso. El registro vence por TTL (expira_en).
+"""
+import os
+import time
+from typing import Dict, Optional
+
+from botocore.exceptions import ClientError
+
+APLICADO = 'aplicado'
+APLICAR = 'aplicar'
+ESPERAR = 'esperar'
+
+class ReplayOrder:
+    def __init__(self, counters_table, max_esperas: int = 3, dias: int = 14):
+        self.counters_table = counters_table
+        self.max_esperas = max_esperas
+        self.dias = dias
+
+    @staticmethod
+    def aplica(data: Dict) -> bool:
+        return data.get('origen') == 'replay' and bool(data.get('replay_seq'))
+
+    @staticmethod
+    def _clave(data: Dict) -> Dict[str, str]:
+        return {'contador': f"replay#{data.get('replay_archivo', '')}#{data.get('replay_clave') or data['placa']}"}
+
+    def estado(self, data: Dict, recepciones: int) -> str:
+        """APLICADO, APLICAR o ESPERAR según el último replay_seq aplicado de la placa"""
+        item = self.counters_table.get_item(Key=self._clave(data), ConsistentRead=True).get('Item') or {}
+        ultimo = int(item.get('seq', 0))
+        seq = int(data['replay_seq'])
+        if seq <= ultimo:
+            return APLICADO
+        if seq == ultimo + 1 or recepciones >= self.max_esperas:
+            return APLICAR
+        return ESPERAR
+
+    def avanzar(self, data: Dict) -> Optional[int]:
+        """Marca el cruce como aplicado; el cursor nunca retrocede"""
+        seq = int(data['replay_seq'])
+        try:
+            self.counters_table.update_item(
+                Key=self._clave(data),
+                UpdateExpression='SET seq = :seq, expira_en = :expira',
+                ConditionExpression='attribute_not_exists(seq) OR seq < :seq',
+                ExpressionAttributeValues={':seq': seq, ':expira': int(time.time()) + self.dias * 86400}
+            )
+            return seq
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return None
+
+def replay_order_from_env(counters_table) -> Optional[ReplayOrder]:
+    """None sin CountersTable: los cruces de replay se aplican en el orden en que llegan"""
+    if counters_table is None:
+        return None
+    return ReplayOrder(counters_table, max_esperas=int(os.environ.get('REPLAY_MAX_ESPERAS', '3')))
@@ -1,19 +1,52 @@
 import json
-import boto3
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
-dynamodb = boto3.resource('dynamodb')
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+import aws_clients
+import bulk
+import registry_changes
+
+dynamodb = aws_clients.resource('dynamodb')
 users_table = dynamodb.Table(os.environ['USERS_TABLE'])
 tags_table = dynamodb.Table(os.environ['TAGS_TABLE'])
 
+# Tags y placas modificados: el webhook deja de usar su entrada del snapshot (opcional)
+counters_table = dynamodb.Table(os.environ['COUNTERS_TABLE']) if os.environ.get('COUNTERS_TABLE') else None
+
+# Tags activos por placa (la placa se quita del tag al desactivarlo: índice disperso)
+TAGS_PLACA_INDEX = 'placa-index'
+
+# GET /users/{placa}/tag: lectura del usuario y query del tag en paralelo, con hilos
+# reutilizados entre invocaciones del contenedor
+lookup_executor = ThreadPoolExecutor(max_workers=2)
+
+# POST /tags/bulk
+MAX_BULK_OPERATIONS = int(os.environ.get('MAX_BULK_OPERATIONS', '1000'))
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', '8'))
+BULK_OPERATIONS = ('asociar', 'actualizar', 'desactivar')
+
+# Error por item de la transacción cuya condición falló (orden de *_items)
+CONDITION_ERRORS = {
+    'asociar': [("TAG_IN_USE", "Tag ID already in use"), ("USER_NOT_FOUND", "Usuario no encontrado")],
+    'actualizar': [("TAG_NOT_FOUND", "El tag no está asociado a la placa")],
+    'desactivar': [("TAG_NOT_FOUND", "El tag no está asociado a la placa"),
+                   ("NO_TAG_ASSOCIATED", "El usuario no tiene ese tag asociado")]
+}
+
 def lambda_handler(event, context):
+    if event.get('resource') == '/tags/bulk' or event.get('path', '').endswith('/tags/bulk'):
+        return bulk_handler(event)
+    
     print(f"Event: {json.dumps(event)}")
     
     # Determinar método HTTP y ruta
     http_method = event.get('httpMethod')
     path = event.get('path', '')
-    placa = event.get('pathParameters', {}).get('placa', '').upper()
+    placa = (event.get('pathParameters') or {}).get('placa', '').upper()
     
     if not placa:
         return error_response(400, "MISSING_PLACA", "Placa parameter is required")
@@ -38,7 +71,7 @@ def lambda_handler(event, context):
         return error_response(500, "INTERNAL_ERROR", "Internal server error")
 
 def associate_tag(event, placa):
-    """Asocia un tag a un vehículo"""
+    """Asocia un tag a un vehículo (una sola transacción: tag libre y usuario existente)"""
     body = json.loads(event.get('body', '{}'))
     tag_id = body.get('tag_id')
     metodo_pago = body.get('metodo_pago')
@@ -47,41 +80,18 @@ def associate_tag(event, placa):
     if not tag_id:
         return error_response(400, "MISSING_TAG_ID", "tag_id is required")
     
-    # Verificar que el tag no esté en uso
-    try:
-        existing_tag = tags_table.get_item(Key={'tag_id': tag_id})
-        if 'Item' in existing_tag:
-            return error_response(400, "TAG_IN_USE", "Tag ID already in use")
-    except Exception as e:
-        print(f"Error checking tag: {e}")
-    
-    # Verificar que el usuario existe
-    user_response = users_table.get_item(Key={'placa': placa})
-    if 'Item' not in user_response:
-        return error_response(404, "USER_NOT_FOUND", "Usuario no encontrado")
-    
     # Crear registro del tag
-    tag_item = {
-        'tag_id': tag_id,
-        'placa': placa,
-        'estado': 'activo',
-        'fecha_activacion': datetime.now(timezone.utc).isoformat(),
-        'metodo_pago': metodo_pago,
-        'configuracion': configuracion
-    }
+    tag_item = new_tag_item(tag_id, placa, metodo_pago, configuracion)
     
-    # Actualizar usuario para indicar que tiene tag
-    users_table.update_item(
-        Key={'placa': placa},
-        UpdateExpression='SET tiene_tag = :has_tag, tag_id = :tag_id',
-        ExpressionAttributeValues={
-            ':has_tag': True,
-            ':tag_id': tag_id
-        }
-    )
-    
-    # Guardar tag
-    tags_table.put_item(Item=tag_item)
+    # Las condiciones reemplazan las lecturas previas: tag sin registro y usuario existente
+    reasons = transact_write(associate_items(tag_item))
+    if reasons:
+        if reasons[0] == 'ConditionalCheckFailed':
+            return error_response(400, "TAG_IN_USE", "Tag ID already in use")
+        if reasons[1] == 'ConditionalCheckFailed':
+            return error_response(404, "USER_NOT_FOUND", "Usuario no encontrado")
+        return error_response(409, "CONFLICT", "Concurrent update, retry the request")
+    record_changes([tag_id], [placa])
     
     return success_response({
         'message': 'Tag asociado exitosamente',
@@ -90,8 +100,16 @@ def associate_tag(event, placa):
 
 def get_tag_info(placa):
     """Obtiene información del tag asociado a un vehículo"""
-    # Buscar usuario primero
-    user_response = users_table.get_item(Key={'placa': placa})
+    # Usuario y tag activo de la placa (índice placa-index) en paralelo: una sola espera
+    user_future = lookup_executor.submit(users_table.get_item, Key={'placa': placa})
+    tags_future = lookup_executor.submit(
+        tags_table.query,
+        IndexName=TAGS_PLACA_INDEX,
+        KeyConditionExpression=Key('placa').eq(placa)
+    )
+    user_response = user_future.result()
+    tags = tags_future.result().get('Items', [])
+    
     if 'Item' not in user_response:
         return error_response(404, "USER_NOT_FOUND", "Usuario no encontrado")
     
@@ -104,13 +122,14 @@ def get_tag_info(placa):
             'message': 'El usuario no tiene tag asociado'
         })
     
-    # Obtener información del tag
-    tag_response = tags_table.get_item(Key={'tag_id': user['tag_id']})
-    if 'Item' not in tag_response:
+    # El usuario manda: el índice es eventualmente consistente y justo después de
+    # asociar puede no tener el tag todavía
+    tag_info = next((tag for tag in tags if tag['tag_id'] == user['tag_id']), None)
+    if not tag_info:
+        tag_info = tags_table.get_item(Key={'tag_id': user['tag_id']}).get('Item')
+    if not tag_info:
         return error_response(404, "TAG_NOT_FOUND", "Tag no encontrado")
     
-    tag_info = tag_response['Item']
-    
     return success_response({
         'placa': placa,
         'tag_info': tag_info
@@ -122,80 +141,69 @@ def update_tag_config(event, placa):
     configuracion = body.get('configuracion')
     metodo_pago = body.get('metodo_pago')
     
-    # Obtener tag_id del usuario
-    user_response = users_table.get_item(Key={'placa': placa})
-    if 'Item' not in user_response:
-        return error_response(404, "USER_NOT_FOUND", "Usuario no encontrado")
-    
-    user = user_response['Item']
-    tag_id = user.get('tag_id')
-    
-    if not tag_id:
-        return error_response(400, "NO_TAG_ASSOCIATED", "El usuario no tiene tag asociado")
-    
     # Preparar update expression
-    update_expr = []
-    expr_values = {}
-    
-    if configuracion:
-        update_expr.append('configuracion = :config')
-        expr_values[':config'] = configuracion
-    
-    if metodo_pago:
-        update_expr.append('metodo_pago = :mp')
-        expr_values[':mp'] = metodo_pago
-    
-    if not update_expr:
+    update = update_fields(placa, configuracion, metodo_pago)
+    if not update:
         return error_response(400, "NO_UPDATES", "No se proporcionaron campos para actualizar")
     
-    # Actualizar tag
-    tags_table.update_item(
-        Key={'tag_id': tag_id},
-        UpdateExpression='SET ' + ', '.join(update_expr),
-        ExpressionAttributeValues=expr_values
-    )
-    
-    # Obtener tag actualizado
-    updated_tag = tags_table.get_item(Key={'tag_id': tag_id})['Item']
+    # tag_id del request (una sola llamada) o el tag activo de la placa en el índice placa-index
+    tag_id = body.get('tag_id')
+    if not tag_id:
+        tags = tags_table.query(
+            IndexName=TAGS_PLACA_INDEX,
+            KeyConditionExpression=Key('placa').eq(placa),
+            FilterExpression=Attr('estado').eq('activo'),
+            ProjectionExpression='tag_id'
+        ).get('Items', [])
+        if not tags:
+            return user_not_found(placa) or error_response(400, "NO_TAG_ASSOCIATED", "El usuario no tiene tag asociado")
+        tag_id = tags[0]['tag_id']
+    
+    # Actualizar tag y devolverlo en la misma llamada; la condición evita tocar un tag ya reasignado
+    try:
+        updated_tag = tags_table.update_item(
+            Key={'tag_id': tag_id},
+            ReturnValues='ALL_NEW',
+            **update
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return user_not_found(placa) or error_response(404, "TAG_NOT_FOUND", "Tag no encontrado")
+    record_changes([tag_id], [])
     
     return success_response({
         'message': 'Tag actualizado exitosamente',
         'tag': updated_tag
     })
 
+def user_not_found(placa):
+    """404 si la placa no existe; solo se lee al usuario cuando la operación ya falló"""
+    if 'Item' not in users_table.get_item(Key={'placa': placa}, ProjectionExpression='placa'):
+        return error_response(404, "USER_NOT_FOUND", "Usuario no encontrado")
+    return None
+
 def delete_tag_association(event, placa):
     """Desasocia un tag de un vehículo"""
     body = json.loads(event.get('body', '{}'))
     razon = body.get('razon', 'Sin razón especificada')
     
-    # Obtener usuario
-    user_response = users_table.get_item(Key={'placa': placa})
+    # Obtener tag_id del usuario
+    user_response = users_table.get_item(Key={'placa': placa}, ProjectionExpression='tag_id')
     if 'Item' not in user_response:
         return error_response(404, "USER_NOT_FOUND", "Usuario no encontrado")
     
-    user = user_response['Item']
-    tag_id = user.get('tag_id')
+    tag_id = user_response['Item'].get('tag_id')
     
     if not tag_id:
         return error_response(400, "NO_TAG_ASSOCIATED", "El usuario no tiene tag asociado")
     
-    # Actualizar tag a inactivo
-    tags_table.update_item(
-        Key={'tag_id': tag_id},
-        UpdateExpression='SET estado = :estado, fecha_desactivacion = :fecha, razon_desactivacion = :razon REMOVE placa',
-        ExpressionAttributeValues={
-            ':estado': 'inactivo',
-            ':fecha': datetime.now(timezone.utc).isoformat(),
-            ':razon': razon
-        }
-    )
-    
-    # Actualizar usuario
-    users_table.update_item(
-        Key={'placa': placa},
-        UpdateExpression='REMOVE tag_id SET tiene_tag = :has_tag',
-        ExpressionAttributeValues={':has_tag': False}
-    )
+    # Tag inactivo y usuario sin tag en una sola transacción
+    reasons = transact_write(deactivate_items(placa, tag_id, razon))
+    if reasons:
+        # Otro request cambió el tag entre la lectura y la transacción
+        return error_response(409, "CONFLICT", "Concurrent update, retry the request")
+    record_changes([tag_id], [placa])
     
     return success_response({
         'message': 'Tag desasociado exitosamente',
@@ -204,6 +212,244 @@ def delete_tag_association(event, placa):
         'razon': razon
     })
 
+def bulk_handler(event):
+    """
+    POST /tags/bulk - asocia, actualiza y desactiva tags de una flotilla en un solo request.
+    Devuelve el resultado (aplicada/rechazada) de cada operación.
+    """
+    try:
+        try:
+            data = json.loads(event.get('body') or '{}')
+        except json.JSONDecodeError:
+            return error_response(400, "VALIDATION_ERROR", "Invalid JSON body")
+        
+        operations = data.get('operaciones') if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return error_response(400, "VALIDATION_ERROR", "Field 'operaciones' must be a non-empty list")
+        
+        if len(operations) > MAX_BULK_OPERATIONS:
+            return error_response(400, "BATCH_TOO_LARGE", f"Maximum {MAX_BULK_OPERATIONS} operations per request")
+        
+        print(f"Received bulk request with {len(operations)} operations")
+        results = apply_operations(operations)
+        
+        applied = sum(1 for r in results if r['estado'] == 'aplicada')
+        print(f"Bulk processed: {applied} applied, {len(results) - applied} rejected")
+        
+        return success_response({
+            'total': len(results),
+            'aplicadas': applied,
+            'rechazadas': len(results) - applied,
+            'resultados': results
+        })
+        
+    except Exception as e:
+        print(f"Error processing bulk tags: {str(e)}")
+        return error_response(500, "INTERNAL_ERROR", "Internal server error")
+
+def apply_operations(operations):
+    """
+    Valida las operaciones, resuelve con BatchGetItem el tag_id de las que no lo traen
+    y aplica cada una de forma atómica en transacciones de hasta 100 items en paralelo.
+    """
+    results = [None] * len(operations)
+    
+    # 1. Validaciones sin I/O
+    candidates = []
+    for index, operation in enumerate(operations):
+        prepared, error = prepare_operation(operation)
+        if error:
+            results[index] = rejected_operation(index, operation, *error)
+        else:
+            candidates.append((index, prepared))
+    
+    # 2. tag_id actual de los usuarios para actualizar/desactivar sin tag_id
+    missing = {op['placa'] for _, op in candidates if op['operacion'] != 'asociar' and not op.get('tag_id')}
+    users, unread = bulk.batch_get(dynamodb, users_table, 'placa', missing, 'placa, tag_id', BULK_WORKERS) \
+        if missing else ({}, set())
+    
+    # 3. Cada placa y cada tag una sola vez por request (una transacción no puede tocar dos veces el mismo item)
+    seen = set()
+    groups, owners = [], []
+    for index, op in candidates:
+        if op['operacion'] != 'asociar' and not op.get('tag_id'):
+            if op['placa'] in unread:
+                results[index] = rejected_operation(index, op, "THROTTLED", "User lookup throttled, retry the operation")
+                continue
+            user = users.get(op['placa'])
+            if not user:
+                results[index] = rejected_operation(index, op, "USER_NOT_FOUND", "Usuario no encontrado")
+                continue
+            if not user.get('tag_id'):
+                results[index] = rejected_operation(index, op, "NO_TAG_ASSOCIATED", "El usuario no tiene tag asociado")
+                continue
+            op['tag_id'] = user['tag_id']
+        
+        keys = {('placa', op['placa']), ('tag_id', op['tag_id'])}
+        if keys & seen:
+            results[index] = rejected_operation(index, op, "DUPLICATE_OPERATION",
+                                                "Placa or tag_id already used by another operation in this request")
+            continue
+        seen |= keys
+        
+        if op['operacion'] == 'asociar':
+            group = associate_items(new_tag_item(op['tag_id'], op['placa'], op.get('metodo_pago'),
+                                                 op.get('configuracion', {})))
+        elif op['operacion'] == 'actualizar':
+            group = [{'Update': {'TableName': tags_table.name, 'Key': {'tag_id': op['tag_id']}, **op['update']}}]
+        else:
+            group = deactivate_items(op['placa'], op['tag_id'], op.get('razon', 'Sin razón especificada'))
+        groups.append(group)
+        owners.append((index, op))
+    
+    # 4. Escrituras
+    outcomes = bulk.write_groups(dynamodb.meta.client, groups, BULK_WORKERS)
+    for (index, op), outcome in zip(owners, outcomes):
+        if outcome is None:
+            results[index] = {
+                'indice': index,
+                'estado': 'aplicada',
+                'operacion': op['operacion'],
+                'placa': op['placa'],
+                'tag_id': op['tag_id']
+            }
+        elif outcome[1] == 'ConditionalCheckFailed':
+            results[index] = rejected_operation(index, op, *CONDITION_ERRORS[op['operacion']][outcome[0]])
+        else:
+            results[index] = rejected_operation(index, op, "WRITE_ERROR", f"Transaction failed: {outcome[1]}")
+    
+    applied = [op for (_, op), outcome in zip(owners, outcomes) if outcome is None]
+    record_changes([op['tag_id'] for op in applied],
+                   [op['placa'] for op in applied if op['operacion'] != 'actualizar'])
+    return results
+
+def prepare_operation(operation):
+    """Normaliza una operación del lote; devuelve (operación, None) o (None, (código, mensaje))"""
+    if not isinstance(operation, dict):
+        return None, ("VALIDATION_ERROR", "Operation must be a JSON object")
+    
+    kind = operation.get('operacion')
+    if kind not in BULK_OPERATIONS:
+        return None, ("VALIDATION_ERROR", f"Field 'operacion' must be one of: {', '.join(BULK_OPERATIONS)}")
+    
+    placa = str(operation.get('placa') or '').upper()
+    if not is_valid_placa(placa):
+        return None, ("INVALID_PLACA", "Invalid placa format")
+    
+    prepared = {**operation, 'operacion': kind, 'placa': placa}
+    if kind == 'asociar' and not operation.get('tag_id'):
+        return None, ("MISSING_TAG_ID", "tag_id is required")
+    if kind == 'actualizar':
+        prepared['update'] = update_fields(placa, operation.get('configuracion'), operation.get('metodo_pago'))
+        if not prepared['update']:
+            return None, ("NO_UPDATES", "No se proporcionaron campos para actualizar")
+    return prepared, None
+
+def rejected_operation(index, operation, code, message):
+    return {
+        'indice': index,
+        'estado': 'rechazada',
+        'operacion': operation.get('operacion') if isinstance(operation, dict) else None,
+        'error': {
+            'code': code,
+            'message': message
+        }
+    }
+
+def new_tag_item(tag_id, placa, metodo_pago, configuracion):
+    return {
+        'tag_id': tag_id,
+        'placa': placa,
+        'estado': 'activo',
+        'fecha_activacion': datetime.now(timezone.utc).isoformat(),
+        'metodo_pago': metodo_pago,
+        'configuracion': configuracion
+    }
+
+def associate_items(tag_item):
+    """Items de TransactWriteItems para asociar: [tag libre, usuario existente]"""
+    return [
+        {'Put': {
+            'TableName': tags_table.name,
+            'Item': tag_item,
+            'ConditionExpression': 'attribute_not_exists(tag_id)'
+        }},
+        {'Update': {
+            'TableName': users_table.name,
+            'Key': {'placa': tag_item['placa']},
+            'UpdateExpression': 'SET tiene_tag = :has_tag, tag_id = :tag_id',
+            'ConditionExpression': 'attribute_exists(placa)',
+            'ExpressionAttributeValues': {':has_tag': True, ':tag_id': tag_item['tag_id']}
+        }}
+    ]
+
+def update_fields(placa, configuracion, metodo_pago):
+    """Expresión de update del tag (solo si sigue activo y asociado a la placa); None si no hay campos"""
+    update_expr = []
+    expr_values = {':placa': placa, ':activo': 'activo'}
+    
+    if configuracion:
+        update_expr.append('configuracion = :config')
+        expr_values[':config'] = configuracion
+    
+    if metodo_pago:
+        update_expr.append('metodo_pago = :mp')
+        expr_values[':mp'] = metodo_pago
+    
+    if not update_expr:
+        return None
+    return {
+        'UpdateExpression': 'SET ' + ', '.join(update_expr),
+        'ConditionExpression': 'placa = :placa AND estado = :activo',
+        'ExpressionAttributeValues': expr_values
+    }
+
+def deactivate_items(placa, tag_id, razon):
+    """Items de TransactWriteItems para desasociar: [tag de la placa, usuario con ese tag]"""
+    return [
+        {'Update': {
+            'TableName': tags_table.name,
+            'Key': {'tag_id': tag_id},
+            'UpdateExpression': 'SET estado = :estado, fecha_desactivacion = :fecha, razon_desactivacion = :razon REMOVE placa',
+            'ConditionExpression': 'placa = :placa',
+            'ExpressionAttributeValues': {
+                ':estado': 'inactivo',
+                ':fecha': datetime.now(timezone.utc).isoformat(),
+                ':razon': razon,
+                ':placa': placa
+            }
+        }},
+        {'Update': {
+            'TableName': users_table.name,
+            'Key': {'placa': placa},
+            'UpdateExpression': 'REMOVE tag_id SET tiene_tag = :has_tag',
+            'ConditionExpression': 'tag_id = :tag_id',
+            'ExpressionAttributeValues': {':has_tag': False, ':tag_id': tag_id}
+        }}
+    ]
+
+def record_changes(tag_ids, placas):
+    """
+    Anota los tags y placas recién escritos (registry_changes). Si falla, el webhook
+    puede usar la entrada vieja del snapshot hasta la siguiente reconstrucción.
+    """
+    if counters_table is None or not (tag_ids or placas):
+        return
+    try:
+        registry_changes.registrar_cambios(counters_table, tag_ids, placas)
+    except Exception as e:
+        print(f"Error recording registry changes: {str(e)}")
+
+def transact_write(items):
+    """TransactWriteItems; devuelve None si se aplicó o el código de cancelación de cada item"""
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=items)
+        return None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        return [reason.get('Code', 'None') for reason in e.response.get('CancellationReasons', [])]
+
 def is_valid_placa(placa):
     import re
     pattern = r'^[A-Z0-9]{1,3}-[A-Z0-9]{3,6}$'
@@ -0,0 +1,136 @@
+"""
+Escrituras transaccionales en lote para POST /tags/bulk.
+
+Cada operación del request es un grupo de items de TransactWriteItems (asociar
+y desactivar tocan tag y usuario; actualizar solo el tag). Los grupos se empacan
+en transacciones de hasta 100 items sin partir ningún grupo, y las transacciones
+corren en paralelo.
+
+Una transacción se cancela completa si falla una condición. CancellationReasons
+dice qué item falló: ese grupo se marca rechazado y el resto de la transacción
+se reintenta sin él. Conflictos con otras transacciones y throttling se
+reintentan con backoff exponencial y jitter.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from botocore.exceptions import ClientError
+
+# Límites de DynamoDB por llamada
+TRANSACT_MAX_ITEMS = 100
+BATCH_GET_MAX_KEYS = 100
+
+# Intentos por transacción (o por bloque de BatchGetItem) ante conflictos o throttling
+MAX_ATTEMPTS = 5
+
+# Cancelaciones y errores que no dependen de los datos: se reintentan
+RETRYABLE_REASONS = {'TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded', 'RequestLimitExceeded'}
+RETRYABLE_ERRORS = {'ThrottlingException', 'ProvisionedThroughputExceededException', 'RequestLimitExceeded',
+                    'TransactionInProgressException', 'InternalServerError'}
+
+def pack_groups(groups: List[List[Dict]]) -> List[List[int]]:
+    """Índices de grupos por transacción, en orden, sin pasar de TRANSACT_MAX_ITEMS items"""
+    chunks, current, size = [], [], 0
+    for index, group in enumerate(groups):
+        if current and size + len(group) > TRANSACT_MAX_ITEMS:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(index)
+        size += len(group)
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _backoff(attempt: int):
+    time.sleep(random.uniform(0, min(0.05 * (2 ** attempt), 1.0)))
+
+def _write_chunk(client, groups: List[List[Dict]], chunk: List[int],
+                 outcomes: List[Optional[Tuple[int, str]]]):
+    pending = list(chunk)
+    attempt = 0
+    while pending:
+        try:
+            client.transact_write_items(TransactItems=[item for index in pending for item in groups[index]])
+            for index in pending:
+                outcomes[index] = None
+            return
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code == 'TransactionCanceledException':
+                reasons = [reason.get('Code', 'None') for reason in e.response.get('CancellationReasons', [])]
+                position, remaining = 0, []
+                for index in pending:
+                    group_reasons = reasons[position:position + len(groups[index])]
+                    position += len(groups[index])
+                    if 'ConditionalCheckFailed' in group_reasons:
+                        outcomes[index] = (group_reasons.index('ConditionalCheckFailed'), 'ConditionalCheckFailed')
+                    else:
+                        remaining.append(index)
+                if len(remaining) < len(pending):
+                    # Sin los grupos rechazados la transacción puede pasar: reintento inmediato
+                    pending = remaining
+                    continue
+                code = next((reason for reason in reasons if reason in RETRYABLE_REASONS), code)
+                retryable = code in RETRYABLE_REASONS
+            else:
+                retryable = code in RETRYABLE_ERRORS
+
+            attempt += 1
+            if not retryable or attempt >= MAX_ATTEMPTS:
+                print(f"Error writing bulk chunk ({len(pending)} operations): {code}")
+                for index in pending:
+                    outcomes[index] = (-1, code)
+                return
+            _backoff(attempt)
+
+def write_groups(client, groups: List[List[Dict]], workers: int = 8) -> List[Optional[Tuple[int, str]]]:
+    """
+    Aplica cada grupo de forma atómica. Devuelve, por grupo, None si se aplicó o
+    (posición del item que falló, código); la posición es -1 si falló la transacción completa.
+    """
+    outcomes = [None] * len(groups)
+    chunks = pack_groups(groups)
+    if not chunks:
+        return outcomes
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as executor:
+        list(executor.map(lambda chunk: _write_chunk(client, groups, chunk, outcomes), chunks))
+    return outcomes
+
+def batch_get(dynamodb, table, key_name: str, values, projection: Optional[str] = None,
+              workers: int = 8) -> Tuple[Dict[str, Optional[Dict]], Set[str]]:
+    """
+    Items por llave con BatchGetItem en bloques de 100 paralelos; None si no existe.
+    Devuelve también las llaves que siguen sin procesar tras MAX_ATTEMPTS rondas con
+    throttling: no aparecen en el dict (no se sabe si existen).
+    """
+    values = sorted(set(values))
+    found = {value: None for value in values}
+    unprocessed = set()
+
+    def fetch(keys):
+        request_items = {table.name: {'Keys': [{key_name: value} for value in keys]}}
+        if projection:
+            request_items[table.name]['ProjectionExpression'] = projection
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt:
+                _backoff(attempt)
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(table.name, []):
+                found[item[key_name]] = item
+            # Reintentar llaves no procesadas con backoff exponencial
+            request_items = response.get('UnprocessedKeys') or {}
+            if not request_items:
+                return
+        for key in request_items[table.name]['Keys']:
+            found.pop(key[key_name], None)
+            unprocessed.add(key[key_name])
+
+    blocks = [values[start:start + BATCH_GET_MAX_KEYS] for start in range(0, len(values), BATCH_GET_MAX_KEYS)]
+    if blocks:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(blocks)))) as executor:
+            list(executor.map(fetch, blocks))
+    if unprocessed:
+        print(f"Unprocessed keys after {MAX_ATTEMPTS} attempts: {len(unprocessed)}")
+    return found, unprocessed
@@ -0,0 +1,116 @@
+"""
+Control de admisión del webhook según el atraso de ProcessingQueue.
+
+Cada refresh_seconds lee ApproximateNumberOfMessages de la cola (y, si hay
+umbral de edad, ApproximateAgeOfOldestMessage de CloudWatch). Con la cola por
+encima de un umbral el webhook entra en modo degradado: sigue aceptando cruces
+pero solo con validaciones sin I/O, y deja la lectura de tag y usuario al
+processor (mensaje con enriquecer = true). Sale cuando la cola baja de la mitad
+de los umbrales, para no alternar en cada lectura.
+
+Si la señal no se puede leer se conserva el último modo.
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import aws_clients
+
+# Fracción de los umbrales bajo la cual se vuelve al modo normal
+SALIDA = 0.5
+# ApproximateAgeOfOldestMessage se publica por minuto: no se consulta más seguido
+EDAD_REFRESH_SECONDS = 60
+
+class QueueDepthMonitor:
+    def __init__(self, queue_url: str, max_messages: int, max_age_seconds: int = 0, refresh_seconds: int = 15,
+                 metricas=None, sqs=None, cloudwatch=None, reloj=time.monotonic):
+        self.queue_url = queue_url
+        self.queue_name = queue_url.rsplit('/', 1)[-1]
+        self.max_messages = max_messages
+        self.max_age_seconds = max_age_seconds
+        self.refresh_seconds = refresh_seconds
+        self.metricas = metricas
+        self.sqs = sqs or aws_clients.client('sqs')
+        self.cloudwatch = cloudwatch or (aws_clients.client('cloudwatch') if max_age_seconds else None)
+        self.reloj = reloj
+        self.degraded = False
+        self.depth = None
+        self.age_seconds = None
+        self._checked_at = None
+        self._age_checked_at = None
+
+    def is_degraded(self) -> bool:
+        now = self.reloj()
+        if self._checked_at is None or now - self._checked_at >= self.refresh_seconds:
+            self._checked_at = now
+            try:
+                self._refresh(now)
+            except Exception as e:
+                print(f"Error reading queue depth: {str(e)}")
+        return self.degraded
+
+    def _refresh(self, now: float):
+        attributes = self.sqs.get_queue_attributes(QueueUrl=self.queue_url,
+                                                   AttributeNames=['ApproximateNumberOfMessages'])
+        self.depth = int(attributes['Attributes']['ApproximateNumberOfMessages'])
+        if self.cloudwatch and (self._age_checked_at is None or now - self._age_checked_at >= EDAD_REFRESH_SECONDS):
+            self._age_checked_at = now
+            self.age_seconds = self._oldest_message_age()
+
+        if self.metricas:
+            self.metricas.registrar('ProfundidadCola', self.depth, 'Count')
+            if self.age_seconds is not None:
+                self.metricas.registrar('EdadMensajeMasAntiguo', self.age_seconds, 'Seconds')
+
+        age = self.age_seconds or 0
+        if not self.degraded and (self.depth >= self.max_messages or
+                                  (self.max_age_seconds and age >= self.max_age_seconds)):
+            self._transition(True)
+        elif self.degraded and self.depth < self.max_messages * SALIDA and \
+                (not self.max_age_seconds or age < self.max_age_seconds * SALIDA):
+            self._transition(False)
+        if self.metricas:
+            # 1 en modo degradado: el máximo por minuto muestra si algún contenedor degradó
+            self.metricas.registrar('ModoDegradado', int(self.degraded), 'None')
+
+    def _oldest_message_age(self) -> Optional[float]:
+        fin = datetime.now(timezone.utc)
+        response = self.cloudwatch.get_metric_data(
+            MetricDataQueries=[{
+                'Id': 'edad',
+                'MetricStat': {
+                    'Metric': {'Namespace': 'AWS/SQS', 'MetricName': 'ApproximateAgeOfOldestMessage',
+                               'Dimensions': [{'Name': 'QueueName', 'Value': self.queue_name}]},
+                    'Period': 60,
+                    'Stat': 'Maximum'
+                }
+            }],
+            StartTime=fin - timedelta(minutes=5),
+            EndTime=fin,
+            ScanBy='TimestampDescending'
+        )
+        valores = response['MetricDataResults'][0]['Values']
+        return float(valores[0]) if valores else self.age_seconds
+
+    def _transition(self, degraded: bool):
+        self.degraded = degraded
+        edad = f", mensaje más antiguo {self.age_seconds:.0f}s" if self.age_seconds is not None else ''
+        if degraded:
+            print(f"🔴 Modo degradado: {self.depth} mensajes en {self.queue_name}{edad}")
+        else:
+            print(f"🟢 Modo normal: {self.depth} mensajes en {self.queue_name}{edad}")
+        if self.metricas:
+            self.metricas.contar('EntradasModoDegradado' if degraded else 'SalidasModoDegradado')
+
+def admission_from_env(queue_url: str, metricas=None) -> Optional[QueueDepthMonitor]:
+    """None si ADMISSION_MAX_MESSAGES no está definido: siempre modo normal"""
+    if not os.environ.get('ADMISSION_MAX_MESSAGES'):
+        return None
+    return QueueDepthMonitor(
+        queue_url,
+        max_messages=int(os.environ['ADMISSION_MAX_MESSAGES']),
+        max_age_seconds=int(os.environ.get('ADMISSION_MAX_AGE_SECONDS', '0')),
+        refresh_seconds=int(os.environ.get('ADMISSION_REFRESH_SECONDS', '15')),
+        metricas=metricas
+    )
@@ -1,73 +1,116 @@
 import json
-import boto3
+import aws_clients
+import hashlib
 import os
-from validation import WebhookValidator
+from validation import WebhookValidator, DEFAULT_MAX_AGE_SECONDS
+from snapshot_index import SnapshotLoader
+from bloom_filter import bloom_loader_from_env
+from admission import admission_from_env
+from dedup import suppressor_from_env
+from metricas import Metricas
+from registry_changes import registry_changes_from_env
 
 # Clients de AWS
-sqs = boto3.client('sqs')
-dynamodb = boto3.resource('dynamodb')
-
-# Tablas DynamoDB
-users_table = dynamodb.Table(os.environ['USERS_TABLE'])
-tags_table = dynamodb.Table(os.environ['TAGS_TABLE'])
+sqs = aws_clients.client('sqs')
 
 # Cola SQS
 processing_queue_url = os.environ['PROCESSING_QUEUE_URL']
 
-validator = WebhookValidator()
+# Límites del endpoint batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '500'))
+SQS_BATCH_MAX_MESSAGES = 10  # Límite de SendMessageBatch
+
+# Cola FIFO: un grupo por placa para serializar los cobros de cada cuenta
+FIFO_QUEUE = processing_queue_url.endswith('.fifo')
+# Grupo de los cruces diferidos solo con tag cuya placa no está en el snapshot;
+# el processor los vuelve a encolar en el grupo de su placa (deferred_enrichment)
+GRUPO_SIN_PLACA = 'diferidos-sin-placa'
+
+# Snapshot de tags/placas mapeado en memoria (opcional)
+snapshot_loader = None
+if os.environ.get('SNAPSHOT_BUCKET'):
+    snapshot_loader = SnapshotLoader(
+        os.environ['SNAPSHOT_BUCKET'],
+        os.environ.get('SNAPSHOT_KEY', 'snapshots/index.bin'),
+        refresh_seconds=int(os.environ.get('SNAPSHOT_REFRESH_SECONDS', '60')),
+        max_age_seconds=int(os.environ.get('SNAPSHOT_MAX_AGE_SECONDS', '900'))
+    )
+
+# Filtro de Bloom de placas registradas, cargado al iniciar el contenedor
+plate_filter_loader = bloom_loader_from_env()
+
+# Tags y placas escritos después del snapshot (opcional, COUNTERS_TABLE)
+registry_changes = registry_changes_from_env(aws_clients.resource('dynamodb'))
+
+validator = WebhookValidator(snapshot_loader, plate_filter_loader, registry_changes)
+
+metricas = Metricas({'Servicio': 'webhook'})
+
+# Modo degradado según el atraso de la cola (opcional, ADMISSION_MAX_MESSAGES)
+admission = admission_from_env(processing_queue_url, metricas)
+
+# Lecturas repetidas del mismo vehículo en la misma plaza (opcional, DEDUP_WINDOW_SECONDS)
+suppressor = suppressor_from_env(metricas)
+
+def is_degraded():
+    return admission is not None and admission.is_degraded()
 
 def lambda_handler(event, context):
     """
     Lambda function para validar webhook de peajes - ACTUALIZADO CON TAGS
     """
+    try:
+        if event.get('resource') == '/webhook/toll/batch' or event.get('path', '').endswith('/webhook/toll/batch'):
+            return batch_handler(event)
+        return single_handler(event)
+    finally:
+        publish_metrics()
+
+def publish_metrics():
+    metricas.publicar()
+    if suppressor is not None:
+        suppressor.publicar()
+
+def single_handler(event):
+    """POST /webhook/toll - un cruce"""
     print(f"Received event: {json.dumps(event)}")
     
     try:
+        is_valid, message = validator.validate_structure(event)
+        if not is_valid:
+            return error_response(400, "VALIDATION_ERROR", message)
+        
+        is_valid, message, data = validator.validate_json_body(event['body'])
+        if not is_valid:
+            return error_response(400, "VALIDATION_ERROR", message)
+        
+        if is_degraded():
+            return degraded_single(data)
+        
+        # Tag y usuario en un solo BatchGetItem; validación y mensaje reutilizan esas lecturas
+        prefetched = prefetch_single(data)
+        
         # Validar request completo (incluye validación de tag)
-        is_valid, message, transaction_data = validator.validate_complete(event)
+        is_valid, message, transaction_data = validator.validate_transaction(data, prefetched)
         
         if not is_valid:
             return error_response(400, "VALIDATION_ERROR", message)
         
         # Consultar información del usuario Y del tag
-        user_info = get_user_info(transaction_data['placa'])
-        tag_info = get_tag_info(transaction_data.get('tag_id'))
-        
-        # Determinar tipo de usuario REAL basado en tag válido
-        user_type_final = determine_user_type(user_info, tag_info)
-        has_active_tag = tag_info is not None and tag_info.get('estado') == 'activo'
+        user_info = get_user_info(transaction_data['placa'], prefetched)
+        tag_info = get_tag_info(transaction_data.get('tag_id'), prefetched)
         
         # Preparar mensaje para procesamiento
-        processing_message = {
-            **{k: v for k, v in transaction_data.items() if k != 'tag_info'},
-            'user_type': user_type_final,
-            'user_email': user_info.get('email'),
-            'user_phone': user_info.get('telefono'),
-            'has_tag': has_active_tag,
-            'tag_id': transaction_data.get('tag_id'),
-            'tag_info': tag_info,
-            'metodo_pago': user_info.get('metodo_pago')
-        }
+        processing_message, user_type_final, has_active_tag = build_processing_message(
+            transaction_data, user_info, tag_info
+        )
+        
+        accepted_timestamp = check_duplicate(processing_message)
+        if accepted_timestamp:
+            return duplicate_response(processing_message, accepted_timestamp)
         
         # Enviar a cola de procesamiento
-        response = sqs.send_message(
-            QueueUrl=processing_queue_url,
-            MessageBody=json.dumps(processing_message),
-            MessageAttributes={
-                'UserType': {
-                    'DataType': 'String',
-                    'StringValue': user_type_final
-                },
-                'HasActiveTag': {
-                    'DataType': 'String', 
-                    'StringValue': str(has_active_tag)
-                },
-                'PeajeId': {
-                    'DataType': 'String',
-                    'StringValue': transaction_data['peaje_id']
-                }
-            }
-        )
+        response = send_single(processing_message)
         
         print(f"Message sent to SQS: {response['MessageId']}")
         print(f"User type determined: {user_type_final}, Active tag: {has_active_tag}")
@@ -85,50 +128,357 @@ def lambda_handler(event, context):
         print(f"Error processing webhook: {str(e)}")
         return error_response(500, "INTERNAL_ERROR", "Internal server error")
 
-def get_user_info(placa):
-    """Consulta información del usuario basado en placa"""
+def degraded_single(data):
+    """Acepta el cruce sin lecturas a DynamoDB; el processor resuelve tag y usuario"""
+    is_valid, message, transaction_data = validator.validate_offline(data)
+    if not is_valid:
+        return error_response(400, "VALIDATION_ERROR", message)
+    
+    processing_message = build_deferred_message(transaction_data)
+    accepted_timestamp = check_duplicate(processing_message, degraded=True)
+    if accepted_timestamp:
+        return duplicate_response(processing_message, accepted_timestamp)
+    
+    response = send_single(processing_message)
+    metricas.contar('CrucesDiferidos')
+    print(f"Message sent to SQS (degraded): {response['MessageId']}")
+    
+    return success_response({
+        "status": "processing",
+        "message": "Transaction received and queued for processing",
+        "user_type": processing_message['user_type'],
+        "has_active_tag": None,
+        "degraded": True,
+        "message_id": response['MessageId']
+    })
+
+def send_single(processing_message):
+    """Encola un cruce; si falla, libera su lectura para que el reintento no quede como duplicado"""
     try:
-        response = users_table.get_item(Key={'placa': placa})
-        
-        if 'Item' in response:
-            user_data = response['Item']
-            return {
-                'tipo_usuario': user_data.get('tipo_usuario', 'no_registrado'),
-                'email': user_data.get('email'),
-                'telefono': user_data.get('telefono'),
-                'tiene_tag': user_data.get('tiene_tag', False),
-                'metodo_pago': user_data.get('metodo_pago')
-            }
+        return sqs.send_message(
+            QueueUrl=processing_queue_url,
+            MessageBody=json.dumps(processing_message, default=str),
+            MessageAttributes=build_message_attributes(processing_message),
+            **build_fifo_params(processing_message)
+        )
+    except Exception:
+        release_duplicate_check(processing_message)
+        raise
+
+def placa_de_grupo(processing_message):
+    """Placa del cruce o, en modo degradado solo con tag, la del snapshot; None si no se conoce"""
+    return processing_message.get('placa') or processing_message.get('placa_snapshot')
+
+def suppression_key(processing_message):
+    # Misma llave que en modo normal; solo un tag fuera del snapshot queda por tag_id
+    return (placa_de_grupo(processing_message) or processing_message.get('tag_id'),
+            processing_message['peaje_id'], processing_message['timestamp'])
+
+def check_duplicate(processing_message, degraded=False):
+    """Timestamp del cruce ya aceptado si la lectura es repetida; None si es un cruce nuevo"""
+    if suppressor is None:
+        return None
+    return suppressor.check(*suppression_key(processing_message), use_table=not degraded)
+
+def release_duplicate_check(processing_message):
+    if suppressor is not None:
+        suppressor.release(*suppression_key(processing_message))
+
+def duplicate_response(processing_message, accepted_timestamp):
+    print(f"Duplicate read suppressed: {processing_message.get('placa') or processing_message.get('tag_id')} "
+          f"at {processing_message['peaje_id']} (accepted {accepted_timestamp})")
+    return success_response({
+        "status": "duplicate",
+        "message": "Duplicate read of an already accepted crossing; not queued",
+        "duplicate_of": accepted_timestamp
+    })
+
+def batch_handler(event):
+    """
+    POST /webhook/toll/batch - recibe varios cruces de una plaza en un solo request.
+    Devuelve el resultado (aceptada/rechazada) de cada transacción.
+    """
+    try:
+        is_valid, message = validator.validate_structure(event)
+        if not is_valid:
+            return error_response(400, "VALIDATION_ERROR", message)
+        
+        is_valid, message, data = validator.validate_json_body(event['body'])
+        if not is_valid:
+            return error_response(400, "VALIDATION_ERROR", message)
+        
+        transactions = data.get('transacciones') if isinstance(data, dict) else None
+        if not isinstance(transactions, list) or not transactions:
+            return error_response(400, "VALIDATION_ERROR", "Field 'transacciones' must be a non-empty list")
+        
+        if len(transactions) > MAX_BATCH_SIZE:
+            return error_response(400, "BATCH_TOO_LARGE", f"Maximum {MAX_BATCH_SIZE} transactions per batch")
+        
+        print(f"Received batch with {len(transactions)} transactions")
+        results = process_transactions(transactions)
+        
+        accepted = sum(1 for r in results if r['estado'] == 'aceptada')
+        duplicates = sum(1 for r in results if r['estado'] == 'duplicada')
+        print(f"Batch processed: {accepted} accepted, {duplicates} duplicates, "
+              f"{len(results) - accepted - duplicates} rejected")
+        
+        return success_response({
+            "status": "processing",
+            "total": len(results),
+            "aceptadas": accepted,
+            "duplicadas": duplicates,
+            "rechazadas": len(results) - accepted - duplicates,
+            "resultados": results
+        })
+        
+    except Exception as e:
+        print(f"Error processing batch webhook: {str(e)}")
+        return error_response(500, "INTERNAL_ERROR", "Internal server error")
+
+def process_transactions(transactions, max_age_seconds=DEFAULT_MAX_AGE_SECONDS, sequencer=None):
+    """
+    Valida, enriquece y encola un lote de transacciones.
+    Usa BatchGetItem para tags/usuarios y SendMessageBatch para SQS.
+    En modo degradado no hay lecturas: el processor enriquece cada mensaje.
+    sequencer (replay) numera cada mensaje aceptado por placa o lo rechaza fuera de orden.
+    """
+    results = [None] * len(transactions)
+    degraded = is_degraded()
+    
+    # 1. Validaciones sin I/O para descartar temprano y no consultar llaves inválidas
+    candidates = []
+    for index, data in enumerate(transactions):
+        if not isinstance(data, dict):
+            results[index] = rejected(index, "Transaction must be a JSON object")
+            continue
+        is_valid, message = validator.validate_required_fields(data)
+        if not is_valid:
+            results[index] = rejected(index, message)
+            continue
+        candidates.append((index, data))
+    
+    # 2. Resolver todos los tags y usuarios del lote
+    if candidates and not degraded:
+        prefetched = validator.prefetch(data for _, data in candidates)
+    else:
+        prefetched = {'tags': {}, 'users': {}}
+    
+    # 3. Reglas completas por transacción y construcción de mensajes
+    entries = []
+    messages = {}
+    for index, data in candidates:
+        throttled = validator.unprocessed_lookup(data, prefetched)
+        if throttled:
+            # DynamoDB no devolvió el tag o el usuario: la plaza reintenta solo este cruce
+            results[index] = rejected(index, throttled, "THROTTLED")
+            continue
+        if degraded:
+            is_valid, message, transaction_data = validator.validate_offline(data, max_age_seconds)
+        else:
+            is_valid, message, transaction_data = validator.validate_transaction(data, prefetched, max_age_seconds)
+        if not is_valid:
+            results[index] = rejected(index, message)
+            continue
+        
+        if degraded:
+            processing_message = build_deferred_message(transaction_data)
+            user_type_final, has_active_tag = processing_message['user_type'], None
         else:
-            # Usuario no encontrado - tratar como no registrado
-            return {
-                'tipo_usuario': 'no_registrado',
-                'email': None,
-                'telefono': None, 
-                'tiene_tag': False,
-                'metodo_pago': None
+            user_item = prefetched['users'].get(transaction_data['placa'])
+            tag_info = prefetched['tags'].get(transaction_data.get('tag_id')) if transaction_data.get('tag_id') else None
+            processing_message, user_type_final, has_active_tag = build_processing_message(
+                transaction_data, format_user_info(user_item), tag_info
+            )
+        
+        # Lecturas repetidas dentro del mismo lote también se detectan aquí
+        accepted_timestamp = check_duplicate(processing_message, degraded)
+        if accepted_timestamp:
+            results[index] = {
+                'indice': index,
+                'estado': 'duplicada',
+                'placa': processing_message.get('placa'),
+                'duplicado_de': accepted_timestamp
             }
+            continue
+        
+        if sequencer is not None:
+            out_of_order = sequencer.assign(processing_message)
+            if out_of_order:
+                release_duplicate_check(processing_message)
+                results[index] = rejected(index, out_of_order, "OUT_OF_ORDER")
+                continue
+        
+        messages[str(index)] = processing_message
+        entries.append({
+            'Id': str(index),
+            'MessageBody': json.dumps(processing_message, default=str),
+            'MessageAttributes': build_message_attributes(processing_message),
+            **build_fifo_params(processing_message)
+        })
+        results[index] = {
+            'indice': index,
+            'estado': 'aceptada',
+            'placa': transaction_data['placa'],
+            'user_type': user_type_final,
+            'has_active_tag': has_active_tag
+        }
+        if degraded:
+            results[index]['degraded'] = True
+    
+    # 4. Encolar en lotes de 10
+    for start in range(0, len(entries), SQS_BATCH_MAX_MESSAGES):
+        chunk = entries[start:start + SQS_BATCH_MAX_MESSAGES]
+        try:
+            response = sqs.send_message_batch(QueueUrl=processing_queue_url, Entries=chunk)
+        except Exception as e:
+            print(f"Error sending batch to SQS: {str(e)}")
+            response = {'Failed': [{'Id': entry['Id'], 'Message': str(e)} for entry in chunk]}
+        
+        for success in response.get('Successful', []):
+            results[int(success['Id'])]['message_id'] = success['MessageId']
+        if degraded:
+            metricas.contar('CrucesDiferidos', len(response.get('Successful', [])))
+        # En orden inverso: el sequencer solo devuelve el último número de cada placa
+        for failure in reversed(response.get('Failed', [])):
+            index = int(failure['Id'])
+            release_duplicate_check(messages[failure['Id']])
+            if sequencer is not None:
+                sequencer.release(messages[failure['Id']])
+            results[index] = rejected(index, f"Queue error: {failure.get('Message', 'unknown')}", "QUEUE_ERROR")
+    
+    return results
+
+def rejected(index, message, code="VALIDATION_ERROR"):
+    return {
+        'indice': index,
+        'estado': 'rechazada',
+        'error': {
+            'code': code,
+            'message': message
+        }
+    }
+
+def build_processing_message(transaction_data, user_info, tag_info):
+    """Arma el mensaje para la cola de procesamiento"""
+    # Determinar tipo de usuario REAL basado en tag válido
+    user_type_final = determine_user_type(user_info, tag_info)
+    has_active_tag = tag_info is not None and tag_info.get('estado') == 'activo'
+    
+    processing_message = {
+        **{k: v for k, v in transaction_data.items() if k != 'tag_info'},
+        'user_type': user_type_final,
+        'user_email': user_info.get('email'),
+        'user_phone': user_info.get('telefono'),
+        'has_tag': has_active_tag,
+        'tag_id': transaction_data.get('tag_id'),
+        'tag_info': tag_info,
+        'metodo_pago': user_info.get('metodo_pago')
+    }
+    return processing_message, user_type_final, has_active_tag
+
+def build_deferred_message(transaction_data):
+    """
+    Mensaje del modo degradado: sin datos de usuario ni tag. enriquecer = true
+    indica al processor que lea tag y usuario y aplique las reglas pendientes.
+    Un cruce solo con tag lleva la placa del snapshot (placa_snapshot) para el
+    grupo FIFO y la supresión; el processor vuelve a validar con el tag leído.
+    """
+    placa_snapshot = None
+    if not transaction_data.get('placa'):
+        placa_snapshot = validator.snapshot_placa_of_tag(transaction_data.get('tag_id'))
+    return {
+        **transaction_data,
+        'placa_snapshot': placa_snapshot,
+        'user_type': 'pendiente',
+        'user_email': None,
+        'user_phone': None,
+        'has_tag': False,
+        'tag_id': transaction_data.get('tag_id'),
+        'tag_info': None,
+        'metodo_pago': None,
+        'enriquecer': True
+    }
+
+def build_message_attributes(processing_message):
+    return {
+        'UserType': {
+            'DataType': 'String',
+            'StringValue': processing_message['user_type']
+        },
+        'HasActiveTag': {
+            'DataType': 'String', 
+            'StringValue': str(processing_message['has_tag'])
+        },
+        'PeajeId': {
+            'DataType': 'String',
+            'StringValue': processing_message['peaje_id']
+        }
+    }
+
+def build_fifo_params(processing_message):
+    """
+    Parámetros para cola FIFO: MessageGroupId = placa (orden por cuenta) y un
+    MessageDeduplicationId del cruce, para que reenvíos del mismo evento no se cobren dos veces.
+    """
+    if not FIFO_QUEUE:
+        return {}
+    
+    crossing = '|'.join(str(processing_message.get(field) or '') for field in ('placa', 'peaje_id', 'timestamp', 'tag_id'))
+    return {
+        # Solo con tag y fuera del snapshot: grupo único, el processor lo reagrupa por placa
+        'MessageGroupId': placa_de_grupo(processing_message) or GRUPO_SIN_PLACA,
+        'MessageDeduplicationId': hashlib.sha256(crossing.encode('utf-8')).hexdigest()
+    }
+
+def prefetch_single(data):
+    """
+    Lecturas de un cruce con BatchGetItem: tag y placa del request en una ronda
+    (más la placa del tag si no venía en el request). None si no aplica o si falla;
+    entonces cada validación lee por su cuenta.
+    """
+    if not isinstance(data, dict) or not validator.validate_required_fields(data)[0]:
+        return None
+    try:
+        return validator.prefetch([data])
+    except Exception as e:
+        print(f"Error prefetching user/tag: {str(e)}")
+        return None
+
+def get_user_info(placa, prefetched=None):
+    """Consulta información del usuario basado en placa"""
+    try:
+        return format_user_info(validator.lookup_user(placa, prefetched))
             
     except Exception as e:
         print(f"Error querying user info: {str(e)}")
+        return format_user_info(None)
+
+def format_user_info(user_data):
+    """Normaliza el item de usuario; si no existe se trata como no registrado"""
+    if not user_data:
         return {
             'tipo_usuario': 'no_registrado',
             'email': None,
-            'telefono': None,
+            'telefono': None, 
             'tiene_tag': False,
             'metodo_pago': None
         }
+    
+    return {
+        'tipo_usuario': user_data.get('tipo_usuario', 'no_registrado'),
+        'email': user_data.get('email'),
+        'telefono': user_data.get('telefono'),
+        'tiene_tag': user_data.get('tiene_tag', False),
+        'metodo_pago': user_data.get('metodo_pago')
+    }
 
-def get_tag_info(tag_id):
+def get_tag_info(tag_id, prefetched=None):
     """Consulta información del tag si existe"""
     if not tag_id:
         return None
         
     try:
-        response = tags_table.get_item(Key={'tag_id': tag_id})
-        if 'Item' in response:
-            return response['Item']
-        return None
+        return validator.lookup_tag(tag_id, prefetched)
     except Exception as e:
         print(f"Error querying tag info: {str(e)}")
         return None
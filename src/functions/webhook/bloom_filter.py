@@ -0,0 +1,140 @@
+"""
+Filtro de Bloom de placas registradas.
+
+might_contain() == False es un miss definitivo: la placa no estaba en UsersTable
+cuando se construyó el filtro, así que el webhook la rechaza sin leer DynamoDB,
+salvo que la placa se haya escrito después de version_ms (registry_changes).
+might_contain() == True puede ser un falso positivo y se confirma con DynamoDB.
+"""
+import hashlib
+import math
+import os
+import struct
+import time
+from typing import Iterable, Optional
+
+import aws_clients
+
+MAGIC = b'GPBLOOM1'
+HEADER = struct.Struct('<8sQIIQ')  # magic, bits, hashes, elementos, version_ms
+
+class BloomFilter:
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[bytearray] = None,
+                 count: int = 0, version_ms: int = 0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+        self.version_ms = version_ms
+
+    @classmethod
+    def for_capacity(cls, expected_items: int, false_positive_rate: float = 0.01) -> 'BloomFilter':
+        """Dimensiona el filtro: m = -n ln(p) / ln(2)^2, k = m/n ln(2)"""
+        expected_items = max(expected_items, 1)
+        num_bits = int(math.ceil(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / expected_items * math.log(2))))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, key: str):
+        # Doble hashing (Kirsch-Mitzenmacher) sobre un solo digest de 128 bits
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, keys: Iterable[str]):
+        for key in keys:
+            self.add(key)
+
+    def might_contain(self, key: str) -> bool:
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def expected_false_positive_rate(self) -> float:
+        """(1 - e^(-kn/m))^k para los elementos insertados"""
+        if not self.count:
+            return 0.0
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.version_ms / 1000.0
+
+    def to_bytes(self) -> bytes:
+        return HEADER.pack(MAGIC, self.num_bits, self.num_hashes, self.count, self.version_ms) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        magic, num_bits, num_hashes, count, version_ms = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Invalid bloom filter data")
+        return cls(num_bits, num_hashes, bytearray(data[HEADER.size:]), count, version_ms)
+
+class BloomFilterLoader:
+    """
+    Carga el filtro desde S3 al iniciar el contenedor y lo refresca si cambia.
+    Un filtro más viejo que max_age_seconds no se usa. Las placas registradas
+    después de construirlo las resuelve el validador con registry_changes.
+    """
+
+    def __init__(self, bucket: str, key: str, refresh_seconds: int = 60, max_age_seconds: int = 900, s3=None):
+        self.bucket = bucket
+        self.key = key
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.s3 = s3 or aws_clients.client('s3')
+        self.filter = None
+        self._etag = None
+        self._checked_at = 0.0
+
+    def get(self) -> Optional[BloomFilter]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.refresh_seconds:
+            self._checked_at = now
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"Error refreshing bloom filter: {str(e)}")
+
+        if self.filter and self.filter.age_seconds > self.max_age_seconds:
+            return None
+        return self.filter
+
+    def _refresh(self):
+        head = self.s3.head_object(Bucket=self.bucket, Key=self.key)
+        if head['ETag'] == self._etag:
+            return
+        response = self.s3.get_object(Bucket=self.bucket, Key=self.key)
+        self.filter = BloomFilter.from_bytes(response['Body'].read())
+        self._etag = response['ETag']
+        print(f"Bloom filter loaded: {self.filter.count} placas, {len(self.filter.bits)} bytes, "
+              f"k={self.filter.num_hashes}, fp esperado={self.filter.expected_false_positive_rate():.4%}")
+
+def build_plate_filter(placas: Iterable[str], false_positive_rate: float, headroom: float = 1.2,
+                       version_ms: Optional[int] = None) -> BloomFilter:
+    placas = list(placas)
+    bloom = BloomFilter.for_capacity(int(len(placas) * headroom), false_positive_rate)
+    bloom.update(placas)
+    bloom.version_ms = version_ms or int(time.time() * 1000)
+    return bloom
+
+def bloom_loader_from_env() -> Optional[BloomFilterLoader]:
+    if not os.environ.get('SNAPSHOT_BUCKET'):
+        return None
+    loader = BloomFilterLoader(
+        os.environ['SNAPSHOT_BUCKET'],
+        os.environ.get('BLOOM_KEY', 'snapshots/placas.bloom'),
+        refresh_seconds=int(os.environ.get('SNAPSHOT_REFRESH_SECONDS', '60')),
+        max_age_seconds=int(os.environ.get('BLOOM_MAX_AGE_SECONDS', '900'))
+    )
+    loader.get()  # Cargar al iniciar el contenedor
+    return loader
@@ -0,0 +1,142 @@
+"""
+Supresión de lecturas repetidas del mismo vehículo en la misma plaza.
+
+Cámara y antena reportan el mismo cruce dos o tres veces en pocos segundos con
+timestamps distintos. Una lectura es duplicada si hay un cruce aceptado con la
+misma llave (placa o tag_id, peaje_id) a menos de window_seconds de su timestamp.
+La ventana se mueve con cada cruce aceptado de la llave.
+
+    memoria   OrderedDict llave de 8 bytes -> timestamp aceptado (ms), LRU de max_entries;
+              un duplicado dentro del contenedor se descarta sin I/O
+    tabla     UpdateItem condicional en CountersTable (dedup#<peaje>#<placa o tag>); decide
+              entre contenedores y devuelve el cruce aceptado si la lectura es duplicada
+
+Si la escritura falla por otra causa la lectura se acepta: un cobro doble se
+puede revertir, un cruce perdido no.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+from metricas import Metricas
+
+class CrossingSuppressor:
+    def __init__(self, window_seconds: int = 60, max_entries: int = 100000, table=None, metricas=None,
+                 ttl_seconds: int = 3600):
+        self.window_ms = window_seconds * 1000
+        self.max_entries = max_entries
+        self.table = table
+        self.metricas = metricas
+        self.ttl_seconds = ttl_seconds
+        self.accepted = OrderedDict()
+        # Un Metricas por plaza: LecturasSuprimidas lleva la dimensión Plaza
+        self.plazas = {}
+
+    @staticmethod
+    def _key(identifier: str, peaje_id: str) -> bytes:
+        return hashlib.blake2b(f"{peaje_id}|{identifier}".encode('utf-8'), digest_size=8).digest()
+
+    @staticmethod
+    def _millis(timestamp: str) -> int:
+        return int(datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp() * 1000)
+
+    def _remember(self, key: bytes, accepted_ms: int):
+        self.accepted[key] = accepted_ms
+        self.accepted.move_to_end(key)
+        if len(self.accepted) > self.max_entries:
+            self.accepted.popitem(last=False)
+
+    def _within(self, accepted_ms: Optional[int], read_ms: int) -> bool:
+        return accepted_ms is not None and abs(read_ms - accepted_ms) < self.window_ms
+
+    def _count(self, peaje_id: str):
+        if peaje_id not in self.plazas:
+            self.plazas[peaje_id] = Metricas({'Servicio': 'webhook', 'Plaza': peaje_id})
+        self.plazas[peaje_id].contar('LecturasSuprimidas')
+
+    def _claim(self, identifier: str, peaje_id: str, read_ms: int) -> Optional[int]:
+        """None si esta lectura queda como el cruce aceptado; si no, el timestamp (ms) del aceptado"""
+        try:
+            self.table.update_item(
+                Key={'contador': f"dedup#{peaje_id}#{identifier}"},
+                UpdateExpression='SET aceptado = :leido, expira_en = :expira',
+                ConditionExpression='attribute_not_exists(aceptado) OR aceptado <= :desde OR aceptado >= :hasta',
+                ExpressionAttributeValues={':leido': read_ms, ':desde': read_ms - self.window_ms,
+                                           ':hasta': read_ms + self.window_ms,
+                                           ':expira': int(time.time()) + self.ttl_seconds},
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+            return None
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                # El item viene sin deserializar: {'aceptado': {'N': '...'}}
+                return int(e.response.get('Item', {}).get('aceptado', {}).get('N', read_ms))
+            raise
+
+    def check(self, identifier: str, peaje_id: str, timestamp: str, use_table: bool = True) -> Optional[str]:
+        """
+        None si la lectura es un cruce nuevo; si es duplicada, el timestamp ISO del
+        cruce aceptado. use_table = False (modo degradado) decide solo con la memoria.
+        """
+        key = self._key(identifier, peaje_id)
+        read_ms = self._millis(timestamp)
+        accepted_ms = self.accepted.get(key)
+
+        if not self._within(accepted_ms, read_ms):
+            accepted_ms = None
+            if self.table is not None and use_table:
+                try:
+                    accepted_ms = self._claim(identifier, peaje_id, read_ms)
+                except Exception as e:
+                    print(f"Error checking duplicate read: {str(e)}")
+                    if self.metricas:
+                        self.metricas.contar('ErroresSupresion')
+                if accepted_ms is not None and self.metricas:
+                    self.metricas.contar('SupresionesEnTabla')
+            if accepted_ms is None:
+                self._remember(key, read_ms)
+                return None
+            self._remember(key, accepted_ms)
+
+        self._count(peaje_id)
+        return datetime.fromtimestamp(accepted_ms / 1000, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+    def release(self, identifier: str, peaje_id: str, timestamp: str):
+        """Deshace check() de una lectura aceptada que no se pudo encolar, para que su reintento pase"""
+        key = self._key(identifier, peaje_id)
+        read_ms = self._millis(timestamp)
+        if self.accepted.get(key) == read_ms:
+            del self.accepted[key]
+        if self.table is None:
+            return
+        try:
+            self.table.delete_item(Key={'contador': f"dedup#{peaje_id}#{identifier}"},
+                                   ConditionExpression='aceptado = :leido',
+                                   ExpressionAttributeValues={':leido': read_ms})
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print(f"Error releasing duplicate read: {str(e)}")
+
+    def publicar(self):
+        for metricas in self.plazas.values():
+            metricas.publicar()
+
+def suppressor_from_env(metricas=None) -> Optional[CrossingSuppressor]:
+    """None si DEDUP_WINDOW_SECONDS no está definido o es 0"""
+    window = int(os.environ.get('DEDUP_WINDOW_SECONDS', '0'))
+    if window <= 0:
+        return None
+    table = aws_clients.resource('dynamodb').Table(os.environ['COUNTERS_TABLE']) \
+        if os.environ.get('COUNTERS_TABLE') else None
+    return CrossingSuppressor(
+        window_seconds=window,
+        max_entries=int(os.environ.get('DEDUP_MAX_ENTRIES', '100000')),
+        table=table,
+        metricas=metricas
+    )
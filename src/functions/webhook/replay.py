@@ -0,0 +1,281 @@
+import heapq
+import json
+import os
+import time
+import aws_clients
+from datetime import datetime
+from urllib.parse import unquote_plus
+
+from app import process_transactions, publish_metrics
+
+# Clients de AWS
+s3 = aws_clients.client('s3')
+lambda_client = aws_clients.client('lambda')
+
+# Ventana de llegada tardía para replay (por defecto 7 días)
+REPLAY_MAX_AGE_SECONDS = int(os.environ.get('REPLAY_MAX_AGE_SECONDS', str(7 * 86400)))
+# Transacciones por lote enviado a process_transactions (BatchGetItem + SendMessageBatch)
+REPLAY_CHUNK_SIZE = int(os.environ.get('REPLAY_CHUNK_SIZE', '100'))
+# Líneas retenidas para ordenar por timestamp antes de encolar; una línea más
+# desordenada que esto llega después de un cruce posterior de su placa y se rechaza
+REPLAY_REORDER_WINDOW = int(os.environ.get('REPLAY_REORDER_WINDOW', '5000'))
+# Control de tasa hacia la cola de procesamiento
+REPLAY_MAX_MESSAGES_PER_SECOND = float(os.environ.get('REPLAY_MAX_MESSAGES_PER_SECOND', '200'))
+# Margen para dejar checkpoint antes del timeout de Lambda
+REPLAY_TIME_MARGIN_MS = 30000
+# Máximo de rechazos detallados en el reporte
+REPORT_MAX_REJECTIONS = 1000
+
+BACKLOG_PREFIX = 'backlog/'
+REPORTS_PREFIX = 'reportes/'
+CHECKPOINTS_PREFIX = 'checkpoints/'
+
+class RateLimiter:
+    """Token bucket sencillo para limitar mensajes por segundo"""
+
+    def __init__(self, rate_per_second, capacity=None):
+        self.rate = rate_per_second
+        self.capacity = capacity or rate_per_second
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def acquire(self, tokens):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= tokens or self.tokens >= self.capacity:
+                self.tokens -= tokens
+                return
+            time.sleep((tokens - self.tokens) / self.rate)
+
+class PlateCursor:
+    """
+    Último cruce encolado de cada placa en el archivo: {placa: [timestamp, replay_seq]}.
+    Numera los mensajes de la placa en orden (el processor aplica cada uno después
+    del anterior, processor/replay_order.py) y rechaza un cruce más viejo que el
+    último ya encolado. Viaja en el checkpoint entre invocaciones de continuación.
+    """
+
+    def __init__(self, archivo, state=None):
+        self.archivo = archivo
+        self.state = state or {}
+        # Estados anteriores por placa dentro del lote en curso, para release()
+        self.previous = {}
+
+    def assign(self, message):
+        """Numera el mensaje; devuelve el motivo de rechazo si llegó fuera de orden"""
+        plate_key = message.get('placa') or message.get('tag_id')
+        timestamp = str(message.get('timestamp') or '')
+        last = self.state.get(plate_key)
+        if last and timestamp < last[0]:
+            return f"Out of order: {plate_key} already has a later crossing queued ({last[0]})"
+        self.previous.setdefault(plate_key, []).append(last)
+        seq = (last[1] if last else 0) + 1
+        self.state[plate_key] = [timestamp, seq]
+        message.update({'replay_archivo': self.archivo, 'replay_clave': plate_key, 'replay_seq': seq})
+        return None
+
+    def release(self, message):
+        """Deshace assign() de un mensaje que no se pudo encolar (el último numerado de su placa)"""
+        plate_key = message.get('replay_clave')
+        if self.state.get(plate_key, [None, None])[1] != message.get('replay_seq') or not self.previous.get(plate_key):
+            return
+        previous = self.previous[plate_key].pop()
+        if previous:
+            self.state[plate_key] = previous
+        else:
+            del self.state[plate_key]
+
+    def commit(self):
+        self.previous = {}
+
+def lambda_handler(event, context):
+    """
+    Replay de backlog: procesa archivos NDJSON subidos a s3://<ReplayBucket>/backlog/<peaje_id>/...
+    Solo principals IAM con permiso de escritura en el prefijo de su plaza pueden subir archivos.
+    Tambien acepta invocaciones de continuación {'bucket', 'key', 'offset', 'line', 'checkpoint'}.
+    """
+    if 'Records' in event:
+        jobs = [
+            {
+                'bucket': record['s3']['bucket']['name'],
+                'key': unquote_plus(record['s3']['object']['key']),
+                'offset': 0,
+                'line': 0
+            }
+            for record in event['Records']
+        ]
+    else:
+        jobs = [event]
+
+    try:
+        for job in jobs:
+            replay_object(job, context)
+    finally:
+        publish_metrics()
+
+    return {'statusCode': 200, 'body': json.dumps({'archivos': len(jobs)})}
+
+def replay_object(job, context):
+    bucket, key = job['bucket'], job['key']
+    peaje_id = plaza_from_key(key)
+    if not peaje_id:
+        print(f"❌ Key invalida para replay (se espera {BACKLOG_PREFIX}<peaje_id>/archivo.ndjson): {key}")
+        return
+
+    print(f"🔁 Replay de {key} desde byte {job.get('offset', 0)} (plaza {peaje_id})")
+
+    stats = {
+        'archivo': key,
+        'peaje_id': peaje_id,
+        'lineas': job.get('line', 0),
+        'aceptadas': 0,
+        'duplicadas': 0,
+        'rechazadas': 0,
+        'fuera_de_orden': 0,
+        'rechazos': []
+    }
+    limiter = RateLimiter(REPLAY_MAX_MESSAGES_PER_SECOND)
+    cursor = PlateCursor(key, load_checkpoint(bucket, job.get('checkpoint')))
+    # Montículo (timestamp, línea, cruce): se encola primero lo más viejo de la ventana
+    pending = []
+
+    kwargs = {'Bucket': bucket, 'Key': key}
+    if job.get('offset'):
+        kwargs['Range'] = f"bytes={job['offset']}-"
+    response = s3.get_object(**kwargs)
+    body = response['Body']
+
+    offset = job.get('offset', 0)
+    end = offset + response['ContentLength']
+    for raw_line, size in iter_lines(body):
+        offset += size
+        stats['lineas'] += 1
+        read_line(raw_line, stats['lineas'], peaje_id, pending, stats)
+
+        if len(pending) >= REPLAY_REORDER_WINDOW + REPLAY_CHUNK_SIZE:
+            flush_chunk([heapq.heappop(pending) for _ in range(REPLAY_CHUNK_SIZE)], stats, limiter, cursor)
+
+        # Checkpoint: antes de leer la siguiente línea, con tiempo para encolar lo retenido
+        if offset < end and out_of_time(context, len(pending)):
+            body.close()
+            flush_all(pending, stats, limiter, cursor)
+            checkpoint = save_checkpoint(bucket, key, cursor)
+            continue_later(context, bucket, key, offset, stats['lineas'], checkpoint)
+            write_report(bucket, key, stats, parcial=True)
+            return
+
+    flush_all(pending, stats, limiter, cursor)
+
+    write_report(bucket, key, stats, parcial=False)
+    print(f"✅ Replay completado {key}: {stats['aceptadas']} aceptadas, {stats['duplicadas']} duplicadas, "
+          f"{stats['rechazadas']} rechazadas, {stats['fuera_de_orden']} fuera de orden")
+
+def read_line(raw_line, line_number, peaje_id, pending, stats):
+    """Valida la línea y la retiene en la ventana de orden; los rechazos van al reporte"""
+    if not raw_line.strip():
+        return
+    try:
+        data = json.loads(raw_line)
+    except ValueError as e:
+        add_rejection(stats, line_number, f"Invalid JSON: {str(e)}")
+        return
+
+    if not isinstance(data, dict) or data.get('peaje_id') != peaje_id:
+        add_rejection(stats, line_number, f"Transaction does not belong to plaza {peaje_id}")
+        return
+
+    heapq.heappush(pending, (str(data.get('timestamp') or ''), line_number, data))
+
+def out_of_time(context, retained):
+    """Queda menos que el margen más lo que tarda encolar la ventana retenida a la tasa límite"""
+    if not context:
+        return False
+    flush_ms = retained / REPLAY_MAX_MESSAGES_PER_SECOND * 1000
+    return context.get_remaining_time_in_millis() < REPLAY_TIME_MARGIN_MS + flush_ms
+
+def flush_all(pending, stats, limiter, cursor):
+    """Encola todo lo retenido en la ventana, en orden de timestamp"""
+    while pending:
+        flush_chunk([heapq.heappop(pending) for _ in range(min(REPLAY_CHUNK_SIZE, len(pending)))],
+                    stats, limiter, cursor)
+
+def flush_chunk(chunk, stats, limiter, cursor):
+    """Encola un lote ya ordenado por timestamp; cursor numera cada cruce aceptado de su placa"""
+    transactions = [{**data, 'origen': 'replay'} for _, _, data in chunk]
+
+    limiter.acquire(len(transactions))
+    results = process_transactions(transactions, max_age_seconds=REPLAY_MAX_AGE_SECONDS, sequencer=cursor)
+    cursor.commit()
+
+    for (_, line_number, _), result in zip(chunk, results):
+        if result['estado'] == 'aceptada':
+            stats['aceptadas'] += 1
+        elif result['estado'] == 'duplicada':
+            stats['duplicadas'] += 1
+        else:
+            if result['error']['code'] == 'OUT_OF_ORDER':
+                stats['fuera_de_orden'] += 1
+            add_rejection(stats, line_number, result['error']['message'])
+
+def iter_lines(body, chunk_size=65536):
+    """Itera el StreamingBody por líneas sin cargar el archivo; devuelve (linea, bytes consumidos)"""
+    pending = b''
+    for data in body.iter_chunks(chunk_size):
+        pending += data
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line, len(line) + 1
+    if pending:
+        yield pending, len(pending)
+
+def add_rejection(stats, line_number, message):
+    stats['rechazadas'] += 1
+    if len(stats['rechazos']) < REPORT_MAX_REJECTIONS:
+        stats['rechazos'].append({'linea': line_number, 'error': message})
+
+def plaza_from_key(key):
+    """backlog/PEAJE_ZONA10/2025-11-14.ndjson -> PEAJE_ZONA10"""
+    if not key.startswith(BACKLOG_PREFIX):
+        return None
+    parts = key[len(BACKLOG_PREFIX):].split('/')
+    return parts[0] if len(parts) > 1 and parts[0] else None
+
+def checkpoint_key(key):
+    return CHECKPOINTS_PREFIX + key[len(BACKLOG_PREFIX):] + '.json'
+
+def save_checkpoint(bucket, key, cursor):
+    """Guarda el cursor por placa; el payload de la continuación lleva solo su key"""
+    ckey = checkpoint_key(key)
+    s3.put_object(Bucket=bucket, Key=ckey, Body=json.dumps(cursor.state).encode('utf-8'),
+                  ContentType='application/json')
+    return ckey
+
+def load_checkpoint(bucket, ckey):
+    if not ckey:
+        return {}
+    return json.loads(s3.get_object(Bucket=bucket, Key=ckey)['Body'].read())
+
+def continue_later(context, bucket, key, offset, line, checkpoint):
+    print(f"⏸️ Checkpoint de replay {key} en byte {offset} (linea {line})")
+    lambda_client.invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps({'bucket': bucket, 'key': key, 'offset': offset, 'line': line, 'checkpoint': checkpoint})
+    )
+
+def write_report(bucket, key, stats, parcial):
+    report_key = REPORTS_PREFIX + key[len(BACKLOG_PREFIX):] + f".{int(time.time())}.json"
+    s3.put_object(
+        Bucket=bucket,
+        Key=report_key,
+        Body=json.dumps({
+            **stats,
+            'parcial': parcial,
+            'generado': datetime.utcnow().isoformat() + 'Z'
+        }).encode('utf-8'),
+        ContentType='application/json'
+    )
+    print(f"📄 Reporte de replay: s3://{bucket}/{report_key}")
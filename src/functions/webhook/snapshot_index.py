@@ -0,0 +1,342 @@
+"""
+Snapshot compacto de tags y placas para resolver el webhook sin leer DynamoDB.
+
+Formato del archivo (little endian, registros de ancho fijo ordenados por llave):
+
+    header  : magic(8) formato(I) version_ms(Q) n_tags(I) n_placas(I) off_tags(Q) off_placas(Q)
+    tags    : tag_id(16s) placa(12s) estado(B) metodo_pago(B) flags(B)
+    placas  : placa(12s) tipo_usuario(B) metodo_pago(B) flags(B)
+
+El archivo se abre con mmap y se busca con búsqueda binaria, sin deserializar nada.
+Un miss NO significa que la llave no exista (puede ser más nueva que el snapshot):
+el llamador debe consultar DynamoDB en ese caso. Un hit tampoco vale si la llave
+cambió después de version_ms (registry_changes).
+
+version_ms es la hora en que empezó el scan: todo lo escrito antes está en el archivo.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import aws_clients
+import registry_changes
+from bloom_filter import build_plate_filter
+
+MAGIC = b'GPSNAP01'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<8sIQIIQQ')
+TAG_RECORD = struct.Struct('<16s12sBBB')
+PLACA_RECORD = struct.Struct('<12sBBB')
+
+TAG_ID_WIDTH = 16
+PLACA_WIDTH = 12
+
+# Códigos enumerados; 255 = valor desconocido (el registro no se incluye)
+UNKNOWN = 255
+ESTADOS = ['activo', 'inactivo']
+TIPOS_USUARIO = ['registrado', 'no_registrado']
+METODOS_PAGO = [None, 'tarjeta_credito', 'tarjeta_debito']
+
+# Flags de placa
+FLAG_EMAIL = 1
+FLAG_TELEFONO = 2
+FLAG_TIENE_TAG = 4
+
+# Flags de tag
+FLAG_NOTIFICACIONES_DEFINIDO = 1
+FLAG_NOTIFICACIONES = 2
+
+def _encode(values, value):
+    try:
+        return values.index(value)
+    except ValueError:
+        return UNKNOWN
+
+def _pad(value: str, width: int) -> Optional[bytes]:
+    raw = value.encode('utf-8')
+    if len(raw) > width:
+        return None
+    return raw.ljust(width, b'\0')
+
+class SnapshotIndex:
+    """Vista de solo lectura sobre un archivo de snapshot mapeado en memoria"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, fmt, version_ms, n_tags, n_placas, off_tags, off_placas = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"Invalid snapshot file: {path}")
+
+        self.version_ms = version_ms
+        self.n_tags = n_tags
+        self.n_placas = n_placas
+        self._off_tags = off_tags
+        self._off_placas = off_placas
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.version_ms / 1000.0
+
+    def close(self):
+        self._mm.close()
+
+    def _search(self, key: bytes, offset: int, count: int, record: struct.Struct, width: int) -> Optional[int]:
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offset + mid * record.size
+            current = self._mm[start:start + width]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return start
+        return None
+
+    def get_tag(self, tag_id: str) -> Optional[Dict]:
+        key = _pad(tag_id, TAG_ID_WIDTH)
+        if key is None:
+            return None
+        start = self._search(key, self._off_tags, self.n_tags, TAG_RECORD, TAG_ID_WIDTH)
+        if start is None:
+            return None
+
+        _, placa, estado, metodo_pago, flags = TAG_RECORD.unpack_from(self._mm, start)
+        tag = {
+            'tag_id': tag_id,
+            'placa': placa.rstrip(b'\0').decode('utf-8') or None,
+            'estado': ESTADOS[estado],
+            'metodo_pago': METODOS_PAGO[metodo_pago]
+        }
+        if flags & FLAG_NOTIFICACIONES_DEFINIDO:
+            tag['configuracion'] = {'notificaciones': bool(flags & FLAG_NOTIFICACIONES)}
+        return tag
+
+    def get_user(self, placa: str) -> Optional[Dict]:
+        key = _pad(placa, PLACA_WIDTH)
+        if key is None:
+            return None
+        start = self._search(key, self._off_placas, self.n_placas, PLACA_RECORD, PLACA_WIDTH)
+        if start is None:
+            return None
+
+        _, tipo_usuario, metodo_pago, flags = PLACA_RECORD.unpack_from(self._mm, start)
+        return {
+            'placa': placa,
+            'tipo_usuario': TIPOS_USUARIO[tipo_usuario],
+            'metodo_pago': METODOS_PAGO[metodo_pago],
+            'tiene_email': bool(flags & FLAG_EMAIL),
+            'tiene_telefono': bool(flags & FLAG_TELEFONO),
+            'tiene_tag': bool(flags & FLAG_TIENE_TAG)
+        }
+
+# ==================== CONSTRUCCION ====================
+
+def encode_tag(item: Dict) -> Optional[bytes]:
+    """Registro binario del tag, o None si no cabe en el formato (se resolverá con DynamoDB)"""
+    tag_id = _pad(item.get('tag_id', ''), TAG_ID_WIDTH)
+    placa = _pad(item.get('placa') or '', PLACA_WIDTH)
+    estado = _encode(ESTADOS, item.get('estado'))
+    metodo_pago = _encode(METODOS_PAGO, item.get('metodo_pago'))
+    if tag_id is None or placa is None or UNKNOWN in (estado, metodo_pago):
+        return None
+
+    flags = 0
+    notificaciones = (item.get('configuracion') or {}).get('notificaciones')
+    if notificaciones is not None:
+        flags |= FLAG_NOTIFICACIONES_DEFINIDO
+        if notificaciones:
+            flags |= FLAG_NOTIFICACIONES
+    return TAG_RECORD.pack(tag_id, placa, estado, metodo_pago, flags)
+
+def encode_user(item: Dict) -> Optional[bytes]:
+    placa = _pad(item.get('placa', ''), PLACA_WIDTH)
+    tipo_usuario = _encode(TIPOS_USUARIO, item.get('tipo_usuario', 'no_registrado'))
+    metodo_pago = _encode(METODOS_PAGO, item.get('metodo_pago'))
+    if placa is None or UNKNOWN in (tipo_usuario, metodo_pago):
+        return None
+
+    flags = 0
+    if item.get('email'):
+        flags |= FLAG_EMAIL
+    if item.get('telefono'):
+        flags |= FLAG_TELEFONO
+    if item.get('tiene_tag'):
+        flags |= FLAG_TIENE_TAG
+    return PLACA_RECORD.pack(placa, tipo_usuario, metodo_pago, flags)
+
+def write_snapshot(path: str, tags: Iterable[Dict], users: Iterable[Dict], version_ms: Optional[int] = None) -> Dict:
+    """Escribe el snapshot ordenado; devuelve estadísticas de registros incluidos/omitidos"""
+    tag_records = sorted(r for r in (encode_tag(t) for t in tags) if r)
+    user_records = sorted(r for r in (encode_user(u) for u in users) if r)
+    version_ms = version_ms or int(time.time() * 1000)
+
+    off_tags = HEADER.size
+    off_placas = off_tags + len(tag_records) * TAG_RECORD.size
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, version_ms, len(tag_records), len(user_records), off_tags, off_placas))
+        f.writelines(tag_records)
+        f.writelines(user_records)
+    os.replace(tmp_path, path)
+
+    return {
+        'version_ms': version_ms,
+        'tags': len(tag_records),
+        'placas': len(user_records),
+        'bytes': off_placas + len(user_records) * PLACA_RECORD.size
+    }
+
+def parallel_scan(table, total_segments: int = 4, projection: Optional[str] = None,
+                  consistent: bool = False) -> List[Dict]:
+    """Scan paralelo por segmentos (Segment/TotalSegments)"""
+    def scan_segment(segment):
+        items = []
+        kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+        if consistent:
+            kwargs['ConsistentRead'] = True
+        if projection:
+            kwargs['ProjectionExpression'] = projection
+        while True:
+            response = table.scan(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        results = executor.map(scan_segment, range(total_segments))
+    return [item for segment_items in results for item in segment_items]
+
+def verify_snapshot(index: SnapshotIndex, tags: Iterable[Dict], users: Iterable[Dict]) -> Dict:
+    """Compara el snapshot contra el contenido actual de las tablas"""
+    report = {'tags_ok': 0, 'placas_ok': 0, 'faltantes': [], 'diferentes': [], 'no_representables': 0}
+
+    for item in tags:
+        if encode_tag(item) is None:
+            report['no_representables'] += 1
+            continue
+        snap = index.get_tag(item['tag_id'])
+        if snap is None:
+            report['faltantes'].append(item['tag_id'])
+        elif (snap['placa'], snap['estado'], snap['metodo_pago']) != (item.get('placa'), item.get('estado'), item.get('metodo_pago')):
+            report['diferentes'].append(item['tag_id'])
+        else:
+            report['tags_ok'] += 1
+
+    for item in users:
+        if encode_user(item) is None:
+            report['no_representables'] += 1
+            continue
+        snap = index.get_user(item['placa'])
+        expected = (item.get('tipo_usuario', 'no_registrado'), item.get('metodo_pago'), bool(item.get('email')),
+                    bool(item.get('telefono')), bool(item.get('tiene_tag')))
+        if snap is None:
+            report['faltantes'].append(item['placa'])
+        elif (snap['tipo_usuario'], snap['metodo_pago'], snap['tiene_email'], snap['tiene_telefono'], snap['tiene_tag']) != expected:
+            report['diferentes'].append(item['placa'])
+        else:
+            report['placas_ok'] += 1
+
+    return report
+
+# ==================== CARGA EN EL WEBHOOK ====================
+
+class SnapshotLoader:
+    """
+    Descarga el snapshot de S3 a /tmp y lo mantiene mapeado en memoria.
+    Revisa si hay una versión nueva cada refresh_seconds (un HEAD a S3) y
+    descarta snapshots más viejos que max_age_seconds.
+    """
+
+    def __init__(self, bucket: str, key: str, refresh_seconds: int = 60, max_age_seconds: int = 900, s3=None):
+        self.bucket = bucket
+        self.key = key
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.s3 = s3 or aws_clients.client('s3')
+        self.index = None
+        self._etag = None
+        self._checked_at = 0.0
+
+    def get(self) -> Optional[SnapshotIndex]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.refresh_seconds:
+            self._checked_at = now
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"Error refreshing snapshot: {str(e)}")
+
+        if self.index and self.index.age_seconds > self.max_age_seconds:
+            return None
+        return self.index
+
+    def _refresh(self):
+        head = self.s3.head_object(Bucket=self.bucket, Key=self.key)
+        if head['ETag'] == self._etag:
+            return
+
+        fd, path = tempfile.mkstemp(prefix='snapshot-', suffix='.bin', dir='/tmp')
+        os.close(fd)
+        self.s3.download_file(self.bucket, self.key, path)
+        new_index = SnapshotIndex(path)
+
+        old_index, self.index, self._etag = self.index, new_index, head['ETag']
+        print(f"Snapshot loaded: version {new_index.version_ms}, {new_index.n_tags} tags, {new_index.n_placas} placas")
+        if old_index:
+            old_index.close()
+            os.remove(old_index.path)
+
+def build_handler(event, context):
+    """Lambda programada: reconstruye el snapshot con scan paralelo y lo publica en S3"""
+    dynamodb = aws_clients.resource('dynamodb')
+    s3 = aws_clients.client('s3')
+    segments = int(os.environ.get('SCAN_SEGMENTS', '4'))
+
+    # Lectura consistente desde este instante: los cambios anotados después invalidan la llave
+    version_ms = int(time.time() * 1000)
+    tags = parallel_scan(dynamodb.Table(os.environ['TAGS_TABLE']), segments,
+                         'tag_id, placa, estado, metodo_pago, configuracion', consistent=True)
+    users = parallel_scan(dynamodb.Table(os.environ['USERS_TABLE']), segments,
+                          'placa, tipo_usuario, metodo_pago, email, telefono, tiene_tag', consistent=True)
+
+    path = '/tmp/snapshot-build.bin'
+    stats = write_snapshot(path, tags, users, version_ms=version_ms)
+
+    # Verificar el archivo recién escrito antes de publicarlo
+    index = SnapshotIndex(path)
+    report = verify_snapshot(index, tags, users)
+    index.close()
+    if report['faltantes'] or report['diferentes']:
+        raise RuntimeError(f"Snapshot verification failed: {report}")
+
+    s3.upload_file(path, os.environ['SNAPSHOT_BUCKET'], os.environ['SNAPSHOT_KEY'],
+                   ExtraArgs={'Metadata': {'version-ms': str(stats['version_ms'])}})
+    print(f"Snapshot published: {stats}, no representables: {report['no_representables']}")
+
+    # Filtro de Bloom de placas registradas, con la misma versión del snapshot
+    bloom = build_plate_filter((u['placa'] for u in users), float(os.environ.get('BLOOM_FP_RATE', '0.01')),
+                               version_ms=stats['version_ms'])
+    s3.put_object(Bucket=os.environ['SNAPSHOT_BUCKET'], Key=os.environ.get('BLOOM_KEY', 'snapshots/placas.bloom'),
+                  Body=bloom.to_bytes())
+    print(f"Bloom filter published: {bloom.count} placas, {len(bloom.bits)} bytes, k={bloom.num_hashes}")
+
+    # Anotaciones anteriores al snapshot más viejo que el webhook todavía acepta
+    if os.environ.get('COUNTERS_TABLE'):
+        max_age_ms = int(os.environ.get('SNAPSHOT_MAX_AGE_SECONDS', '900')) * 1000
+        purgadas = registry_changes.purgar(dynamodb.Table(os.environ['COUNTERS_TABLE']),
+                                           version_ms - max_age_ms - registry_changes.MARGEN_MS)
+        print(f"Registry changes purged: {purgadas}")
+    return stats
@@ -1,14 +1,213 @@
+import random
 import re
+import time
 from datetime import datetime
-from typing import Dict, Any, Tuple, Optional
-import boto3
+from typing import Dict, Any, Tuple, Optional, Iterable, Set
+import aws_clients
 import os
 
+# Límite de llaves por llamada de BatchGetItem (impuesto por DynamoDB)
+BATCH_GET_MAX_KEYS = 100
+
+# Rondas de BatchGetItem por bloque de llaves; las que siguen sin procesar se reportan
+BATCH_GET_MAX_ATTEMPTS = 4
+BATCH_GET_BACKOFF_BASE = 0.05
+BATCH_GET_BACKOFF_MAX = 1.0
+
+# Antigüedad máxima aceptada para un cruce en tiempo real (segundos)
+DEFAULT_MAX_AGE_SECONDS = 86400
+
 class WebhookValidator:
-    def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb')
+    def __init__(self, snapshot_loader=None, plate_filter_loader=None, registry_changes=None):
+        self.dynamodb = aws_clients.resource('dynamodb')
         self.tags_table = self.dynamodb.Table(os.environ['TAGS_TABLE'])
         self.users_table = self.dynamodb.Table(os.environ['USERS_TABLE'])
+        # Snapshot mapeado en memoria (opcional); un hit evita la lectura a DynamoDB
+        self.snapshot_loader = snapshot_loader
+        # Filtro de Bloom de placas registradas (opcional); un miss rechaza sin I/O
+        self.plate_filter_loader = plate_filter_loader
+        # Tags y placas escritos después del snapshot: su hit no vale (opcional, COUNTERS_TABLE)
+        self.registry_changes = registry_changes
+    
+    def _snapshot(self):
+        return self.snapshot_loader.get() if self.snapshot_loader else None
+    
+    def _unchanged_since(self, version_ms: int, tag_id: Optional[str] = None, placa: Optional[str] = None) -> bool:
+        return self.registry_changes is None or self.registry_changes.vigente(version_ms, tag_id, placa)
+    
+    def _snapshot_tag(self, snapshot, tag_id: str) -> Optional[Dict]:
+        """Tag del snapshot, o None si no está o cambió después de construirlo"""
+        tag = snapshot.get_tag(tag_id)
+        if tag and self._unchanged_since(snapshot.version_ms, tag_id=tag_id):
+            return tag
+        return None
+    
+    def _snapshot_user(self, snapshot, placa: str) -> Optional[Dict]:
+        """Usuario del snapshot, o None si no está o cambió después de construirlo"""
+        user = snapshot.get_user(placa)
+        if user and self._unchanged_since(snapshot.version_ms, placa=placa):
+            return user
+        return None
+    
+    def snapshot_placa_of_tag(self, tag_id: str) -> Optional[str]:
+        """
+        Placa del tag según el snapshot en memoria, sin leer TagsTable (modo degradado);
+        None si no hay snapshot, el tag no está o cambió después de construirlo
+        """
+        snapshot = self._snapshot()
+        tag = self._snapshot_tag(snapshot, tag_id) if snapshot and tag_id else None
+        return tag.get('placa') if tag else None
+    
+    def is_unknown_placa(self, placa: str) -> bool:
+        """
+        True solo si el filtro de Bloom garantiza que la placa no está registrada: un miss
+        de una placa escrita después de construir el filtro se confirma con DynamoDB
+        """
+        plate_filter = self.plate_filter_loader.get() if self.plate_filter_loader else None
+        return (plate_filter is not None and not plate_filter.might_contain(placa)
+                and self._unchanged_since(plate_filter.version_ms, placa=placa))
+    
+    def lookup_tag(self, tag_id: str, prefetched: Optional[Dict] = None) -> Optional[Dict]:
+        """Obtiene el tag: prefetch del lote, luego snapshot, luego DynamoDB"""
+        if prefetched is not None and tag_id in prefetched.get('tags', {}):
+            return prefetched['tags'][tag_id]
+        snapshot = self._snapshot()
+        if snapshot:
+            tag = self._snapshot_tag(snapshot, tag_id)
+            if tag:
+                return tag
+        response = self.tags_table.get_item(Key={'tag_id': tag_id})
+        return response.get('Item')
+    
+    def lookup_user(self, placa: str, prefetched: Optional[Dict] = None) -> Optional[Dict]:
+        """Obtiene el usuario: prefetch del lote, luego snapshot, luego DynamoDB"""
+        if prefetched is not None and placa in prefetched.get('users', {}):
+            return prefetched['users'][placa]
+        snapshot = self._snapshot()
+        if snapshot:
+            user = self._snapshot_user(snapshot, placa)
+            if user:
+                return user
+        if self.is_unknown_placa(placa):
+            return None
+        response = self.users_table.get_item(Key={'placa': placa})
+        return response.get('Item')
+    
+    def _batch_get(self, requests: Dict[Any, Tuple[str, Iterable[str]]]) -> Tuple[Dict[str, Dict[str, Optional[Dict]]],
+                                                                               Dict[str, Set[str]]]:
+        """
+        Lee llaves de una o varias tablas con BatchGetItem.
+        requests: {tabla: (nombre_llave, valores)}. Devuelve ({nombre_tabla: {valor: item o None}},
+        {nombre_tabla: valores sin procesar}): tras BATCH_GET_MAX_ATTEMPTS rondas con throttling,
+        las llaves pendientes no aparecen en el primer dict (no se sabe si existen).
+        """
+        pending = []
+        found = {}
+        unprocessed = {}
+        key_names = {}
+        for table, (key_name, values) in requests.items():
+            found[table.name] = {}
+            unprocessed[table.name] = set()
+            key_names[table.name] = key_name
+            for value in sorted(set(v for v in values if v)):
+                found[table.name][value] = None
+                pending.append((table.name, key_name, value))
+        
+        for start in range(0, len(pending), BATCH_GET_MAX_KEYS):
+            request_items = {}
+            for table_name, key_name, value in pending[start:start + BATCH_GET_MAX_KEYS]:
+                request_items.setdefault(table_name, {'Keys': []})['Keys'].append({key_name: value})
+            
+            for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+                if attempt:
+                    # Backoff exponencial con jitter completo: los contenedores no reintentan a la vez
+                    time.sleep(random.uniform(0, min(BATCH_GET_BACKOFF_MAX, BATCH_GET_BACKOFF_BASE * (2 ** attempt))))
+                response = self.dynamodb.batch_get_item(RequestItems=request_items)
+                for table_name, items in response.get('Responses', {}).items():
+                    for item in items:
+                        found[table_name][item[key_names[table_name]]] = item
+                request_items = response.get('UnprocessedKeys') or {}
+                if not request_items:
+                    break
+            
+            for table_name, pending_keys in request_items.items():
+                for key in pending_keys['Keys']:
+                    value = key[key_names[table_name]]
+                    found[table_name].pop(value, None)
+                    unprocessed[table_name].add(value)
+        
+        return found, unprocessed
+    
+    def prefetch(self, transactions: Iterable[Dict]) -> Dict[str, Dict[str, Optional[Dict]]]:
+        """
+        Resuelve con BatchGetItem los tags y usuarios de un lote de transacciones.
+        Primera ronda: tags y placas del request. Segunda ronda: placas resueltas desde tags.
+        """
+        transactions = list(transactions)
+        snapshot = self._snapshot()
+        tags, users = {}, {}
+        
+        # Las llaves presentes en el snapshot no necesitan lectura
+        if snapshot:
+            for t in transactions:
+                if t.get('tag_id') and t['tag_id'] not in tags:
+                    tag = self._snapshot_tag(snapshot, t['tag_id'])
+                    if tag:
+                        tags[t['tag_id']] = tag
+                if t.get('placa') and t['placa'] not in users:
+                    user = self._snapshot_user(snapshot, t['placa'])
+                    if user:
+                        users[t['placa']] = user
+        
+        # Placas descartadas por el filtro de Bloom tampoco se consultan
+        for t in transactions:
+            if t.get('placa') and t['placa'] not in users and self.is_unknown_placa(t['placa']):
+                users[t['placa']] = None
+        
+        tag_ids = [t.get('tag_id') for t in transactions if t.get('tag_id') not in tags]
+        placas = [t.get('placa') for t in transactions if t.get('placa') not in users]
+        
+        found, unprocessed = self._batch_get({
+            self.tags_table: ('tag_id', tag_ids),
+            self.users_table: ('placa', placas)
+        })
+        tags.update(found[self.tags_table.name])
+        users.update(found[self.users_table.name])
+        
+        placas_de_tags = {tag.get('placa') for tag in tags.values() if tag and tag.get('placa')}
+        missing = set()
+        for placa in placas_de_tags - set(users) - unprocessed[self.users_table.name]:
+            user = self._snapshot_user(snapshot, placa) if snapshot else None
+            if user or self.is_unknown_placa(placa):
+                users[placa] = user
+            else:
+                missing.add(placa)
+        if missing:
+            found_users, unprocessed_users = self._batch_get({self.users_table: ('placa', missing)})
+            users.update(found_users[self.users_table.name])
+            unprocessed[self.users_table.name] |= unprocessed_users[self.users_table.name]
+        
+        return {
+            'tags': tags,
+            'users': users,
+            # Llaves que DynamoDB no devolvió por throttling: el cruce se rechaza para reintento
+            'unprocessed': {'tags': unprocessed[self.tags_table.name], 'users': unprocessed[self.users_table.name]}
+        }
+    
+    @staticmethod
+    def unprocessed_lookup(data: Dict, prefetched: Optional[Dict]) -> Optional[str]:
+        """Mensaje de error si la validación del cruce depende de una llave que quedó sin leer"""
+        unprocessed = (prefetched or {}).get('unprocessed')
+        if not unprocessed or not isinstance(data, dict):
+            return None
+        tag_id, placa = data.get('tag_id'), data.get('placa')
+        if tag_id and tag_id in unprocessed['tags']:
+            return f"Tag lookup throttled, retry later: {tag_id}"
+        if not placa and tag_id:
+            placa = (prefetched['tags'].get(tag_id) or {}).get('placa')
+        if placa and placa in unprocessed['users']:
+            return f"Placa lookup throttled, retry later: {placa}"
+        return None
     
     @staticmethod
     def validate_structure(event: Dict) -> Tuple[bool, str]:
@@ -54,7 +253,7 @@ class WebhookValidator:
         return True, "OK"
     
     @staticmethod
-    def validate_timestamp(timestamp: str) -> Tuple[bool, str]:
+    def validate_timestamp(timestamp: str, max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS) -> Tuple[bool, str]:
         try:
             dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
             now = datetime.now(dt.tzinfo)
@@ -63,7 +262,7 @@ class WebhookValidator:
                 return False, "Timestamp cannot be in the future"
             
             time_diff = now - dt
-            if time_diff.total_seconds() > 86400:
+            if time_diff.total_seconds() > max_age_seconds:
                 return False, "Timestamp too old"
                 
             return True, "OK"
@@ -87,25 +286,23 @@ class WebhookValidator:
         
         return True, "OK"
     
-    def resolve_placa_from_tag(self, tag_id: str) -> Tuple[bool, str, Optional[str]]:
+    def resolve_placa_from_tag(self, tag_id: str, prefetched: Optional[Dict] = None) -> Tuple[bool, str, Optional[str]]:
         """Resuelve la placa a partir del tag_id"""
         if not tag_id:
             return False, "No tag_id provided", None
         
         try:
-            response = self.tags_table.get_item(Key={'tag_id': tag_id})
-            if 'Item' not in response:
+            tag_info = self.lookup_tag(tag_id, prefetched)
+            if not tag_info:
                 return False, f"Tag ID not found: {tag_id}", None
             
-            tag_info = response['Item']
             placa = tag_info.get('placa')
             
             if not placa:
                 return False, f"Tag {tag_id} is not associated with any vehicle", None
             
             # Verificar que la placa existe
-            user_response = self.users_table.get_item(Key={'placa': placa})
-            if 'Item' not in user_response:
+            if not self.lookup_user(placa, prefetched):
                 return False, f"Associated placa {placa} not found in system", None
             
             return True, "Placa resolved successfully", placa
@@ -113,19 +310,17 @@ class WebhookValidator:
         except Exception as e:
             return False, f"Error resolving placa from tag: {str(e)}", None
     
-    def validate_tag_association(self, tag_id: str, placa: str) -> Tuple[bool, str, Dict]:
+    def validate_tag_association(self, tag_id: str, placa: str, prefetched: Optional[Dict] = None) -> Tuple[bool, str, Dict]:
         """Valida que el tag esté asociado a la placa correcta"""
         if not tag_id:
             return True, "OK", {}
         
         try:
             # Buscar el tag en la tabla de tags
-            response = self.tags_table.get_item(Key={'tag_id': tag_id})
-            if 'Item' not in response:
+            tag_info = self.lookup_tag(tag_id, prefetched)
+            if not tag_info:
                 return False, f"Tag ID not found: {tag_id}", {}
             
-            tag_info = response['Item']
-            
             # Verificar si el tag está activo
             if tag_info.get('estado') != 'activo':
                 return False, f"Tag is not active: {tag_id}", {}
@@ -140,12 +335,10 @@ class WebhookValidator:
                 return False, f"Tag {tag_id} is associated with placa {tag_placa}, not {placa}", {}
             
             # Verificar que la placa existe en la tabla de usuarios
-            user_response = self.users_table.get_item(Key={'placa': placa})
-            if 'Item' not in user_response:
+            user_info = self.lookup_user(placa, prefetched)
+            if not user_info:
                 return False, f"Placa {placa} not found in system", {}
             
-            user_info = user_response['Item']
-            
             return True, "Tag validation successful", {
                 'tag_info': tag_info,
                 'user_info': user_info
@@ -154,6 +347,37 @@ class WebhookValidator:
         except Exception as e:
             return False, f"Error validating tag association: {str(e)}", {}
     
+    def validate_offline(self, data: Dict, max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS) -> Tuple[bool, str, Dict]:
+        """
+        Modo degradado: solo reglas sin lecturas a DynamoDB (formatos, timestamp,
+        peaje y filtro de Bloom). Existencia de placa y tag queda para el processor.
+        """
+        if not isinstance(data, dict):
+            return False, "Transaction must be a JSON object", {}
+
+        is_valid, message = self.validate_required_fields(data)
+        if not is_valid:
+            return False, message, {}
+
+        placa = data.get('placa')
+        tag_id = data.get('tag_id')
+        validations = [
+            (self.validate_placa_format, placa),
+            (lambda ts: self.validate_timestamp(ts, max_age_seconds), data['timestamp']),
+            (self.validate_peaje_id, data['peaje_id']),
+            (self.validate_tag_id_format, tag_id)
+        ]
+        for validation_func, value in validations:
+            if value is not None:
+                is_valid, message = validation_func(value)
+                if not is_valid:
+                    return False, message, {}
+
+        if placa and self.is_unknown_placa(placa):
+            return False, f"Placa {placa} not found in system", {}
+
+        return True, "Validation deferred", {**data, 'placa': placa, 'tag_id': tag_id, 'user_type': 'unknown'}
+
     def validate_complete(self, event: Dict) -> Tuple[bool, str, Dict]:
         # Validar estructura HTTP
         is_valid, message = self.validate_structure(event)
@@ -165,6 +389,18 @@ class WebhookValidator:
         if not is_valid:
             return False, message, {}
         
+        return self.validate_transaction(data)
+    
+    def validate_transaction(self, data: Dict, prefetched: Optional[Dict] = None,
+                             max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS) -> Tuple[bool, str, Dict]:
+        """
+        Aplica las reglas de negocio a una transacción ya parseada.
+        prefetched permite reutilizar lecturas hechas con BatchGetItem (endpoint batch).
+        max_age_seconds amplía la ventana de llegada tardía (replay de backlog).
+        """
+        if not isinstance(data, dict):
+            return False, "Transaction must be a JSON object", {}
+        
         # Validar campos requeridos (placa O tag_id)
         is_valid, message = self.validate_required_fields(data)
         if not is_valid:
@@ -177,7 +413,7 @@ class WebhookValidator:
         # CASO 1: Solo tag_id (sin placa)
         if not original_placa and tag_id:
             # Resolver la placa desde el tag
-            is_valid, message, resolved_placa = self.resolve_placa_from_tag(tag_id)
+            is_valid, message, resolved_placa = self.resolve_placa_from_tag(tag_id, prefetched)
             if not is_valid:
                 return False, f"Cannot process with tag: {message}", {}
             
@@ -190,8 +426,7 @@ class WebhookValidator:
             # Solo validar que la placa existe
             placa = original_placa
             try:
-                user_response = self.users_table.get_item(Key={'placa': placa})
-                if 'Item' not in user_response:
+                if not self.lookup_user(placa, prefetched):
                     return False, f"Placa {placa} not found in system", {}
             except Exception as e:
                 return False, f"Error validating placa: {str(e)}", {}
@@ -200,7 +435,7 @@ class WebhookValidator:
         elif original_placa and tag_id:
             placa = original_placa
             # Validar que el tag esté asociado a esta placa específica
-            is_valid, message, validation_result = self.validate_tag_association(tag_id, placa)
+            is_valid, message, validation_result = self.validate_tag_association(tag_id, placa, prefetched)
             if not is_valid:
                 # ERROR: Tag no está asociado a esta placa - NO permitir
                 return False, f"Tag validation failed: {message}", {}
@@ -212,7 +447,7 @@ class WebhookValidator:
         # Validar formatos individuales
         validations = [
             (self.validate_placa_format, placa),
-            (self.validate_timestamp, data['timestamp']),
+            (lambda ts: self.validate_timestamp(ts, max_age_seconds), data['timestamp']),
             (self.validate_peaje_id, data['peaje_id']),
             (self.validate_tag_id_format, tag_id)
         ]
@@ -234,9 +469,9 @@ class WebhookValidator:
         # Si hay tag_id válido, agregar información adicional
         if tag_id:
             try:
-                tag_response = self.tags_table.get_item(Key={'tag_id': tag_id})
-                if 'Item' in tag_response:
-                    final_data['tag_info'] = tag_response['Item']
+                tag_item = self.lookup_tag(tag_id, prefetched)
+                if tag_item:
+                    final_data['tag_info'] = tag_item
             except Exception:
                 pass  # No crítico si falla aquí
         
@@ -0,0 +1,105 @@
+"""
+Clients de AWS compartidos por las funciones, con una sola configuración de boto3.
+
+    BOTO_MAX_POOL_CONNECTIONS  conexiones HTTP por client (boto3 usa 10)
+    BOTO_MAX_ATTEMPTS          intentos por llamada, reintentos en modo adaptive
+    BOTO_CONNECT_TIMEOUT       segundos para abrir la conexión
+    BOTO_READ_TIMEOUT          segundos esperando cada lectura de la respuesta
+    keep-alive TCP activado
+
+Con el pool de 10 conexiones, el processor en paralelo (PROCESSOR_CONCURRENCY)
+y POST /tags/bulk (BULK_WORKERS) dejan hilos esperando una conexión libre. El
+modo adaptive, además del backoff, frena la tasa del lado del cliente cuando
+DynamoDB responde con throttling.
+
+Cada servicio tiene un client (o resource) por contenedor, reutilizado por
+todos los módulos de la función. contadores() devuelve llamadas, reintentos y
+throttles por servicio desde que arrancó el contenedor.
+"""
+import os
+import threading
+from typing import Dict
+
+import boto3
+from botocore.config import Config
+
+# Códigos de error que AWS usa para throttling
+THROTTLING_ERRORS = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'ProvisionedThroughputExceededException', 'RequestLimitExceeded',
+    'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete'
+}
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_resources = {}
+_contadores = {}
+
+def config_from_env() -> Config:
+    return Config(
+        max_pool_connections=int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', '50')),
+        connect_timeout=float(os.environ.get('BOTO_CONNECT_TIMEOUT', '2')),
+        read_timeout=float(os.environ.get('BOTO_READ_TIMEOUT', '10')),
+        retries={'mode': 'adaptive', 'total_max_attempts': int(os.environ.get('BOTO_MAX_ATTEMPTS', '5'))},
+        tcp_keepalive=True
+    )
+
+def _contador(servicio: str) -> Dict[str, int]:
+    return _contadores.setdefault(servicio, {'llamadas': 0, 'reintentos': 0, 'throttles': 0})
+
+def _registrar_eventos(servicio: str, client):
+    """Cuenta intentos con throttling (needs-retry) y reintentos de cada llamada (after-call)"""
+    def intento(response=None, **kwargs):
+        error = response[1].get('Error', {}).get('Code') if response else None
+        if error in THROTTLING_ERRORS:
+            with _lock:
+                _contador(servicio)['throttles'] += 1
+
+    def llamada(parsed=None, **kwargs):
+        reintentos = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        with _lock:
+            contador = _contador(servicio)
+            contador['llamadas'] += 1
+            contador['reintentos'] += reintentos
+
+    # needs-retry se emite en cada intento; after-call una vez por llamada, con RetryAttempts
+    client.meta.events.register('needs-retry', intento)
+    client.meta.events.register('after-call', llamada)
+
+def _crear(servicio: str, tipo: str):
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    if tipo == 'client':
+        nuevo = _session.client(servicio, config=config_from_env())
+        _registrar_eventos(servicio, nuevo)
+    else:
+        nuevo = _session.resource(servicio, config=config_from_env())
+        _registrar_eventos(servicio, nuevo.meta.client)
+    return nuevo
+
+def client(servicio: str):
+    """Client de boto3 del servicio, creado una vez por contenedor"""
+    with _lock:
+        if servicio not in _clients:
+            _clients[servicio] = _crear(servicio, 'client')
+        return _clients[servicio]
+
+def resource(servicio: str):
+    """Resource de boto3 del servicio (DynamoDB), creado una vez por contenedor"""
+    with _lock:
+        if servicio not in _resources:
+            _resources[servicio] = _crear(servicio, 'resource')
+        return _resources[servicio]
+
+def contadores() -> Dict[str, Dict[str, int]]:
+    """Llamadas, reintentos y throttles por servicio desde el arranque del contenedor"""
+    with _lock:
+        return {servicio: dict(contador) for servicio, contador in _contadores.items()}
+
+def resumen() -> str:
+    """Servicios con reintentos o throttles, para el log; vacío si no hubo"""
+    partes = [f"{servicio}: {c['reintentos']} reintentos, {c['throttles']} throttles de {c['llamadas']} llamadas"
+              for servicio, c in sorted(contadores().items()) if c['reintentos'] or c['throttles']]
+    return '; '.join(partes)
@@ -0,0 +1,72 @@
+"""
+GET condicional (ETag / If-None-Match) para los historiales por placa.
+
+La versión de la placa es el contador "version#<placa>" de CountersTable, que el
+processor incrementa al guardar cada transacción de la placa (también las que
+llegan tarde con un timestamp anterior al último). Es un GetItem de 0.5 RCU. Sin
+COUNTERS_TABLE se usa la transacción más reciente del índice placa-timestamp
+(query Limit=1).
+
+El ETag combina esa versión con lo que cambia el body (ruta, limite, cursor). Si
+coincide con If-None-Match se responde 304 sin consultar transacciones ni
+construir el body. La compresión gzip la hace API Gateway (MinimumCompressionSize).
+"""
+import hashlib
+
+from boto3.dynamodb.conditions import Key
+
+from transaction_archive import INDICE_PLACA
+
+# Cambiarla invalida los ETag emitidos cuando cambia el formato de las respuestas
+VERSION_RESPUESTA = 1
+CACHE_CONTROL = 'private, no-cache'
+
+def clave_version(placa: str) -> dict:
+    return {'contador': f"version#{placa}"}
+
+def version_de_placa(counters_table, transactions_table, placa: str) -> str:
+    if counters_table:
+        item = counters_table.get_item(
+            Key=clave_version(placa),
+            ProjectionExpression='#version',
+            ExpressionAttributeNames={'#version': 'version'}
+        ).get('Item')
+        return str(int(item['version'])) if item else 'sin-cruces'
+
+    items = transactions_table.query(
+        IndexName=INDICE_PLACA,
+        KeyConditionExpression=Key('placa').eq(placa),
+        ScanIndexForward=False,
+        Limit=1,
+        ProjectionExpression='#ts, transaction_id',
+        ExpressionAttributeNames={'#ts': 'timestamp'}
+    ).get('Items', [])
+    return f"{items[0]['timestamp']}:{items[0]['transaction_id']}" if items else 'sin-cruces'
+
+def calcular_etag(version: str, *partes) -> str:
+    llave = '|'.join(str(parte) for parte in (VERSION_RESPUESTA, version, *partes))
+    # Débil: el mismo contenido puede viajar con o sin gzip
+    return f'W/"{hashlib.sha1(llave.encode("utf-8")).hexdigest()[:20]}"'
+
+def no_modificado(event, etag: str) -> bool:
+    headers = {nombre.lower(): valor for nombre, valor in (event.get('headers') or {}).items()}
+    valor = headers.get('if-none-match')
+    if not valor:
+        return False
+    candidatos = [candidato.strip() for candidato in valor.split(',')]
+    # Comparación débil (RFC 9110): W/"x" y "x" son el mismo validador
+    return '*' in candidatos or etag.removeprefix('W/') in (c.removeprefix('W/') for c in candidatos)
+
+def cabeceras(etag: str) -> dict:
+    return {
+        'ETag': etag,
+        'Cache-Control': CACHE_CONTROL,
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+def respuesta_304(etag: str) -> dict:
+    return {
+        'statusCode': 304,
+        'headers': {**cabeceras(etag), 'Access-Control-Allow-Origin': '*'},
+        'body': ''
+    }
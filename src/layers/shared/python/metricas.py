@@ -0,0 +1,66 @@
+"""
+Métricas de CloudWatch en Embedded Metric Format (EMF).
+
+publicar() imprime una línea JSON con la llave '_aws' y CloudWatch Logs la
+convierte en métricas del namespace, sin llamadas a PutMetricData. Los valores
+se acumulan en memoria (varios hilos pueden registrar a la vez) hasta publicar(),
+que la función llama al final de cada invocación.
+
+    registrar('LatenciaAutorizacion', 182.4, 'Milliseconds')   cada valor (p50/p99 en CloudWatch)
+    contar('CobrosDiferidos')                                   se suma y se publica un solo valor
+
+EMF acepta hasta 100 valores por métrica en cada línea; si hay más se imprimen
+varias líneas.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'GuatePass')
+MAX_VALORES = 100
+
+class Metricas:
+    def __init__(self, dimensiones: Dict[str, str], namespace: str = NAMESPACE, salida=print, reloj=time.time):
+        self.dimensiones = dimensiones
+        self.namespace = namespace
+        self.salida = salida
+        self.reloj = reloj
+        self._valores = {}
+        self._conteos = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre: str, valor: float, unidad: str = 'None'):
+        with self._lock:
+            self._valores.setdefault(nombre, (unidad, []))[1].append(valor)
+
+    def contar(self, nombre: str, cantidad: int = 1):
+        with self._lock:
+            self._conteos[nombre] = self._conteos.get(nombre, 0) + cantidad
+
+    def publicar(self):
+        """Imprime lo acumulado como EMF y lo descarta; no imprime nada si no hay valores"""
+        with self._lock:
+            valores, self._valores = self._valores, {}
+            conteos, self._conteos = self._conteos, {}
+        metricas = {nombre: (unidad, lista) for nombre, (unidad, lista) in valores.items()}
+        metricas.update({nombre: ('Count', [total]) for nombre, total in conteos.items()})
+
+        inicio = 0
+        while any(len(lista) > inicio for _, lista in metricas.values()):
+            linea = {nombre: (lista[inicio:inicio + MAX_VALORES] if len(lista) > 1 else lista[0])
+                     for nombre, (_, lista) in metricas.items() if len(lista) > inicio}
+            self.salida(json.dumps({
+                '_aws': {
+                    'Timestamp': int(self.reloj() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': self.namespace,
+                        'Dimensions': [list(self.dimensiones)],
+                        'Metrics': [{'Name': nombre, 'Unit': metricas[nombre][0]} for nombre in linea]
+                    }]
+                },
+                **self.dimensiones,
+                **linea
+            }))
+            inicio += MAX_VALORES
@@ -0,0 +1,133 @@
+"""
+Cambios recientes de tags y placas, para no confiar en un snapshot viejo.
+
+El snapshot del webhook (snapshot_index) y el filtro de Bloom se reconstruyen
+cada 5 minutos y se aceptan hasta SNAPSHOT_MAX_AGE_SECONDS. Sin más, un tag
+desactivado seguiría cobrándose como tag_express hasta la siguiente versión.
+
+Quien escribe en TagsTable o UsersTable anota, después de escribir, la hora de
+cada llave que cambió en un solo item de CountersTable:
+
+    contador     'registro#cambios'
+    tag#<id>     ms del último cambio del tag
+    placa#<p>    ms del último cambio del usuario
+    reinicio_ms  carga masiva (scripts): nada anterior es confiable
+
+Una llave del snapshot (o un miss del filtro) vale solo si no cambió desde la
+versión del snapshot; si cambió, el llamador lee DynamoDB. El webhook relee el
+item con lectura consistente cada refresh_seconds: esa es la ventana en la que
+todavía puede usar un valor viejo. El snapshot builder purga las anotaciones
+que ya ningún snapshot vigente necesita.
+"""
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+from botocore.exceptions import ClientError
+
+CLAVE = {'contador': 'registro#cambios'}
+PREFIJO_TAG = 'tag#'
+PREFIJO_PLACA = 'placa#'
+REINICIO = 'reinicio_ms'
+
+# Atributos por UpdateExpression (el límite de la expresión es 4 KB)
+ATRIBUTOS_POR_UPDATE = 50
+
+# Diferencia tolerada entre relojes de los contenedores que escriben y el builder
+MARGEN_MS = 1000
+
+def _ahora_ms() -> int:
+    return int(time.time() * 1000)
+
+def _en_bloques(valores, tamano=ATRIBUTOS_POR_UPDATE):
+    valores = list(valores)
+    for start in range(0, len(valores), tamano):
+        yield valores[start:start + tamano]
+
+def registrar_cambios(counters_table, tag_ids: Iterable[str] = (), placas: Iterable[str] = ()) -> int:
+    """Anota que estos tags y placas cambiaron ahora; llamar después de escribirlos"""
+    ms = _ahora_ms()
+    llaves = sorted({PREFIJO_TAG + t for t in tag_ids if t} | {PREFIJO_PLACA + p for p in placas if p})
+    for bloque in _en_bloques(llaves):
+        names = {f'#k{i}': llave for i, llave in enumerate(bloque)}
+        counters_table.update_item(
+            Key=CLAVE,
+            UpdateExpression='SET ' + ', '.join(f'{name} = :ms' for name in names),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={':ms': ms}
+        )
+    return ms
+
+def registrar_reinicio(counters_table) -> int:
+    """Carga masiva: ningún snapshot ni filtro anterior a este momento es confiable"""
+    ms = _ahora_ms()
+    counters_table.update_item(Key=CLAVE, UpdateExpression=f'SET {REINICIO} = :ms',
+                               ExpressionAttributeValues={':ms': ms})
+    return ms
+
+def purgar(counters_table, antes_de_ms: int) -> int:
+    """
+    Quita las anotaciones anteriores a antes_de_ms. Cada bloque se condiciona a que
+    sus valores no hayan cambiado: una anotación nueva de la misma llave no se pierde.
+    """
+    item = counters_table.get_item(Key=CLAVE, ConsistentRead=True).get('Item') or {}
+    viejas = [(llave, valor) for llave, valor in item.items()
+              if llave.startswith((PREFIJO_TAG, PREFIJO_PLACA)) and int(valor) < antes_de_ms]
+    purgadas = 0
+    for bloque in _en_bloques(viejas):
+        names = {f'#k{i}': llave for i, (llave, _) in enumerate(bloque)}
+        values = {f':v{i}': valor for i, (_, valor) in enumerate(bloque)}
+        try:
+            counters_table.update_item(
+                Key=CLAVE,
+                UpdateExpression='REMOVE ' + ', '.join(names),
+                ConditionExpression=' AND '.join(f'#k{i} = :v{i}' for i in range(len(bloque))),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+            purgadas += len(bloque)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    return purgadas
+
+class RegistryChanges:
+    """Copia por contenedor de las anotaciones, releída cada refresh_seconds"""
+
+    def __init__(self, counters_table, refresh_seconds: float = 5):
+        self.counters_table = counters_table
+        self.refresh_seconds = refresh_seconds
+        self._cambios = None
+        self._leido_en = None
+
+    def get(self) -> Optional[Dict]:
+        """Anotaciones vigentes; None si no se pudieron leer (nada del snapshot es confiable)"""
+        ahora = time.monotonic()
+        if self._leido_en is None or ahora - self._leido_en >= self.refresh_seconds:
+            try:
+                self._cambios = self.counters_table.get_item(Key=CLAVE, ConsistentRead=True).get('Item') or {}
+            except Exception as e:
+                print(f"Error reading registry changes: {str(e)}")
+                self._cambios = None
+            self._leido_en = ahora
+        return self._cambios
+
+    def vigente(self, version_ms: int, tag_id: Optional[str] = None, placa: Optional[str] = None) -> bool:
+        """True si el tag y la placa no cambiaron desde la versión version_ms del snapshot"""
+        cambios = self.get()
+        if cambios is None:
+            return False
+        desde = version_ms - MARGEN_MS
+        if int(cambios.get(REINICIO, 0)) >= desde:
+            return False
+        for llave in (tag_id and PREFIJO_TAG + tag_id, placa and PREFIJO_PLACA + placa):
+            if llave and int(cambios.get(llave, 0)) >= desde:
+                return False
+        return True
+
+def registry_changes_from_env(dynamodb) -> Optional[RegistryChanges]:
+    """None sin COUNTERS_TABLE: los hits del snapshot se aceptan sin revisar cambios"""
+    if not os.environ.get('COUNTERS_TABLE'):
+        return None
+    return RegistryChanges(dynamodb.Table(os.environ['COUNTERS_TABLE']),
+                           refresh_seconds=float(os.environ.get('REGISTRY_REFRESH_SECONDS', '5')))
@@ -0,0 +1,89 @@
+"""
+Caché de respuestas por placa en memoria del contenedor, invalidada por versión.
+
+El processor incrementa "version#<placa>" en CountersTable cada vez que guarda
+una transacción de la placa (ver http_cache.version_de_placa). Cada entrada
+guarda el body ya serializado junto con la versión con la que se construyó; si
+la versión actual es otra, la entrada se descarta. Una petición repetida cuesta
+el GetItem de la versión en lugar del query de la página.
+
+El tamaño está acotado por entradas y por bytes (LRU), y cada entrada vence a
+los ttl_segundos por si el incremento de versión llegara a fallar.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Cada cuántas consultas se imprimen las estadísticas en el log
+REPORTE_CADA = 100
+
+class ResponseCache:
+    def __init__(self, max_entradas: int = 256, max_bytes: int = 8 * 1024 * 1024,
+                 ttl_segundos: float = 300, reloj=time.monotonic):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self.reloj = reloj
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidadas = 0
+        self.expulsadas = 0
+
+    def obtener(self, llave, version):
+        """Body guardado para la llave si se construyó con esta versión; None si no"""
+        with self._lock:
+            entrada = self._entradas.get(llave)
+            if entrada and (entrada[0] != version or self.reloj() - entrada[2] > self.ttl_segundos):
+                self._quitar(llave)
+                self.invalidadas += 1
+                entrada = None
+            if entrada:
+                self._entradas.move_to_end(llave)
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._reportar()
+            return entrada[1] if entrada else None
+
+    def guardar(self, llave, version, body: str):
+        tamano = len(body)
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            if llave in self._entradas:
+                self._quitar(llave)
+            self._entradas[llave] = (version, body, self.reloj())
+            self._bytes += tamano
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                self._quitar(next(iter(self._entradas)))
+                self.expulsadas += 1
+
+    def _quitar(self, llave):
+        _, body, _ = self._entradas.pop(llave)
+        self._bytes -= len(body)
+
+    def estadisticas(self) -> dict:
+        consultas = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'tasa_hits': round(self.hits / consultas, 3) if consultas else 0.0,
+            'invalidadas': self.invalidadas,
+            'expulsadas': self.expulsadas,
+            'entradas': len(self._entradas),
+            'bytes': self._bytes
+        }
+
+    def _reportar(self):
+        if (self.hits + self.misses) % REPORTE_CADA == 0:
+            print(f"📊 Cache de respuestas: {self.estadisticas()}")
+
+def cache_from_env(environ):
+    return ResponseCache(
+        max_entradas=int(environ.get('RESPONSE_CACHE_ENTRIES', '256')),
+        max_bytes=int(environ.get('RESPONSE_CACHE_BYTES', str(8 * 1024 * 1024))),
+        ttl_segundos=float(environ.get('RESPONSE_CACHE_TTL_SECONDS', '300'))
+    )
@@ -0,0 +1,163 @@
+"""
+Archivo frío de transacciones en S3 y lectura combinada con DynamoDB.
+
+Las transacciones más viejas que ARCHIVE_AFTER_DAYS se copian a S3 como NDJSON
+gzip, particionadas por placa y mes del cruce, una parte por día de proceso:
+
+    archivo/placa=<placa>/mes=<YYYY-MM>/<dia_procesado>.ndjson.gz
+
+Después la copia en DynamoDB queda marcada (archivado = true) y expira por TTL.
+leer_pagina() entrega ambas fuentes ordenadas por (timestamp, transaction_id)
+descendente con un cursor opaco, así el cliente pagina igual sin importar de
+dónde sale cada fila. El archivo tiene las filas de más de ARCHIVE_AFTER_DAYS:
+todas son más antiguas que las vivas, así que S3 solo se lee cuando el query de
+DynamoDB se agota y las páginas recientes no tocan S3.
+"""
+import base64
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from itertools import groupby
+
+from boto3.dynamodb.conditions import Key
+
+import aws_clients
+from transaction_schema import leer_transaccion
+
+PREFIJO = 'archivo'
+INDICE_PLACA = 'placa-timestamp-index'
+# Filas revisadas como máximo por página (con filtro una placa puede tener pocas que califiquen)
+MAX_REVISADAS = 1000
+
+def clave_parte(placa: str, mes: str, parte: str, prefijo: str = PREFIJO) -> str:
+    return f"{prefijo}/placa={placa}/mes={mes}/{parte}.ndjson.gz"
+
+def _numero(valor):
+    if isinstance(valor, Decimal):
+        return int(valor) if valor == valor.to_integral_value() else float(valor)
+    raise TypeError(f"Object of type {type(valor).__name__} is not JSON serializable")
+
+def serializar(filas) -> bytes:
+    lineas = '\n'.join(json.dumps(fila, default=_numero, separators=(',', ':')) for fila in filas)
+    return gzip.compress(lineas.encode('utf-8'))
+
+def deserializar(datos: bytes) -> list:
+    # parse_float=Decimal: los montos vuelven como Decimal, igual que desde DynamoDB
+    return [json.loads(linea, parse_float=Decimal) for linea in gzip.decompress(datos).decode('utf-8').splitlines() if linea]
+
+class TransactionArchive:
+    def __init__(self, bucket: str, s3=None, prefijo: str = PREFIJO):
+        self.bucket = bucket
+        self.s3 = s3 or aws_clients.client('s3')
+        self.prefijo = prefijo
+
+    def escribir_parte(self, placa: str, mes: str, parte: str, filas) -> str:
+        """Sobrescribe la parte completa: reprocesar el mismo día es idempotente"""
+        key = clave_parte(placa, mes, parte, self.prefijo)
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=serializar(filas),
+                           ContentType='application/x-ndjson', ContentEncoding='gzip')
+        return key
+
+    def partes_por_mes(self, placa: str) -> dict:
+        """{mes: [keys]} de la placa con un solo LIST (paginado)"""
+        meses = {}
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for pagina in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefijo}/placa={placa}/"):
+            for objeto in pagina.get('Contents', []):
+                mes = objeto['Key'].split('/mes=')[1][:7]
+                meses.setdefault(mes, []).append(objeto['Key'])
+        return meses
+
+    def leer_partes(self, keys) -> list:
+        def leer(key):
+            return deserializar(self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read())
+
+        with ThreadPoolExecutor(max_workers=min(8, max(len(keys), 1))) as executor:
+            return [fila for filas in executor.map(leer, keys) for fila in filas]
+
+def _orden(tx):
+    return (tx['timestamp'], tx['transaction_id'])
+
+def codificar_cursor(tx) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(_orden(tx))).encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(cursor: str):
+    """(timestamp, transaction_id) de la última fila entregada; ValueError si el cursor no es válido"""
+    try:
+        timestamp, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return str(timestamp), str(transaction_id)
+
+def _filas_dynamo(table, placa: str, corte, tamano: int):
+    """Filas vivas (no archivadas) de la placa en orden descendente, por páginas del índice placa-timestamp"""
+    condicion = Key('placa').eq(placa)
+    if corte:
+        condicion = condicion & Key('timestamp').lte(corte[0])
+    kwargs = {'IndexName': INDICE_PLACA, 'KeyConditionExpression': condicion,
+              'ScanIndexForward': False, 'Limit': tamano}
+
+    def paginas():
+        while True:
+            response = table.query(**kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    # El índice solo ordena por timestamp: los empates se ordenan por transaction_id
+    for _, empatadas in groupby(paginas(), key=lambda tx: tx['timestamp']):
+        for tx in sorted(empatadas, key=_orden, reverse=True):
+            if tx.get('archivado') or (corte and _orden(tx) >= corte):
+                continue
+            yield tx
+
+def _filas_archivo(archive: TransactionArchive, placa: str, corte):
+    """Filas archivadas en orden descendente; solo lee los meses que la página necesita"""
+    if not archive:
+        return
+    partes = archive.partes_por_mes(placa)
+    for mes in sorted(partes, reverse=True):
+        if corte and mes > corte[0][:7]:
+            continue
+        for tx in sorted(archive.leer_partes(partes[mes]), key=_orden, reverse=True):
+            if corte and _orden(tx) >= corte:
+                continue
+            yield tx
+
+def _filas_en_orden(table, archive, placa: str, corte, tamano: int):
+    """DynamoDB primero; el archivo solo cuando el query se agotó, con filas más antiguas que la última viva"""
+    ultima = None
+    for tx in _filas_dynamo(table, placa, corte, tamano):
+        ultima = tx
+        yield tx
+    # Durante la gracia del TTL una fila puede estar en ambas fuentes: el corte la descarta del archivo
+    yield from _filas_archivo(archive, placa, _orden(ultima) if ultima else corte)
+
+def leer_pagina(table, archive, placa: str, limite: int = 50, cursor: str = None, incluir=None,
+                max_revisadas: int = MAX_REVISADAS):
+    """
+    Página de transacciones de la placa (más reciente primero) combinando DynamoDB
+    y el archivo, en la vista v1 (leer_transaccion). Devuelve (filas, siguiente_cursor);
+    siguiente_cursor es None en la última página.
+
+    Con incluir, la página se corta al revisar max_revisadas filas aunque tenga menos
+    de limite: la página puede venir corta (o vacía) con cursor y el cliente sigue.
+    """
+    corte = decodificar_cursor(cursor) if cursor else None
+
+    filas = []
+    revisadas = 0
+    for tx in _filas_en_orden(table, archive, placa, corte, limite * 2):
+        revisadas += 1
+        tx = leer_transaccion(tx)
+        if not incluir or incluir(tx):
+            filas.append(tx)
+        if len(filas) == limite or revisadas == max_revisadas:
+            return filas, codificar_cursor(tx)
+    return filas, None
+
+def archive_from_env(environ):
+    bucket = environ.get('ARCHIVE_BUCKET')
+    return TransactionArchive(bucket) if bucket else None
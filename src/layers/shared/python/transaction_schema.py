@@ -0,0 +1,139 @@
+"""
+Formato compacto (v2) de los items de TransactionsTable.
+
+v1 guardaba el dict 'resultado' completo: la factura repetía placa, peaje_id y
+monto, y cada item llevaba textos fijos ('Pago procesado exitosamente',
+mensaje_invitacion, datos del contribuyente...). v2 guarda solo lo que varía:
+
+    v           2
+    monto_c     monto en centavos (int)
+    pago        código de ESTADOS_PAGO (tag_express / registrado_digital)
+    auth        código de autorización si el pago fue exitoso
+    metodo      código de METODOS_PAGO
+    factura_id  número fiscal (no_registrado_tradicional)
+    consolidado cruce no registrado sin factura propia, va al estado de cuenta mensual
+    pago_real   si se descontó saldo (no_registrado_tradicional)
+    has_tag     si el usuario tenía tag activo (igual que en v1; obligatorio)
+    tag_id      solo si hubo tag
+
+Las llaves y los atributos que usan índices y filtros (transaction_id, timestamp,
+placa, peaje_id, user_type, tipo_escenario, fecha_procesado, dia_procesado) no
+cambian. leer_transaccion() devuelve la vista v1 de cualquier item, así los
+lectores funcionan igual mientras conviven ambos formatos.
+"""
+from decimal import Decimal
+
+VERSION = 2
+# El índice es el código guardado; 0 = desconocido (igual que snapshot_index)
+ESTADOS_PAGO = [None, 'exitoso', 'fondos_insuficientes', 'error_procesamiento', 'rechazado']
+METODOS_PAGO = [None, 'tarjeta_credito', 'tarjeta_debito']
+
+MENSAJE_EXITOSO = 'Pago procesado exitosamente'
+MENSAJE_FALLIDO = 'El pago no pudo ser procesado'
+ERRORES_PAGO = {'fondos_insuficientes': 'Fondos insuficientes', 'error_procesamiento': 'Error en procesamiento',
+                'rechazado': 'Pago rechazado'}
+
+def _codigo(valores, valor) -> int:
+    return valores.index(valor) if valor in valores else 0
+
+def centavos(monto) -> int:
+    return int((Decimal(str(monto)) * 100).to_integral_value())
+
+def compactar_transaccion(item: dict) -> dict:
+    """Item v1 (con 'resultado') -> item v2"""
+    resultado = item.get('resultado', {})
+    compacto = {
+        campo: item[campo]
+        for campo in ('transaction_id', 'timestamp', 'placa', 'peaje_id', 'user_type', 'tipo_escenario',
+                      'fecha_procesado', 'dia_procesado', 'archivado', 'expira_en')
+        if item.get(campo) is not None
+    }
+    compacto['v'] = VERSION
+    # No se deduce de tag_id ni de tipo_escenario: el item debe traerlo
+    compacto['has_tag'] = bool(item['has_tag'])
+    compacto['monto_c'] = centavos(item['monto'])
+    if item.get('tag_id'):
+        compacto['tag_id'] = item['tag_id']
+
+    pago = resultado.get('pago')
+    if pago:
+        if pago.get('exitoso'):
+            compacto['pago'] = _codigo(ESTADOS_PAGO, 'exitoso')
+            compacto['auth'] = pago.get('codigo_autorizacion')
+        elif pago.get('rechazado'):
+            compacto['pago'] = _codigo(ESTADOS_PAGO, 'rechazado')
+        else:
+            compacto['pago'] = _codigo(ESTADOS_PAGO, 'error_procesamiento' if pago.get('pago_real') else 'fondos_insuficientes')
+        compacto['metodo'] = _codigo(METODOS_PAGO, pago.get('metodo_pago'))
+
+    factura = resultado.get('factura')
+    if factura:
+        compacto['factura_id'] = factura['factura_id']
+        compacto['pago_real'] = bool(resultado.get('pago_real', factura.get('pago_real_exitoso', False)))
+    elif resultado.get('consolidado'):
+        compacto['consolidado'] = True
+        compacto['pago_real'] = bool(resultado.get('pago_real', False))
+
+    return compacto
+
+def cobro_exitoso(resultado: dict) -> bool:
+    """True si el cruce descontó saldo: pago exitoso (tag/registrado) o pago_real (no registrado)"""
+    pago = resultado.get('pago')
+    if pago is not None:
+        return bool(pago.get('exitoso'))
+    return bool(resultado.get('pago_real'))
+
+def _pago_v1(item: dict) -> dict:
+    estado = ESTADOS_PAGO[int(item['pago'])]
+    metodo = METODOS_PAGO[int(item.get('metodo', 0))]
+    if estado == 'exitoso':
+        return {'exitoso': True, 'codigo_autorizacion': item.get('auth'), 'mensaje': MENSAJE_EXITOSO,
+                'metodo_pago': metodo, 'pago_real': True}
+    pago = {'exitoso': False, 'error': ERRORES_PAGO.get(estado, 'Error en procesamiento'), 'mensaje': MENSAJE_FALLIDO,
+            'metodo_pago': metodo, 'pago_real': estado == 'error_procesamiento'}
+    if estado == 'rechazado':
+        pago['rechazado'] = True
+    return pago
+
+def _factura_v1(item: dict, monto: Decimal) -> dict:
+    peaje_id = item.get('peaje_id')
+    return {
+        'factura_id': item['factura_id'],
+        'placa': item.get('placa'),
+        'peaje_id': peaje_id,
+        'monto': monto,
+        # La factura se emite al procesar la transacción
+        'fecha_emision': item.get('fecha_procesado'),
+        'concepto': f'Cobro de peaje {peaje_id} - Usuario no registrado',
+        'estado': 'pendiente',
+        'tipo_usuario': item.get('user_type'),
+        'cargo_premium': '50%',
+        'multa_tardia': 'Q15.00',
+        'mensaje_invitacion': 'Registrese en GuatePass para evitar recargos',
+        'pago_real_exitoso': bool(item.get('pago_real', False))
+    }
+
+def leer_transaccion(item: dict) -> dict:
+    """Vista v1 de un item en cualquier formato; acepta items parciales (ProjectionExpression)"""
+    if int(item.get('v', 1)) < 2:
+        return item
+
+    tx = {campo: valor for campo, valor in item.items()
+          if campo not in ('v', 'monto_c', 'pago', 'auth', 'metodo', 'factura_id', 'consolidado', 'pago_real')}
+    if 'monto_c' in item:
+        tx['monto'] = (Decimal(int(item['monto_c'])) / 100).quantize(Decimal('0.01'))
+
+    resultado = {'tipo_escenario': item.get('tipo_escenario'), 'monto': tx.get('monto')}
+    if 'pago' in item:
+        resultado['pago'] = _pago_v1(item)
+        if item.get('tipo_escenario') == 'tag_express':
+            resultado.update({'tag_id': item.get('tag_id'), 'procesamiento_rapido': True, 'descuento_aplicado': '10%'})
+        else:
+            resultado['metodo_pago'] = resultado['pago']['metodo_pago']
+    if 'factura_id' in item:
+        resultado.update({'factura': _factura_v1(item, tx.get('monto')), 'enviar_invitacion': True,
+                          'pago_real': bool(item.get('pago_real', False))})
+    elif item.get('consolidado'):
+        resultado.update({'consolidado': True, 'pago_real': bool(item.get('pago_real', False))})
+    tx['resultado'] = resultado
+    return tx
@@ -0,0 +1,137 @@
+"""
+Fixtures de las pruebas unitarias: DynamoDB, SQS, SNS y S3 en memoria (moto),
+con las tablas tal como las define template.yaml, y carga de los módulos de
+cada función como lo hace Lambda (carpeta de la función + capa compartida).
+
+    python -m pytest -q tests
+
+Cada prueba arranca un "contenedor" nuevo: los módulos de src/ se vuelven a
+importar, así los clients y las tablas de nivel de módulo quedan dentro del mock.
+"""
+import importlib
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import boto3
+import pytest
+import yaml
+from moto import mock_aws
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(RAIZ, 'src')
+FUNCIONES = os.path.join(SRC, 'functions')
+CAPA = os.path.join(SRC, 'layers', 'shared', 'python')
+SCRIPTS = os.path.join(RAIZ, 'scripts')
+
+# Variables que apuntan a recursos del template (el nombre del recurso es su id lógico)
+RECURSOS = {
+    'USERS_TABLE': 'UsersTable',
+    'TRANSACTIONS_TABLE': 'TransactionsTable',
+    'TAGS_TABLE': 'TagsTable',
+    'COUNTERS_TABLE': 'CountersTable',
+}
+# Funcionalidades opcionales: cada prueba activa las que necesita
+OPCIONALES = (
+    'SNAPSHOT_BUCKET', 'BLOOM_KEY', 'LEDGER_TABLE', 'SUMMARY_TABLE', 'TRAFFIC_TABLE', 'STATEMENTS_TABLE',
+    'ARCHIVE_BUCKET', 'ADMISSION_MAX_MESSAGES', 'DEDUP_WINDOW_SECONDS', 'PAYMENT_GATEWAY', 'INVOICE_SERIES',
+    'INVOICE_BLOCK_SIZE', 'INVOICE_LEASE_SECONDS', 'BALANCE_MODE', 'TRANSACTION_SCHEMA_VERSION', 'CONSOLIDATED_STATEMENTS',
+)
+
+class _Template(yaml.SafeLoader):
+    """Lee template.yaml ignorando las funciones intrínsecas (!Ref, !Sub, ...)"""
+
+_Template.add_multi_constructor('!', lambda loader, sufijo, nodo: None)
+
+def _recursos_template():
+    with open(os.path.join(RAIZ, 'template.yaml'), encoding='utf-8') as f:
+        return yaml.load(f, Loader=_Template)['Resources']
+
+def _crear_tabla(dynamodb, nombre, propiedades):
+    kwargs = {
+        'TableName': nombre,
+        'AttributeDefinitions': propiedades['AttributeDefinitions'],
+        'KeySchema': propiedades['KeySchema'],
+        'BillingMode': 'PAY_PER_REQUEST',
+    }
+    if propiedades.get('GlobalSecondaryIndexes'):
+        kwargs['GlobalSecondaryIndexes'] = [
+            {'IndexName': gsi['IndexName'], 'KeySchema': gsi['KeySchema'], 'Projection': gsi['Projection']}
+            for gsi in propiedades['GlobalSecondaryIndexes']
+        ]
+    dynamodb.create_table(**kwargs)
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Todas las tablas, colas, buckets y el tópico del template, vacíos"""
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('BOTO_MAX_ATTEMPTS', '1')
+    for variable in OPCIONALES:
+        monkeypatch.delenv(variable, raising=False)
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        sqs = boto3.client('sqs', region_name='us-east-1')
+        s3 = boto3.client('s3', region_name='us-east-1')
+        sns = boto3.client('sns', region_name='us-east-1')
+
+        colas = {}
+        for nombre, recurso in _recursos_template().items():
+            tipo = recurso['Type']
+            if tipo == 'AWS::DynamoDB::Table':
+                _crear_tabla(dynamodb, nombre, recurso['Properties'])
+            elif tipo == 'AWS::SQS::Queue':
+                colas[nombre] = sqs.create_queue(QueueName=nombre)['QueueUrl']
+            elif tipo == 'AWS::S3::Bucket':
+                s3.create_bucket(Bucket=nombre.lower())
+
+        for variable, nombre in RECURSOS.items():
+            monkeypatch.setenv(variable, nombre)
+        monkeypatch.setenv('PROCESSING_QUEUE_URL', colas['ProcessingQueue'])
+        topic_arn = sns.create_topic(Name='NotificationsTopic')['TopicArn']
+        monkeypatch.setenv('NOTIFICATIONS_TOPIC_ARN', topic_arn)
+
+        def mensajes(cola='ProcessingQueue'):
+            """Bodies de los mensajes que quedaron en la cola (los consume)"""
+            bodies = []
+            while True:
+                response = sqs.receive_message(QueueUrl=colas[cola], MaxNumberOfMessages=10)
+                if not response.get('Messages'):
+                    return bodies
+                for mensaje in response['Messages']:
+                    bodies.append(json.loads(mensaje['Body']))
+                    sqs.delete_message(QueueUrl=colas[cola], ReceiptHandle=mensaje['ReceiptHandle'])
+
+        yield SimpleNamespace(
+            dynamodb=dynamodb, sqs=sqs, s3=s3, sns=sns, colas=colas, topic_arn=topic_arn,
+            tabla=dynamodb.Table, mensajes=mensajes
+        )
+
+def _descartar_modulos():
+    for nombre, modulo in list(sys.modules.items()):
+        archivo = getattr(modulo, '__file__', None) or ''
+        if archivo.startswith(SRC) or archivo.startswith(SCRIPTS):
+            del sys.modules[nombre]
+
+@pytest.fixture
+def cargar(aws, monkeypatch):
+    """
+    cargar('processor') importa src/functions/processor/app.py en un contenedor nuevo;
+    cargar('processor', 'balance_ledger') importa otro módulo de la misma función.
+    Una prueba carga módulos de una sola función (todas tienen su app.py).
+    """
+    _descartar_modulos()
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+
+    def _cargar(funcion, modulo='app'):
+        directorio = SCRIPTS if funcion == 'scripts' else os.path.join(FUNCIONES, funcion)
+        if directorio not in sys.path:
+            sys.path.insert(0, CAPA)
+            sys.path.insert(0, directorio)
+        return importlib.import_module(modulo)
+
+    yield _cargar
+    _descartar_modulos()
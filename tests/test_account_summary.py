@@ -0,0 +1,78 @@
+"""Resumen por placa en la transacción del cruce, solo con cobros exitosos (user-034)"""
+import json
+from decimal import Decimal
+
+import pytest
+
+@pytest.fixture
+def processor(cargar, monkeypatch):
+    monkeypatch.setenv('SUMMARY_TABLE', 'AccountSummaryTable')
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    return cargar
+
+def usuario(aws, saldo):
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-800HHH', 'tipo_usuario': 'registrado',
+                                           'saldo_disponible': Decimal(saldo)})
+
+def entrega(app, timestamp, message_id='m-1'):
+    body = json.dumps({'placa': 'P-800HHH', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': timestamp,
+                       'user_type': 'registrado', 'has_tag': False})
+    return app.lambda_handler({'Records': [{'messageId': message_id, 'body': body, 'attributes': {}}]}, None)
+
+def resumen(aws, periodo='TOTAL'):
+    return aws.tabla('AccountSummaryTable').get_item(Key={'placa': 'P-800HHH', 'periodo': periodo})['Item']
+
+def test_reentrega_no_cuenta_dos_veces(aws, processor):
+    usuario(aws, '100')
+    app = processor('processor')
+
+    entrega(app, '2025-01-20T10:00:00Z', 'm-1')
+    entrega(app, '2025-01-20T10:00:00Z', 'm-2')
+
+    for periodo in ('TOTAL', '2025-01'):
+        item = resumen(aws, periodo)
+        assert (item['cruces_total'], item['gasto_total']) == (1, Decimal('25.00'))
+    assert resumen(aws)['ultima_plaza'] == 'PEAJE_ZONA10'
+
+def test_cobro_fallido_cuenta_el_cruce_sin_gasto(aws, processor):
+    usuario(aws, '30')
+    app = processor('processor')
+
+    entrega(app, '2025-01-20T10:00:00Z', 'm-1')
+    entrega(app, '2025-01-20T11:00:00Z', 'm-2')
+
+    item = resumen(aws)
+    assert item['cruces_total'] == 2
+    assert item['gasto_total'] == Decimal('25.00')
+    assert item['gasto_registrado_digital'] == Decimal('25.00')
+
+def test_transaccion_fallida_no_deja_resumen(aws, processor, monkeypatch):
+    usuario(aws, '100')
+    app = processor('processor')
+    # Transacción ya guardada por otra entrega (mismo transaction_id): se cancela todo
+    aws.tabla('TransactionsTable').put_item(Item={
+        'transaction_id': app.id_transaccion({'placa': 'P-800HHH', 'peaje_id': 'PEAJE_ZONA10',
+                                              'timestamp': '2025-01-20T10:00:00Z'}),
+        'placa': 'P-800HHH', 'timestamp': '2025-01-20T10:00:00Z'})
+
+    entrega(app, '2025-01-20T10:00:00Z')
+
+    assert 'Item' not in aws.tabla('AccountSummaryTable').get_item(Key={'placa': 'P-800HHH', 'periodo': 'TOTAL'})
+
+def test_reconciliador_usa_la_misma_regla(aws, processor):
+    usuario(aws, '30')
+    app = processor('processor')
+    entrega(app, '2025-01-20T10:00:00Z', 'm-1')
+    entrega(app, '2025-01-20T11:00:00Z', 'm-2')
+    reconcile = processor('scripts', 'reconcile_summaries')
+
+    esperado = reconcile.acumular_segmento(aws.tabla('TransactionsTable'), 0)
+    for segmento in range(1, reconcile.SEGMENTOS):
+        for llave, acumulados in reconcile.acumular_segmento(aws.tabla('TransactionsTable'), segmento).items():
+            for atributo, valor in acumulados.items():
+                esperado[llave][atributo] += valor
+
+    item = resumen(aws)
+    assert {k: v for k, v in item.items() if reconcile.es_acumulado(k)} == dict(esperado[('P-800HHH', 'TOTAL')])
@@ -0,0 +1,54 @@
+"""Un client por servicio y contenedor, con pool, reintentos y contadores (user-046)"""
+import json
+
+from botocore.awsrequest import AWSResponse
+
+class Cuerpo:
+    def __init__(self, contenido: bytes):
+        self.contenido = contenido
+
+    def stream(self, **kwargs):
+        yield self.contenido
+
+def throttling_una_vez(client, operacion):
+    """El primer intento de la operación responde ThrottlingException; los demás siguen a moto"""
+    restantes = [1]
+
+    def antes_de_enviar(request, **kwargs):
+        if restantes:
+            restantes.pop()
+            cuerpo = json.dumps({'__type': 'com.amazonaws.dynamodb.v20120810#ThrottlingException',
+                                 'message': 'Rate exceeded'}).encode()
+            return AWSResponse(request.url, 400, {'x-amzn-RequestId': 'prueba'}, Cuerpo(cuerpo))
+    client.meta.events.register_first(f"before-send.dynamodb.{operacion}", antes_de_enviar)
+
+def test_un_client_por_servicio_con_la_config_del_ambiente(aws, cargar, monkeypatch):
+    monkeypatch.setenv('BOTO_MAX_POOL_CONNECTIONS', '64')
+    monkeypatch.setenv('BOTO_MAX_ATTEMPTS', '3')
+    aws_clients = cargar('processor', 'aws_clients')
+
+    dynamodb = aws_clients.resource('dynamodb')
+
+    assert aws_clients.resource('dynamodb') is dynamodb
+    assert aws_clients.client('sqs') is aws_clients.client('sqs')
+    config = dynamodb.meta.client.meta.config
+    assert config.max_pool_connections == 64
+    assert config.retries == {'mode': 'adaptive', 'total_max_attempts': 3}
+
+def test_funciones_comparten_el_client(aws, cargar):
+    app = cargar('processor')
+    aws_clients = cargar('processor', 'aws_clients')
+
+    assert app.dynamodb is aws_clients.resource('dynamodb')
+
+def test_cuenta_reintentos_y_throttles(aws, cargar, monkeypatch):
+    monkeypatch.setenv('BOTO_MAX_ATTEMPTS', '3')
+    aws_clients = cargar('processor', 'aws_clients')
+    tabla = aws_clients.resource('dynamodb').Table('UsersTable')
+    throttling_una_vez(tabla.meta.client, 'GetItem')
+
+    tabla.get_item(Key={'placa': 'P-100AAA'})
+    tabla.get_item(Key={'placa': 'P-100AAA'})
+
+    assert aws_clients.contadores()['dynamodb'] == {'llamadas': 2, 'reintentos': 1, 'throttles': 1}
+    assert aws_clients.resumen() == 'dynamodb: 1 reintentos, 1 throttles de 2 llamadas'
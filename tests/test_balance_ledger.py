@@ -0,0 +1,130 @@
+"""Ledger de saldo: débitos condicionados, compactación transaccional y sin scan (user-031)"""
+import json
+from decimal import Decimal
+
+import pytest
+from botocore.exceptions import ClientError
+
+def usuario(aws, placa='P-FLOTA1', saldo='100'):
+    item = {'placa': placa, 'tipo_usuario': 'registrado', 'modo_saldo': 'ledger', 'saldo_disponible': Decimal(saldo)}
+    aws.tabla('UsersTable').put_item(Item=item)
+    return item
+
+def entradas(aws):
+    return [i for i in aws.tabla('LedgerTable').scan()['Items'] if i['entrada'] != '~saldo']
+
+@pytest.fixture
+def ledger_mod(cargar, monkeypatch):
+    monkeypatch.setenv('LEDGER_TABLE', 'LedgerTable')
+    return cargar('processor', 'balance_ledger')
+
+def test_dos_contenedores_no_sobregiran_la_cuenta(aws, ledger_mod):
+    cuenta = usuario(aws, saldo='30')
+    # Cada contenedor tiene su propio ledger; ninguno confía en un saldo en caché
+    a = ledger_mod.BalanceLedger(aws.tabla('LedgerTable'), shards=4)
+    b = ledger_mod.BalanceLedger(aws.tabla('LedgerTable'), shards=4)
+
+    assert a.saldo_disponible(cuenta) == Decimal('30')
+    assert b.saldo_disponible(cuenta) == Decimal('30')
+    assert a.debitar('P-FLOTA1', Decimal('25'), cuenta) is True
+    assert b.debitar('P-FLOTA1', Decimal('25'), cuenta) is False
+    assert b.saldo_disponible(cuenta) == Decimal('5')
+
+def test_saldo_repartido_entre_shards_se_gasta_completo(aws, ledger_mod):
+    cuenta = usuario(aws, saldo='100')
+    ledger = ledger_mod.BalanceLedger(aws.tabla('LedgerTable'), shards=4)
+
+    assert all(ledger.debitar('P-FLOTA1', Decimal('22.50'), cuenta) for _ in range(4))
+    assert ledger.debitar('P-FLOTA1', Decimal('22.50'), cuenta) is False
+    assert ledger.saldo_disponible(cuenta) == Decimal('10.00')
+    assert ledger.debitar('P-FLOTA1', Decimal('10.00'), cuenta) is True
+    assert ledger.saldo_disponible(cuenta) == Decimal('0')
+
+def test_compactacion_pliega_y_borra_en_bloques(aws, ledger_mod):
+    cuenta = usuario(aws, saldo='1000')
+    ledger = ledger_mod.BalanceLedger(aws.tabla('LedgerTable'), shards=2)
+    for _ in range(120):
+        assert ledger.debitar('P-FLOTA1', Decimal('1.25'), cuenta)
+
+    resultado = ledger.compactar(aws.tabla('UsersTable'), 'P-FLOTA1', '9000-01-01T00:00:00')
+
+    assert resultado['entradas'] == 120
+    assert resultado['delta'] == Decimal('-150.00')
+    snapshot = aws.tabla('UsersTable').get_item(Key={'placa': 'P-FLOTA1'})['Item']
+    assert snapshot['saldo_disponible'] == Decimal('850.00')
+    assert entradas(aws) == []
+    assert ledger.saldo_disponible(snapshot) == Decimal('850.00')
+    assert ledger.placas_pendientes() == []
+
+def test_lector_concurrente_ve_el_mismo_saldo_durante_la_compactacion(aws, ledger_mod):
+    cuenta = usuario(aws, saldo='100')
+    ledger = ledger_mod.BalanceLedger(aws.tabla('LedgerTable'), shards=2)
+    for _ in range(3):
+        ledger.debitar('P-FLOTA1', Decimal('10'), cuenta)
+
+    # El lector conserva el usuario leído antes de la compactación
+    ledger.compactar(aws.tabla('UsersTable'), 'P-FLOTA1', '9000-01-01T00:00:00')
+
+    assert ledger.saldo_disponible(cuenta) == Decimal('70')
+
+def test_handler_solo_visita_placas_con_entradas_pendientes(aws, ledger_mod, monkeypatch):
+    monkeypatch.setenv('LEDGER_COMPACTION_MARGIN_SECONDS', '0')
+    ledger = ledger_mod.BalanceLedger(aws.tabla('LedgerTable'), shards=2)
+    activa, quieta = usuario(aws, 'P-FLOTA1'), usuario(aws, 'P-FLOTA2')
+    ledger.debitar('P-FLOTA1', Decimal('5'), activa)
+    ledger.debitar('P-FLOTA2', Decimal('5'), quieta)
+    ledger.compactar(aws.tabla('UsersTable'), 'P-FLOTA2', '9000-01-01T00:00:00')
+    ledger.debitar('P-FLOTA1', Decimal('5'), activa)
+
+    def sin_scan(*args, **kwargs):
+        raise AssertionError('la compactación no debe recorrer la tabla')
+    monkeypatch.setattr(type(aws.tabla('LedgerTable')), 'scan', sin_scan, raising=False)
+
+    resultado = ledger_mod.compaction_handler({}, None)
+
+    assert resultado['cuentas'] == 1
+    assert resultado['entradas'] == 2
+    assert aws.tabla('UsersTable').get_item(Key={'placa': 'P-FLOTA1'})['Item']['saldo_disponible'] == Decimal('90')
+
+def conflicto_en(client, monkeypatch, tabla):
+    """Toda transacción que toque la tabla se cancela por TransactionConflict"""
+    transact = client.transact_write_items
+
+    def transact_en_conflicto(TransactItems):
+        tablas = [next(iter(item.values()))['TableName'] for item in TransactItems]
+        if tabla in tablas:
+            motivos = [{'Code': 'TransactionConflict' if t == tabla else 'None'} for t in tablas]
+            raise ClientError({'Error': {'Code': 'TransactionCanceledException'},
+                               'CancellationReasons': motivos}, 'TransactWriteItems')
+        return transact(TransactItems=TransactItems)
+    monkeypatch.setattr(client, 'transact_write_items', transact_en_conflicto)
+    return lambda: monkeypatch.setattr(client, 'transact_write_items', transact)
+
+@pytest.mark.parametrize('modo, tabla', [('directo', 'UsersTable'), ('ledger', 'LedgerTable')])
+def test_contencion_reintenta_el_mensaje_en_vez_de_fondos_insuficientes(aws, cargar, monkeypatch, modo, tabla):
+    monkeypatch.setenv('LEDGER_TABLE', 'LedgerTable')
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-FLOTA1', 'tipo_usuario': 'registrado', 'modo_saldo': modo,
+                                           'metodo_pago': 'tarjeta_credito', 'saldo_disponible': Decimal('100')})
+    app = cargar('processor')
+    dead_letters = cargar('processor', 'dead_letters')
+    body = json.dumps({'placa': 'P-FLOTA1', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': '2025-01-20T10:00:00Z',
+                       'user_type': 'registrado', 'has_tag': False})
+    evento = {'Records': [{'messageId': 'm-1', 'body': body, 'attributes': {}}]}
+    sin_conflicto = conflicto_en(app.dynamodb.meta.client, monkeypatch, tabla)
+
+    for _ in range(3):
+        assert app.lambda_handler(evento, None)['batchItemFailures'] == [{'itemIdentifier': 'm-1'}]
+    # Ningún cobro fallido guardado con el transaction_id del cruce
+    assert aws.tabla('TransactionsTable').scan()['Items'] == []
+    fallo = aws.tabla('CountersTable').get_item(Key=dead_letters.clave_fallo('m-1'))['Item']
+    assert fallo['tipo_error'] == 'aws:TransactionCanceledException'
+
+    sin_conflicto()
+    assert app.lambda_handler(evento, None)['batchItemFailures'] == []
+    schema = cargar('processor', 'transaction_schema')
+    transaccion, = [schema.leer_transaccion(item) for item in aws.tabla('TransactionsTable').scan()['Items']]
+    assert transaccion['resultado']['pago']['exitoso'] is True
+    assert app.payment_calculator.verificar_saldo_actual('P-FLOTA1', app.users_table) == Decimal('100') - transaccion['monto']
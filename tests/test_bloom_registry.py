@@ -0,0 +1,58 @@
+"""Un miss del filtro de Bloom es definitivo solo para placas sin cambios posteriores (user-029)"""
+import json
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+def ahora():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+class FiltroFijo:
+    """BloomFilterLoader con un filtro ya construido"""
+    def __init__(self, bloom):
+        self.filter = bloom
+
+    def get(self):
+        return self.filter
+
+def con_filtro(app, bloom_filter, placas):
+    version_ms = int((time.time() - 60) * 1000)
+    app.validator.plate_filter_loader = FiltroFijo(bloom_filter.build_plate_filter(placas, 0.01, version_ms=version_ms))
+
+def registrar(aws, placa):
+    aws.tabla('UsersTable').put_item(Item={'placa': placa, 'tipo_usuario': 'registrado',
+                                           'saldo_disponible': Decimal('100')})
+
+def cruce(placa):
+    return {'body': json.dumps({'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora()})}
+
+def test_placa_registrada_despues_del_filtro_se_acepta(aws, cargar):
+    registrar(aws, 'P-100AAA')
+    app = cargar('webhook')
+    con_filtro(app, cargar('webhook', 'bloom_filter'), ['P-100AAA'])
+    registrar(aws, 'P-300NEW')
+    cargar('webhook', 'registry_changes').registrar_cambios(aws.tabla('CountersTable'), placas=['P-300NEW'])
+
+    respuesta = app.lambda_handler(cruce('P-300NEW'), None)
+
+    assert respuesta['statusCode'] == 200
+    assert [m['placa'] for m in aws.mensajes()] == ['P-300NEW']
+
+def test_carga_masiva_posterior_desactiva_los_miss(aws, cargar):
+    app = cargar('webhook')
+    con_filtro(app, cargar('webhook', 'bloom_filter'), ['P-100AAA'])
+    registrar(aws, 'P-300NEW')
+    cargar('webhook', 'registry_changes').registrar_reinicio(aws.tabla('CountersTable'))
+
+    assert app.lambda_handler(cruce('P-300NEW'), None)['statusCode'] == 200
+
+def test_miss_sin_cambios_se_rechaza_sin_leer_dynamodb(aws, cargar):
+    # La placa existe en la tabla pero no en el filtro ni en los cambios: el filtro manda
+    registrar(aws, 'P-300NEW')
+    app = cargar('webhook')
+    con_filtro(app, cargar('webhook', 'bloom_filter'), ['P-100AAA'])
+
+    respuesta = app.lambda_handler(cruce('P-300NEW'), None)
+
+    assert respuesta['statusCode'] == 400
+    assert 'not found' in json.loads(respuesta['body'])['error']['message']
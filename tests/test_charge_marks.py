@@ -0,0 +1,80 @@
+"""Una nueva entrega del mismo cruce no descuenta el saldo otra vez (user-048)"""
+import json
+from decimal import Decimal
+
+import pytest
+
+CRUCE = {'placa': 'P-500EEE', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': '2025-01-20T10:00:00Z'}
+
+@pytest.fixture
+def processor(cargar, monkeypatch):
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    return cargar
+
+def usuario(aws, tipo='registrado', **extra):
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-500EEE', 'tipo_usuario': tipo,
+                                           'saldo_disponible': Decimal('100'), **extra})
+
+def entrega(app, user_type, message_id='m-1'):
+    body = json.dumps({**CRUCE, 'user_type': user_type, 'has_tag': False})
+    return app.lambda_handler({'Records': [{'messageId': message_id, 'body': body, 'attributes': {}}]}, None)
+
+def saldo(aws):
+    return aws.tabla('UsersTable').get_item(Key={'placa': 'P-500EEE'})['Item']['saldo_disponible']
+
+def test_reentrega_tras_falla_de_factura_no_repite_cobro_ni_multa(aws, processor, monkeypatch):
+    usuario(aws, 'no_registrado')
+    app = processor('processor')
+    generar = app.invoice_generator.generar_factura
+    fallas = iter([RuntimeError('CountersTable no disponible')])
+
+    def generar_con_falla(*args):
+        for error in fallas:
+            raise error
+        return generar(*args)
+    monkeypatch.setattr(app.invoice_generator, 'generar_factura', generar_con_falla)
+
+    primera = entrega(app, 'no_registrado')
+    segunda = entrega(app, 'no_registrado')
+
+    assert primera['batchItemFailures'] == [{'itemIdentifier': 'm-1'}]
+    assert segunda['batchItemFailures'] == []
+    # 25 * 1.5 + 15 una sola vez
+    assert saldo(aws) == Decimal('47.50')
+    marca = aws.tabla('CountersTable').get_item(
+        Key={'contador': 'cobro#P-500EEE#PEAJE_ZONA10#2025-01-20T10:00:00Z'})['Item']
+    assert marca['monto'] == Decimal('52.50')
+
+def test_reenvio_de_la_dlq_no_descuenta_de_nuevo(aws, processor):
+    usuario(aws)
+    app = processor('processor')
+
+    entrega(app, 'registrado', 'm-1')
+    entrega(app, 'registrado', 'm-2')
+
+    assert saldo(aws) == Decimal('75.00')
+
+def test_cuenta_de_ledger_tambien_es_idempotente(aws, processor, monkeypatch):
+    monkeypatch.setenv('LEDGER_TABLE', 'LedgerTable')
+    usuario(aws, modo_saldo='ledger')
+    app = processor('processor')
+
+    entrega(app, 'registrado')
+    entrega(app, 'registrado')
+
+    debitos = [i for i in aws.tabla('LedgerTable').scan()['Items'] if i.get('tipo') == 'debito']
+    assert len(debitos) == 1
+    assert app.payment_calculator.verificar_saldo_actual('P-500EEE', aws.tabla('UsersTable')) == Decimal('75.00')
+
+def test_debito_directo_condicionado_al_saldo(aws, processor):
+    usuario(aws)
+    calculadora = processor('processor', 'payment_calculator').PaymentCalculator()
+    users = aws.tabla('UsersTable')
+    # Otro contenedor gastó el saldo después de la lectura de este
+    users.update_item(Key={'placa': 'P-500EEE'}, UpdateExpression='SET saldo_disponible = :s',
+                      ExpressionAttributeValues={':s': Decimal('10')})
+
+    assert calculadora._descontar(users, 'P-500EEE', Decimal('25')) is False
+    assert saldo(aws) == Decimal('10')
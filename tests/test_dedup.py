@@ -0,0 +1,60 @@
+"""Lecturas repetidas de la misma placa en la misma plaza: un solo cruce (user-050)"""
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+@pytest.fixture
+def webhook(aws, cargar, monkeypatch):
+    monkeypatch.setenv('DEDUP_WINDOW_SECONDS', '60')
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-100AAA', 'tipo_usuario': 'registrado'})
+    return cargar('webhook')
+
+def hace(segundos):
+    return (datetime.now(timezone.utc) - timedelta(seconds=segundos)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def lectura(timestamp, peaje_id='PEAJE_ZONA10'):
+    return {'body': json.dumps({'placa': 'P-100AAA', 'peaje_id': peaje_id, 'timestamp': timestamp})}
+
+def estado(respuesta):
+    return json.loads(respuesta['body'])['status']
+
+def test_segunda_lectura_en_la_ventana_no_se_encola(aws, webhook):
+    aceptado = hace(120)
+    primera = webhook.lambda_handler(lectura(aceptado), None)
+    repetida = webhook.lambda_handler(lectura(hace(115)), None)
+
+    assert (estado(primera), estado(repetida)) == ('processing', 'duplicate')
+    assert json.loads(repetida['body'])['duplicate_of'] == aceptado[:-1] + '.000Z'
+    assert len(aws.mensajes()) == 1
+
+def test_fuera_de_la_ventana_u_otra_plaza_es_otro_cruce(aws, webhook):
+    webhook.lambda_handler(lectura(hace(120)), None)
+
+    assert estado(webhook.lambda_handler(lectura(hace(115), 'PEAJE_ZONA11'), None)) == 'processing'
+    assert estado(webhook.lambda_handler(lectura(hace(30)), None)) == 'processing'
+    assert len(aws.mensajes()) == 3
+
+def test_otro_contenedor_la_suprime_con_la_tabla(aws, cargar, webhook):
+    dedup = cargar('webhook', 'dedup')
+    webhook.lambda_handler(lectura(hace(120)), None)
+    # Contenedor nuevo: memoria vacía, misma CountersTable
+    otro = dedup.CrossingSuppressor(window_seconds=60, table=aws.tabla('CountersTable'))
+
+    assert otro.check('P-100AAA', 'PEAJE_ZONA10', hace(118)) is not None
+    assert otro.check('P-100AAA', 'PEAJE_ZONA10', hace(30)) is None
+
+def test_envio_fallido_libera_la_lectura(aws, webhook, monkeypatch):
+    send_message = webhook.sqs.send_message
+    fallas = iter([RuntimeError('SQS no disponible')])
+
+    def send_con_falla(**kwargs):
+        for error in fallas:
+            raise error
+        return send_message(**kwargs)
+    monkeypatch.setattr(webhook.sqs, 'send_message', send_con_falla)
+
+    assert webhook.lambda_handler(lectura(hace(120)), None)['statusCode'] == 500
+    # La plaza reintenta la misma lectura: no es un duplicado
+    assert estado(webhook.lambda_handler(lectura(hace(120)), None)) == 'processing'
+    assert len(aws.mensajes()) == 1
@@ -0,0 +1,104 @@
+"""Modo degradado en cola FIFO: un cruce solo con tag va al grupo de su placa (user-049)"""
+import json
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+TAG = {'tag_id': 'TAG-049', 'placa': 'P-490AAA', 'estado': 'activo', 'metodo_pago': 'tarjeta_debito'}
+USUARIO = {'placa': 'P-490AAA', 'tipo_usuario': 'registrado', 'email': 'p490@guatepass.com', 'metodo_pago': 'tarjeta_debito',
+           'tiene_tag': True, 'tag_id': 'TAG-049', 'saldo_disponible': Decimal('100')}
+
+class SnapshotFijo:
+    def __init__(self, index):
+        self.index = index
+
+    def get(self):
+        return self.index
+
+@pytest.fixture
+def fifo(aws, monkeypatch):
+    url = aws.sqs.create_queue(QueueName='ProcessingQueue.fifo', Attributes={'FifoQueue': 'true'})['QueueUrl']
+    monkeypatch.setenv('PROCESSING_QUEUE_URL', url)
+    aws.tabla('UsersTable').put_item(Item=USUARIO)
+    aws.tabla('TagsTable').put_item(Item=TAG)
+
+    def recibir():
+        response = aws.sqs.receive_message(QueueUrl=url, MaxNumberOfMessages=10, AttributeNames=['MessageGroupId'])
+        return [(m['Attributes']['MessageGroupId'], json.loads(m['Body'])) for m in response.get('Messages', [])]
+    return recibir
+
+@pytest.fixture
+def webhook(aws, cargar, fifo, monkeypatch, tmp_path):
+    monkeypatch.setenv('DEDUP_WINDOW_SECONDS', '60')
+    app = cargar('webhook')
+    snapshot_index = cargar('webhook', 'snapshot_index')
+    path = str(tmp_path / 'index.bin')
+    snapshot_index.write_snapshot(path, [TAG], [USUARIO], version_ms=int((time.time() - 60) * 1000))
+    app.validator.snapshot_loader = SnapshotFijo(snapshot_index.SnapshotIndex(path))
+    monkeypatch.setattr(app, 'is_degraded', lambda: True)
+    return app
+
+def cruce(**campos):
+    ahora = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return {'body': json.dumps({'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora, **campos})}
+
+def test_tag_del_snapshot_usa_el_grupo_de_su_placa(webhook, fifo):
+    assert webhook.lambda_handler(cruce(tag_id='TAG-049'), None)['statusCode'] == 200
+
+    (grupo, body), = fifo()
+    assert grupo == 'P-490AAA'
+    assert (body['placa'], body['placa_snapshot'], body['enriquecer']) == (None, 'P-490AAA', True)
+
+def test_tag_fuera_del_snapshot_va_al_grupo_sin_placa(webhook, fifo):
+    assert webhook.lambda_handler(cruce(tag_id='TAG-777'), None)['statusCode'] == 200
+
+    (grupo, body), = fifo()
+    assert grupo == webhook.GRUPO_SIN_PLACA
+    assert body['placa_snapshot'] is None
+
+def test_lectura_por_placa_despues_del_tag_es_repetida(webhook, fifo):
+    webhook.lambda_handler(cruce(tag_id='TAG-049'), None)
+
+    respuesta = json.loads(webhook.lambda_handler(cruce(placa='P-490AAA'), None)['body'])
+
+    assert respuesta['status'] == 'duplicate'
+    assert len(fifo()) == 1
+
+def registro(message_id, grupo, **campos):
+    body = {'placa': None, 'tag_id': 'TAG-049', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': '2025-01-20T10:00:00Z',
+            'user_type': 'pendiente', 'user_email': None, 'user_phone': None, 'has_tag': False, 'tag_info': None,
+            'metodo_pago': None, 'enriquecer': True, **campos}
+    return {'messageId': message_id, 'body': json.dumps(body), 'attributes': {'MessageGroupId': grupo}}
+
+@pytest.fixture
+def processor(aws, cargar, fifo, monkeypatch):
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    return cargar('processor')
+
+def saldo(aws):
+    return aws.tabla('UsersTable').get_item(Key={'placa': 'P-490AAA'})['Item']['saldo_disponible']
+
+def test_grupo_sin_placa_se_reencola_en_el_de_la_placa(aws, processor, fifo):
+    respuesta = processor.lambda_handler({'Records': [registro('m-1', 'diferidos-sin-placa')]}, None)
+
+    assert respuesta['batchItemFailures'] == []
+    assert saldo(aws) == Decimal('100')
+    (grupo, body), = fifo()
+    assert grupo == 'P-490AAA'
+    assert (body['placa'], body['user_type'], body['has_tag']) == ('P-490AAA', 'registrado', True)
+    assert 'enriquecer' not in body and 'placa_snapshot' not in body
+
+    # La nueva entrega se cobra en el grupo de la placa, una sola vez
+    reencolado = {'messageId': 'm-2', 'body': json.dumps(body), 'attributes': {'MessageGroupId': grupo}}
+    processor.lambda_handler({'Records': [reencolado]}, None)
+    assert saldo(aws) == Decimal('77.50')
+
+def test_grupo_de_la_placa_se_cobra_sin_reencolar(aws, processor, fifo):
+    processor.lambda_handler({'Records': [registro('m-1', 'P-490AAA', placa_snapshot='P-490AAA')]}, None)
+
+    assert fifo() == []
+    assert saldo(aws) == Decimal('77.50')
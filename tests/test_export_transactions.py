@@ -0,0 +1,67 @@
+"""Exportador incremental: solo lo procesado después de la marca de agua, columnas compactas (user-036)"""
+import glob
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+@pytest.fixture
+def export(aws, cargar, monkeypatch):
+    modulo = cargar('scripts', 'export_transactions')
+    # El script arma el nombre de la tabla por ambiente; en moto es el id lógico
+    monkeypatch.setattr(modulo.boto3, 'resource', lambda servicio: type('R', (), {
+        'Table': staticmethod(lambda nombre: aws.tabla('TransactionsTable'))})())
+    return modulo
+
+def procesada(aws, cargar, numero, procesado, exitoso=True, shard=0):
+    schema = cargar('processor', 'transaction_schema')
+    fecha = procesado.isoformat() + 'Z'
+    item = schema.compactar_transaccion({
+        'transaction_id': f"TXN-{numero}", 'placa': 'P-900III', 'peaje_id': 'PEAJE_ZONA10',
+        'timestamp': f"2025-01-20T10:0{numero}:00Z", 'monto': Decimal('25.00'), 'user_type': 'registrado',
+        'has_tag': False, 'tipo_escenario': 'registrado_digital', 'fecha_procesado': fecha,
+        'dia_procesado': f"{fecha[:10]}#{shard}",
+        'resultado': {'tipo_escenario': 'registrado_digital', 'pago': {'exitoso': exitoso}}
+    })
+    aws.tabla('TransactionsTable').put_item(Item=item)
+
+def test_segunda_corrida_solo_exporta_lo_nuevo(aws, cargar, export, tmp_path, monkeypatch):
+    antes = datetime.utcnow() - timedelta(minutes=30)
+    procesada(aws, cargar, 1, antes, shard=3)
+    procesada(aws, cargar, 2, antes + timedelta(minutes=10), exitoso=False, shard=5)
+    export.guardar_estado(str(tmp_path), {'marca_de_agua': (antes - timedelta(minutes=1)).isoformat() + 'Z'})
+
+    # Primera corrida hace 25 minutos: TXN-2 todavía no estaba procesada
+    monkeypatch.setattr(export, 'RETRASO_SEGUNDOS', 25 * 60)
+    export.exportar(str(tmp_path))
+    marca = export.leer_estado(str(tmp_path))['marca_de_agua']
+    monkeypatch.setattr(export, 'RETRASO_SEGUNDOS', 120)
+    export.exportar(str(tmp_path))
+
+    columnas = export.cargar(str(tmp_path))
+    # Cada fila sale en una sola corrida
+    assert sorted(columnas['transaction_id']) == [b'TXN-1', b'TXN-2']
+    assert len(glob.glob(str(tmp_path / 'dia=*' / 'peaje=*' / 'part-*.npz'))) == 2
+    assert export.leer_estado(str(tmp_path))['marca_de_agua'] > marca
+
+def test_columnas_compactas(aws, cargar, export, tmp_path):
+    procesado = datetime.utcnow() - timedelta(minutes=30)
+    procesada(aws, cargar, 1, procesado)
+    procesada(aws, cargar, 2, procesado + timedelta(seconds=1), exitoso=False)
+
+    dia = procesado.strftime('%Y-%m-%d')
+    filas = export.consultar_dia(aws.tabla('TransactionsTable'), dia, f"{dia}T00:00:00Z", f"{dia}T23:59:59Z")
+    export.escribir_particiones(filas, str(tmp_path), 'prueba')
+    columnas = export.cargar(str(tmp_path), peaje_id='PEAJE_ZONA10')
+
+    orden = columnas['transaction_id'].argsort()
+    assert columnas['monto_centavos'][orden].tolist() == [2500, 2500]
+    assert columnas['pago_exitoso'][orden].tolist() == [1, 0]
+    assert set(columnas['user_type'].tolist()) == {export.CODIGOS['user_type']['registrado']}
+
+def test_fila_en_la_marca_no_se_repite(aws, cargar, export):
+    procesado = datetime.utcnow() - timedelta(minutes=30)
+    procesada(aws, cargar, 1, procesado)
+    desde = procesado.isoformat() + 'Z'
+
+    assert export.consultar_dia(aws.tabla('TransactionsTable'), desde[:10], desde, desde[:10] + 'T23:59:59Z') == []
@@ -0,0 +1,59 @@
+"""Cola FIFO: un grupo por placa y los cobros de cada placa en orden (user-030)"""
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+def registro(message_id, placa, minuto, grupo=True):
+    body = {'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': f"2025-01-20T10:{minuto:02d}:00Z",
+            'user_type': 'registrado', 'has_tag': False}
+    return {'messageId': message_id, 'body': json.dumps(body),
+            'attributes': {'MessageGroupId': placa} if grupo else {}}
+
+@pytest.fixture
+def processor(cargar, monkeypatch):
+    app = cargar('processor')
+    aplicados = []
+
+    def procesar_registro(data):
+        if data['timestamp'].endswith('10:02:00Z'):
+            raise RuntimeError('DynamoDB no disponible')
+        aplicados.append((data['placa'], data['timestamp'][11:16]))
+    monkeypatch.setattr(app, 'procesar_registro', procesar_registro)
+    return app, aplicados
+
+def test_falla_en_fifo_devuelve_el_resto_del_grupo(processor):
+    app, aplicados = processor
+    records = [registro('a1', 'P-301AAA', 1), registro('a2', 'P-301AAA', 2), registro('a3', 'P-301AAA', 3),
+               registro('b1', 'P-302BBB', 1), registro('b3', 'P-302BBB', 3)]
+
+    respuesta = app.lambda_handler({'Records': records}, None)
+
+    assert sorted(f['itemIdentifier'] for f in respuesta['batchItemFailures']) == ['a2', 'a3']
+    # El 10:03 de P-301AAA no se adelanta al 10:02 que falló
+    assert sorted(aplicados) == [('P-301AAA', '10:01'), ('P-302BBB', '10:01'), ('P-302BBB', '10:03')]
+
+def test_cola_estandar_solo_reintenta_el_fallido(processor):
+    app, aplicados = processor
+    records = [registro(f"a{m}", 'P-301AAA', m, grupo=False) for m in (1, 2, 3)]
+
+    respuesta = app.lambda_handler({'Records': records}, None)
+
+    assert [f['itemIdentifier'] for f in respuesta['batchItemFailures']] == ['a2']
+    assert aplicados == [('P-301AAA', '10:01'), ('P-301AAA', '10:03')]
+
+def test_webhook_agrupa_por_placa_y_deduplica_por_cruce(aws, cargar, monkeypatch):
+    url = aws.sqs.create_queue(QueueName='ProcessingQueue.fifo', Attributes={'FifoQueue': 'true'})['QueueUrl']
+    monkeypatch.setenv('PROCESSING_QUEUE_URL', url)
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-301AAA', 'tipo_usuario': 'registrado'})
+    app = cargar('webhook')
+    ahora = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    cruce = {'body': json.dumps({'placa': 'P-301AAA', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora})}
+
+    # La plaza reenvía el mismo evento: SQS descarta la segunda copia por MessageDeduplicationId
+    for _ in range(2):
+        assert app.lambda_handler(cruce, None)['statusCode'] == 200
+
+    mensajes = aws.sqs.receive_message(QueueUrl=url, MaxNumberOfMessages=10, AttributeNames=['All'])['Messages']
+    assert len(mensajes) == 1
+    assert mensajes[0]['Attributes']['MessageGroupId'] == 'P-301AAA'
@@ -0,0 +1,51 @@
+"""GET condicional del historial: 304 mientras la placa no cambie (user-039)"""
+from decimal import Decimal
+
+import pytest
+
+@pytest.fixture
+def history(aws, cargar):
+    return cargar('history')
+
+def guardar_cruce(aws, cargar, timestamp):
+    """Lo que deja el processor: la transacción y el incremento de version#<placa>"""
+    aws.tabla('TransactionsTable').put_item(Item={
+        'transaction_id': f"TXN-{timestamp}", 'placa': 'P-110AAA', 'peaje_id': 'PEAJE_ZONA10',
+        'timestamp': timestamp, 'monto': Decimal('25.00'), 'user_type': 'registrado',
+        'tipo_escenario': 'registrado_digital', 'resultado': {'pago': {'exitoso': True}}
+    })
+    aws.tabla('CountersTable').update_item(
+        Key=cargar('history', 'http_cache').clave_version('P-110AAA'),
+        UpdateExpression='ADD #version :uno', ExpressionAttributeNames={'#version': 'version'},
+        ExpressionAttributeValues={':uno': 1})
+
+def consultar(history, etag=None):
+    return history.lambda_handler({
+        'resource': '/history/payments/{placa}', 'pathParameters': {'placa': 'P-110AAA'},
+        'headers': {'If-None-Match': etag} if etag else {}
+    }, None)
+
+def test_placa_sin_cambios_responde_304(aws, cargar, history):
+    guardar_cruce(aws, cargar, '2025-01-20T10:00:00Z')
+    primera = consultar(history)
+    etag = primera['headers']['ETag']
+
+    segunda = consultar(history, etag)
+
+    assert primera['statusCode'] == 200 and etag.startswith('W/"')
+    assert (segunda['statusCode'], segunda['body']) == (304, '')
+    assert segunda['headers']['ETag'] == etag
+    # Comparación débil: el mismo validador sin W/ también vale
+    assert consultar(history, etag.removeprefix('W/'))['statusCode'] == 304
+
+def test_cruce_tardio_cambia_el_etag(aws, cargar, history):
+    guardar_cruce(aws, cargar, '2025-01-20T10:00:00Z')
+    etag = consultar(history)['headers']['ETag']
+    # Llega tarde un cruce anterior al último: el último timestamp no cambia
+    guardar_cruce(aws, cargar, '2025-01-19T08:00:00Z')
+
+    respuesta = consultar(history, etag)
+
+    assert respuesta['statusCode'] == 200
+    assert respuesta['headers']['ETag'] != etag
+    assert '"total_payments": 2, "total_en_pagina": 2' in respuesta['body']
@@ -0,0 +1,116 @@
+"""Números de factura por bloques arrendados a cada contenedor, sin huecos en la serie (user-032)"""
+import json
+from decimal import Decimal
+
+import pytest
+from botocore.exceptions import ClientError
+
+@pytest.fixture
+def app(aws, cargar):
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-600FFF', 'tipo_usuario': 'no_registrado',
+                                           'saldo_disponible': Decimal('500')})
+    return cargar('processor')
+
+def entrega(app, timestamp, message_id='m-1'):
+    body = json.dumps({'placa': 'P-600FFF', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': timestamp,
+                       'user_type': 'no_registrado', 'has_tag': False})
+    return app.lambda_handler({'Records': [{'messageId': message_id, 'body': body, 'attributes': {}}]}, None)
+
+def facturas(aws):
+    return sorted(item['factura_id'] for item in aws.tabla('TransactionsTable').scan()['Items'])
+
+def ultimo(aws):
+    return aws.tabla('CountersTable').get_item(Key={'contador': 'FACT'})['Item']['siguiente']
+
+def bloque(aws, inicio):
+    return aws.tabla('CountersTable').get_item(Key={'contador': f"FACT#bloque#{inicio}"})['Item']
+
+def test_guardado_fallido_no_consume_numero(aws, app, monkeypatch):
+    client = app.invoice_generator.numeracion.client
+    transact = client.transact_write_items
+    fallas = iter([ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'TransactWriteItems')])
+
+    def transact_con_falla(TransactItems):
+        # Solo falla el guardado con factura, no el débito ni la reserva del bloque
+        if TransactItems[0].get('Update', {}).get('Key', {}).get('contador', '').startswith('FACT#bloque#'):
+            for error in fallas:
+                raise error
+        return transact(TransactItems=TransactItems)
+    monkeypatch.setattr(client, 'transact_write_items', transact_con_falla)
+
+    assert entrega(app, '2025-01-20T10:00:00Z')['batchItemFailures'] == [{'itemIdentifier': 'm-1'}]
+    assert facturas(aws) == []
+    entrega(app, '2025-01-20T10:00:00Z')
+    entrega(app, '2025-01-20T10:05:00Z', 'm-2')
+
+    assert facturas(aws) == ['FACT-0000000001', 'FACT-0000000002']
+    # Un solo bloque reservado para las dos facturas
+    assert ultimo(aws) == 50
+    assert bloque(aws, 1)['usados'] == {1, 2}
+
+def test_reentrega_de_un_cruce_guardado_no_consume_numero(aws, app):
+    entrega(app, '2025-01-20T10:00:00Z')
+    entrega(app, '2025-01-20T10:00:00Z')
+    entrega(app, '2025-01-20T10:05:00Z', 'm-2')
+
+    assert facturas(aws) == ['FACT-0000000001', 'FACT-0000000002']
+    assert bloque(aws, 1)['usados'] == {1, 2}
+
+@pytest.fixture
+def contenedores(aws, cargar):
+    numbering = cargar('processor', 'invoice_numbering')
+    counters = aws.tabla('CountersTable')
+
+    def crear(nombre, reloj=lambda: 1000.0):
+        return numbering.InvoiceNumbering(counters, contenedor_id=nombre, reloj=reloj, dormir=lambda s: None)
+
+    def items(numero):
+        # Un número repetido haría fallar la condición y la prueba
+        return [{'Put': {'TableName': counters.name, 'Item': {'contador': f"prueba#{numero}"},
+                         'ConditionExpression': 'attribute_not_exists(contador)'}}]
+    return crear, items
+
+def test_cada_contenedor_toma_su_bloque(aws, contenedores):
+    crear, items = contenedores
+    a, b = crear('a'), crear('b')
+
+    assert [a.escribir(items), b.escribir(items), a.escribir(items), b.escribir(items)] == [1, 51, 2, 52]
+    assert ultimo(aws) == 100
+    assert (bloque(aws, 1)['contenedor'], bloque(aws, 51)['contenedor']) == ('a', 'b')
+
+def test_rango_de_un_contenedor_retirado_se_reutiliza(aws, contenedores):
+    crear, items = contenedores
+    a = crear('a')
+    a.escribir(items)
+    a.escribir(items)
+
+    assert a.liberar_restante() == ['3-50']
+    assert bloque(aws, 1)['sin_usar'] == ['3-50']
+
+    b = crear('b')
+    assert [b.escribir(items), b.escribir(items)] == [3, 4]
+    assert ultimo(aws) == 50
+    assert bloque(aws, 1)['contenedor'] == 'b'
+
+def test_arriendo_vencido_se_reclama_y_el_dueno_anterior_sigue_en_otro_bloque(aws, contenedores):
+    crear, items = contenedores
+    # El contenedor a se congeló: su reloj no avanzó y cree que su arriendo sigue vigente
+    a, b = crear('a', reloj=lambda: 1000.0), crear('b', reloj=lambda: 2000.0)
+    a.escribir(items)
+
+    assert b.escribir(items) == 2
+    # La transacción de a pierde la condición del arriendo: reserva un bloque nuevo
+    assert a.escribir(items) == 51
+    assert b.escribir(items) == 3
+    assert bloque(aws, 1)['usados'] == {1, 2, 3}
+    assert bloque(aws, 51)['usados'] == {51}
+
+def test_bloque_agotado_sale_de_pendientes(aws, cargar):
+    numbering = cargar('processor', 'invoice_numbering')
+    counters = aws.tabla('CountersTable')
+    a = numbering.InvoiceNumbering(counters, tamano_bloque=2, contenedor_id='a', dormir=lambda s: None)
+    items = lambda numero: []
+
+    assert [a.escribir(items) for _ in range(3)] == [1, 2, 3]
+    pendientes = counters.get_item(Key={'contador': 'FACT#pendientes'})['Item']
+    assert sorted(nombre for nombre in pendientes if nombre.startswith('bloque_')) == ['bloque_3']
@@ -0,0 +1,44 @@
+"""Contacto de la notificación: un hit del snapshot manda email y teléfono en None (user-043)"""
+import json
+from decimal import Decimal
+
+import pytest
+
+@pytest.fixture
+def processor(aws, cargar, monkeypatch):
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-123ABC', 'tipo_usuario': 'registrado', 'email': 'p123@correo.com',
+                                           'telefono': '+50255550000', 'nombre': 'Ana', 'saldo_disponible': Decimal('100')})
+    app = cargar('processor')
+    publicados = []
+    monkeypatch.setattr(app.sns, 'publish', lambda **kwargs: publicados.append(kwargs))
+    return app, publicados
+
+def entrega(app, **contacto):
+    # Mensaje de build_processing_message: con un hit del snapshot user_info solo trae flags
+    body = json.dumps({'placa': 'P-123ABC', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': '2025-01-20T10:00:00Z',
+                       'user_type': 'registrado', 'has_tag': False, 'tag_info': None, 'metodo_pago': 'tarjeta_credito',
+                       **contacto})
+    app.lambda_handler({'Records': [{'messageId': 'm-1', 'body': body, 'attributes': {}}]}, None)
+
+def test_hit_del_snapshot_lee_el_contacto_del_usuario(processor):
+    app, publicados = processor
+
+    entrega(app, user_email=None, user_phone=None)
+
+    mensaje, = publicados
+    datos = json.loads(mensaje['Message'])
+    assert (datos['email'], datos['telefono'], datos['nombre']) == ('p123@correo.com', '+50255550000', 'Ana')
+    assert datos['canales'] == ['email', 'sms']
+
+def test_contacto_en_el_mensaje_no_lee_al_usuario(processor):
+    app, publicados = processor
+
+    entrega(app, user_email='mensaje@correo.com', user_phone=None)
+
+    datos = json.loads(publicados[0]['Message'])
+    # Sin la lectura del usuario no hay nombre ni teléfono
+    assert (datos['email'], datos['telefono'], datos['nombre']) == ('mensaje@correo.com', None, None)
+    assert datos['canales'] == ['email']
@@ -0,0 +1,100 @@
+"""Cobros con tarjeta por la pasarela: reintentos, circuit breaker y cobro diferido (user-047)"""
+import json
+from decimal import Decimal
+
+import pytest
+
+class PasarelaGuionada:
+    """Responde (o falla) según el guion, una entrada por llamada"""
+    def __init__(self, errores, guion):
+        self.errores = errores
+        self.guion = list(guion)
+        self.solicitudes = []
+
+    def autorizar(self, solicitud, timeout):
+        self.solicitudes.append(solicitud)
+        paso = self.guion.pop(0)
+        if paso == 'error':
+            raise self.errores.ErrorPasarela('HTTP 503')
+        return {'aprobado': paso == 'aprobado'}
+
+@pytest.fixture
+def gateway(cargar):
+    return cargar('processor', 'payment_gateway')
+
+def cliente(gateway, guion, reloj=lambda: 0.0, **kwargs):
+    pasarela = PasarelaGuionada(gateway, guion)
+    circuito = gateway.CircuitBreaker(umbral=kwargs.pop('umbral', 5), enfriamiento=30, reloj=reloj)
+    return gateway.ClientePasarela(pasarela, circuito, reloj=reloj, dormir=lambda s: None, **kwargs), pasarela
+
+def test_reintenta_con_la_misma_referencia(gateway):
+    pago, pasarela = cliente(gateway, ['error', 'error', 'aprobado'])
+
+    assert pago.autorizar('P-100AAA', Decimal('25'), 'tarjeta_credito', 'P-100AAA#PEAJE_ZONA10#t')['aprobado']
+    assert {s['referencia'] for s in pasarela.solicitudes} == {'P-100AAA#PEAJE_ZONA10#t'}
+    assert len(pasarela.solicitudes) == 3
+
+def test_rechazo_no_se_reintenta(gateway):
+    pago, pasarela = cliente(gateway, ['rechazado', 'aprobado'])
+
+    assert pago.autorizar('P-100AAA', Decimal('25'), 'tarjeta_credito', 'ref') == {'aprobado': False}
+    assert len(pasarela.solicitudes) == 1
+
+def test_circuito_abierto_no_llama_y_semi_abierto_prueba_una_vez(gateway):
+    ahora = [0.0]
+    pago, pasarela = cliente(gateway, ['error', 'error', 'aprobado'], reloj=lambda: ahora[0],
+                             umbral=2, max_intentos=2)
+
+    with pytest.raises(gateway.PasarelaNoDisponible):
+        pago.autorizar('P-100AAA', Decimal('25'), 'tarjeta_credito', 'ref')
+    assert pago.circuito.estado == 'abierto'
+    with pytest.raises(gateway.PasarelaNoDisponible, match='Circuito abierto'):
+        pago.autorizar('P-100AAA', Decimal('25'), 'tarjeta_credito', 'ref')
+    assert len(pasarela.solicitudes) == 2
+
+    ahora[0] = 31
+    # Semi abierto: otro hilo ya tiene la única prueba
+    assert pago.circuito.permitir()
+    with pytest.raises(gateway.PasarelaNoDisponible, match='Circuito abierto'):
+        pago.autorizar('P-100AAA', Decimal('25'), 'tarjeta_credito', 'ref')
+    # La prueba del otro hilo falla: otro enfriamiento completo
+    pago.circuito.fallo()
+    ahora[0] = 62
+    assert pago.autorizar('P-100AAA', Decimal('25'), 'tarjeta_credito', 'ref')['aprobado']
+    assert pago.circuito.estado == 'cerrado'
+
+def entrega(app):
+    body = json.dumps({'placa': 'P-100AAA', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': '2025-01-20T10:00:00Z',
+                       'user_type': 'registrado', 'has_tag': False})
+    return app.lambda_handler({'Records': [{'messageId': 'm-1', 'body': body, 'attributes': {}}]}, None)
+
+@pytest.fixture
+def processor(aws, cargar, monkeypatch):
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_MAX_ATTEMPTS', '1')
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-100AAA', 'tipo_usuario': 'registrado',
+                                           'metodo_pago': 'tarjeta_credito', 'saldo_disponible': Decimal('100')})
+    return cargar
+
+def saldo(aws):
+    return aws.tabla('UsersTable').get_item(Key={'placa': 'P-100AAA'})['Item']['saldo_disponible']
+
+def test_pasarela_caida_difiere_el_cobro_sin_escribir(aws, processor, monkeypatch):
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '1')
+    app = processor('processor')
+
+    assert entrega(app)['batchItemFailures'] == [{'itemIdentifier': 'm-1'}]
+    assert saldo(aws) == Decimal('100')
+    assert aws.tabla('TransactionsTable').scan()['Items'] == []
+
+def test_tarjeta_rechazada_se_guarda_sin_debito(aws, processor, monkeypatch):
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '1')
+    app = processor('processor')
+    schema = processor('processor', 'transaction_schema')
+
+    assert entrega(app)['batchItemFailures'] == []
+    assert saldo(aws) == Decimal('100')
+    transaccion, = [schema.leer_transaccion(item) for item in aws.tabla('TransactionsTable').scan()['Items']]
+    assert transaccion['resultado']['pago']['exitoso'] is False
+    assert transaccion['resultado']['pago']['rechazado'] is True
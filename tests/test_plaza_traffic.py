@@ -0,0 +1,45 @@
+"""Tráfico por plaza: el ingreso solo cuenta cobros exitosos (user-035)"""
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+@pytest.fixture
+def processor(cargar, monkeypatch):
+    monkeypatch.setenv('TRAFFIC_TABLE', 'PlazaTrafficTable')
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    return cargar
+
+def entrega(app, timestamp, message_id):
+    body = json.dumps({'placa': 'P-900JJJ', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': timestamp,
+                       'user_type': 'registrado', 'has_tag': False})
+    return app.lambda_handler({'Records': [{'messageId': message_id, 'body': body, 'attributes': {}}]}, None)
+
+def test_cobro_fallido_suma_cruce_sin_ingreso(aws, processor):
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-900JJJ', 'tipo_usuario': 'registrado',
+                                           'saldo_disponible': Decimal('30')})
+    app = processor('processor')
+
+    entrega(app, '2025-01-20T10:00:10Z', 'm-1')
+    # Sin saldo para el segundo cruce
+    entrega(app, '2025-01-20T10:00:40Z', 'm-2')
+
+    minuto, = app.plaza_traffic.ultimos_minutos('PEAJE_ZONA10', 1, datetime(2025, 1, 20, 10, 0, tzinfo=timezone.utc))
+    assert minuto['cruces_total'] == 2
+    assert minuto['monto_total'] == Decimal('25.00')
+    assert minuto['por_tipo']['registrado'] == {'cruces': 2, 'monto': Decimal('25.00')}
+
+def test_endpoint_reutiliza_la_tabla_del_contenedor(aws, processor, monkeypatch):
+    traffic = processor('processor', 'plaza_traffic')
+    trafico = traffic.trafico
+    monkeypatch.setattr(traffic, 'traffic_from_env', lambda: pytest.fail('tabla creada por request'))
+
+    for _ in range(2):
+        respuesta = traffic.api_handler({'pathParameters': {'peaje_id': 'peaje_zona10'},
+                                         'queryStringParameters': {'minutos': '5'}}, None)
+        assert respuesta['statusCode'] == 200
+        assert json.loads(respuesta['body'])['cruces_total'] == 0
+    assert traffic.trafico is trafico
@@ -0,0 +1,57 @@
+"""Placas distintas del lote en paralelo, cada placa en orden (user-044)"""
+import json
+import threading
+from decimal import Decimal
+
+def test_grupos_se_solapan_y_cada_uno_va_en_orden(cargar):
+    concurrency = cargar('processor', 'concurrency')
+    # Si los grupos corrieran en serie, el primero esperaría al segundo hasta el timeout
+    barrera = threading.Barrier(2, timeout=5)
+    vistos = {'P-1': [], 'P-2': []}
+
+    def procesar_grupo(grupo, registros):
+        barrera.wait()
+        for registro in registros:
+            vistos[grupo].append(registro)
+        return [r for r in registros if r.endswith('x')]
+
+    fallidos = concurrency.procesar_grupos({'P-1': ['a1', 'a2x', 'a3'], 'P-2': ['b1', 'b2']}, procesar_grupo, 4)
+
+    assert vistos == {'P-1': ['a1', 'a2x', 'a3'], 'P-2': ['b1', 'b2']}
+    assert fallidos == ['a2x']
+
+def test_concurrencia_uno_es_en_serie(cargar):
+    concurrency = cargar('processor', 'concurrency')
+    hilos = set()
+
+    def procesar_grupo(grupo, registros):
+        hilos.add(threading.get_ident())
+        return []
+
+    concurrency.procesar_grupos({'P-1': ['a'], 'P-2': ['b'], 'P-3': ['c']}, procesar_grupo, 1)
+
+    assert hilos == {threading.get_ident()}
+
+def test_lote_con_varias_placas_cobra_cada_una(aws, cargar, monkeypatch):
+    monkeypatch.setenv('PROCESSOR_CONCURRENCY', '4')
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    placas = [f"P-{n}00AAA" for n in range(1, 5)]
+    for placa in placas:
+        aws.tabla('UsersTable').put_item(Item={'placa': placa, 'tipo_usuario': 'registrado',
+                                               'saldo_disponible': Decimal('100')})
+    app = cargar('processor')
+    records = [
+        {'messageId': f"{placa}-{minuto}", 'attributes': {'MessageGroupId': placa},
+         'body': json.dumps({'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': f"2025-01-20T10:0{minuto}:00Z",
+                             'user_type': 'registrado', 'has_tag': False})}
+        for placa in placas for minuto in (1, 2)
+    ]
+
+    respuesta = app.lambda_handler({'Records': records}, None)
+
+    assert respuesta['batchItemFailures'] == []
+    for placa in placas:
+        assert aws.tabla('UsersTable').get_item(Key={'placa': placa})['Item']['saldo_disponible'] == Decimal('50.00')
+    assert len(aws.tabla('TransactionsTable').scan()['Items']) == 8
@@ -0,0 +1,86 @@
+"""Motivo de cada falla y reenvío de la DLQ por tipo, sin duplicar cruces (user-048)"""
+import json
+from decimal import Decimal
+
+import pytest
+
+def cruce(placa):
+    return {'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': '2025-01-20T10:00:00Z',
+            'user_type': 'registrado', 'has_tag': False}
+
+def test_processor_registra_el_motivo_de_la_falla(aws, cargar, monkeypatch):
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '1')
+    monkeypatch.setenv('PAYMENT_MAX_ATTEMPTS', '1')
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-100AAA', 'tipo_usuario': 'registrado',
+                                           'metodo_pago': 'tarjeta_credito', 'saldo_disponible': Decimal('100')})
+    app = cargar('processor')
+    dead_letters = cargar('processor', 'dead_letters')
+
+    respuesta = app.lambda_handler({'Records': [
+        {'messageId': 'm-1', 'body': json.dumps(cruce('P-100AAA')), 'attributes': {'ApproximateReceiveCount': '3'}},
+        {'messageId': 'm-2', 'body': '{"placa": "P-', 'attributes': {}}
+    ]}, None)
+
+    assert sorted(f['itemIdentifier'] for f in respuesta['batchItemFailures']) == ['m-1', 'm-2']
+    fallo = lambda message_id: aws.tabla('CountersTable').get_item(Key=dead_letters.clave_fallo(message_id))['Item']
+    assert (fallo('m-1')['tipo_error'], fallo('m-1')['placa'], fallo('m-1')['recepciones']) == (
+        'pasarela_no_disponible', 'P-100AAA', 3)
+    assert fallo('m-2')['tipo_error'] == 'json_invalido'
+
+@pytest.fixture
+def dlq(aws, cargar):
+    redrive_dlq = cargar('scripts', 'redrive_dlq')
+    url = aws.colas['ProcessingDeadLetterQueue']
+    counters = aws.tabla('CountersTable')
+
+    def agregar(body, tipo=None):
+        message_id = aws.sqs.send_message(QueueUrl=url, MessageBody=body)['MessageId']
+        if tipo:
+            counters.put_item(Item={**redrive_dlq.clave_fallo(message_id), 'tipo_error': tipo})
+        return message_id
+
+    redrive = redrive_dlq.Redrive(aws.sqs, url, aws.colas['ProcessingQueue'], counters,
+                                  aws.tabla('TransactionsTable'), dormir=lambda s: None)
+    return redrive, agregar
+
+def test_reenvia_solo_el_tipo_elegido(aws, dlq):
+    redrive, agregar = dlq
+    agregar(json.dumps(cruce('P-100AAA')), 'pasarela_no_disponible')
+    agregar(json.dumps(cruce('P-200BBB')), 'aws:ProvisionedThroughputExceededException')
+    agregar(json.dumps(cruce('P-300CCC')), 'mensaje_incompleto')
+
+    conteo = redrive.reenviar(['pasarela_no_disponible'], tasa=1000)
+
+    assert conteo == {'reenviados': 1, 'ya_procesados': 0, 'ya_reenviados': 0, 'errores': 0}
+    assert [m['placa'] for m in aws.mensajes()] == ['P-100AAA']
+    # Lo no elegido vuelve a estar visible en la DLQ
+    assert len(aws.mensajes('ProcessingDeadLetterQueue')) == 2
+
+def test_todos_no_reenvia_mensajes_malos_ni_cruces_ya_guardados(aws, dlq):
+    redrive, agregar = dlq
+    agregar(json.dumps(cruce('P-100AAA')), 'pasarela_no_disponible')
+    agregar(json.dumps(cruce('P-200BBB')), 'pasarela_no_disponible')
+    agregar('{"placa": "P-', 'json_invalido')
+    # P-200BBB se procesó en una entrega posterior cuyo borrado de la DLQ no llegó
+    aws.tabla('TransactionsTable').put_item(Item={'transaction_id': 'TXN-1', **cruce('P-200BBB')})
+
+    conteo = redrive.reenviar(['todos'], tasa=1000)
+
+    assert (conteo['reenviados'], conteo['ya_procesados']) == (1, 1)
+    assert [m['placa'] for m in aws.mensajes()] == ['P-100AAA']
+    # El JSON inválido sigue en la DLQ hasta corregir el productor
+    restantes = aws.sqs.receive_message(QueueUrl=aws.colas['ProcessingDeadLetterQueue'], MaxNumberOfMessages=10)
+    assert [m['Body'] for m in restantes['Messages']] == ['{"placa": "P-']
+
+def test_mensaje_ya_reenviado_no_se_duplica(aws, dlq):
+    redrive, agregar = dlq
+    message_id = agregar(json.dumps(cruce('P-100AAA')), 'pasarela_no_disponible')
+    # Una corrida anterior lo reenvió y se interrumpió antes de borrarlo de la DLQ
+    assert redrive.marcar(message_id)
+
+    conteo = redrive.reenviar(['pasarela_no_disponible'], tasa=1000)
+
+    assert (conteo['reenviados'], conteo['ya_reenviados']) == (0, 1)
+    assert aws.mensajes() == []
+    assert aws.mensajes('ProcessingDeadLetterQueue') == []
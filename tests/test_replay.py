@@ -0,0 +1,112 @@
+"""Replay de backlog con orden por placa entre lotes y continuaciones (user-027)"""
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+BUCKET = 'replaybucket'
+KEY = 'backlog/PEAJE_ZONA10/2025-11-14.ndjson'
+INICIO = datetime.now(timezone.utc) - timedelta(days=2)
+
+def ts(minuto):
+    return (INICIO + timedelta(minutes=minuto)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def cruce(placa, minuto):
+    return {'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ts(minuto)}
+
+def preparar(aws, monkeypatch, lineas, chunk='2', ventana='2'):
+    monkeypatch.setenv('REPLAY_CHUNK_SIZE', chunk)
+    monkeypatch.setenv('REPLAY_REORDER_WINDOW', ventana)
+    for placa in ('P-100AAA', 'P-200BBB'):
+        aws.tabla('UsersTable').put_item(Item={'placa': placa, 'tipo_usuario': 'registrado',
+                                               'saldo_disponible': Decimal('100')})
+    aws.s3.put_object(Bucket=BUCKET, Key=KEY, Body='\n'.join(json.dumps(l) for l in lineas).encode('utf-8'))
+
+def evento_s3():
+    return {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': KEY}}}]}
+
+def reporte(aws):
+    keys = [o['Key'] for o in aws.s3.list_objects_v2(Bucket=BUCKET, Prefix='reportes/')['Contents']]
+    return json.loads(aws.s3.get_object(Bucket=BUCKET, Key=sorted(keys)[-1])['Body'].read())
+
+def por_placa(mensajes):
+    resultado = {}
+    for m in mensajes:
+        resultado.setdefault(m['placa'], []).append((m['replay_seq'], m['timestamp']))
+    return resultado
+
+def test_ventana_ordena_entre_lotes_y_numera_por_placa(aws, cargar, monkeypatch):
+    # Minuto 5 llega antes que 1, 2 y 3; con lotes de 2 el orden antiguo los encolaba después
+    preparar(aws, monkeypatch, [cruce('P-100AAA', 5), cruce('P-200BBB', 4), cruce('P-100AAA', 1),
+                                cruce('P-100AAA', 2), cruce('P-100AAA', 3)], ventana='10')
+    replay = cargar('webhook', 'replay')
+
+    replay.lambda_handler(evento_s3(), None)
+
+    mensajes = por_placa(aws.mensajes())
+    assert mensajes['P-100AAA'] == [(1, ts(1)), (2, ts(2)), (3, ts(3)), (4, ts(5))]
+    assert mensajes['P-200BBB'] == [(1, ts(4))]
+    assert reporte(aws)['fuera_de_orden'] == 0
+
+def test_desorden_mayor_que_la_ventana_se_rechaza(aws, cargar, monkeypatch):
+    preparar(aws, monkeypatch, [cruce('P-100AAA', 9), cruce('P-200BBB', 10), cruce('P-200BBB', 11),
+                                cruce('P-200BBB', 12), cruce('P-200BBB', 13), cruce('P-100AAA', 1)], chunk='1', ventana='1')
+    replay = cargar('webhook', 'replay')
+
+    replay.lambda_handler(evento_s3(), None)
+
+    assert [t for _, t in por_placa(aws.mensajes())['P-100AAA']] == [ts(9)]
+    stats = reporte(aws)
+    assert stats['fuera_de_orden'] == 1
+    assert stats['rechazos'][0]['linea'] == 6
+
+def test_continuacion_sigue_la_numeracion(aws, cargar, monkeypatch):
+    preparar(aws, monkeypatch, [cruce('P-100AAA', minuto) for minuto in range(6)], chunk='2', ventana='0')
+    replay = cargar('webhook', 'replay')
+    continuaciones = []
+    monkeypatch.setattr(replay, 'continue_later',
+                        lambda context, bucket, key, offset, line, checkpoint: continuaciones.append(
+                            {'bucket': bucket, 'key': key, 'offset': offset, 'line': line, 'checkpoint': checkpoint}))
+
+    class PocoTiempo:
+        function_name = 'webhook-replay-test'
+        def get_remaining_time_in_millis(self):
+            return 1000
+
+    replay.lambda_handler(evento_s3(), PocoTiempo())
+    # Sin tiempo, cada invocación lee una línea y deja checkpoint; la última termina el archivo
+    for continuacion in continuaciones:
+        replay.lambda_handler(continuacion, PocoTiempo())
+
+    assert len(continuaciones) == 5
+    assert por_placa(aws.mensajes())['P-100AAA'] == [(seq, ts(seq - 1)) for seq in range(1, 7)]
+
+def test_checkpoint_sin_llenar_la_ventana(aws, cargar, monkeypatch):
+    # Ventana más grande que el archivo: antes el tiempo solo se revisaba al vaciarla
+    preparar(aws, monkeypatch, [cruce('P-100AAA', 1), cruce('P-200BBB', 2), cruce('P-100AAA', 3)], ventana='100')
+    replay = cargar('webhook', 'replay')
+    continuaciones = []
+    monkeypatch.setattr(replay, 'continue_later',
+                        lambda context, bucket, key, offset, line, checkpoint: continuaciones.append(checkpoint))
+    reloj = iter([60000, 1000])
+
+    class TiempoQueSeAcaba:
+        function_name = 'webhook-replay-test'
+        def get_remaining_time_in_millis(self):
+            return next(reloj)
+
+    replay.lambda_handler(evento_s3(), TiempoQueSeAcaba())
+
+    assert len(continuaciones) == 1
+    checkpoint = json.loads(aws.s3.get_object(Bucket=BUCKET, Key=continuaciones[0])['Body'].read())
+    assert checkpoint == {'P-100AAA': [ts(1), 1], 'P-200BBB': [ts(2), 1]}
+    assert reporte(aws)['parcial'] is True
+
+def test_mismo_archivo_otra_vez_repite_la_numeracion(aws, cargar, monkeypatch):
+    preparar(aws, monkeypatch, [cruce('P-100AAA', 1), cruce('P-100AAA', 2)])
+    replay = cargar('webhook', 'replay')
+
+    replay.lambda_handler(evento_s3(), None)
+    replay.lambda_handler(evento_s3(), None)
+
+    # Mismos replay_seq: el processor descarta la segunda vuelta (test_replay_order)
+    assert sorted(seq for seq, _ in por_placa(aws.mensajes())['P-100AAA']) == [1, 1, 2, 2]
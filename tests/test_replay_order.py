@@ -0,0 +1,62 @@
+"""El processor aplica los cruces de replay de cada placa en orden de replay_seq (user-027)"""
+import json
+
+def registro(message_id, seq, recepciones=1, placa='P-100AAA'):
+    body = {'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': f"2025-11-14T10:0{seq}:00Z",
+            'user_type': 'registrado', 'origen': 'replay', 'replay_archivo': 'backlog/PEAJE_ZONA10/a.ndjson',
+            'replay_clave': placa, 'replay_seq': seq}
+    return {'messageId': message_id, 'body': json.dumps(body),
+            'attributes': {'ApproximateReceiveCount': str(recepciones)}}
+
+def procesar(app, *records):
+    respuesta = app.lambda_handler({'Records': list(records)}, None)
+    return [f['itemIdentifier'] for f in respuesta['batchItemFailures']]
+
+def test_espera_al_anterior_y_descarta_los_ya_aplicados(aws, cargar, monkeypatch):
+    app = cargar('processor')
+    aplicados = []
+    monkeypatch.setattr(app, 'procesar_registro', lambda data: aplicados.append(data['replay_seq']))
+
+    # Llega el 2 antes que el 1: vuelve a la cola sin registrar fallo
+    assert procesar(app, registro('m2', 2)) == ['m2']
+    assert aplicados == []
+    assert 'Item' not in aws.tabla('CountersTable').get_item(Key={'contador': 'fallo#m2'})
+
+    assert procesar(app, registro('m1', 1)) == []
+    assert procesar(app, registro('m2', 2, recepciones=2)) == []
+    # Reentrega del 1 (o el mismo archivo subido otra vez): ya aplicado
+    assert procesar(app, registro('m1', 1, recepciones=2)) == []
+    assert aplicados == [1, 2]
+
+def test_en_el_mismo_lote_se_aplican_en_orden(aws, cargar, monkeypatch):
+    app = cargar('processor')
+    aplicados = []
+    monkeypatch.setattr(app, 'procesar_registro', lambda data: aplicados.append(data['replay_seq']))
+
+    assert procesar(app, registro('m1', 1), registro('m2', 2), registro('m4', 4), registro('m5', 5)) == ['m4', 'm5']
+    assert aplicados == [1, 2]
+
+def test_hueco_se_salta_tras_max_esperas(aws, cargar, monkeypatch):
+    monkeypatch.setenv('REPLAY_MAX_ESPERAS', '3')
+    app = cargar('processor')
+    aplicados = []
+    monkeypatch.setattr(app, 'procesar_registro', lambda data: aplicados.append(data['replay_seq']))
+
+    procesar(app, registro('m1', 1))
+    # El 2 nunca se encoló (falló SendMessageBatch): el 3 espera hasta su tercera entrega
+    assert procesar(app, registro('m3', 3, recepciones=2)) == ['m3']
+    assert procesar(app, registro('m3', 3, recepciones=3)) == []
+    assert aplicados == [1, 3]
+
+def test_error_al_procesar_no_avanza_el_cursor(aws, cargar, monkeypatch):
+    app = cargar('processor')
+
+    def falla(data):
+        raise RuntimeError('DynamoDB no disponible')
+    monkeypatch.setattr(app, 'procesar_registro', falla)
+    assert procesar(app, registro('m1', 1)) == ['m1']
+
+    aplicados = []
+    monkeypatch.setattr(app, 'procesar_registro', lambda data: aplicados.append(data['replay_seq']))
+    assert procesar(app, registro('m1', 1, recepciones=2)) == []
+    assert aplicados == [1]
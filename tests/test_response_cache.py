@@ -0,0 +1,65 @@
+"""Caché de historial por contenedor, invalidada por la versión de la placa (user-040)"""
+from decimal import Decimal
+
+import pytest
+
+@pytest.fixture
+def invoices(aws, cargar):
+    return cargar('invoices')
+
+def guardar_cruce(aws, cargar, timestamp):
+    """Lo que deja el processor: la factura y el incremento de version#<placa>"""
+    aws.tabla('TransactionsTable').put_item(Item={
+        'transaction_id': f"TXN-{timestamp}", 'placa': 'P-220BBB', 'peaje_id': 'PEAJE_ZONA10',
+        'timestamp': timestamp, 'monto': Decimal('52.50'), 'user_type': 'no_registrado',
+        'tipo_escenario': 'no_registrado_tradicional',
+        'resultado': {'factura': {'factura_id': f"FACT-{timestamp}", 'fecha_emision': timestamp}}
+    })
+    aws.tabla('CountersTable').update_item(
+        Key=cargar('invoices', 'http_cache').clave_version('P-220BBB'),
+        UpdateExpression='ADD #version :uno', ExpressionAttributeNames={'#version': 'version'},
+        ExpressionAttributeValues={':uno': 1})
+
+def consultar(invoices):
+    return invoices.lambda_handler({
+        'resource': '/history/invoices/{placa}', 'pathParameters': {'placa': 'P-220BBB'}
+    }, None)
+
+def test_repetida_sale_de_cache_sin_consultar_transacciones(aws, cargar, invoices, monkeypatch):
+    guardar_cruce(aws, cargar, '2025-01-20T10:00:00Z')
+    primera = consultar(invoices)
+    consultas = []
+    query = invoices.transactions_table.query
+    monkeypatch.setattr(invoices.transactions_table, 'query', lambda **kw: consultas.append(kw) or query(**kw))
+
+    segunda = consultar(invoices)
+
+    assert 'X-Cache' not in primera['headers']
+    assert segunda['headers']['X-Cache'] == 'HIT'
+    assert segunda['body'] == primera['body']
+    assert consultas == []
+
+def test_cruce_nuevo_invalida_la_entrada(aws, cargar, invoices):
+    guardar_cruce(aws, cargar, '2025-01-20T10:00:00Z')
+    consultar(invoices)
+    guardar_cruce(aws, cargar, '2025-01-21T10:00:00Z')
+
+    respuesta = consultar(invoices)
+
+    assert 'X-Cache' not in respuesta['headers']
+    assert '"total_invoices": 2, "total_en_pagina": 2' in respuesta['body']
+    assert invoices.response_cache.estadisticas()['invalidadas'] == 1
+
+def test_limites_por_bytes_y_ttl(cargar):
+    response_cache = cargar('invoices', 'response_cache')
+    ahora = [0.0]
+    cache = response_cache.ResponseCache(max_entradas=10, max_bytes=10, ttl_segundos=60, reloj=lambda: ahora[0])
+
+    cache.guardar('a', '1', 'x' * 6)
+    cache.guardar('b', '1', 'y' * 6)
+    assert cache.obtener('a', '1') is None
+    assert cache.obtener('b', '1') == 'y' * 6
+
+    ahora[0] = 61
+    assert cache.obtener('b', '1') is None
+    assert cache.estadisticas()['bytes'] == 0
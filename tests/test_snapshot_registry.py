@@ -0,0 +1,117 @@
+"""Tags y placas cambiados después del snapshot se leen de DynamoDB (user-028)"""
+import json
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+def ahora():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+TAG = {'tag_id': 'TAG-001', 'placa': 'P-200BBB', 'estado': 'activo', 'metodo_pago': 'tarjeta_debito'}
+USUARIO = {'placa': 'P-200BBB', 'tipo_usuario': 'registrado', 'email': 'p200@guatepass.com',
+           'metodo_pago': 'tarjeta_debito', 'tiene_tag': True, 'tag_id': 'TAG-001', 'saldo_disponible': Decimal('100')}
+
+class SnapshotFijo:
+    """SnapshotLoader con un archivo ya construido"""
+    def __init__(self, index):
+        self.index = index
+
+    def get(self):
+        return self.index
+
+def sembrar(aws):
+    aws.tabla('UsersTable').put_item(Item=USUARIO)
+    aws.tabla('TagsTable').put_item(Item=TAG)
+
+def con_snapshot(app, snapshot_index, tmp_path, hace_segundos=60):
+    """Snapshot de hace un minuto con el tag activo, en el validador del webhook"""
+    path = str(tmp_path / 'index.bin')
+    snapshot_index.write_snapshot(path, [TAG], [USUARIO], version_ms=int((time.time() - hace_segundos) * 1000))
+    app.validator.snapshot_loader = SnapshotFijo(snapshot_index.SnapshotIndex(path))
+
+def cruce_con_tag():
+    return {'body': json.dumps({'placa': 'P-200BBB', 'tag_id': 'TAG-001', 'peaje_id': 'PEAJE_ZONA10',
+                                'timestamp': ahora()})}
+
+def desactivar(aws, registry_changes):
+    aws.tabla('TagsTable').update_item(Key={'tag_id': 'TAG-001'}, UpdateExpression='SET estado = :e REMOVE placa',
+                                       ExpressionAttributeValues={':e': 'inactivo'})
+    registry_changes.registrar_cambios(aws.tabla('CountersTable'), ['TAG-001'], ['P-200BBB'])
+
+def test_tag_desactivado_despues_del_snapshot_no_se_cobra_como_tag(aws, cargar, tmp_path):
+    sembrar(aws)
+    app = cargar('webhook')
+    con_snapshot(app, cargar('webhook', 'snapshot_index'), tmp_path)
+    desactivar(aws, cargar('webhook', 'registry_changes'))
+
+    respuesta = app.lambda_handler(cruce_con_tag(), None)
+
+    assert respuesta['statusCode'] == 400
+    assert 'Tag is not active' in json.loads(respuesta['body'])['error']['message']
+    assert aws.mensajes() == []
+
+def test_lote_tampoco_usa_la_entrada_vieja(aws, cargar, tmp_path):
+    sembrar(aws)
+    app = cargar('webhook')
+    con_snapshot(app, cargar('webhook', 'snapshot_index'), tmp_path)
+    desactivar(aws, cargar('webhook', 'registry_changes'))
+
+    respuesta = app.lambda_handler({'resource': '/webhook/toll/batch', 'body': json.dumps({'transacciones': [
+        {'tag_id': 'TAG-001', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora()}]})}, None)
+
+    resultado = json.loads(respuesta['body'])['resultados'][0]
+    assert resultado['estado'] == 'rechazada'
+    assert 'not associated' in resultado['error']['message']
+
+def test_llave_sin_cambios_sigue_saliendo_del_snapshot(aws, cargar, tmp_path):
+    # Solo el snapshot conoce el tag: si se consultara DynamoDB el cruce se rechazaría
+    aws.tabla('UsersTable').put_item(Item=USUARIO)
+    app = cargar('webhook')
+    con_snapshot(app, cargar('webhook', 'snapshot_index'), tmp_path)
+    cargar('webhook', 'registry_changes').registrar_cambios(aws.tabla('CountersTable'), ['TAG-999'], [])
+
+    respuesta = app.lambda_handler(cruce_con_tag(), None)
+
+    assert respuesta['statusCode'] == 200
+    assert json.loads(respuesta['body'])['has_active_tag'] is True
+
+def test_carga_masiva_invalida_todo_el_snapshot(aws, cargar, tmp_path):
+    sembrar(aws)
+    app = cargar('webhook')
+    con_snapshot(app, cargar('webhook', 'snapshot_index'), tmp_path)
+    aws.tabla('TagsTable').delete_item(Key={'tag_id': 'TAG-001'})
+    cargar('webhook', 'registry_changes').registrar_reinicio(aws.tabla('CountersTable'))
+
+    respuesta = app.lambda_handler(cruce_con_tag(), None)
+
+    assert respuesta['statusCode'] == 400
+    assert 'Tag ID not found' in json.loads(respuesta['body'])['error']['message']
+
+def test_desasociar_tag_anota_tag_y_placa(aws, cargar):
+    sembrar(aws)
+    tags = cargar('tags')
+
+    respuesta = tags.lambda_handler({'httpMethod': 'DELETE', 'path': '/users/P-200BBB/tag',
+                                     'pathParameters': {'placa': 'P-200BBB'}, 'body': '{}'}, None)
+
+    assert respuesta['statusCode'] == 200
+    cambios = aws.tabla('CountersTable').get_item(Key={'contador': 'registro#cambios'})['Item']
+    assert {'tag#TAG-001', 'placa#P-200BBB'} <= set(cambios)
+
+def test_builder_versiona_al_inicio_del_scan_y_purga(aws, cargar, monkeypatch):
+    sembrar(aws)
+    monkeypatch.setenv('SNAPSHOT_BUCKET', 'indexbucket')
+    monkeypatch.setenv('SNAPSHOT_KEY', 'snapshots/index.bin')
+    monkeypatch.setenv('SNAPSHOT_MAX_AGE_SECONDS', '900')
+    snapshot_index = cargar('webhook', 'snapshot_index')
+    counters = aws.tabla('CountersTable')
+    counters.put_item(Item={'contador': 'registro#cambios', 'tag#TAG-VIEJO': int((time.time() - 3600) * 1000),
+                            'tag#TAG-NUEVO': int(time.time() * 1000)})
+    antes = int(time.time() * 1000)
+
+    stats = snapshot_index.build_handler({}, None)
+
+    assert antes <= stats['version_ms'] <= int(time.time() * 1000)
+    cambios = counters.get_item(Key={'contador': 'registro#cambios'})['Item']
+    assert 'tag#TAG-VIEJO' not in cambios
+    assert 'tag#TAG-NUEVO' in cambios
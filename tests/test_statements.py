@@ -0,0 +1,91 @@
+"""El estado de cuenta mensual cuadra con lo que el processor cobró (user-033)"""
+import json
+from decimal import Decimal
+
+def entrega(app, peaje_id, timestamp, message_id):
+    body = json.dumps({'placa': 'P-700GGG', 'peaje_id': peaje_id, 'timestamp': timestamp,
+                       'user_type': 'no_registrado', 'has_tag': False})
+    return app.lambda_handler({'Records': [{'messageId': message_id, 'body': body, 'attributes': {}}]}, None)
+
+def test_cruce_consolidado_sin_multa_factura_ni_notificacion(aws, cargar, monkeypatch):
+    monkeypatch.setenv('CONSOLIDATED_STATEMENTS', 'true')
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-700GGG', 'tipo_usuario': 'no_registrado',
+                                           'email': 'p700@correo.com', 'saldo_disponible': Decimal('100')})
+    app = cargar('processor')
+    publicados = []
+    monkeypatch.setattr(app.sns, 'publish', lambda **kwargs: publicados.append(kwargs))
+
+    entrega(app, 'PEAJE_ZONA12', '2025-01-20T10:33:00Z', 'm-1')
+    entrega(app, 'PEAJE_ZONA10', '2025-01-27T18:05:00Z', 'm-2')
+
+    # 20 * 1.5 + 25 * 1.5, sin la multa de Q15 por cruce
+    assert aws.tabla('UsersTable').get_item(Key={'placa': 'P-700GGG'})['Item']['saldo_disponible'] == Decimal('32.50')
+    items = aws.tabla('TransactionsTable').scan()['Items']
+    assert all(item.get('consolidado') and 'factura_id' not in item for item in items)
+    assert publicados == []
+    assert 'siguiente' not in aws.tabla('CountersTable').get_item(Key={'contador': 'FACT'}).get('Item', {})
+
+def transaccion(schema, placa, timestamp, monto, resultado):
+    return schema.compactar_transaccion({
+        'transaction_id': f"TXN-{timestamp}", 'placa': placa, 'peaje_id': 'PEAJE_ZONA10', 'timestamp': timestamp,
+        'monto': Decimal(monto), 'user_type': 'no_registrado', 'has_tag': False,
+        'tipo_escenario': 'no_registrado_tradicional',
+        'resultado': {'tipo_escenario': 'no_registrado_tradicional', **resultado}
+    })
+
+def test_total_del_estado_igual_a_lo_cobrado_mas_una_multa(aws, cargar, tmp_path):
+    schema = cargar('invoices', 'transaction_schema')
+    statements = cargar('invoices', 'statements')
+    transacciones = aws.tabla('TransactionsTable')
+    for dia in ('05', '12', '19'):
+        transacciones.put_item(Item=transaccion(schema, 'P-700GGG', f"2025-01-{dia}T10:00:00Z", '37.50',
+                                                {'consolidado': True, 'pago_real': True}))
+    # Sin saldo: el cruce está en el estado pero no se cobró
+    transacciones.put_item(Item=transaccion(schema, 'P-700GGG', '2025-01-26T10:00:00Z', '37.50',
+                                            {'consolidado': True, 'pago_real': False}))
+
+    statements.generar_estados(transacciones, aws.tabla('StatementsTable'), '2025-01', segmentos=2, shards=2,
+                               workers=2, directorio=str(tmp_path))
+
+    estado = aws.tabla('StatementsTable').get_item(Key={'placa': 'P-700GGG', 'periodo': '2025-01'})['Item']
+    assert estado['total_cruces'] == 4
+    assert estado['subtotal_peajes'] == Decimal('150.00')
+    assert estado['total'] == Decimal('165.00')
+    assert estado['total_cobrado'] == Decimal('112.50')
+    assert estado['saldo_pendiente'] == Decimal('52.50')
+    assert [linea['monto'] for linea in estado['lineas']] == [Decimal('37.50')] * 4
+
+def test_cruce_facturado_antes_de_consolidar_ya_pago_su_multa(aws, cargar):
+    statements = cargar('invoices', 'statements')
+    lineas = [('2025-01-05T10:00:00Z', 'TXN-1', 'FACT-0000000001', 'PEAJE_ZONA10', '52.50', '1'),
+              ('2025-01-12T10:00:00Z', 'TXN-2', '', 'PEAJE_ZONA10', '37.50', '1')]
+
+    estado, = statements.construir_estado('P-700GGG', '2025-01', lineas, '2025-02-01T06:00:00Z')
+
+    assert [linea['monto'] for linea in estado['lineas']] == [Decimal('37.50'), Decimal('37.50')]
+    assert estado['total'] == Decimal('90.00')
+    assert estado['total_cobrado'] == Decimal('90.00')
+    assert estado['saldo_pendiente'] == Decimal('0')
+
+def test_mes_regenerado_con_menos_partes_no_mezcla_las_viejas(aws, cargar, monkeypatch):
+    monkeypatch.setenv('STATEMENTS_TABLE', 'StatementsTable')
+    statements = cargar('invoices', 'statements')
+    invoices = cargar('invoices')
+    monkeypatch.setattr(statements, 'LINEAS_POR_ITEM', 2)
+    tabla = aws.tabla('StatementsTable')
+    linea = lambda dia: (f"2025-01-{dia}T10:00:00Z", f"TXN-{dia}", '', 'PEAJE_ZONA10', '37.50', '1')
+
+    # Primera corrida: 5 líneas en 3 partes; la segunda solo encuentra 3 líneas (2 partes)
+    statements.guardar_estados(tabla, statements.construir_estado('P-700GGG', '2025-01', [linea(d) for d in (
+        '01', '02', '03', '04', '05')], '2025-02-01T06:00:00Z'))
+    statements.guardar_estados(tabla, statements.construir_estado('P-700GGG', '2025-01', [linea(d) for d in (
+        '01', '02', '03')], '2025-02-01T07:00:00Z'))
+    # Parte sin encabezado de un mes anterior
+    tabla.put_item(Item={'placa': 'P-700GGG', 'periodo': '2024-12#001', 'lineas': [{'transaction_id': 'TXN-X'}]})
+
+    respuesta = invoices.lambda_handler({'resource': '/history/statements/{placa}', 'httpMethod': 'GET',
+                                         'pathParameters': {'placa': 'P-700GGG'}}, None)
+
+    assert respuesta['statusCode'] == 200
+    estado, = json.loads(respuesta['body'])['statements']
+    assert [linea['transaction_id'] for linea in estado['lineas']] == ['TXN-01', 'TXN-02', 'TXN-03']
@@ -0,0 +1,73 @@
+"""Tag y usuario se escriben juntos o no se escribe nada (user-041)"""
+import json
+
+import pytest
+
+@pytest.fixture
+def tags(aws, cargar):
+    for placa in ('P-456DEF', 'P-789GHI'):
+        aws.tabla('UsersTable').put_item(Item={'placa': placa, 'tipo_usuario': 'registrado'})
+    return cargar('tags')
+
+def evento(metodo, placa, body=None):
+    return {'httpMethod': metodo, 'path': f"/users/{placa}/tag", 'pathParameters': {'placa': placa},
+            'body': json.dumps(body or {})}
+
+def codigo(respuesta):
+    return respuesta['statusCode'], json.loads(respuesta['body'])['error']['code']
+
+def usuario(aws, placa):
+    return aws.tabla('UsersTable').get_item(Key={'placa': placa})['Item']
+
+def test_tag_en_uso_no_se_asocia_a_otra_placa(aws, tags):
+    tags.lambda_handler(evento('POST', 'P-456DEF', {'tag_id': 'TAG-001'}), None)
+
+    respuesta = tags.lambda_handler(evento('POST', 'P-789GHI', {'tag_id': 'TAG-001'}), None)
+
+    assert codigo(respuesta) == (400, 'TAG_IN_USE')
+    assert 'tag_id' not in usuario(aws, 'P-789GHI')
+    assert aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-001'})['Item']['placa'] == 'P-456DEF'
+
+def test_usuario_inexistente_no_deja_tag_huerfano(aws, tags):
+    respuesta = tags.lambda_handler(evento('POST', 'P-000ZZZ', {'tag_id': 'TAG-009'}), None)
+
+    assert codigo(respuesta) == (404, 'USER_NOT_FOUND')
+    assert 'Item' not in aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-009'})
+
+def test_get_devuelve_el_tag_del_usuario(aws, tags):
+    tags.lambda_handler(evento('POST', 'P-456DEF', {'tag_id': 'TAG-001', 'metodo_pago': 'tarjeta_credito'}), None)
+
+    respuesta = json.loads(tags.lambda_handler(evento('GET', 'P-456DEF'), None)['body'])
+
+    assert respuesta['tag_info']['tag_id'] == 'TAG-001'
+    assert respuesta['tag_info']['metodo_pago'] == 'tarjeta_credito'
+
+def test_get_no_crea_un_pool_de_hilos_por_request(aws, tags, monkeypatch):
+    tags.lambda_handler(evento('POST', 'P-456DEF', {'tag_id': 'TAG-001', 'metodo_pago': 'tarjeta_credito'}), None)
+    monkeypatch.setattr(tags, 'ThreadPoolExecutor', lambda *a, **k: pytest.fail('GET creó un ThreadPoolExecutor'))
+
+    for _ in range(2):
+        respuesta = json.loads(tags.lambda_handler(evento('GET', 'P-456DEF'), None)['body'])
+        assert respuesta['tag_info']['tag_id'] == 'TAG-001'
+
+def test_delete_desactiva_tag_y_usuario_juntos(aws, tags):
+    tags.lambda_handler(evento('POST', 'P-456DEF', {'tag_id': 'TAG-001'}), None)
+
+    respuesta = tags.lambda_handler(evento('DELETE', 'P-456DEF', {'razon': 'venta'}), None)
+
+    assert respuesta['statusCode'] == 200
+    tag = aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-001'})['Item']
+    assert (tag['estado'], 'placa' in tag) == ('inactivo', False)
+    assert (usuario(aws, 'P-456DEF')['tiene_tag'], 'tag_id' in usuario(aws, 'P-456DEF')) == (False, False)
+
+def test_delete_con_tag_reasignado_responde_conflicto(aws, tags):
+    tags.lambda_handler(evento('POST', 'P-456DEF', {'tag_id': 'TAG-001'}), None)
+    # Otro request movió el tag a otra placa después de leer al usuario
+    aws.tabla('TagsTable').update_item(Key={'tag_id': 'TAG-001'}, UpdateExpression='SET placa = :p',
+                                       ExpressionAttributeValues={':p': 'P-789GHI'})
+
+    respuesta = tags.lambda_handler(evento('DELETE', 'P-456DEF'), None)
+
+    assert codigo(respuesta) == (409, 'CONFLICT')
+    assert usuario(aws, 'P-456DEF')['tag_id'] == 'TAG-001'
+    assert aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-001'})['Item']['estado'] == 'activo'
@@ -0,0 +1,72 @@
+"""PUT /users/{placa}/tag sin leer al usuario salvo para responder errores: tag_id o el índice placa-index (user-042)"""
+import json
+
+import pytest
+
+@pytest.fixture
+def tags(aws, cargar):
+    for placa in ('P-456DEF', 'P-789GHI'):
+        aws.tabla('UsersTable').put_item(Item={'placa': placa, 'tipo_usuario': 'registrado'})
+    app = cargar('tags')
+    for placa, tag_id in (('P-456DEF', 'TAG-001'), ('P-789GHI', 'TAG-002')):
+        assert app.lambda_handler(evento('POST', placa, {'tag_id': tag_id, 'metodo_pago': 'tarjeta_credito'}),
+                                  None)['statusCode'] == 200
+    return app
+
+@pytest.fixture
+def sin_leer_usuario(tags, monkeypatch):
+    """Un PUT exitoso no lee al usuario; solo los errores lo leen para responder 404"""
+    monkeypatch.setattr(tags.users_table, 'get_item', lambda **kwargs: pytest.fail('PUT leyó al usuario'))
+
+def evento(metodo, placa, body):
+    return {'httpMethod': metodo, 'path': f"/users/{placa}/tag", 'pathParameters': {'placa': placa},
+            'body': json.dumps(body)}
+
+def test_put_con_tag_id_es_una_sola_llamada(aws, tags, sin_leer_usuario, monkeypatch):
+    monkeypatch.setattr(tags.tags_table, 'query', lambda **kwargs: pytest.fail('PUT consultó el índice'))
+
+    respuesta = tags.lambda_handler(evento('PUT', 'P-456DEF', {'tag_id': 'TAG-001', 'metodo_pago': 'tarjeta_debito'}), None)
+
+    assert respuesta['statusCode'] == 200
+    tag = json.loads(respuesta['body'])['tag']
+    assert (tag['tag_id'], tag['placa'], tag['metodo_pago']) == ('TAG-001', 'P-456DEF', 'tarjeta_debito')
+
+def test_put_sin_tag_id_usa_el_indice(aws, tags, sin_leer_usuario):
+    respuesta = tags.lambda_handler(evento('PUT', 'P-456DEF', {'configuracion': {'notificaciones': False}}), None)
+
+    assert respuesta['statusCode'] == 200
+    item = aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-001'})['Item']
+    assert item['configuracion'] == {'notificaciones': False}
+
+def test_put_con_tag_de_otra_placa_no_lo_modifica(aws, tags):
+    respuesta = tags.lambda_handler(evento('PUT', 'P-456DEF', {'tag_id': 'TAG-002', 'metodo_pago': 'tarjeta_debito'}), None)
+
+    assert respuesta['statusCode'] == 404
+    assert json.loads(respuesta['body'])['error']['code'] == 'TAG_NOT_FOUND'
+    assert aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-002'})['Item']['metodo_pago'] == 'tarjeta_credito'
+
+def test_put_sin_tag_activo(aws, tags):
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-111AAA', 'tipo_usuario': 'registrado'})
+
+    respuesta = tags.lambda_handler(evento('PUT', 'P-111AAA', {'metodo_pago': 'tarjeta_debito'}), None)
+
+    assert respuesta['statusCode'] == 400
+    assert json.loads(respuesta['body'])['error']['code'] == 'NO_TAG_ASSOCIATED'
+
+@pytest.mark.parametrize('body', [{'metodo_pago': 'tarjeta_debito'}, {'tag_id': 'TAG-001', 'metodo_pago': 'tarjeta_debito'}])
+def test_put_placa_inexistente(aws, tags, body):
+    respuesta = tags.lambda_handler(evento('PUT', 'P-999ZZZ', body), None)
+
+    assert respuesta['statusCode'] == 404
+    assert json.loads(respuesta['body'])['error']['code'] == 'USER_NOT_FOUND'
+
+def test_put_ignora_tag_inactivo_de_la_placa(aws, tags):
+    # Tag desactivado antes de que la desactivación quitara la placa del índice
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-111AAA', 'tipo_usuario': 'registrado'})
+    aws.tabla('TagsTable').put_item(Item={'tag_id': 'TAG-OLD', 'placa': 'P-111AAA', 'estado': 'inactivo'})
+
+    respuesta = tags.lambda_handler(evento('PUT', 'P-111AAA', {'metodo_pago': 'tarjeta_debito'}), None)
+
+    assert respuesta['statusCode'] == 400
+    assert json.loads(respuesta['body'])['error']['code'] == 'NO_TAG_ASSOCIATED'
+    assert 'metodo_pago' not in aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-OLD'})['Item']
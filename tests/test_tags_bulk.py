@@ -0,0 +1,86 @@
+"""POST /tags/bulk: cada operación se aplica o se rechaza sola (user-042)"""
+import json
+
+import pytest
+
+@pytest.fixture
+def tags(aws, cargar):
+    for placa in ('P-100AAA', 'P-200BBB', 'P-300CCC'):
+        aws.tabla('UsersTable').put_item(Item={'placa': placa, 'tipo_usuario': 'registrado'})
+    return cargar('tags')
+
+def bulk(tags, operaciones):
+    respuesta = tags.lambda_handler({'resource': '/tags/bulk', 'httpMethod': 'POST',
+                                     'body': json.dumps({'operaciones': operaciones})}, None)
+    return respuesta['statusCode'], json.loads(respuesta['body'])
+
+def errores(body):
+    return [r.get('error', {}).get('code') for r in body['resultados']]
+
+def test_lote_mixto_rechaza_solo_las_que_fallan(aws, tags):
+    bulk(tags, [{'operacion': 'asociar', 'placa': 'P-100AAA', 'tag_id': 'TAG-100'}])
+    # Tag desactivado: el registro sigue existiendo
+    aws.tabla('TagsTable').put_item(Item={'tag_id': 'TAG-777', 'estado': 'inactivo'})
+
+    status, body = bulk(tags, [
+        {'operacion': 'asociar', 'placa': 'P-200BBB', 'tag_id': 'TAG-200'},
+        {'operacion': 'asociar', 'placa': 'P-300CCC', 'tag_id': 'TAG-777'},
+        {'operacion': 'actualizar', 'placa': 'P-100AAA', 'metodo_pago': 'tarjeta_debito'},
+        {'operacion': 'asociar', 'placa': 'P-999ZZZ', 'tag_id': 'TAG-999'},
+        {'operacion': 'borrar', 'placa': 'P-300CCC'},
+    ])
+
+    assert status == 200
+    assert (body['aplicadas'], body['rechazadas']) == (2, 3)
+    assert errores(body) == [None, 'TAG_IN_USE', None, 'USER_NOT_FOUND', 'VALIDATION_ERROR']
+    assert aws.tabla('UsersTable').get_item(Key={'placa': 'P-200BBB'})['Item']['tag_id'] == 'TAG-200'
+    assert 'tag_id' not in aws.tabla('UsersTable').get_item(Key={'placa': 'P-300CCC'})['Item']
+    assert 'Item' not in aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-999'})
+    assert aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-100'})['Item']['metodo_pago'] == 'tarjeta_debito'
+
+def test_desactivar_sin_tag_id_lo_toma_del_usuario(aws, tags):
+    bulk(tags, [{'operacion': 'asociar', 'placa': 'P-100AAA', 'tag_id': 'TAG-100'}])
+
+    _, body = bulk(tags, [{'operacion': 'desactivar', 'placa': 'P-100AAA'},
+                          {'operacion': 'desactivar', 'placa': 'P-200BBB'}])
+
+    assert errores(body) == [None, 'NO_TAG_ASSOCIATED']
+    assert body['resultados'][0]['tag_id'] == 'TAG-100'
+    assert aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-100'})['Item']['estado'] == 'inactivo'
+
+def test_misma_placa_dos_veces_en_el_lote(aws, tags):
+    _, body = bulk(tags, [{'operacion': 'asociar', 'placa': 'P-100AAA', 'tag_id': 'TAG-100'},
+                          {'operacion': 'asociar', 'placa': 'P-100AAA', 'tag_id': 'TAG-101'}])
+
+    assert errores(body) == [None, 'DUPLICATE_OPERATION']
+    assert 'Item' not in aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-101'})
+
+def test_lote_demasiado_grande(aws, tags, monkeypatch):
+    monkeypatch.setattr(tags, 'MAX_BULK_OPERATIONS', 2)
+
+    status, body = bulk(tags, [{'operacion': 'desactivar', 'placa': 'P-100AAA'}] * 3)
+
+    assert (status, body['error']['code']) == (400, 'BATCH_TOO_LARGE')
+
+def test_usuario_no_leido_por_throttling_se_rechaza_solo(aws, tags, monkeypatch):
+    bulk(tags, [{'operacion': 'asociar', 'placa': 'P-100AAA', 'tag_id': 'TAG-100'},
+                {'operacion': 'asociar', 'placa': 'P-200BBB', 'tag_id': 'TAG-200'}])
+    batch_get_item = tags.dynamodb.batch_get_item
+    llamadas = []
+
+    def batch_get_con_throttling(RequestItems):
+        # P-200BBB nunca sale de UnprocessedKeys
+        llamadas.append(RequestItems)
+        response = batch_get_item(RequestItems=RequestItems)
+        tabla = tags.users_table.name
+        response['UnprocessedKeys'] = {tabla: {**RequestItems[tabla], 'Keys': [{'placa': 'P-200BBB'}]}}
+        return response
+    monkeypatch.setattr(tags.dynamodb, 'batch_get_item', batch_get_con_throttling)
+    monkeypatch.setattr(tags.bulk.time, 'sleep', lambda s: None)
+
+    _, body = bulk(tags, [{'operacion': 'desactivar', 'placa': 'P-100AAA'},
+                          {'operacion': 'desactivar', 'placa': 'P-200BBB'}])
+
+    assert errores(body) == [None, 'THROTTLED']
+    assert len(llamadas) == tags.bulk.MAX_ATTEMPTS
+    assert aws.tabla('TagsTable').get_item(Key={'tag_id': 'TAG-200'})['Item']['estado'] == 'activo'
@@ -0,0 +1,95 @@
+"""Historial combinado: S3 solo cuando DynamoDB se agota, páginas filtradas acotadas y archivado sin recorrer el índice (user-037)"""
+import pytest
+
+PLACA = 'P-100KKK'
+
+@pytest.fixture
+def archivo(aws, cargar):
+    modulo = cargar('history', 'transaction_archive')
+    llamadas = []
+
+    class S3Contado:
+        """Client de S3 que anota cada operación"""
+        def __getattr__(self, nombre):
+            llamadas.append(nombre)
+            return getattr(aws.s3, nombre)
+
+    archive = modulo.TransactionArchive('archivebucket', s3=S3Contado())
+    return modulo, archive, llamadas
+
+def fila(dia, hora, user_type='registrado', **extra):
+    return {'transaction_id': f"TXN-{dia}{hora}", 'placa': PLACA, 'peaje_id': 'PEAJE_ZONA10',
+            'timestamp': f"2025-{dia}T{hora}:00:00Z", 'monto': 25, 'user_type': user_type, **extra}
+
+def paginas(modulo, aws, archive, limite, **kwargs):
+    todas, cursor = [], None
+    while True:
+        filas, cursor = modulo.leer_pagina(aws.tabla('TransactionsTable'), archive, PLACA, limite, cursor, **kwargs)
+        todas.append([tx['transaction_id'] for tx in filas])
+        if not cursor:
+            return todas
+
+def test_pagina_reciente_no_toca_s3(aws, archivo):
+    modulo, archive, llamadas = archivo
+    archive.escribir_parte(PLACA, '2025-01', '2025-04-20', [fila('01-05', '10')])
+    llamadas.clear()
+    for hora in ('10', '11', '12'):
+        aws.tabla('TransactionsTable').put_item(Item=fila('05-01', hora))
+
+    filas, cursor = modulo.leer_pagina(aws.tabla('TransactionsTable'), archive, PLACA, limite=2)
+
+    assert [tx['transaction_id'] for tx in filas] == ['TXN-05-0112', 'TXN-05-0111']
+    assert cursor and llamadas == []
+
+def test_paginas_siguen_en_el_archivo_sin_repetir(aws, archivo):
+    modulo, archive, llamadas = archivo
+    archive.escribir_parte(PLACA, '2025-01', '2025-04-20', [fila('01-05', '10'), fila('01-06', '10')])
+    tabla = aws.tabla('TransactionsTable')
+    tabla.put_item(Item=fila('05-01', '10'))
+    # En la gracia del TTL: la fila sigue en DynamoDB marcada y también está en el archivo
+    tabla.put_item(Item=fila('01-06', '10', archivado=True))
+
+    assert paginas(modulo, aws, archive, 2) == [['TXN-05-0110', 'TXN-01-0610'], ['TXN-01-0510']]
+
+def test_pagina_filtrada_revisa_un_maximo_de_filas(aws, archivo):
+    modulo, archive, _ = archivo
+    tabla = aws.tabla('TransactionsTable')
+    for hora in range(10, 20):
+        tabla.put_item(Item=fila('05-01', str(hora), user_type='no_registrado'))
+    tabla.put_item(Item=fila('04-30', '10'))
+    solo_pagos = lambda tx: tx['user_type'] != 'no_registrado'
+
+    filas, cursor = modulo.leer_pagina(tabla, archive, PLACA, 5, incluir=solo_pagos, max_revisadas=4)
+    assert (filas, modulo.decodificar_cursor(cursor)) == ([], ('2025-05-01T16:00:00Z', 'TXN-05-0116'))
+
+    assert paginas(modulo, aws, archive, 5, incluir=solo_pagos, max_revisadas=4) == [[], [], ['TXN-04-3010']]
+
+@pytest.fixture
+def archiver(aws, cargar, monkeypatch):
+    monkeypatch.setenv('ARCHIVE_BUCKET', 'archivebucket')
+    return cargar('archiver')
+
+def test_sin_nada_que_archivar_guarda_progreso_y_no_vuelve_a_recorrer_el_indice(aws, archiver, monkeypatch):
+    aws.tabla('TransactionsTable').put_item(Item=fila('05-01', '10', dia_procesado='2099-05-01#0'))
+
+    archiver.lambda_handler({}, None)
+    corte = archiver.datetime.utcnow() - archiver.timedelta(days=archiver.ARCHIVE_AFTER_DAYS + 1)
+    assert archiver.leer_progreso()['ultimo_dia'] == corte.strftime('%Y-%m-%d')
+
+    def sin_scan(**kwargs):
+        raise AssertionError('con progreso guardado no se recorre el índice')
+    monkeypatch.setattr(archiver.transactions_table, 'scan', sin_scan)
+    archiver.lambda_handler({}, None)
+
+def test_llaves_sin_procesar_se_reintentan_un_numero_acotado_de_veces(aws, archiver, monkeypatch):
+    llamadas = []
+
+    def batch_get_con_throttling(RequestItems):
+        llamadas.append(RequestItems)
+        return {'Responses': {}, 'UnprocessedKeys': RequestItems}
+    monkeypatch.setattr(archiver.dynamodb, 'batch_get_item', batch_get_con_throttling)
+    monkeypatch.setattr(archiver.time, 'sleep', lambda s: None)
+
+    with pytest.raises(RuntimeError, match='1 filas sin leer'):
+        archiver.leer_filas([{'transaction_id': 'TXN-1', 'timestamp': '2025-01-20T10:00:00Z'}])
+    assert len(llamadas) == archiver.BATCH_GET_MAX_ATTEMPTS
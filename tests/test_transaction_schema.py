@@ -0,0 +1,33 @@
+"""Formato v2: has_tag obligatorio y la vista v1 lo conserva aunque el tag esté inactivo (user-038)"""
+import json
+from decimal import Decimal
+
+import pytest
+
+def test_tag_inactivo_se_lee_sin_tag(aws, cargar, monkeypatch):
+    monkeypatch.setenv('TRANSACTION_SCHEMA_VERSION', '2')
+    monkeypatch.setenv('PAYMENT_STUB_LATENCY_MS', '0')
+    monkeypatch.setenv('PAYMENT_STUB_DECLINE_RATE', '0')
+    monkeypatch.setenv('PAYMENT_STUB_ERROR_RATE', '0')
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-200LLL', 'tipo_usuario': 'registrado',
+                                           'saldo_disponible': Decimal('100')})
+    app = cargar('processor')
+    # Usuario con tag_id pero el tag está inactivo: paga como registrado
+    body = json.dumps({'placa': 'P-200LLL', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': '2025-01-20T10:00:00Z',
+                       'user_type': 'registrado', 'has_tag': False, 'tag_id': 'TAG-200'})
+    app.lambda_handler({'Records': [{'messageId': 'm-1', 'body': body, 'attributes': {}}]}, None)
+
+    item, = aws.tabla('TransactionsTable').scan()['Items']
+    tx = cargar('processor', 'transaction_schema').leer_transaccion(item)
+    assert (item['v'], item['tag_id']) == (2, 'TAG-200')
+    assert tx['has_tag'] is False
+    assert tx['tipo_escenario'] == 'registrado_digital'
+
+def test_v2_exige_has_tag(cargar):
+    schema = cargar('processor', 'transaction_schema')
+    v1 = {'transaction_id': 'TXN-1', 'timestamp': '2025-01-20T10:00:00Z', 'placa': 'P-200LLL', 'monto': Decimal('25'),
+          'tipo_escenario': 'tag_express', 'tag_id': 'TAG-200', 'resultado': {}}
+
+    assert schema.compactar_transaccion({**v1, 'has_tag': False})['has_tag'] is False
+    with pytest.raises(KeyError):
+        schema.compactar_transaccion(v1)
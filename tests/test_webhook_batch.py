@@ -0,0 +1,92 @@
+"""POST /webhook/toll/batch (user-026)"""
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+def ahora():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def sembrar(aws):
+    users = aws.tabla('UsersTable')
+    for placa in ('P-100AAA', 'P-200BBB'):
+        users.put_item(Item={'placa': placa, 'tipo_usuario': 'registrado', 'email': f"{placa}@guatepass.com",
+                             'metodo_pago': 'tarjeta_credito', 'saldo_disponible': Decimal('100')})
+    aws.tabla('TagsTable').put_item(Item={'tag_id': 'TAG-001', 'placa': 'P-200BBB', 'estado': 'activo'})
+
+def lote(*transacciones):
+    return {'resource': '/webhook/toll/batch', 'body': json.dumps({'transacciones': list(transacciones)})}
+
+class DynamoConThrottling:
+    """Resource de DynamoDB que nunca procesa las llaves de ciertas placas en BatchGetItem"""
+    def __init__(self, dynamodb, placas):
+        self.dynamodb = dynamodb
+        self.placas = placas
+        self.llamadas = 0
+
+    def batch_get_item(self, RequestItems):
+        self.llamadas += 1
+        sin_procesar = {}
+        pedido = {}
+        for tabla, request in RequestItems.items():
+            for key in request['Keys']:
+                destino = sin_procesar if key.get('placa') in self.placas else pedido
+                destino.setdefault(tabla, {'Keys': []})['Keys'].append(key)
+        response = self.dynamodb.batch_get_item(RequestItems=pedido) if pedido else {'Responses': {}}
+        response['UnprocessedKeys'] = sin_procesar
+        return response
+
+def test_lote_acepta_y_rechaza_por_item(aws, cargar):
+    sembrar(aws)
+    app = cargar('webhook')
+
+    respuesta = app.lambda_handler(lote(
+        {'placa': 'P-100AAA', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora()},
+        {'tag_id': 'TAG-001', 'peaje_id': 'PEAJE_ZONA11', 'timestamp': ahora()},
+        {'placa': 'P-999ZZZ', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora()},
+        {'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora()}
+    ), None)
+
+    body = json.loads(respuesta['body'])
+    assert respuesta['statusCode'] == 200
+    assert [r['estado'] for r in body['resultados']] == ['aceptada', 'aceptada', 'rechazada', 'rechazada']
+    assert body['resultados'][1]['placa'] == 'P-200BBB'
+    assert body['resultados'][1]['has_active_tag'] is True
+    encolados = aws.mensajes()
+    assert sorted(m['placa'] for m in encolados) == ['P-100AAA', 'P-200BBB']
+
+def test_llaves_sin_procesar_se_reportan_como_throttled(aws, cargar, monkeypatch):
+    sembrar(aws)
+    app = cargar('webhook')
+    validation = cargar('webhook', 'validation')
+    esperas = []
+    monkeypatch.setattr(validation.time, 'sleep', esperas.append)
+    dynamo = DynamoConThrottling(app.validator.dynamodb, {'P-100AAA'})
+    app.validator.dynamodb = dynamo
+
+    respuesta = app.lambda_handler(lote(
+        {'placa': 'P-100AAA', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora()},
+        {'placa': 'P-200BBB', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora()}
+    ), None)
+
+    resultados = json.loads(respuesta['body'])['resultados']
+    assert resultados[0]['estado'] == 'rechazada'
+    assert resultados[0]['error']['code'] == 'THROTTLED'
+    assert resultados[1]['estado'] == 'aceptada'
+    # Intentos acotados, con espera entre rondas y nunca más que el máximo
+    assert dynamo.llamadas == validation.BATCH_GET_MAX_ATTEMPTS
+    assert len(esperas) == validation.BATCH_GET_MAX_ATTEMPTS - 1
+    assert all(0 <= espera <= validation.BATCH_GET_BACKOFF_MAX for espera in esperas)
+    assert [m['placa'] for m in aws.mensajes()] == ['P-200BBB']
+
+def test_placa_de_tag_sin_procesar_se_reporta(aws, cargar, monkeypatch):
+    sembrar(aws)
+    app = cargar('webhook')
+    validation = cargar('webhook', 'validation')
+    monkeypatch.setattr(validation.time, 'sleep', lambda segundos: None)
+    app.validator.dynamodb = DynamoConThrottling(app.validator.dynamodb, {'P-200BBB'})
+
+    respuesta = app.lambda_handler(lote({'tag_id': 'TAG-001', 'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora()}), None)
+
+    resultado = json.loads(respuesta['body'])['resultados'][0]
+    assert resultado['error']['code'] == 'THROTTLED'
+    assert 'P-200BBB' in resultado['error']['message']
@@ -0,0 +1,66 @@
+"""POST /webhook/toll lee tag y usuario en un solo BatchGetItem (user-045)"""
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+class DynamoContado:
+    """Resource de DynamoDB que cuenta los BatchGetItem"""
+    def __init__(self, dynamodb, falla=None):
+        self.dynamodb = dynamodb
+        self.falla = falla
+        self.llamadas = 0
+
+    def batch_get_item(self, RequestItems):
+        self.llamadas += 1
+        if self.falla:
+            raise self.falla
+        return self.dynamodb.batch_get_item(RequestItems=RequestItems)
+
+@pytest.fixture
+def webhook(aws, cargar):
+    aws.tabla('UsersTable').put_item(Item={'placa': 'P-200BBB', 'tipo_usuario': 'registrado',
+                                           'email': 'p200@guatepass.com', 'saldo_disponible': Decimal('100')})
+    aws.tabla('TagsTable').put_item(Item={'tag_id': 'TAG-001', 'placa': 'P-200BBB', 'estado': 'activo'})
+    return cargar('webhook')
+
+def cruce(**campos):
+    ahora = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return {'body': json.dumps({'peaje_id': 'PEAJE_ZONA10', 'timestamp': ahora, **campos})}
+
+def sin_lecturas_sueltas(webhook, monkeypatch):
+    for tabla in (webhook.validator.users_table, webhook.validator.tags_table):
+        monkeypatch.setattr(tabla, 'get_item', lambda **kwargs: pytest.fail('GetItem fuera del BatchGetItem'))
+
+def test_placa_y_tag_en_una_lectura(aws, webhook, monkeypatch):
+    dynamodb = DynamoContado(webhook.validator.dynamodb)
+    monkeypatch.setattr(webhook.validator, 'dynamodb', dynamodb)
+    sin_lecturas_sueltas(webhook, monkeypatch)
+
+    respuesta = webhook.lambda_handler(cruce(placa='P-200BBB', tag_id='TAG-001'), None)
+
+    assert respuesta['statusCode'] == 200
+    assert dynamodb.llamadas == 1
+    mensaje, = aws.mensajes()
+    assert (mensaje['user_type'], mensaje['has_tag']) == ('registrado', True)
+
+def test_solo_tag_lee_la_placa_en_una_segunda_ronda(aws, webhook, monkeypatch):
+    dynamodb = DynamoContado(webhook.validator.dynamodb)
+    monkeypatch.setattr(webhook.validator, 'dynamodb', dynamodb)
+    sin_lecturas_sueltas(webhook, monkeypatch)
+
+    respuesta = webhook.lambda_handler(cruce(tag_id='TAG-001'), None)
+
+    assert respuesta['statusCode'] == 200
+    assert dynamodb.llamadas == 2
+    assert aws.mensajes()[0]['placa'] == 'P-200BBB'
+
+def test_falla_del_batch_vuelve_a_las_lecturas_sueltas(aws, webhook, monkeypatch):
+    monkeypatch.setattr(webhook.validator, 'dynamodb',
+                        DynamoContado(webhook.validator.dynamodb, falla=RuntimeError('throttling')))
+
+    respuesta = webhook.lambda_handler(cruce(placa='P-200BBB', tag_id='TAG-001'), None)
+
+    assert respuesta['statusCode'] == 200
+    assert aws.mensajes()[0]['user_type'] == 'registrado'